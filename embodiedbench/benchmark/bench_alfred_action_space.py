@@ -0,0 +1,150 @@
+"""
+Benchmark of the action space of ``EBAlfEnv`` resets and the visible objects of its steps, without the simulator.
+
+``--scenes`` synthetic scenes of ``--objects`` objects (ALFRED types, receptacles and pickupables
+with several instances) are reset ``--resets`` times each, with the pickupables moved (new object
+ids) between resets, as the tasks of a scene do. ``generate_additional_action_space`` is timed as
+before (skill strings and action space rebuilt on every reset) and with the per-scene action
+table cache, cold (first reset of every scene) and warm. Then ``--steps`` events with random
+visibility are replayed: the visible object types of every step are timed as before (a scan of
+the metadata) and from the metadata index of the event, which the reward evaluation of the step
+has built already. Reported are the microseconds per reset/step and whether the skill sets, the
+name/id maps and the visible objects are identical.
+
+    python -m embodiedbench.benchmark.bench_alfred_action_space --scenes 20 --resets 10
+"""
+import time
+import types
+import random
+import argparse
+
+import gym
+
+from embodiedbench.envs.eb_alfred.EBAlfEnv import EBAlfEnv, get_global_action_space, get_scene_action_table
+from embodiedbench.envs.eb_alfred.gen.utils.metadata_index import get_metadata_index
+from embodiedbench.envs.eb_alfred.utils import alfred_open_obj, alfred_pick_obj, alfred_recep
+
+
+def legacy_generate_additional_action_space(env):
+    # the previous EBAlfEnv.generate_additional_action_space
+    add_findable_objs = []
+    add_pickable_objs = []
+    recept_obj_dict = {}
+    pickable_obj_dict = {}
+    name_to_id_dict = {}
+    for obj in env.env.last_event.metadata['objects']:
+        if obj['receptacle']:
+            recept_obj_dict.setdefault(obj['objectType'], []).append(obj['objectId'])
+        elif obj['pickupable']:
+            pickable_obj_dict.setdefault(obj['objectType'], []).append(obj['objectId'])
+    for key in recept_obj_dict:
+        if len(recept_obj_dict[key]) >= 2:
+            for i in range(len(recept_obj_dict[key])):
+                if i == 0:
+                    name_to_id_dict[key] = recept_obj_dict[key][i]
+                else:
+                    name_to_id_dict[key + '_{}'.format(i+1)] = recept_obj_dict[key][i]
+                    add_findable_objs.append(key + '_{}'.format(i+1))
+    for key in pickable_obj_dict:
+        if len(pickable_obj_dict[key]) >= 2:
+            for i in range(len(pickable_obj_dict[key])):
+                if i == 0:
+                    name_to_id_dict[key] = pickable_obj_dict[key][i]
+                else:
+                    name_to_id_dict[key + '_{}'.format(i+1)] = pickable_obj_dict[key][i]
+                    add_pickable_objs.append(key + '_{}'.format(i+1))
+    id_to_name_dict = {}
+    for key in name_to_id_dict:
+        id_to_name_dict[name_to_id_dict[key]] = key
+    add_findable_objs = sorted(list(set(add_findable_objs)))
+    add_pickable_objs = sorted(list(set(add_pickable_objs)))
+    action_space = [f"find a {obj}" for obj in add_findable_objs]
+    for obj in add_findable_objs:
+        if obj.split('_')[0] in alfred_open_obj:
+            action_space.extend([f"open the {obj}", f"close the {obj}"])
+    for obj in add_pickable_objs:
+        if obj.split('_')[0] in alfred_pick_obj:
+            action_space.extend([f"find a {obj}"])
+    env.language_skill_set = get_global_action_space() + action_space
+    env.action_space = gym.spaces.Discrete(len(env.language_skill_set))
+    env.name_to_id_dict = name_to_id_dict
+    env.id_to_name_dict = id_to_name_dict
+
+
+def object_id(object_type, rng):
+    return '%s|%+.2f|%+.2f|%+.2f' % (object_type, rng.uniform(-3, 3), rng.uniform(0, 2), rng.uniform(-3, 3))
+
+
+def synthetic_scene(rng, num_objects):
+    '''
+    (type, receptacle, pickupable) of the objects of a scene
+    '''
+    recep_types = rng.sample(alfred_recep, 12)
+    pick_types = rng.sample([t for t in alfred_pick_obj if t not in alfred_recep], 15)
+    objs = [(t, True, False) for t in recep_types]
+    while len(objs) < num_objects:
+        if rng.random() < 0.4:
+            objs.append((rng.choice(recep_types), True, False))
+        else:
+            objs.append((rng.choice(pick_types), False, True))
+    return objs
+
+
+def scene_event(rng, scene, scene_name, static_ids):
+    # receptacles keep their ids, pickupables get new ones (moved by the task)
+    objects = [{'objectType': t, 'objectId': static_ids[i] if recep else object_id(t, rng), 'receptacle': recep,
+                'pickupable': pick, 'visible': rng.random() < 0.2}
+               for i, (t, recep, pick) in enumerate(scene)]
+    return types.SimpleNamespace(metadata={'sceneName': scene_name, 'objects': objects})
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    out = [fn(item) for item in items]
+    return (time.perf_counter() - start) * 1e6 / len(items), out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the action space and visible objects of EBAlfEnv.')
+    parser.add_argument('--scenes', type=int, default=20)
+    parser.add_argument('--resets', type=int, default=10)
+    parser.add_argument('--objects', type=int, default=80)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    resets = []
+    for s in range(args.scenes):
+        scene = synthetic_scene(rng, args.objects)
+        static_ids = [object_id(t, rng) for t, _, _ in scene]
+        resets.append([scene_event(rng, scene, 'FloorPlan%d' % s, static_ids) for _ in range(args.resets)])
+    events = [event for scene_events in resets for event in scene_events]
+
+    def reset(generate):
+        def run(event):
+            env = types.SimpleNamespace(env=types.SimpleNamespace(last_event=event))
+            generate(env)
+            return env.language_skill_set, env.name_to_id_dict, env.id_to_name_dict
+        return run
+
+    print('{} scenes, {} resets each, {} objects'.format(args.scenes, args.resets, args.objects))
+    print('{:>16} {:>12} {:>10}'.format('', 'us', 'identical'))
+    us, expected = timed(reset(legacy_generate_additional_action_space), events)
+    print('{:>16} {:>12.1f} {:>10}'.format('reset, rebuilt', us, ''))
+    get_scene_action_table.cache_clear()
+    cached = reset(EBAlfEnv.generate_additional_action_space)
+    us, cold = timed(cached, [scene_events[0] for scene_events in resets])
+    print('{:>16} {:>12.1f} {:>10}'.format('reset, cold', us, str(cold == expected[::args.resets])))
+    us, warm = timed(cached, events)
+    print('{:>16} {:>12.1f} {:>10}'.format('reset, warm', us, str(warm == expected)))
+
+    steps = [scene_event(rng, scene, 'FloorPlan0', [object_id(t, rng) for t, _, _ in scene])
+             for scene in [synthetic_scene(rng, args.objects)] for _ in range(args.steps)]
+    us, expected = timed(lambda e: [obj['objectType'] for obj in e.metadata['objects'] if obj['visible']], steps)
+    print('{:>16} {:>12.1f} {:>10}'.format('visible, scan', us, ''))
+    for e in steps:
+        # built by the reward evaluation of the step
+        get_metadata_index(e)
+    us, visible = timed(lambda e: get_metadata_index(e).visible_types(), steps)
+    print('{:>16} {:>12.1f} {:>10}'.format('visible, index', us, str(visible == expected)))
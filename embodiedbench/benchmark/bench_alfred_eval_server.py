@@ -0,0 +1,255 @@
+"""
+Benchmark of the legacy ALFRED evaluation (``models/eval``) with and without the model server, on CPU.
+
+THOR is replaced by a stub env: every step sleeps ``--env_ms`` and shows a synthetic frame that
+depends only on the task and the step, so both evaluations see the same frames. The model is a
+``seq2seq_im_mask`` with random weights (``--dhid``) and the vocabulary of a synthetic dataset
+(as in ``bench_alfred_preprocess``); the Resnet18 has random weights, seeded alike in both
+evaluations, so nothing is downloaded and ai2thor is not imported. ``--episodes`` episodes of
+at most ``--max_steps`` steps are evaluated by ``--workers`` workers, with the previous scheme
+(every worker steps the shared model and runs the Resnet on its own frames, one at a time) and
+with ``--model_server`` (one server process batches the steps of the workers). Reported are
+steps per second, the summed peak RSS of the processes, and whether every episode took the same
+actions.
+
+    python -m embodiedbench.benchmark.bench_alfred_eval_server --workers 4 --episodes 16
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import shutil
+import argparse
+import resource
+import tempfile
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+ALFRED_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs', 'eb_alfred')
+sys.path.append(ALFRED_ROOT)
+sys.path.append(os.path.join(ALFRED_ROOT, 'models'))
+sys.path.append(os.path.join(ALFRED_ROOT, 'models', 'eval'))
+
+from data.preprocess import Dataset
+from model.seq2seq_im_mask import Module
+from models.nn.resnet import Resnet
+from eval_task import EvalTask
+from model_server import LocalPolicy, serve
+from embodiedbench.benchmark.bench_alfred_loader import model_args
+from embodiedbench.benchmark.bench_alfred_preprocess import write_dataset
+
+
+class Event(object):
+    def __init__(self, frame):
+        self.frame = frame
+        self.metadata = {'lastActionSuccess': True, 'errorMessage': ''}
+
+
+class StubEnv(object):
+    '''
+    the calls of EvalTask.run_episode to ThorEnv: steps sleep and show frames of the task and step
+    '''
+
+    def __init__(self, env_ms):
+        self.env_ms = env_ms
+        self.task_id, self.t, self.actions = None, 0, []
+        self.last_event = None
+
+    def render(self):
+        rng = np.random.default_rng(zlib.crc32(self.task_id.encode()) * 10000 + self.t)
+        self.last_event = Event(rng.integers(0, 256, size=(300, 300, 3), dtype=np.uint8))
+        return self.last_event
+
+    def reset(self, scene_name):
+        pass
+
+    def restore_scene(self, object_poses, object_toggles, dirty_and_empty):
+        pass
+
+    def step(self, action):
+        return self.last_event
+
+    def set_task(self, traj_data, args, reward_type='dense'):
+        self.task_id = '%s_%s' % (traj_data['task_id'], traj_data['repeat_idx'])
+        self.t, self.actions = 0, []
+        self.render()
+
+    def va_interact(self, action, interact_mask=None, smooth_nav=False, debug=False):
+        time.sleep(self.env_ms / 1000.)
+        self.actions.append(action)
+        self.t += 1
+        self.render()
+        return True, self.last_event, None, '', None
+
+    def get_transition_reward(self):
+        return 0., False
+
+    def get_goal_satisfied(self):
+        return False
+
+    def get_goal_conditions_met(self):
+        return 0, 1
+
+    def stop(self):
+        pass
+
+
+class StubEvalTask(EvalTask):
+    env_ms = 20
+
+    @classmethod
+    def make_env(cls):
+        return StubEnv(cls.env_ms)
+
+    @classmethod
+    def setup_scene(cls, env, traj_data, r_idx, args, reward_type='dense'):
+        env.set_task(traj_data, args, reward_type=reward_type)
+
+    @classmethod
+    def run_episode(cls, env, policy, r_idx, traj_data, args):
+        try:
+            super(StubEvalTask, cls).run_episode(env, policy, r_idx, traj_data, args)
+        except ZeroDivisionError:
+            # the SPL of an episode stopped at its first step divides by zero; only the actions are compared here
+            pass
+        return env.task_id, list(env.actions)
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def legacy_worker(model, resnet, args, task_queue, results, env_ms):
+    # the previous EvalTask.run, with the stub env
+    env = StubEnv(env_ms)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        traj = model.load_task_json(task)
+        results.put(StubEvalTask.run_episode(env, LocalPolicy(model, resnet), task['repeat_idx'], traj, args))
+    results.put(('rss', peak_rss()))
+
+
+def server_worker(worker_id, args, model_args, task_queue, requests, responses, results, env_ms, server_pid):
+    StubEvalTask.env_ms = env_ms
+    StubEvalTask.run_worker(worker_id, args, model_args, task_queue, requests, responses, results, server_pid)
+    results.put(('rss', peak_rss()))
+
+
+def server_process(model, args, requests, responses, results):
+    # the same random Resnet as the legacy evaluation
+    torch.manual_seed(0)
+    serve(model, args, requests, responses)
+    results.put(('rss', peak_rss()))
+
+
+def collect(results, processes):
+    episodes, rss = {}, 0
+    while any(p.is_alive() for p in processes) or not results.empty():
+        try:
+            key, value = results.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        if key == 'rss':
+            rss += value
+        else:
+            episodes[key] = value
+    return episodes, rss
+
+
+def run(mode, model, args, tasks, num_workers, env_ms):
+    task_queue, results = mp.Queue(), mp.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    for _ in range(num_workers):
+        task_queue.put(None)
+
+    start = time.perf_counter()
+    if mode == 'legacy':
+        args.visual_model = 'resnet18'
+        torch.manual_seed(0)
+        resnet = Resnet(args, eval=True, share_memory=True, use_conv_feat=True)
+        processes = [mp.Process(target=legacy_worker, args=(model, resnet, args, task_queue, results, env_ms))
+                     for _ in range(num_workers)]
+        for p in processes:
+            p.start()
+        episodes, rss = collect(results, processes)
+    else:
+        requests = mp.Queue()
+        responses = [mp.Queue() for _ in range(num_workers)]
+        server = mp.Process(target=server_process, args=(model, args, requests, responses, results))
+        server.start()
+        processes = [mp.Process(target=server_worker, args=(n, args, model.args, task_queue, requests, responses[n],
+                                                            results, env_ms, server.pid))
+                     for n in range(num_workers)]
+        for p in processes:
+            p.start()
+        episodes, rss = collect(results, processes)
+        requests.put(('stop', None, None))
+        server.join()
+        while not results.empty():
+            rss += results.get()[1]
+    for p in processes:
+        p.join()
+    return time.perf_counter() - start, episodes, rss
+
+
+def write_tasks(root, num_episodes):
+    splits = write_dataset(root, num_episodes)
+    for k, d in splits.items():
+        for name in sorted({task['task'] for task in d}):
+            json_path = os.path.join(root, k, name, 'traj_data.json')
+            with open(json_path) as f:
+                ex = json.load(f)
+            ex['task_id'] = name.split('/')[-1]
+            ex['scene'].update({'object_poses': [], 'object_toggles': [], 'dirty_and_empty': False,
+                                'init_action': {'action': 'TeleportFull'}})
+            with open(json_path, 'w') as f:
+                json.dump(ex, f)
+    dataset = Dataset(model_args(root, 0, 2))
+    dataset.preprocess_splits(splits)
+    return dataset.vocab, [task for d in splits.values() for task in d][:num_episodes]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ALFRED evaluation with the model server.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--episodes', type=int, default=16)
+    parser.add_argument('--max_steps', type=int, default=30)
+    parser.add_argument('--env_ms', type=float, default=20)
+    parser.add_argument('--dhid', type=int, default=512)
+    args = parser.parse_args()
+
+    mp.set_start_method('spawn')
+    root = tempfile.mkdtemp(prefix='alfred_eval_server_')
+    try:
+        vocab, tasks = write_tasks(root, args.episodes)
+        torch.manual_seed(0)
+        m_args = model_args(root, 0, 2)
+        m_args.dhid = args.dhid
+        model = Module(m_args, vocab)
+        model.share_memory()
+        model.eval()
+        model.test_mode = True
+
+        eval_args = argparse.Namespace(gpu=False, max_steps=args.max_steps, max_fails=10, debug=False,
+                                       smooth_nav=False, server_batch_wait=0.005,
+                                       pretrained_resnet=False)
+        print('{} episodes, {} workers, at most {} steps, {:.0f} ms per env step'.format(
+            len(tasks), args.workers, args.max_steps, args.env_ms))
+        print('{:>14} {:>10} {:>12} {:>12} {:>10}'.format('', 'seconds', 'steps/s', 'peak RSS MB', 'identical'))
+        reference = None
+        for mode in ('legacy', 'server'):
+            seconds, episodes, rss = run(mode, model, eval_args, tasks, args.workers, args.env_ms)
+            steps = sum(len(actions) for actions in episodes.values())
+            identical = '' if reference is None else str(episodes == reference)
+            reference = reference or episodes
+            print('{:>14} {:>10.2f} {:>12.1f} {:>12.0f} {:>10}'.format(mode, seconds, steps / seconds,
+                                                                       rss / 2 ** 20, identical))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,108 @@
+"""
+Benchmark of the training steps of the ALFRED seq2seq model (``seq2seq_im_mask``) on CPU.
+
+A small synthetic dataset is written to a temporary folder: trajectories as in
+``bench_alfred_preprocess``, preprocessed into the consolidated split files, and a
+``feat_conv.pt`` of random Resnet features per trajectory. Training steps (forward, loss,
+backward, optimizer step) are timed with the batches loaded in the training loop from the
+per-trajectory feature files, as ``Module.iterate`` did, and with the packed feature store and
+``--workers`` background loader processes. The losses of every step are compared between the
+two (dropout off, same initial weights).
+
+    python -m embodiedbench.benchmark.bench_alfred_loader --trajectories 48 --workers 1,2
+"""
+import os
+import sys
+import copy
+import time
+import shutil
+import argparse
+import tempfile
+
+import torch
+
+ALFRED_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs', 'eb_alfred')
+sys.path.append(ALFRED_ROOT)
+sys.path.append(os.path.join(ALFRED_ROOT, 'models'))
+
+from data.preprocess import Dataset
+from data.feature_store import FeatureStore
+from model.seq2seq_im_mask import Module
+from embodiedbench.benchmark.bench_alfred_preprocess import write_dataset
+from embodiedbench.envs.eb_alfred.gen import constants
+
+
+def model_args(root, workers, prefetch):
+    return argparse.Namespace(
+        data=root, pp_folder='pp', pp_workers=1, pframe=constants.DETECTION_SCREEN_WIDTH, fast_epoch=False, use_templated_goals=False,
+        seed=123, gpu=False, batch=4, lr=1e-4, dhid=64, dframe=2500, demb=100,
+        mask_loss_wt=1., action_loss_wt=1., subgoal_aux_loss_wt=0., pm_aux_loss_wt=0.,
+        zero_goal=False, zero_instr=False, lang_dropout=0., input_dropout=0., vis_dropout=0.,
+        hstate_dropout=0., attn_dropout=0., actor_dropout=0., dec_teacher_forcing=True,
+        temp_no_history=False, dataset_fraction=0, loader_workers=workers, prefetch=prefetch)
+
+
+def write_features(root, splits, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    dataset = Dataset(model_args(root, 0, 2))
+    dataset.preprocess_splits(splits)
+    for k, d in splits.items():
+        for name in sorted({task['task'] for task in d}):
+            with open(os.path.join(root, k, name, 'traj_data.json')) as f:
+                num_low_actions = f.read().count('"api_action"')
+            frames = torch.rand(num_low_actions + 1, 512, 7, 7, generator=generator)
+            torch.save(frames, os.path.join(root, k, name, 'feat_conv.pt'))
+    return dataset.vocab
+
+
+def train_steps(model, optimizer, data, batch_size):
+    losses = []
+    start = time.perf_counter()
+    for batch, feat in model.iterate(data, batch_size):
+        out = model.forward(feat)
+        loss = model.compute_loss(out, batch, feat)
+        optimizer.zero_grad()
+        sum_loss = sum(loss.values())
+        sum_loss.backward()
+        optimizer.step()
+        losses.append(float(sum_loss.detach()))
+    return time.perf_counter() - start, losses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the seq2seq training data loader.')
+    parser.add_argument('--trajectories', type=int, default=48)
+    parser.add_argument('--batch', type=int, default=4)
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')], default=[1, 2])
+    parser.add_argument('--prefetch', type=int, default=2)
+    args = parser.parse_args()
+
+    torch.set_num_threads(max(1, os.cpu_count() or 1))
+    root = tempfile.mkdtemp(prefix='alfred_loader_')
+    try:
+        splits = write_dataset(root, args.trajectories)
+        vocab = write_features(root, splits)
+        train = splits['train']
+        torch.manual_seed(0)
+        initial = Module(model_args(root, 0, args.prefetch), vocab)
+        print('{} training annotations, batch {}, {} cpus'.format(len(train), args.batch, os.cpu_count()))
+        print('{:>28} {:>10} {:>12} {:>10}'.format('', 'seconds', 'ms/step', 'identical'))
+
+        def run(workers):
+            model = copy.deepcopy(initial)
+            model.args = model_args(root, workers, args.prefetch)
+            optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+            return train_steps(model, optimizer, train, args.batch)
+
+        seconds, reference = run(0)
+        print('{:>28} {:>10.2f} {:>12.1f} {:>10}'.format('synchronous, feat_conv.pt', seconds,
+                                                           seconds * 1e3 / len(reference), ''))
+        store = FeatureStore(root)
+        for k, d in splits.items():
+            store.pack(k, d)
+        for workers in [0] + args.workers:
+            seconds, losses = run(workers)
+            print('{:>28} {:>10.2f} {:>12.1f} {:>10}'.format('packed, %d loader workers' % workers, seconds,
+                                                               seconds * 1e3 / len(losses), str(losses == reference)))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,176 @@
+"""
+Benchmark of the ALFRED preprocessing of ``Dataset.preprocess_splits`` on synthetic trajectories.
+
+A dataset folder of synthetic ``traj_data.json`` files (annotations, a plan of high and low
+level actions with interaction masks, image entries) is written to a temporary folder. It is
+preprocessed with the previous loop (one trajectory after the other, one ``ann_<r>.json`` per
+annotation) and with the pool pipeline writing one file per split: a first run, a run with
+nothing changed, and a run after ``--touch`` of the trajectories changed. The vocabularies
+(words, indices and counts) and every preprocessed trajectory are compared with the ones of
+the previous loop.
+
+    python -m embodiedbench.benchmark.bench_alfred_preprocess --trajectories 400 --workers 1,4
+"""
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from embodiedbench.envs.eb_alfred.data.preprocess import Dataset
+from embodiedbench.envs.eb_alfred.data.preprocessed_store import PreprocessedStore
+
+WORDS = ('walk to the counter then pick up the apple and put it in the fridge near sink '
+         'turn left go forward open close drawer cabinet knife slice bread on table a red mug '
+         'coffee machine toggle lamp look down at shelf move ahead right around wash plate').split()
+OBJECTS = ['Apple', 'Fridge', 'CounterTop', 'Knife', 'Bread', 'Mug', 'SinkBasin', 'Cabinet', 'Drawer', 'Lamp']
+LOW = ['MoveAhead', 'RotateLeft', 'RotateRight', 'LookDown', 'LookUp', 'PickupObject', 'PutObject',
+       'OpenObject', 'CloseObject', 'ToggleObjectOn', 'SliceObject']
+HIGH = ['GotoLocation', 'PickupObject', 'PutObject', 'CleanObject', 'HeatObject', 'SliceObject']
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def synthetic_trajectory(rng, num_high=6):
+    high_pddl, low_actions, images = [], [], []
+    for h in range(num_high):
+        action = rng.choice(HIGH)
+        args = [rng.choice(OBJECTS).lower() for _ in range(rng.randint(1, 2))]
+        high_pddl.append({'discrete_action': {'action': action, 'args': args},
+                          'planner_action': {'action': action}, 'high_idx': h})
+        for _ in range(rng.randint(4, 12)):
+            action = rng.choice(LOW)
+            discrete = {'action': action, 'args': {}}
+            if action not in ('MoveAhead', 'RotateLeft', 'RotateRight', 'LookDown', 'LookUp'):
+                x, y = rng.randint(0, 250), rng.randint(0, 250)
+                discrete['args'] = {'bbox': [x, y, x + 40, y + 40],
+                                    'mask': [[rng.randint(0, 89000), rng.randint(1, 400)] for _ in range(30)]}
+            low_actions.append({'api_action': {'action': action}, 'discrete_action': discrete, 'high_idx': h})
+            images.append({'high_idx': h, 'low_idx': len(low_actions) - 1,
+                           'image_name': '%09d.png' % len(images)})
+    high_pddl.append({'discrete_action': {'action': 'NoOp', 'args': []},
+                      'planner_action': {'value': 1, 'action': 'End'}, 'high_idx': num_high})
+    anns = [{'task_desc': sentence(rng, rng.randint(6, 12)),
+             'high_descs': [sentence(rng, rng.randint(8, 16)) for _ in range(num_high)]} for _ in range(3)]
+    return {'plan': {'high_pddl': high_pddl, 'low_actions': low_actions}, 'images': images,
+            'turk_annotations': {'anns': anns}, 'scene': {'scene_num': rng.randint(1, 30)},
+            'task_type': 'pick_and_place_simple', 'pddl_params': {}}
+
+
+def write_dataset(root, num_trajectories, seed=0):
+    rng = random.Random(seed)
+    splits = {'train': [], 'valid_seen': []}
+    for i in range(num_trajectories):
+        k = 'train' if i % 5 else 'valid_seen'
+        name = 'pick_and_place_simple-%d/trial_T%06d' % (i % 37, i)
+        folder = os.path.join(root, k, name)
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'traj_data.json'), 'w') as f:
+            json.dump(synthetic_trajectory(rng), f, indent=2)
+        for r_idx in range(2):
+            splits[k].append({'task': name, 'repeat_idx': r_idx})
+    return splits
+
+
+def touch(root, splits, fraction, seed=1):
+    """Change the first annotation of a fraction of the trajectories."""
+    rng = random.Random(seed)
+    names = sorted({(k, t['task']) for k, d in splits.items() for t in d})
+    for k, name in rng.sample(names, int(len(names) * fraction)):
+        json_path = os.path.join(root, k, name, 'traj_data.json')
+        with open(json_path) as f:
+            ex = json.load(f)
+        ex['turk_annotations']['anns'][0]['task_desc'] = sentence(rng, 8) + ' grab a zucchini.'
+        with open(json_path, 'w') as f:
+            json.dump(ex, f, indent=2)
+
+
+def legacy_preprocess_splits(dataset, splits):
+    """The previous Dataset.preprocess_splits, without the progressbar."""
+    args = dataset.args
+    for k, d in splits.items():
+        train_mode = 'test' not in k
+        for task in d:
+            json_path = os.path.join(args.data, k, task['task'], 'traj_data.json')
+            with open(json_path) as f:
+                ex = json.load(f)
+            r_idx = task['repeat_idx']
+            traj = ex.copy()
+            traj['root'] = os.path.join(args.data, task['task'])
+            traj['split'] = k
+            traj['repeat_idx'] = r_idx
+            use_templated_goals = args.use_templated_goals and train_mode
+            dataset.process_language(ex, traj, r_idx, use_templated_goals=use_templated_goals)
+            if train_mode:
+                dataset.process_actions(ex, traj)
+            preprocessed_folder = os.path.join(args.data, task['task'], args.pp_folder)
+            if not os.path.isdir(preprocessed_folder):
+                os.makedirs(preprocessed_folder)
+            with open(os.path.join(preprocessed_folder, 'ann_%d.json' % r_idx), 'w') as f:
+                json.dump(traj, f, sort_keys=True, indent=4)
+
+
+def make_args(root, pp_folder, workers):
+    return argparse.Namespace(data=root, pframe=300, fast_epoch=False, use_templated_goals=False,
+                              pp_folder=pp_folder, pp_workers=workers, dout=root)
+
+
+def run_legacy(root, splits):
+    dataset = Dataset(make_args(root, 'pp_legacy', 1))
+    start = time.perf_counter()
+    legacy_preprocess_splits(dataset, splits)
+    return time.perf_counter() - start, dataset.vocab
+
+
+def run_pipeline(root, splits, pp_folder, workers):
+    dataset = Dataset(make_args(root, pp_folder, workers))
+    start = time.perf_counter()
+    dataset.preprocess_splits(splits)
+    return time.perf_counter() - start, dataset.vocab
+
+
+def identical(root, splits, vocab, reference_vocab, pp_folder):
+    if not all(vocab[name] == reference_vocab[name] and
+               vocab[name]._index2word == reference_vocab[name]._index2word for name in reference_vocab):
+        return False
+    legacy, store = PreprocessedStore(root, 'pp_legacy'), PreprocessedStore(root, pp_folder)
+    return all(legacy.load(task) == store.load(task) for d in splits.values() for task in d)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ALFRED preprocessing.')
+    parser.add_argument('--trajectories', type=int, default=400)
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')], default=[1, 4])
+    parser.add_argument('--touch', type=float, default=0.05, help='fraction of trajectories changed')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='alfred_pp_')
+    try:
+        splits = write_dataset(root, args.trajectories)
+        num = sum(len(d) for d in splits.values())
+        print('{} trajectories, {} annotations, {} cpus'.format(args.trajectories, num, os.cpu_count()))
+        print('{:>22} {:>10} {:>12} {:>10}'.format('', 'seconds', 'annot/s', 'identical'))
+        legacy_seconds, legacy_vocab = run_legacy(root, splits)
+        print('{:>22} {:>10.2f} {:>12.0f} {:>10}'.format('previous loop', legacy_seconds, num / legacy_seconds, ''))
+        for workers in args.workers:
+            pp_folder = 'pp_%d' % workers
+            for label in ('first run', 'unchanged'):
+                seconds, vocab = run_pipeline(root, splits, pp_folder, workers)
+                same = identical(root, splits, vocab, legacy_vocab, pp_folder)
+                print('{:>22} {:>10.2f} {:>12.0f} {:>10}'.format(
+                    '%d workers, %s' % (workers, label), seconds, num / seconds, str(same)))
+        # change a few trajectories and compare with the previous loop run again
+        touch(root, splits, args.touch)
+        legacy_seconds, legacy_vocab = run_legacy(root, splits)
+        for workers in args.workers:
+            pp_folder = 'pp_%d' % workers
+            seconds, vocab = run_pipeline(root, splits, pp_folder, workers)
+            same = identical(root, splits, vocab, legacy_vocab, pp_folder)
+            print('{:>22} {:>10.2f} {:>12.0f} {:>10}'.format(
+                '%d workers, %d%% changed' % (workers, args.touch * 100), seconds, num / seconds, str(same)))
+    finally:
+        shutil.rmtree(root)
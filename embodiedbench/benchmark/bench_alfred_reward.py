@@ -0,0 +1,231 @@
+"""
+Benchmark of the ALFRED reward evaluation (``env/tasks.py``, ``env/reward.py``) per step.
+
+Every step does what ``EBAlfEnv.step`` does after the simulator step: ``transition_reward``
+(dense rewards), ``goal_conditions_met`` and ``goal_satisfied`` on the new event. Episodes are
+read from ``--trace`` (a jsonl of recorded episodes: ``traj`` and the ``metadata``,
+``pose_discrete`` and heated/cooled/cleaned object ids of every ``steps``) or, without one,
+synthesized: ``pick_heat_then_place_in_recep`` episodes in scenes of ``--objects`` objects,
+with the metadata of a new event per step, as THOR returns it. Navigation distances come from
+a stub graph (Manhattan paths) in both cases.
+
+The previous evaluation (the subgoal action resolved and instantiated by ``get_action`` every
+step, objects found by scanning the metadata, e.g. ``game_util.get_object``) is compared with
+the reward engine (actions resolved once per episode) and the metadata index of the event.
+Reported are the microseconds per step and whether rewards, dones and goal conditions are
+identical.
+
+    python -m embodiedbench.benchmark.bench_alfred_reward --episodes 20 --objects 100
+"""
+import os
+import json
+import time
+import types
+import random
+import argparse
+
+from embodiedbench.envs.eb_alfred.env import tasks, reward
+from embodiedbench.envs.eb_alfred.gen.utils import game_util, metadata_index
+
+REWARD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs', 'eb_alfred',
+                           'models', 'config', 'rewards.json')
+
+
+class ScanIndex(object):
+    '''
+    lookups of the previous evaluation: a scan of the metadata per call
+    '''
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def get_object(self, object_id):
+        return game_util.get_object(object_id, self.metadata)
+
+    def with_name_and_prop(self, name, prop):
+        return game_util.get_objects_with_name_and_prop(name, prop, self.metadata)
+
+
+def scan_index(event):
+    return ScanIndex(event.metadata)
+
+
+class StubGraph(object):
+    def get_shortest_path(self, pose, goal_pose):
+        actions = ['MoveAhead'] * (abs(pose[0] - goal_pose[0]) + abs(pose[1] - goal_pose[1]))
+        actions += ['RotateLeft'] * ((pose[2] - goal_pose[2]) % 4)
+        return actions, None
+
+
+class StubEnv(object):
+    def __init__(self):
+        self.last_event = None
+        self.heated_objects, self.cooled_objects, self.cleaned_objects = set(), set(), set()
+        self.cooled_reward, self.reopen_reward = False, False
+
+
+def stub_nav_graph(task):
+    task.gt_graph = StubGraph()
+
+
+def make_task(traj, env, args, max_episode_length):
+    # as tasks.get_task, without the navigation graph of the scene
+    task_cls = getattr(tasks, traj['task_type'].replace('_', ' ').title().replace(' ', '') + 'Task')
+    task_cls = type(task_cls.__name__, (task_cls,), {'load_nav_graph': stub_nav_graph})
+    return task_cls(traj, env, args, reward_type='dense', max_episode_length=max_episode_length)
+
+
+def legacy_transition_reward(task, state):
+    # the previous BaseTask.transition_reward
+    reward_total = 0
+    if task.goal_finished:
+        return reward_total, True
+    expert_plan = task.traj['plan']['high_pddl']
+    action_type = expert_plan[task.goal_idx]['planner_action']['action']
+    if "dense" in task.reward_type:
+        action = reward.get_action(action_type, task.gt_graph, task.env, task.reward_config, task.strict)
+        sg_reward, sg_done = action.get_reward(state, task.prev_state, expert_plan, task.goal_idx)
+        reward_total += sg_reward
+        if sg_done:
+            task.finished += 1
+            if task.goal_idx + 1 < task.num_subgoals:
+                task.goal_idx += 1
+    if task.goal_satisfied(state):
+        reward_total += task.reward_config['Generic']['goal_reward']
+        task.goal_finished = True
+    if task.step_num > len(task.traj['plan']['low_actions']):
+        reward_total += task.reward_config['Generic']['step_penalty']
+    task.prev_state = task.env.last_event
+    task.step_num += 1
+    return reward_total, task.goal_idx >= task.num_subgoals or task.step_num >= task.max_episode_length
+
+
+def make_object(object_type, n, **props):
+    obj = {'objectId': '%s|%d|1|%d' % (object_type, n, n), 'objectType': object_type, 'visible': False,
+           'receptacle': False, 'pickupable': False, 'toggleable': False, 'isOpen': False, 'isToggled': False,
+           'isSliced': False, 'receptacleObjectIds': None, 'parentReceptacles': None}
+    obj.update(props)
+    return obj
+
+
+def synthetic_episode(rng, num_objects):
+    '''
+    (traj, steps) of a pick_heat_then_place_in_recep episode: walk to an apple, pick it up, walk to the
+    microwave, heat the apple, walk to the counter top and put it there
+    '''
+    object_types = ['Chair', 'Mug', 'Cabinet', 'Drawer', 'Bread', 'Knife', 'Plate', 'Spoon', 'Pot', 'Tomato']
+    objs = [make_object(rng.choice(object_types), n, pickupable=rng.random() < 0.5, receptacle=rng.random() < 0.3,
+                        receptacleObjectIds=[]) for n in range(num_objects - 3)]
+    apple = make_object('Apple', num_objects, pickupable=True)
+    microwave = make_object('Microwave', num_objects + 1, receptacle=True, toggleable=True, receptacleObjectIds=[])
+    counter = make_object('CounterTop', num_objects + 2, receptacle=True, receptacleObjectIds=[])
+    for obj in (apple, microwave, counter):
+        objs.insert(rng.randrange(len(objs) + 1), obj)
+
+    locations = [(rng.randrange(-10, 10), rng.randrange(-10, 10), 0, 0) for _ in range(3)]
+
+    def goto(location):
+        return {'planner_action': {'action': 'GotoLocation', 'location': 'loc|%d|%d|%d|%d' % location}}
+
+    plan = [goto(locations[0]),
+            {'planner_action': {'action': 'PickupObject', 'objectId': apple['objectId']}},
+            goto(locations[1]),
+            {'planner_action': {'action': 'HeatObject', 'objectId': microwave['objectId']}},
+            goto(locations[2]),
+            {'planner_action': {'action': 'PutObject', 'objectId': apple['objectId'],
+                                'receptacleObjectId': counter['objectId']}},
+            {'planner_action': {'action': 'End'}}]
+
+    steps, pose, inventory, heated = [], (0, 0, 0, 0), [], []
+
+    def step(action):
+        metadata = {'lastAction': action, 'lastActionSuccess': True, 'inventoryObjects': list(inventory),
+                    'objects': list(objs)}
+        steps.append({'metadata': metadata, 'pose_discrete': list(pose), 'heated_objects': list(heated)})
+
+    for location in locations:
+        while abs(pose[0] - location[0]) + abs(pose[1] - location[1]) > 1:
+            dx, dz = location[0] - pose[0], location[1] - pose[1]
+            pose = (pose[0] + (dx > 0) - (dx < 0), pose[1], pose[2], 0) if dx else \
+                (pose[0], pose[1] + (dz > 0) - (dz < 0), pose[2], 0)
+            step('MoveAhead')
+        if location is locations[0]:
+            inventory = [{'objectId': apple['objectId']}]
+            step('PickupObject')
+        elif location is locations[1]:
+            step('OpenObject')
+            step('PutObject')
+            heated = [apple['objectId']]
+            step('ToggleObjectOn')
+            step('PickupObject')
+        else:
+            inventory = []
+            # a new object, the metadata of the previous events keeps the empty counter top
+            objs[objs.index(counter)] = dict(counter, receptacleObjectIds=[apple['objectId']])
+            step('PutObject')
+    traj = {'task_type': 'pick_heat_then_place_in_recep',
+            'plan': {'high_pddl': plan, 'low_actions': [None] * len(steps)},
+            'pddl_params': {'object_target': 'Apple', 'parent_target': 'CounterTop', 'toggle_target': '',
+                            'mrecep_target': '', 'object_sliced': False},
+            'scene': {'floor_plan': 'FloorPlan1', 'scene_num': 1}}
+    return traj, steps
+
+
+def run(episodes, legacy):
+    index = scan_index if legacy else metadata_index.get_metadata_index
+    tasks.get_metadata_index = reward.get_metadata_index = index
+    args = types.SimpleNamespace(reward_config=REWARD_PATH)
+    outcomes, seconds, num_steps = [], 0., 0
+    try:
+        for traj, steps in episodes:
+            env = StubEnv()
+            events = [types.SimpleNamespace(metadata=s['metadata'], pose_discrete=tuple(s['pose_discrete']))
+                      for s in steps]
+            env.last_event = types.SimpleNamespace(metadata=steps[0]['metadata'], pose_discrete=(0, 0, 0, 0))
+            task = make_task(traj, env, args, len(steps) + 10)
+            for s, event in zip(steps, events):
+                env.heated_objects = set(s.get('heated_objects', ()))
+                env.cooled_objects = set(s.get('cooled_objects', ()))
+                env.cleaned_objects = set(s.get('cleaned_objects', ()))
+                env.last_event = event
+                start = time.perf_counter()
+                if legacy:
+                    task.targets = None
+                    step_reward, done = legacy_transition_reward(task, event)
+                else:
+                    step_reward, done = task.transition_reward(event)
+                conditions = task.goal_conditions_met(event)
+                if legacy:
+                    task.targets = None
+                satisfied = task.goal_satisfied(event)
+                seconds += time.perf_counter() - start
+                outcomes.append((round(step_reward, 6), done, conditions, satisfied))
+                num_steps += 1
+    finally:
+        tasks.get_metadata_index = reward.get_metadata_index = metadata_index.get_metadata_index
+    return seconds, num_steps, outcomes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ALFRED reward evaluation per step.')
+    parser.add_argument('--trace', help='jsonl of recorded episodes (default: synthetic episodes)', default=None)
+    parser.add_argument('--episodes', type=int, default=20)
+    parser.add_argument('--objects', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as f:
+            episodes = [(e['traj'], e['steps']) for e in map(json.loads, f)][:args.episodes]
+    else:
+        rng = random.Random(args.seed)
+        episodes = [synthetic_episode(rng, args.objects) for _ in range(args.episodes)]
+
+    print('{} episodes, {} steps'.format(len(episodes), sum(len(steps) for _, steps in episodes)))
+    print('{:>10} {:>12} {:>10}'.format('', 'us/step', 'identical'))
+    reference = None
+    for label, legacy in (('legacy', True), ('engine', False)):
+        seconds, num_steps, outcomes = run(episodes, legacy)
+        identical = '' if reference is None else str(outcomes == reference)
+        reference = reference or outcomes
+        print('{:>10} {:>12.1f} {:>10}'.format(label, seconds * 1e6 / num_steps, identical))
@@ -0,0 +1,137 @@
+"""
+Benchmark of the task loading of ``EBAlfEnv`` resets, without the simulator.
+
+Synthetic preprocessed trajectories (``--tasks`` tasks, shaped as ALFRED's preprocessed jsons:
+object poses, a plan of ``--low_actions`` low-level actions with their API calls, image names,
+annotations and their numericalization), packed into a split file as ``data/preprocess.py``
+writes them, and a ``splits.json`` of one eval set are written to a temporary folder, and the
+eval set is packed with ``task_store.build_task_store``. The reset preparation
+(``EBAlfEnv.prepare_task``: the trajectory of the task with its instruction and the initial
+action of the scene) is timed reading the json of every reset, as before, and from the
+task store: cold (first reset of every task, records read and decoded) and warm (decoded tasks
+from the cache). Also reported are the startup (``_load_dataset``) time, the bytes per task
+read, and whether the prepared tasks agree in every field the env uses.
+
+    python -m embodiedbench.benchmark.bench_alfred_task_store --tasks 50 --resets 3
+"""
+import os
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import tempfile
+
+from embodiedbench.envs.eb_alfred import utils
+from embodiedbench.envs.eb_alfred.EBAlfEnv import EBAlfEnv
+from embodiedbench.envs.eb_alfred.task_store import TaskStore, build_task_store, compact_task
+from embodiedbench.envs.eb_alfred.data.preprocessed_store import PreprocessedSplit, task_key
+
+
+def synthetic_traj(rng, name, repeat_idx, num_low_actions):
+    num_high = 8
+
+    def pose():
+        return {'x': rng.uniform(-3, 3), 'y': rng.uniform(0, 2), 'z': rng.uniform(-3, 3)}
+
+    low_actions = [{'api_action': {'action': 'MoveAhead', 'forceAction': True, 'moveMagnitude': 0.25},
+                    'discrete_action': {'action': 'MoveAhead_25', 'args': {}},
+                    'high_idx': i * num_high // num_low_actions} for i in range(num_low_actions)]
+    return {
+        'task_id': name.split('/')[-1], 'task_type': 'pick_and_place_simple', 'repeat_idx': repeat_idx,
+        'root': name, 'split': 'valid_seen',
+        'pddl_params': {'object_target': 'Apple', 'parent_target': 'CounterTop', 'toggle_target': '',
+                        'mrecep_target': '', 'object_sliced': False},
+        'scene': {'floor_plan': 'FloorPlan1', 'scene_num': 1, 'random_seed': rng.randrange(10 ** 9),
+                  'dirty_and_empty': False, 'object_toggles': [],
+                  'object_poses': [{'objectName': 'Obj_%d' % i, 'position': pose(), 'rotation': pose()}
+                                   for i in range(40)],
+                  'init_action': {'action': 'TeleportFull', 'x': 1.0, 'y': 0.9, 'z': -1.0, 'rotation': 90,
+                                  'horizon': 30, 'rotateOnTeleport': False}},
+        'plan': {'high_pddl': [{'high_idx': i, 'discrete_action': {'action': 'GotoLocation', 'args': ['apple']},
+                                'planner_action': {'action': 'GotoLocation', 'location': 'loc|1|2|0|30'}}
+                               for i in range(num_high)],
+                 'low_actions': low_actions},
+        'images': [{'high_idx': a['high_idx'], 'low_idx': i, 'image_name': '%09d.png' % i}
+                   for i, a in enumerate(low_actions)],
+        'turk_annotations': {'anns': [{'task_desc': 'put an apple on the counter', 'votes': [1, 1, 1],
+                                       'assignment_id': 'A%d' % j,
+                                       'high_descs': ['walk to the counter'] * num_high} for j in range(3)]},
+        'num': {'lang_goal': list(range(10)), 'lang_instr': [list(range(8))] * num_high,
+                'action_low': [[{'action': 3, 'mask': None, 'valid_interact': 0} for _ in range(10)]] * num_high,
+                'action_high': [{'action': 2, 'action_high_args': [5]} for _ in range(num_high)],
+                'low_to_high_idx': [a['high_idx'] for a in low_actions]},
+    }
+
+
+def write_tasks(root, num_tasks, num_low_actions, seed):
+    rng = random.Random(seed)
+    data = os.path.join(root, 'json_2.1.0')
+    dataset, lines = [], []
+    for t in range(num_tasks):
+        name = 'pick_and_place_simple-Apple-None-CounterTop-1/trial_%05d' % t
+        task = {'task': name, 'repeat_idx': t % 3, 'instruction': 'place the apple on the counter %d' % t}
+        traj = synthetic_traj(rng, name, task['repeat_idx'], num_low_actions)
+        lines.append(json.dumps(traj, sort_keys=True).encode('utf-8'))
+        dataset.append(task)
+    keys = [task_key(task) for task in dataset]
+    PreprocessedSplit(os.path.join(data, 'pp'), 'valid_seen').write(keys, lines, {key: {} for key in keys})
+    split_path = os.path.join(root, 'splits.json')
+    with open(split_path, 'w') as f:
+        json.dump({'base': dataset}, f)
+    return data, split_path, dataset
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    out = [fn(item) for item in items]
+    return (time.perf_counter() - start) * 1e3 / len(items), out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the task loading of EBAlfEnv resets.')
+    parser.add_argument('--tasks', type=int, default=50)
+    parser.add_argument('--low_actions', type=int, default=150)
+    parser.add_argument('--resets', type=int, default=3, help='resets per task')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='alfred_task_store_')
+    try:
+        data, split_path, dataset = write_tasks(root, args.tasks, args.low_actions, args.seed)
+        folder = os.path.join(root, 'task_store')
+        build_task_store('base', folder, split_path, data)
+        json_bytes = os.path.getsize(utils.task_json_path(dataset[0], data)) / len(dataset)
+        store_bytes = os.path.getsize(os.path.join(folder, 'base.bin')) / len(dataset)
+
+        # EBAlfEnv without the simulator
+        legacy = types.SimpleNamespace(task_store=None, data_path=split_path, down_sample_ratio=1.0)
+        legacy.load_task = lambda task: utils.load_task_json(task, data)
+        stored = types.SimpleNamespace(data_path=split_path, down_sample_ratio=1.0)
+        stored.load_task = lambda task: EBAlfEnv.load_task(stored, task)
+
+        print('{} tasks, {} resets each, {:.0f} KB json and {:.1f} KB packed per task'.format(
+            len(dataset), args.resets, json_bytes / 1024, store_bytes / 1024))
+        print('{:>14} {:>14} {:>10}'.format('', 'ms/reset', 'identical'))
+
+        start = time.perf_counter()
+        EBAlfEnv._load_dataset(legacy, 'base')
+        legacy_startup = (time.perf_counter() - start) * 1e3
+        resets = dataset * args.resets
+        ms, expected = timed(lambda task: EBAlfEnv.prepare_task(legacy, task), resets)
+        print('{:>14} {:>14.3f} {:>10}'.format('json', ms, ''))
+        expected = [compact_task(traj) for traj in expected]
+
+        start = time.perf_counter()
+        stored.task_store = TaskStore.open('base', folder, split_path, data, cache_size=len(dataset))
+        EBAlfEnv._load_dataset(stored, 'base')
+        store_startup = (time.perf_counter() - start) * 1e3
+        for label, items, reference in (('store, cold', dataset, expected[:len(dataset)]),
+                                        ('store, warm', resets, expected)):
+            ms, prepared = timed(lambda task: EBAlfEnv.prepare_task(stored, task), items)
+            print('{:>14} {:>14.3f} {:>10}'.format(label, ms, str(prepared == reference)))
+        print('startup: {:.2f} ms from splits.json, {:.2f} ms from the store index'.format(legacy_startup,
+                                                                                        store_startup))
+    finally:
+        shutil.rmtree(root)
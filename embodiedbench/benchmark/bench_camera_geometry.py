@@ -0,0 +1,151 @@
+"""
+Benchmark of the camera geometry of ``gen/utils/game_util`` on ALFRED frame sizes.
+
+Depth frames of 300x300 (the frames of the training data), 500x500 (``constants.SCREEN_WIDTH``)
+and 600x600 (``augment_trajectories.py``) are projected to world coordinates from the poses
+of an agent walking through a scene (4 rotations, horizons from -30 to 60 degrees). The
+previous ``depth_to_world_coordinates`` (grids, rotation matrix and its inverse rebuilt per
+frame, a [3, h*w] matrix product) is compared with ``depth_to_world_coordinates``, the same
+projection with the inverse rotation cached. The world points are projected back with
+``world_to_camera_coordinates``, and the grid bounds of ``--objects`` objects are computed per
+object and with ``get_objects_bounds``. It checks that the results agree within ``--atol``
+(bounds exactly).
+
+    python -m embodiedbench.benchmark.bench_camera_geometry --frames 100 --objects 100
+"""
+import time
+import argparse
+
+import numpy as np
+
+from embodiedbench.envs.eb_alfred.gen import constants
+from embodiedbench.envs.eb_alfred.gen.utils import game_util
+from embodiedbench.envs.eb_alfred.gen.utils.camera_geometry import CameraGeometry
+
+
+def legacy_rotation_matrix(pose):
+    sin_x = np.sin(-pose[3] * np.pi / 180)
+    cos_x = np.cos(-pose[3] * np.pi / 180)
+    x_rotation = np.matrix([
+        [1, 0, 0],
+        [0, cos_x, -sin_x],
+        [0, sin_x, cos_x]], dtype=np.float32)
+    sin_y = np.sin((-pose[2] % 4) * 90 * np.pi / 180)
+    cos_y = np.cos((-pose[2] % 4) * 90 * np.pi / 180)
+    y_rotation = np.matrix([
+        [cos_y, 0, sin_y],
+        [0, 1, 0],
+        [-sin_y, 0, cos_y]], dtype=np.float32)
+    return np.matmul(x_rotation, y_rotation)
+
+
+def legacy_depth_to_world(depth, pose, camera_height, focal_length):
+    height, width = depth.shape
+    x_points = np.arange(-width / 2, width / 2, dtype=depth.dtype)
+    x_vals = (depth * x_points / focal_length)
+
+    y_points = np.arange(height / 2, -height / 2, -1, dtype=depth.dtype)
+    y_vals = (depth.T * y_points / focal_length).T
+
+    z_vals = depth
+    xyz = np.stack((x_vals, y_vals, z_vals), axis=2) / (1000 * constants.AGENT_STEP_SIZE)
+    rotation_matrix = np.linalg.inv(legacy_rotation_matrix(pose))
+    xyz = np.array(np.dot(rotation_matrix, xyz.reshape(-1, 3).T).T).reshape(height, width, 3)
+    xzy = xyz[:, :, [0, 2, 1]]
+    xzy += np.array([pose[0], pose[1], camera_height])
+    return xzy
+
+
+def legacy_world_to_camera(coordinates, pose, camera_height, width, height, focal_length):
+    coordinates = coordinates.copy()
+    coordinates -= np.array([pose[0], pose[1], camera_height])
+    xyz = coordinates[:, [0, 2, 1]]
+    xyd = np.array(np.dot(legacy_rotation_matrix(pose), xyz.T).T)
+    xyd *= (1000 * constants.AGENT_STEP_SIZE)
+    depth = np.maximum(xyd[:, -1], 0.01)
+    x_points = xyd[:, 0] * focal_length / depth + width / 2
+    y_points = height - (xyd[:, 1] * focal_length / depth + height / 2)
+    return np.stack((x_points, y_points, depth)).T
+
+
+def legacy_object_bounds(obj, scene_bounds):
+    obj_bounds = np.array([obj['position']['x'], obj['position']['z'], obj['position']['x'], obj['position']['z']])
+    obj_bounds /= constants.AGENT_STEP_SIZE
+    obj_bounds = np.round(obj_bounds).astype(np.int32)
+    obj_bounds[[2, 3]] = np.maximum(obj_bounds[[2, 3]], obj_bounds[[0, 1]] + 1)
+    obj_bounds[[0, 2]] = np.clip(obj_bounds[[0, 2]], scene_bounds[0], scene_bounds[0] + scene_bounds[2])
+    obj_bounds[[1, 3]] = np.clip(obj_bounds[[1, 3]], scene_bounds[1], scene_bounds[1] + scene_bounds[3])
+    obj_bounds -= np.array(scene_bounds)[[0, 1, 0, 1]]
+    return obj_bounds
+
+
+def synthetic_depths(rng, num_frames, size):
+    # a floor plane and a few boxes in front of it, in mm
+    ys, xs = np.mgrid[:size, :size]
+    depths = []
+    for _ in range(num_frames):
+        depth = (1000 + 4000 * (1 - ys / size) + rng.normal(0, 5, (size, size))).astype(np.float32)
+        for _ in range(5):
+            y, x, s = rng.integers(0, size, size=3)
+            depth[y:y + s // 3, x:x + s // 3] = rng.uniform(500, 3000)
+        depths.append(depth)
+    return depths
+
+
+def walk(rng, num_frames):
+    return [(int(rng.integers(-20, 20)), int(rng.integers(-20, 20)), int(rng.integers(0, 4)),
+             int(rng.choice([-30, -15, 0, 15, 30, 45, 60]))) for _ in range(num_frames)]
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    out = [fn(*item) for item in items]
+    return (time.perf_counter() - start) * 1e3 / len(items), out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the camera geometry of game_util.')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--objects', type=int, default=100)
+    parser.add_argument('--atol', type=float, default=1e-3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    camera_height = constants.CAMERA_HEIGHT_OFFSET / constants.AGENT_STEP_SIZE
+    print('{} frames per size'.format(args.frames))
+    print('{:>8} {:>20} {:>12} {:>12} {:>10}'.format('size', '', 'ms/frame', 'max error', 'identical'))
+    for size in (300, 500, 600):
+        depths = synthetic_depths(rng, args.frames, size)
+        poses = walk(rng, args.frames)
+        focal_length = constants.FOCAL_LENGTH * size / constants.SCREEN_WIDTH
+        geometry = CameraGeometry(size, size)
+        frames = list(zip(depths, poses))
+
+        ms, expected = timed(lambda d, p: legacy_depth_to_world(d, p, camera_height, focal_length), frames)
+        print('{:>8} {:>20} {:>12.3f} {:>12} {:>10}'.format(size, 'depth, rebuilt', ms, '', ''))
+        ms, world = timed(lambda d, p: game_util.depth_to_world_coordinates(d, p, camera_height), frames)
+        error = max(float(np.abs(w - e).max()) for w, e in zip(world, expected))
+        print('{:>8} {:>20} {:>12.3f} {:>12.2e} {:>10}'.format(size, 'depth, game_util', ms, error,
+                                                                str(error <= args.atol)))
+
+        points = [(e.reshape(-1, 3)[::10].astype(np.float64), p) for e, p in zip(expected, poses)]
+        ms, expected = timed(lambda c, p: legacy_world_to_camera(c, p, camera_height, size, size, focal_length),
+                             points)
+        print('{:>8} {:>20} {:>12.3f} {:>12} {:>10}'.format(size, 'points, rebuilt', ms, '', ''))
+        ms, pixels = timed(lambda c, p: geometry.world_to_camera(c, p, camera_height), points)
+        error = max(float(np.abs(x - e).max()) for x, e in zip(pixels, expected))
+        print('{:>8} {:>20} {:>12.3f} {:>12.2e} {:>10}'.format(size, 'points, cached', ms, error,
+                                                                str(error <= args.atol)))
+
+    scene_bounds = [-20, -20, 40, 40]
+    objs = [{'position': {'x': float(x), 'y': 1.0, 'z': float(z)}}
+            for x, z in rng.uniform(-6, 6, size=(args.objects, 2))]
+    start = time.perf_counter()
+    expected = np.stack([legacy_object_bounds(obj, scene_bounds) for obj in objs])
+    per_object = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    bounds = game_util.get_objects_bounds(objs, scene_bounds)
+    batched = (time.perf_counter() - start) * 1e3
+    print('{} object bounds: {:.3f} ms per object, {:.3f} ms batched, identical {}'.format(
+        args.objects, per_object, batched, np.array_equal(bounds, expected)))
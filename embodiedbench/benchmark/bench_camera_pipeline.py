@@ -0,0 +1,174 @@
+"""
+Benchmark of the camera pipeline of ``Scene.get_observation`` on replayed sensor buffers.
+
+``ReplaySensor`` stands in for the pyrep ``VisionSensor``: it returns raw rgb, depth and
+mask buffers (synthetic ones, or buffers recorded from the simulator and passed with
+``--record`` as an npz of ``<camera>_rgb``, ``<camera>_depth``, ``<camera>_mask``,
+``<camera>_extrinsics``, ``<camera>_intrinsics``) and sleeps ``--readout_ms`` per buffer
+for the render and readback, which the simulator does with the GIL released. The five
+cameras are read with rgb, depth, point cloud and mask, once in sequence with the previous
+``get_rgb_depth``/``get_mask`` code and once through ``CameraPipeline``, and the outputs are
+compared array by array.
+
+The amsolver package needs pyrep, so the pipeline modules are loaded from their files.
+
+    python -m embodiedbench.benchmark.bench_camera_pipeline --size 256 --workers 0,1,2,4
+"""
+import os
+import time
+import argparse
+import importlib.util
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'envs', 'eb_manipulation', 'amsolver', 'backend')
+CAMERAS = ('left_shoulder', 'right_shoulder', 'overhead', 'wrist', 'front')
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BACKEND_DIR, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+camera_pipeline = _load('camera_pipeline')
+handle_mask = _load('handle_mask')
+
+
+def pointcloud_from_depth_and_camera_params(depth, extrinsics, intrinsics):
+    """Same computation as pyrep's VisionSensor.pointcloud_from_depth_and_camera_params."""
+    h, w = depth.shape
+    upc = np.stack(list(np.meshgrid(np.arange(w), np.arange(h))) + [np.ones((h, w))], axis=-1)
+    pc = upc * np.expand_dims(depth, -1)
+    C = np.expand_dims(extrinsics[:3, 3], 0).T
+    R_inv = extrinsics[:3, :3].T
+    cam_proj_mat = np.matmul(intrinsics, np.concatenate((R_inv, -np.matmul(R_inv, C)), -1))
+    cam_proj_mat_homo = np.concatenate([cam_proj_mat, [np.array([0, 0, 0, 1])]])
+    cam_proj_mat_inv = np.linalg.inv(cam_proj_mat_homo)[0:3]
+    pc_homo = np.concatenate((pc, np.ones((h, w, 1))), -1)
+    world = np.matmul(cam_proj_mat_inv, pc_homo.reshape(-1, 4).T).T
+    return world.reshape(h, w, 3)
+
+
+class ReplaySensor(object):
+    def __init__(self, rgb, depth, extrinsics, intrinsics, readout_s):
+        self._rgb, self._depth = rgb, depth
+        self._extrinsics, self._intrinsics = extrinsics, intrinsics
+        self._readout_s = readout_s
+
+    def handle_explicitly(self):
+        time.sleep(self._readout_s)
+
+    def capture_rgb(self):
+        time.sleep(self._readout_s)
+        return self._rgb.copy()
+
+    def capture_depth(self, in_meters=False):
+        time.sleep(self._readout_s)
+        return self._depth.copy()
+
+    def get_near_clipping_plane(self):
+        return 0.01
+
+    def get_far_clipping_plane(self):
+        return 4.5
+
+    def get_matrix(self):
+        return self._extrinsics
+
+    def get_intrinsic_matrix(self):
+        return self._intrinsics
+
+
+def synthetic_buffers(size, seed=0):
+    rng = np.random.default_rng(seed)
+    buffers = {}
+    for camera in CAMERAS:
+        handles = rng.integers(1, 1 << 20, size=(size // 8, size // 8)).repeat(8, 0).repeat(8, 1)
+        mask = np.stack([handles & 255, (handles >> 8) & 255, (handles >> 16) & 255], -1) / 255.
+        extrinsics = np.eye(4)
+        extrinsics[:3, 3] = rng.normal(size=3)
+        intrinsics = np.array([[-size, 0, size / 2], [0, -size, size / 2], [0, 0, 1.]])
+        buffers.update({
+            camera + '_rgb': rng.random((size, size, 3), dtype=np.float32),
+            camera + '_depth': rng.random((size, size), dtype=np.float32),
+            camera + '_mask': mask.astype(np.float32),
+            camera + '_extrinsics': extrinsics,
+            camera + '_intrinsics': intrinsics,
+        })
+    return buffers
+
+
+def make_sensors(buffers, readout_s):
+    cameras = [ReplaySensor(buffers[c + '_rgb'], buffers[c + '_depth'], buffers[c + '_extrinsics'],
+                            buffers[c + '_intrinsics'], readout_s) for c in CAMERAS]
+    masks = [ReplaySensor(buffers[c + '_mask'], None, None, None, readout_s) for c in CAMERAS]
+    return cameras, masks
+
+
+def sequential_observation(cameras, masks, decoders):
+    """Camera part of the previous get_observation (noise models are Identity)."""
+    def get_rgb_depth(sensor, depth_in_meters=False):
+        sensor.handle_explicitly()
+        rgb = np.clip((sensor.capture_rgb() * 255.).astype(np.uint8), 0, 255)
+        depth = sensor.capture_depth(depth_in_meters)
+        depth_m = depth
+        if not depth_in_meters:
+            near = sensor.get_near_clipping_plane()
+            far = sensor.get_far_clipping_plane()
+            depth_m = near + depth * (far - near)
+        pcd = pointcloud_from_depth_and_camera_params(depth_m, sensor.get_matrix(), sensor.get_intrinsic_matrix())
+        return rgb, depth, pcd
+
+    def get_mask(sensor, mask_fn):
+        sensor.handle_explicitly()
+        return mask_fn(sensor.capture_rgb())
+
+    return [get_rgb_depth(sensor) for sensor in cameras] + [get_mask(s, d) for s, d in zip(masks, decoders)]
+
+
+def pipeline_observation(pipeline, cameras, masks, decoders):
+    futures = [pipeline.read_camera(sensor, True, True, True, None, None, False) for sensor in cameras]
+    futures += [pipeline.read_mask(sensor, decoder) for sensor, decoder in zip(masks, decoders)]
+    return [future.result() for future in futures]
+
+
+def same_observation(a, b):
+    flat_a = [x for item in a for x in (item if isinstance(item, tuple) else (item,))]
+    flat_b = [x for item in b for x in (item if isinstance(item, tuple) else (item,))]
+    return len(flat_a) == len(flat_b) and all(np.array_equal(x, y) for x, y in zip(flat_a, flat_b))
+
+
+def timed(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parallel camera pipeline.')
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')], default=[0, 1, 2, 4])
+    parser.add_argument('--readout_ms', type=float, default=1.0, help='simulated readout time per buffer')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--record', type=str, default=None, help='npz of recorded sensor buffers')
+    args = parser.parse_args()
+
+    buffers = dict(np.load(args.record)) if args.record else synthetic_buffers(args.size)
+    cameras, masks = make_sensors(buffers, args.readout_ms / 1e3)
+    decoders = [handle_mask.HandleMaskDecoder() for _ in CAMERAS]
+    reference = sequential_observation(cameras, masks, decoders)
+    print('5 cameras (rgb, depth, point cloud, mask) at {}, readout {} ms per buffer, {} cpus'.format(
+        buffers['front_rgb'].shape[:2], args.readout_ms, os.cpu_count()))
+    sequential = timed(lambda: sequential_observation(cameras, masks, decoders), args.repeats)
+    print('{:>12} {:>16} {:>10}'.format('', 'ms/observation', 'identical'))
+    print('{:>12} {:>16.2f} {:>10}'.format('sequential', sequential * 1e3, ''))
+    for workers in args.workers:
+        pipeline = camera_pipeline.CameraPipeline(pointcloud_from_depth_and_camera_params, workers)
+        identical = same_observation(reference, pipeline_observation(pipeline, cameras, masks, decoders))
+        seconds = timed(lambda: pipeline_observation(pipeline, cameras, masks, decoders), args.repeats)
+        pipeline.close()
+        print('{:>12} {:>16.2f} {:>10}'.format('%d workers' % workers, seconds * 1e3, str(identical)))
@@ -0,0 +1,193 @@
+"""
+Benchmark of the indexed demo store against the directory walk of ``get_stored_demos``.
+
+A synthetic dataset is written in the layout of the data generator: every episode has the
+15 camera folders with one (empty) image per frame, and a ``low_dim_obs.pkl`` demo whose
+observations carry the joint, gripper and camera parameter arrays of a real recording.
+The benchmark times loading ``--amount`` random episodes per variation with the legacy
+walk (listing the episodes, ten camera folders per episode, unpickling every observation)
+and through ``demo_index.json`` plus the packed containers, cold (page cache dropped for
+the dataset files where the platform allows it) and warm, and checks that both return the
+same arrays.
+
+    python -m embodiedbench.benchmark.bench_demo_store --episodes 50 --frames 150
+"""
+import os
+import sys
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'envs', 'eb_manipulation'))
+from tools.demo_store import (CAMERA_FOLDERS, EPISODES_FOLDER, VARIATIONS_FOLDER, LOW_DIM_PICKLE, index_dataset,
+                              load_demo_index, indexed_episodes, load_low_dim, _indexes)
+
+CHECKED_FOLDERS = [folder for folder in CAMERA_FOLDERS if not folder.endswith('_mask')]
+ARRAY_FIELDS = ('joint_velocities', 'joint_positions', 'joint_forces', 'gripper_pose', 'gripper_matrix',
+                'gripper_joint_positions', 'gripper_touch_forces', 'task_low_dim_state')
+
+
+class Observation(object):
+    """Stand-in for amsolver.observation.Observation with the same attributes."""
+
+    def __init__(self, rng):
+        for camera in CAMERA_FOLDERS:
+            setattr(self, camera, None)
+        self.joint_velocities = rng.standard_normal(7)
+        self.joint_positions = rng.standard_normal(7)
+        self.joint_forces = rng.standard_normal(7)
+        self.gripper_open = float(rng.random() > 0.5)
+        self.gripper_pose = rng.standard_normal(7)
+        self.gripper_matrix = rng.standard_normal((4, 4))
+        self.gripper_joint_positions = rng.standard_normal(2)
+        self.gripper_touch_forces = rng.standard_normal(6)
+        self.task_low_dim_state = rng.standard_normal(120)
+        self.misc = {}
+        for camera in ('left_shoulder', 'right_shoulder', 'overhead', 'wrist', 'front'):
+            self.misc['%s_camera_extrinsics' % camera] = rng.standard_normal((4, 4))
+            self.misc['%s_camera_intrinsics' % camera] = rng.standard_normal((3, 3))
+            self.misc['%s_camera_near' % camera] = 0.01
+            self.misc['%s_camera_far' % camera] = 4.5
+        self.misc['executed_demo_joint_position_action'] = rng.standard_normal(9)
+        self.object_informations = {'object_%d' % i: {'pose': rng.standard_normal(7), 'visible': True}
+                                    for i in range(4)}
+
+
+class Demo(object):
+    def __init__(self, observations, random_seed=None):
+        self._observations = observations
+        self.random_seed = random_seed
+
+    def __len__(self):
+        return len(self._observations)
+
+    def __getitem__(self, i):
+        return self._observations[i]
+
+
+def make_dataset(root, tasks, variations, episodes, frames, seed=0):
+    rng = np.random.default_rng(seed)
+    for task in range(tasks):
+        for variation in range(variations):
+            episodes_path = os.path.join(root, 'task%d' % task, VARIATIONS_FOLDER % variation, EPISODES_FOLDER)
+            for episode in range(episodes):
+                example_path = os.path.join(episodes_path, 'episode%d' % episode)
+                for camera in CAMERA_FOLDERS:
+                    os.makedirs(os.path.join(example_path, camera))
+                    for i in range(frames):
+                        open(os.path.join(example_path, camera, '%d.png' % i), 'wb').close()
+                demo = Demo([Observation(rng) for _ in range(frames)], random_seed=episode)
+                with open(os.path.join(example_path, LOW_DIM_PICKLE), 'wb') as f:
+                    pickle.dump(demo, f)
+
+
+def load_legacy(examples_path, amount, rng):
+    """The walk of get_stored_demos before the index."""
+    examples = os.listdir(examples_path)
+    demos = []
+    for example in rng.choice(examples, amount, replace=False):
+        example_path = os.path.join(examples_path, example)
+        with open(os.path.join(example_path, LOW_DIM_PICKLE), 'rb') as f:
+            obs = pickle.load(f)
+        counts = [len(os.listdir(os.path.join(example_path, folder))) for folder in CHECKED_FOLDERS]
+        if any(count != len(obs) for count in counts):
+            raise RuntimeError('Broken dataset assumption')
+        demos.append(obs)
+    return demos
+
+
+def load_indexed(examples_path, amount, rng):
+    """The walk of get_stored_demos with the index and the packed containers."""
+    index = load_demo_index(os.path.dirname(examples_path))
+    entries = indexed_episodes(index, examples_path)
+    examples = list(entries)
+    demos = []
+    for example in rng.choice(examples, amount, replace=False):
+        entry = entries[example]
+        obs = load_low_dim(os.path.join(examples_path, example), entry)
+        if any(entry['images'].get(folder, 0) != len(obs) for folder in CHECKED_FOLDERS):
+            raise RuntimeError('Broken dataset assumption')
+        demos.append(obs)
+    return demos
+
+
+def drop_cache(root):
+    """Evict the dataset files from the page cache; False where posix_fadvise is missing."""
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    for folder, _, files in os.walk(root):
+        for name in files:
+            fd = os.open(os.path.join(folder, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def time_loads(root, load, amount, seed, cold):
+    if cold:
+        drop_cache(root)
+        _indexes.clear()
+    rng = np.random.RandomState(seed)
+    start = time.perf_counter()
+    demos = []
+    for task in sorted(os.listdir(root)):
+        task_root = os.path.join(root, task)
+        for variation in sorted(os.listdir(task_root)):
+            demos += load(os.path.join(task_root, variation, EPISODES_FOLDER), amount, rng)
+    seconds = time.perf_counter() - start
+    # touch every frame, as a training loop does, so the lazily mapped arrays are read too
+    start = time.perf_counter()
+    checksum = sum(float(obs.joint_positions[0] + obs.misc['front_camera_extrinsics'][0, 0])
+                   for demo in demos for obs in demo)
+    return seconds, time.perf_counter() - start, demos, checksum
+
+
+def same_demos(a, b):
+    for demo_a, demo_b in zip(a, b):
+        if len(demo_a) != len(demo_b) or demo_a.random_seed != demo_b.random_seed:
+            return False
+        for obs_a, obs_b in zip(demo_a, demo_b):
+            if obs_a.gripper_open != obs_b.gripper_open or obs_a.misc.keys() != obs_b.misc.keys():
+                return False
+            if not all(np.array_equal(getattr(obs_a, name), getattr(obs_b, name)) for name in ARRAY_FIELDS):
+                return False
+            if not all(np.array_equal(obs_a.misc[key], obs_b.misc[key]) for key in obs_a.misc):
+                return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the indexed demo store.')
+    parser.add_argument('--tasks', type=int, default=2)
+    parser.add_argument('--variations', type=int, default=2)
+    parser.add_argument('--episodes', type=int, default=50, help='episodes per variation')
+    parser.add_argument('--frames', type=int, default=150, help='frames per episode')
+    parser.add_argument('--amount', type=int, default=10, help='episodes loaded per variation')
+    parser.add_argument('--root', type=str, default=None, help='dataset folder, a temporary one by default')
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='eb_demo_store_')
+    try:
+        start = time.perf_counter()
+        make_dataset(root, args.tasks, args.variations, args.episodes, args.frames)
+        print('dataset: {} episodes x {} frames written in {:.1f}s'.format(
+            args.tasks * args.variations * args.episodes, args.frames, time.perf_counter() - start))
+        start = time.perf_counter()
+        index_dataset(root, pack=True)
+        print('index + pack: {:.1f}s'.format(time.perf_counter() - start))
+
+        print('{:>6} {:>14} {:>14} {:>14}'.format('', 'legacy load s', 'indexed load s', 'touch (idx) s'))
+        for cold in (True, False):
+            legacy, _, legacy_demos, legacy_sum = time_loads(root, load_legacy, args.amount, 0, cold)
+            indexed, touch, indexed_demos, indexed_sum = time_loads(root, load_indexed, args.amount, 0, cold)
+            print('{:>6} {:>14.3f} {:>14.3f} {:>14.3f}'.format('cold' if cold else 'warm', legacy, indexed, touch))
+        print('same episodes and arrays: {}'.format(legacy_sum == indexed_sum and same_demos(legacy_demos, indexed_demos)))
+    finally:
+        if args.root is None:
+            shutil.rmtree(root, ignore_errors=True)
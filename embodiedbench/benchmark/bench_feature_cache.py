@@ -0,0 +1,133 @@
+"""
+Benchmark of the Resnet feature extraction of ALFRED frames (``models/utils/extract_resnet.py``) on CPU.
+
+``--trajectories`` trajectories of 300x300 synthetic frames (``--min_frames`` to ``--max_frames``
+each) are written as PNGs to a temporary folder. The Resnet18 has random weights (nothing is
+downloaded), with the ALFRED transform and conv features. The previous extraction (one
+``featurize`` per trajectory, a ``feat_conv.pt`` each) is compared with the feature cache
+(``FeatureExtractor``: batches of ``--batch`` frames across trajectories, frames added to a
+``FeatureCache``), and with a second run over the filled cache, which featurizes nothing.
+Reported are the frames per second, the frames featurized, the time to load the features of
+every trajectory, and whether the cached features match the feature files within ``--atol``.
+
+    python -m embodiedbench.benchmark.bench_feature_cache --trajectories 40 --batch 32
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import models
+
+ALFRED_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs', 'eb_alfred')
+sys.path.append(ALFRED_ROOT)
+sys.path.append(os.path.join(ALFRED_ROOT, 'models'))
+
+from data.feature_store import FeatureCache
+from models.nn.resnet import Resnet, FeatureExtractor
+
+
+class Trunk(object):
+    def __init__(self):
+        model = models.resnet18(pretrained=False).eval()
+        self.model = nn.Sequential(*list(model.children())[:-2])
+
+    def extract(self, x):
+        return self.model(x)
+
+
+def small_resnet():
+    # Resnet without the download of the pretrained weights
+    resnet = Resnet.__new__(Resnet)
+    resnet.model_type, resnet.gpu = 'resnet18', False
+    resnet.resnet_model = Trunk()
+    resnet.transform = Resnet.get_default_transform()
+    return resnet
+
+
+def write_frames(data, num_trajectories, min_frames, max_frames, seed):
+    rng = np.random.default_rng(seed)
+    trajectories = {}
+    for t in range(num_trajectories):
+        trajectory = os.path.join('train', 'task_%03d' % t, 'trial_0')
+        folder = os.path.join(data, trajectory, 'raw_images')
+        os.makedirs(folder)
+        fimages = []
+        for i in range(int(rng.integers(min_frames, max_frames + 1))):
+            path = os.path.join(folder, '%09d.png' % i)
+            Image.fromarray(rng.integers(0, 256, size=(300, 300, 3), dtype=np.uint8)).save(path)
+            fimages.append(path)
+        trajectories[trajectory] = fimages
+    return trajectories
+
+
+def legacy_extract(resnet, data, trajectories, batch):
+    # the previous extract_resnet.py
+    for trajectory, fimages in trajectories.items():
+        feat = resnet.featurize([Image.open(f) for f in fimages], batch=batch)
+        torch.save(feat.cpu(), os.path.join(data, trajectory, 'feat_conv.pt'))
+    return sum(len(fimages) for fimages in trajectories.values())
+
+
+def cached_extract(resnet, cache, trajectories, batch):
+    extractor = FeatureExtractor(resnet, cache, batch=batch)
+    done = extractor.extract(((trajectory, i), f) for trajectory, fimages in trajectories.items()
+                             for i, f in enumerate(fimages))
+    for trajectory, fimages in trajectories.items():
+        if not cache.has(trajectory):
+            cache.seal(trajectory, len(fimages))
+    return done
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - start, out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Resnet feature cache of ALFRED frames.')
+    parser.add_argument('--trajectories', type=int, default=40)
+    parser.add_argument('--min_frames', type=int, default=5)
+    parser.add_argument('--max_frames', type=int, default=40)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    root = tempfile.mkdtemp(prefix='alfred_feature_cache_')
+    try:
+        data = os.path.join(root, 'data')
+        trajectories = write_frames(data, args.trajectories, args.min_frames, args.max_frames, args.seed)
+        num_frames = sum(len(fimages) for fimages in trajectories.values())
+        resnet = small_resnet()
+        cache_path = os.path.join(root, 'feat_cache')
+
+        print('{} trajectories, {} frames, batch {}'.format(len(trajectories), num_frames, args.batch))
+        print('{:>16} {:>10} {:>10} {:>12} {:>10} {:>12} {:>10}'.format(
+            '', 'seconds', 'frames/s', 'featurized', 'load s', 'max error', 'identical'))
+
+        seconds, done = timed(legacy_extract, resnet, data, trajectories, args.batch)
+        load, expected = timed(lambda: {t: torch.load(os.path.join(data, t, 'feat_conv.pt')) for t in trajectories})
+        print('{:>16} {:>10.2f} {:>10.1f} {:>12} {:>10.3f} {:>12} {:>10}'.format(
+            'per trajectory', seconds, num_frames / seconds, done, load, '', ''))
+
+        for label in ('cache', 'cache, rerun'):
+            # a new FeatureCache, as a new process would open it
+            cache = FeatureCache(cache_path)
+            seconds, done = timed(cached_extract, resnet, cache, trajectories, args.batch)
+            load, feats = timed(lambda c: {t: c.load(t) for t in trajectories}, FeatureCache(cache_path))
+            error = max(float((feats[t] - expected[t]).abs().max()) for t in trajectories)
+            print('{:>16} {:>10.2f} {:>10.1f} {:>12} {:>10.3f} {:>12.2e} {:>10}'.format(
+                label, seconds, num_frames / seconds, done, load, error, str(error <= args.atol)))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,89 @@
+"""
+Benchmark of the FF planner queries of ``PlanParser`` on the sample problem shipped with the planner.
+
+The planner has to be built first (``cd embodiedbench/envs/eb_alfred/gen/ff_planner && make``).
+``--episodes`` game states each plan ``--queries`` times, like trajectory generation replanning
+after every action. Each query is the sample problem under a new problem name, as written by
+``PlannedGameState.state_to_pddl``. Compared are the previous parser (a ``Pool(3)`` per game
+state, the problem written to a file for a fresh ff per solver type), the shared
+``PlannerService`` with the cache disabled (problems piped to ff's stdin), and the service with
+its plan cache. It checks that every query gets the same plan as the previous parser.
+
+    python -m embodiedbench.benchmark.bench_ff_planner --episodes 4 --queries 10
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+GEN_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs', 'eb_alfred', 'gen')
+sys.path.append(GEN_ROOT)
+
+from embodiedbench.envs.eb_alfred.gen.planner import ff_planner_handler
+
+DOMAIN = 'ff_planner/samples/PutTask_domain.pddl'
+PROBLEM = 'ff_planner/samples/problem_0_0.pddl'
+
+
+def problems(episodes, queries):
+    with open(PROBLEM) as f:
+        problem = f.read()
+    return [[problem.replace('plan_0_0', 'plan_%d_%d' % (e, q)) for q in range(queries)]
+            for e in range(episodes)]
+
+
+def legacy(episodes, folder):
+    plans = []
+    for e, episode in enumerate(episodes):
+        pool = multiprocessing.Pool(3)
+        for q, problem in enumerate(episode):
+            filepath = os.path.join(folder, 'problem_%d_%d.pddl' % (e, q))
+            with open(filepath, 'w') as f:
+                f.write(problem)
+            parsed_plans = pool.map(ff_planner_handler.get_plan_from_file,
+                                    zip([DOMAIN] * 3, [filepath] * 3, range(3, 6)))
+            plans.append(parsed_plans)
+        pool.terminate()
+        pool.join()
+    return plans
+
+
+def service(episodes, cache_size):
+    planner = ff_planner_handler.PlannerService(num_workers=3, cache_size=cache_size)
+    plans = [planner.solve(DOMAIN, problem) for episode in episodes for problem in episode]
+    planner.close()
+    return plans, planner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the FF planner queries.')
+    parser.add_argument('--episodes', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=10)
+    args = parser.parse_args()
+
+    os.chdir(GEN_ROOT)
+    if not os.path.exists('ff_planner/ff'):
+        sys.exit('build the planner first: cd %s/ff_planner && make' % GEN_ROOT)
+    ff_planner_handler.constants.DEBUG = False
+    episodes = problems(args.episodes, args.queries)
+    num_queries = args.episodes * args.queries
+    folder = tempfile.mkdtemp(prefix='ff_problems_')
+    try:
+        print('{} episodes x {} queries, 3 solver types per query'.format(args.episodes, args.queries))
+        print('{:>24} {:>10} {:>12} {:>10} {:>10}'.format('', 'seconds', 'ms/query', 'hits', 'identical'))
+        start = time.perf_counter()
+        expected = legacy(episodes, folder)
+        seconds = time.perf_counter() - start
+        print('{:>24} {:>10.2f} {:>12.1f} {:>10} {:>10}'.format('pool per state, files', seconds,
+                                                                 seconds * 1e3 / num_queries, '', ''))
+        for label, cache_size in (('shared pool, pipes', 0), ('shared pool, cache', 1000)):
+            start = time.perf_counter()
+            plans, planner = service(episodes, cache_size)
+            seconds = time.perf_counter() - start
+            print('{:>24} {:>10.2f} {:>12.1f} {:>10} {:>10}'.format(label, seconds, seconds * 1e3 / num_queries,
+                                                                     planner.hits, str(plans == expected)))
+    finally:
+        shutil.rmtree(folder)
@@ -0,0 +1,219 @@
+"""
+Benchmark of the ALFRED trajectory generation orchestration in ``gen/utils/generation_orchestrator``.
+
+THOR is replaced by a stub worker: starting the simulator sleeps ``--env_seconds``, a trial
+sleeps ``--trial_seconds``, fails with probability ``--fail_rate`` and writes ``--frames``
+synthetic 300x300 pngs. ``--units`` units each need ``--target`` successful trials. Compared
+are the previous scheme (``--workers`` independent processes that sample units on their own,
+see the others' successes only when they reload from disk every ``--reload_every`` trials and
+write their images synchronously) and ``WorkerPool`` with ``AsyncImageWriter`` (units handed
+out by the parent, one worker per unit at a time). Reported are units per hour and the
+successful trials beyond the target (duplicated work).
+
+The resume check kills a worker in the middle of a trial, resumes from the ``JobLedger`` and
+checks that every unit ends with exactly ``--target`` finished trials, on disk and in the
+ledger, and that no partial trial is left.
+
+    python -m embodiedbench.benchmark.bench_generation_orchestrator --units 24 --workers 4
+"""
+import os
+import glob
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import functools
+import multiprocessing as mp
+
+import cv2
+import numpy as np
+
+from embodiedbench.envs.eb_alfred.gen.utils.image_util import AsyncImageWriter
+from embodiedbench.envs.eb_alfred.gen.utils.generation_orchestrator import JobLedger, WorkerPool
+
+
+def synthetic_frames(num_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(num_frames):
+        frame = np.zeros((300, 300, 3), dtype=np.uint8)
+        frame[:] = rng.integers(0, 256, size=3)
+        for _ in range(20):
+            y, x = rng.integers(0, 280, size=2)
+            frame[y:y + rng.integers(5, 60), x:x + rng.integers(5, 60)] = rng.integers(0, 256, size=3)
+        frames.append(frame)
+    return frames
+
+
+def unit_dir(save_path, unit):
+    return os.path.join(save_path, 'unit_%03d' % unit)
+
+
+def successes_on_disk(save_path, unit):
+    return len(glob.glob(os.path.join(unit_dir(save_path, unit), 'trial_*')))
+
+
+class StubWorker(object):
+    '''
+    stands in for TrajectoryWorker: a simulator start, then trials that sleep and write frames
+    '''
+
+    def __init__(self, args, save_path, write=None, crash_after=None):
+        time.sleep(args.env_seconds)
+        random.seed(os.getpid())
+        self.args = args
+        self.save_path = save_path
+        self.frames = synthetic_frames(args.frames)
+        self.ledger = JobLedger(save_path)
+        self.writer = AsyncImageWriter()
+        self.write = write or self.writer.save
+        self.crash_after = crash_after
+        self.trials = 0
+
+    def trial(self, unit):
+        '''
+        one trial of unit, returns its folder if it succeeded (else it is deleted)
+        '''
+        path = os.path.join(unit_dir(self.save_path, unit), 'trial_%d_%d' % (os.getpid(), self.trials))
+        images = os.path.join(path, 'raw_images')
+        os.makedirs(images)
+        self.trials += 1
+        self.ledger.record((unit,), 'claimed', trial=path, path=path)
+        for i, frame in enumerate(self.frames):
+            if self.crash_after is not None and self.trials > self.crash_after and i == len(self.frames) // 2:
+                os._exit(1)
+            self.write(images, frame)
+            time.sleep(self.args.trial_seconds / len(self.frames))
+        if random.random() < self.args.fail_rate:
+            self.writer.discard(path)
+            shutil.rmtree(path)
+            self.ledger.record((unit,), 'failed', trial=path)
+            return None
+        self.writer.flush()
+        self.ledger.record((unit,), 'done', trial=path)
+        return path
+
+    def run(self, job):
+        successes = 0
+        while successes < job['target']:
+            if self.trial(job['unit'][0]) is not None:
+                successes += 1
+        return {'successes': successes}
+
+
+def sync_write(folder, image):
+    im_ind = len(glob.glob(folder + '/*.png'))
+    cv2.imwrite(folder + '/%09d.png' % im_ind, image)
+    return im_ind
+
+
+def legacy_process(args, save_path, seed):
+    # the previous parallel_main: every process runs the whole generation loop on its own
+    random.seed(seed)
+    worker = StubWorker(args, save_path, write=sync_write)
+    full = set()
+    trials = 0
+    while len(full) < args.units:
+        if trials % args.reload_every == 0:
+            full = set(u for u in range(args.units) if successes_on_disk(save_path, u) >= args.target)
+        unit = random.choice([u for u in range(args.units) if u not in full])
+        successes = 0
+        while successes < args.target:
+            trials += 1
+            if worker.trial(unit) is not None:
+                successes += 1
+            if successes_on_disk(save_path, unit) >= args.target:
+                break
+        full.add(unit)
+
+
+def run_legacy(args, save_path):
+    procs = [mp.Process(target=legacy_process, args=(args, save_path, seed)) for seed in range(args.workers)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+
+def run_pool(args, save_path, crash_after=None):
+    '''
+    generates the units that are not done in the ledger, returns the number of unfinished trials removed
+    '''
+    ledger = JobLedger(save_path)
+    done, failed, exhausted, unfinished = ledger.state()
+    for trial, (unit, path) in unfinished.items():
+        if path is not None and os.path.exists(path):
+            shutil.rmtree(path)
+        ledger.record(unit, 'failed', trial=trial, error='unfinished')
+    remaining = {u: args.target - len(done.get((u,), ())) for u in range(args.units)}
+    todo = [u for u in range(args.units) if remaining[u] > 0]
+
+    def next_job():
+        if not todo:
+            return None
+        unit = todo.pop()
+        return {'unit': (unit,), 'target': remaining[unit]}
+
+    def on_result(job, result):
+        if 'error' in result and crash_after is None:
+            todo.append(job['unit'][0])
+
+    pool = WorkerPool(functools.partial(StubWorker, args, save_path, crash_after=crash_after), args.workers,
+                      poll_seconds=0.1)
+    try:
+        pool.run(next_job, on_result)
+    finally:
+        pool.close()
+    return len(unfinished)
+
+
+def overshoot(args, save_path):
+    return sum(successes_on_disk(save_path, u) for u in range(args.units)) - args.units * args.target
+
+
+def resume_check(args, save_path):
+    # first run: every worker dies in the middle of its third trial
+    run_pool(args, save_path, crash_after=2)
+    removed = run_pool(args, save_path)
+    done = JobLedger(save_path).state()[0]
+    on_disk = set(glob.glob(os.path.join(save_path, 'unit_*', 'trial_*')))
+    in_ledger = set(trial for trials in done.values() for trial in trials)
+    exact = (all(len(done.get((u,), ())) == args.target for u in range(args.units))
+             and on_disk == in_ledger
+             and all(len(glob.glob(os.path.join(t, 'raw_images', '*.png'))) == args.frames for t in on_disk))
+    return removed, exact
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ALFRED trajectory generation orchestration.')
+    parser.add_argument('--units', type=int, default=24)
+    parser.add_argument('--target', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--env_seconds', type=float, default=2.0)
+    parser.add_argument('--trial_seconds', type=float, default=0.5)
+    parser.add_argument('--fail_rate', type=float, default=0.3)
+    parser.add_argument('--reload_every', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{} units x {} trials, {} workers, {} frames per trial'.format(args.units, args.target, args.workers,
+                                                                       args.frames))
+    print('{:>24} {:>10} {:>12} {:>12}'.format('', 'seconds', 'units/hour', 'overshoot'))
+    for label, run in (('processes, sync writes', run_legacy), ('pool, async writes', run_pool)):
+        save_path = tempfile.mkdtemp(prefix='gen_orchestrator_')
+        try:
+            start = time.perf_counter()
+            run(args, save_path)
+            seconds = time.perf_counter() - start
+            print('{:>24} {:>10.1f} {:>12.1f} {:>12}'.format(label, seconds, args.units * 3600 / seconds,
+                                                             overshoot(args, save_path)))
+        finally:
+            shutil.rmtree(save_path)
+
+    save_path = tempfile.mkdtemp(prefix='gen_orchestrator_')
+    try:
+        removed, exact = resume_check(args, save_path)
+        print('resume after crash: {} unfinished trials removed, exact completion {}'.format(removed, exact))
+    finally:
+        shutil.rmtree(save_path)
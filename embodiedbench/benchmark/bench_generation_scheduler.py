@@ -0,0 +1,190 @@
+"""
+Benchmark of the manipulation data generation scheduler with a stubbed simulator.
+
+``StubGenerator`` replaces the amsolver ``Environment``: launching sleeps like a simulator
+start, and every unit sleeps for a duration drawn per variation (some variations are much
+slower than others) and writes a few files. The benchmark reports units per second of
+``run_generation`` for a growing number of workers, next to the previous scheme (one
+variation per worker at a time, handed out under a Manager lock, every save under one
+global file lock). It then kills the workers of a run half way and checks that the next
+run generates exactly the missing units.
+
+    python -m embodiedbench.benchmark.bench_generation_scheduler --workers 1,2,4,8
+"""
+import os
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import multiprocessing as mp
+
+from embodiedbench.envs.eb_manipulation.tools.generation_scheduler import (
+    WorkUnit, UnitGenerator, UnitFailed, run_generation, enumerate_units, unit_path, PROGRESS_FILE)
+
+
+def make_tasks(num_tasks, variations):
+    return [type('StubTask{}'.format(i), (), {'variations': variations}) for i in range(num_tasks)]
+
+
+class _StubEnv:
+    def shutdown(self):
+        pass
+
+
+class StubGenerator(UnitGenerator):
+    def __init__(self, episodes=5, unit_seconds=0.01, slow_fraction=0.2, slow_factor=8.0, launch_seconds=0.05,
+                 file_kb=64, failing_variation=None, crash_after=None):
+        self.episodes = episodes
+        self.unit_seconds = unit_seconds
+        self.slow_fraction = slow_fraction
+        self.slow_factor = slow_factor
+        self.launch_seconds = launch_seconds
+        self.payload = os.urandom(file_kb * 1024)
+        self.failing_variation = failing_variation
+        self.crash_after = crash_after
+        self._generated = 0
+
+    def launch(self):
+        time.sleep(self.launch_seconds)
+        return _StubEnv()
+
+    def variation_count(self, env, task):
+        return task.variations
+
+    def episodes_per_variation(self, task, variation_count):
+        return self.episodes
+
+    def unit_duration(self, task_name, variation):
+        rng = random.Random('{}/{}'.format(task_name, variation))
+        slow = rng.random() < self.slow_fraction
+        return self.unit_seconds * (self.slow_factor if slow else 1.0)
+
+    def generate(self, env, task, unit, path):
+        if self.crash_after is not None and self._generated >= self.crash_after:
+            os._exit(1)
+        if (unit.task_name, unit.variation) == self.failing_variation:
+            raise UnitFailed('stub failure')
+        time.sleep(self.unit_duration(unit.task_name, unit.variation))
+        for name in ('configs.pkl', 'task_base.ttm', 'waypoint_sets.ttm'):
+            with open(os.path.join(path, name), 'wb') as f:
+                f.write(self.payload)
+        self._generated += 1
+
+
+def _legacy_worker(generator, tasks, variation_counts, save_path, lock, task_index, variation_count, file_lock):
+    """Scheduling loop of the previous ``run``: one whole variation at a time, saves under a global lock."""
+    generator.launch()
+    while True:
+        with lock:
+            if task_index.value >= len(tasks):
+                break
+            my_variation = variation_count.value
+            if my_variation >= variation_counts[task_index.value]:
+                variation_count.value = my_variation = 0
+                task_index.value += 1
+            variation_count.value += 1
+            if task_index.value >= len(tasks):
+                break
+            task = tasks[task_index.value]
+            current_task = task_index.value
+        name = generator.task_name(task)
+        for episode in range(generator.episodes):
+            unit = WorkUnit(current_task, name, my_variation, episode)
+            time.sleep(generator.unit_duration(name, my_variation))
+            path = unit_path(save_path, unit)
+            with file_lock:
+                os.makedirs(path, exist_ok=True)
+                for file_name in ('configs.pkl', 'task_base.ttm', 'waypoint_sets.ttm'):
+                    with open(os.path.join(path, file_name), 'wb') as f:
+                        f.write(generator.payload)
+
+
+def run_legacy(generator, tasks, save_path, num_workers):
+    variation_counts = [task.variations for task in tasks]
+    manager = mp.Manager()
+    lock, file_lock = manager.Lock(), manager.Lock()
+    task_index, variation_count = manager.Value('i', 0), manager.Value('i', 0)
+    processes = [mp.Process(target=_legacy_worker, args=(generator, tasks, variation_counts, save_path, lock,
+                                                         task_index, variation_count, file_lock))
+                 for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def count_done(save_path, units):
+    return sum(os.path.isdir(unit_path(save_path, unit)) for unit in units)
+
+
+def check_resume(generator, tasks, workers):
+    """Interrupt a run, resume it and verify that every unit was generated exactly once."""
+    save_path = tempfile.mkdtemp(prefix='eb_gen_resume_')
+    try:
+        counts = [task.variations for task in tasks]
+        units = enumerate_units(generator, tasks, counts)
+        generator.crash_after = max(1, len(units) // (2 * workers))
+        run_generation(generator, tasks, save_path, workers, variation_counts=counts)
+        interrupted = count_done(save_path, units)
+        generator.crash_after = None
+        generated, _ = run_generation(generator, tasks, save_path, workers, variation_counts=counts)
+        done = {}
+        with open(os.path.join(save_path, PROGRESS_FILE)) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['status'] == 'done':
+                    key = (record['task'], record['variation'], record['episode'])
+                    done[key] = done.get(key, 0) + 1
+        leftovers = [name for root, dirs, files in os.walk(save_path) for name in dirs if '.tmp-' in name]
+        return {
+            'units': len(units),
+            'done_before_interrupt': interrupted,
+            'generated_on_resume': generated,
+            'complete': count_done(save_path, units) == len(units),
+            'generated_exactly_once': len(done) == len(units) and all(v == 1 for v in done.values()),
+            'temporary_leftovers': len(leftovers),
+        }
+    finally:
+        shutil.rmtree(save_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the work-stealing generation scheduler.')
+    parser.add_argument('--tasks', type=int, default=6)
+    parser.add_argument('--variations', type=int, default=4)
+    parser.add_argument('--episodes', type=int, default=5, help='episodes per variation')
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')], default=[1, 2, 4, 8])
+    parser.add_argument('--unit_seconds', type=float, default=0.02)
+    parser.add_argument('--slow_fraction', type=float, default=0.2)
+    parser.add_argument('--slow_factor', type=float, default=8.0)
+    parser.add_argument('--skip_legacy', action='store_true')
+    args = parser.parse_args()
+
+    tasks = make_tasks(args.tasks, args.variations)
+    generator = StubGenerator(episodes=args.episodes, unit_seconds=args.unit_seconds,
+                              slow_fraction=args.slow_fraction, slow_factor=args.slow_factor)
+    counts = [task.variations for task in tasks]
+    num_units = len(enumerate_units(generator, tasks, counts))
+    print('{} units ({} tasks x {} variations x {} episodes)'.format(num_units, args.tasks, args.variations, args.episodes))
+    print('{:>8} {:>16} {:>16}'.format('workers', 'scheduler u/s', 'legacy u/s'))
+    for workers in args.workers:
+        rates = []
+        for legacy in (False, True):
+            if legacy and args.skip_legacy:
+                rates.append(float('nan'))
+                continue
+            save_path = tempfile.mkdtemp(prefix='eb_gen_bench_')
+            start = time.perf_counter()
+            if legacy:
+                run_legacy(generator, tasks, save_path, workers)
+            else:
+                run_generation(generator, tasks, save_path, workers, variation_counts=counts)
+            seconds = time.perf_counter() - start
+            assert count_done(save_path, enumerate_units(generator, tasks, counts)) == num_units
+            shutil.rmtree(save_path, ignore_errors=True)
+            rates.append(num_units / seconds)
+        print('{:>8} {:>16.1f} {:>16.1f}'.format(workers, rates[0], rates[1]))
+
+    print(json.dumps(check_resume(generator, tasks, max(args.workers)), indent=2))
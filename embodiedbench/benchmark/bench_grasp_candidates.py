@@ -0,0 +1,116 @@
+"""
+Benchmark of the vectorized grasp candidate search of Grasploc on synthetic point clouds.
+
+Points are sampled on the surface of a box the size of the task objects. For every cloud
+size the full ``Grasploc.find_grasp1`` search is timed (sample down-sampling, normal
+estimation, candidate counting, selection), and on a subset of the grasp samples the
+candidate counts are compared against the per-candidate loop of the original search
+(kept here as the reference, with scipy's kd-tree in place of open3d's).
+
+    python -m embodiedbench.benchmark.bench_grasp_candidates --sizes 10000,100000,1000000
+"""
+import os
+import sys
+import time
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'envs', 'eb_manipulation'))
+from tools.grasploc import (FINGER_PERCENTS, Grasploc, define_default_args, voxel_down_sample, estimate_normals,
+                            grasp_candidates)
+
+
+def box_surface(num_points, size=(0.05, 0.04, 0.1), noise=1e-5, seed=0):
+    # the noise keeps points off the exact finger boundaries: with the largest finger percent a centroid lies
+    # exactly finger_length/2 from the face it was sampled on, and the counts then depend on rounding
+    rng = np.random.default_rng(seed)
+    size = np.asarray(size)
+    areas = np.array([size[1] * size[2], size[0] * size[2], size[0] * size[1]] * 2)
+    faces = rng.choice(6, size=num_points, p=areas / areas.sum())
+    points = (rng.random((num_points, 3)) - 0.5) * size
+    axis = faces % 3
+    points[np.arange(num_points), axis] = np.where(faces < 3, 0.5, -0.5) * size[axis]
+    return points + rng.normal(scale=noise, size=points.shape)
+
+
+def reference_candidates(points, tree, samples, sample_normals, args):
+    """Counts of the original find_grasp1 loop, in its candidate order."""
+    ft, fd, fw, fl = args.finger_thickness, args.finger_max_distance, args.finger_width, args.finger_length
+    radius = np.sqrt(ft**2 + (fd + 2*fw)**2 + fl**2) / 2
+    n_between, n_around = [], []
+    for pt, nm in zip(samples, sample_normals):
+        for normal in [nm, -nm]:
+            normal = normal / np.linalg.norm(normal)
+            for f_p in FINGER_PERCENTS:
+                centroid = pt + fl*f_p * normal
+                tmp = np.array([1, 0, 0])
+                principal = tmp - np.dot(tmp, normal) * normal
+                principal = principal / np.linalg.norm(principal)
+                theta = np.pi * 2 / args.rotation_sample
+                principals = [np.cos(i*theta) * principal + np.sin(i*theta) * np.cross(principal, normal) for i in range(args.rotation_sample)]
+                principals = [p / np.linalg.norm(p) for p in principals]
+                idx = np.asarray(tree.query_ball_point(centroid, r=radius), dtype=np.intp)
+                idx = idx[np.argsort(np.sum((points[idx] - centroid)**2, axis=1), kind='stable')]
+                pt_offset = points[idx[1:], :] - centroid
+                for principal in principals:
+                    cross = np.cross(normal, principal)
+                    between_conditions = [np.abs(pt_offset @ normal) < fl / 2, np.abs(pt_offset @ principal) < ft / 2, np.abs(pt_offset @ cross) < fd / 2]
+                    around_conditions = [pt_offset @ normal < fl / 2, pt_offset @ normal > -fl / 2 - fw, np.abs(pt_offset @ principal) < ft / 2, np.abs(pt_offset @ cross) < fd / 2 + fw]
+                    between = np.sum(np.bitwise_and.reduce(between_conditions))
+                    n_between.append(between)
+                    n_around.append(np.sum(np.bitwise_and.reduce(around_conditions)) - between)
+    return np.asarray(n_between), np.asarray(n_around)
+
+
+def run_search(points):
+    args = define_default_args([])
+    gl = Grasploc(args)
+    gl.pcd = SimpleNamespace(points=points)
+    gl.crop_factor = 1.0
+    start = time.perf_counter()
+    gl.find_grasp1()
+    return time.perf_counter() - start, len(gl.grasp_points)
+
+
+def compare(points, num_samples, seed=0):
+    args = define_default_args([])
+    tree = cKDTree(points)
+    samples = voxel_down_sample(points, args.grasp_sample_voxel_size)
+    samples = samples[np.random.default_rng(seed).choice(len(samples), size=min(num_samples, len(samples)), replace=False)]
+    normals = estimate_normals(points, samples, tree=tree)
+    start = time.perf_counter()
+    candidates = grasp_candidates(points, tree, samples, normals, args.finger_thickness, args.finger_max_distance,
+                                  args.finger_width, args.finger_length, args.rotation_sample)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    n_between, n_around = reference_candidates(points, tree, samples, normals, args)
+    reference = time.perf_counter() - start
+    return {
+        'samples': len(samples),
+        'candidates': len(n_between),
+        'between_mismatch': int(np.sum(candidates.n_between != n_between)),
+        'around_mismatch': int(np.sum(candidates.n_around != n_around)),
+        'vectorized_s': vectorized,
+        'reference_s': reference,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the vectorized grasp candidate search.')
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')], default=[10000, 100000, 1000000])
+    parser.add_argument('--compare_samples', type=int, default=50, help='grasp samples checked against the reference loop')
+    parser.add_argument('--compare_max_points', type=int, default=100000, help='largest cloud checked against the reference')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        points = box_surface(size)
+        seconds, num_grasps = run_search(points)
+        print('{:>8} points: find_grasp1 {:>7.2f}s, {} grasps'.format(size, seconds, num_grasps))
+        if size <= args.compare_max_points:
+            result = compare(points, args.compare_samples)
+            print('          {samples} samples, {candidates} candidates: vectorized {vectorized_s:.2f}s, '
+                  'reference loop {reference_s:.2f}s ({speedup:.0f}x), count mismatches {between_mismatch}/{around_mismatch}'.format(
+                      speedup=result['reference_s'] / max(result['vectorized_s'], 1e-9), **result))
@@ -0,0 +1,192 @@
+"""
+Import-time regression benchmark for the entry points.
+
+Every entry point is imported in a fresh interpreter started with ``python -X importtime``.
+The benchmark reports the wall time of the import, the peak RSS of the interpreter, the
+packages with the highest self import time and which heavy dependencies (provider SDKs,
+simulators, detectors) were loaded. Heavy dependencies are supposed to be imported on
+first use; an entry point that loads one that is not in its allow list is a regression.
+
+    python -m embodiedbench.benchmark.bench_import_time
+    python -m embodiedbench.benchmark.bench_import_time --output import_time.json
+    python -m embodiedbench.benchmark.bench_import_time --baseline import_time.json
+
+The exit status is 1 if an entry point loads a heavy package it must not, or takes longer
+to import than its budget in ``IMPORT_BUDGETS_MS`` (scaled by ``--budget_scale`` on slower
+machines). With ``--baseline`` it is also 1 if an entry point got slower than the baseline
+by more than ``--tolerance`` (relative) plus ``--slack_ms``. Entry points whose dependencies
+are not installed are reported and skipped.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+HEAVY_PACKAGES = ('torch', 'ultralytics', 'habitat', 'habitat_sim', 'ai2thor', 'pyrep', 'amsolver',
+                  'openai', 'anthropic', 'google.generativeai', 'lmdeploy')
+
+# entry point -> heavy packages it is allowed to load at import time
+ENTRY_POINTS = {
+    'embodiedbench.main': (),
+    'embodiedbench.evaluator.summarize_result': (),
+    'embodiedbench.evaluator.results_warehouse': (),
+    'embodiedbench.planner.planner_utils': (),
+    'embodiedbench.planner.remote_model': (),
+    'embodiedbench.planner.vlm_planner': (),
+    'embodiedbench.planner.nav_planner': (),
+    'embodiedbench.planner.manip_planner_re': (),
+    'embodiedbench.planner.manip_planner': (),
+    'embodiedbench.evaluator.eb_alfred_evaluator': (),
+    'embodiedbench.evaluator.eb_habitat_evaluator': (),
+    'embodiedbench.evaluator.eb_navigation_evaluator': (),
+    'embodiedbench.evaluator.eb_manipulation_evaluator': (),
+    'embodiedbench.evaluator.eb_manipulation_evaluator_re': (),
+}
+
+# entry point -> median import time budget in milliseconds
+IMPORT_BUDGETS_MS = {
+    'embodiedbench.main': 800,
+    'embodiedbench.evaluator.summarize_result': 100,
+    'embodiedbench.evaluator.results_warehouse': 100,
+    'embodiedbench.planner.planner_utils': 400,
+    'embodiedbench.planner.remote_model': 400,
+    'embodiedbench.planner.vlm_planner': 600,
+    'embodiedbench.planner.nav_planner': 600,
+    'embodiedbench.planner.manip_planner_re': 900,
+    'embodiedbench.planner.manip_planner': 900,
+    'embodiedbench.evaluator.eb_alfred_evaluator': 1200,
+    'embodiedbench.evaluator.eb_habitat_evaluator': 1200,
+    'embodiedbench.evaluator.eb_navigation_evaluator': 1200,
+    'embodiedbench.evaluator.eb_manipulation_evaluator': 1200,
+    'embodiedbench.evaluator.eb_manipulation_evaluator_re': 1200,
+}
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+_CHILD = '''
+import sys, json, time, resource
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds,
+                  'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def parse_importtime(stderr):
+    """Self import time in microseconds per top-level package, from ``-X importtime`` output."""
+    self_us = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        self_us[fields[2].strip().split('.')[0]] += int(fields[0])
+    return dict(self_us)
+
+
+def import_once(module, workdir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([REPO_ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    # run outside the repository: importing embodiedbench.main creates a 'data' link in the cwd
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD.format(module=module, heavy=HEAVY_PACKAGES)],
+                          cwd=workdir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+        return {'error': errors[-1] if errors else 'exit status {}'.format(proc.returncode)}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['packages_us'] = parse_importtime(proc.stderr)
+    return result
+
+
+def measure(module, repeat=3, top=8):
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = [import_once(module, workdir) for _ in range(repeat)]
+    if 'error' in runs[0]:
+        return {'error': runs[0]['error']}
+    seconds = np.asarray([run['seconds'] for run in runs])
+    packages = defaultdict(list)
+    for run in runs:
+        for name, us in run['packages_us'].items():
+            packages[name].append(us)
+    packages = {name: float(np.median(values)) / 1000 for name, values in packages.items()}
+    allowed = ENTRY_POINTS.get(module, ())
+    return {
+        'median_ms': float(np.median(seconds) * 1000),
+        'min_ms': float(seconds.min() * 1000),
+        'maxrss_mb': max(run['maxrss_kb'] for run in runs) / 1024,
+        'heavy': runs[-1]['heavy'],
+        'unexpected_heavy': [name for name in runs[-1]['heavy'] if name.split('.')[0] not in allowed],
+        'top_packages_ms': dict(sorted(packages.items(), key=lambda item: -item[1])[:top]),
+    }
+
+
+def find_regressions(report, baseline, tolerance=0.25, slack_ms=50.0, budget_scale=1.0):
+    regressions = []
+    for module, result in report.items():
+        if 'error' in result:
+            continue
+        if result['unexpected_heavy']:
+            regressions.append('{} imports {}'.format(module, ', '.join(result['unexpected_heavy'])))
+        budget = IMPORT_BUDGETS_MS.get(module)
+        if budget is not None and result['median_ms'] > budget * budget_scale:
+            regressions.append('{} takes {:.0f} ms to import, budget {:.0f} ms'.format(
+                module, result['median_ms'], budget * budget_scale))
+        previous = (baseline or {}).get(module)
+        if not previous or 'error' in previous:
+            continue
+        limit = previous['median_ms'] * (1 + tolerance) + slack_ms
+        if result['median_ms'] > limit:
+            regressions.append('{} takes {:.0f} ms to import, baseline {:.0f} ms'.format(
+                module, result['median_ms'], previous['median_ms']))
+    return regressions
+
+
+def format_report(report, baseline=None):
+    lines = ['{:<52} {:>10} {:>10} {:>10} {:>9}  {}'.format('entry point', 'median ms', 'budget', 'baseline', 'rss MB',
+                                                          'heavy packages')]
+    for module, result in report.items():
+        if 'error' in result:
+            lines.append('{:<52} skipped: {}'.format(module, result['error']))
+            continue
+        previous = (baseline or {}).get(module) or {}
+        lines.append('{:<52} {:>10.0f} {:>10} {:>10} {:>9.0f}  {}'.format(
+            module, result['median_ms'], IMPORT_BUDGETS_MS.get(module, '-'),
+            '{:.0f}'.format(previous['median_ms']) if 'median_ms' in previous else '-',
+            result['maxrss_mb'], ', '.join(result['heavy']) or '-'))
+        lines.append('    ' + ', '.join('{} {:.0f}'.format(name, ms) for name, ms in result['top_packages_ms'].items()))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import time of the entry points.')
+    parser.add_argument('--modules', type=lambda s: s.split(','), default=list(ENTRY_POINTS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8, help='packages listed per entry point')
+    parser.add_argument('--output', type=str, default=None, help='write the report as json, usable as baseline')
+    parser.add_argument('--baseline', type=str, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--slack_ms', type=float, default=50.0, help='allowed absolute slowdown')
+    parser.add_argument('--budget_scale', type=float, default=1.0, help='scale of the import time budgets')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    report = {module: measure(module, args.repeat, args.top) for module in args.modules}
+    print(format_report(report, baseline))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    regressions = find_regressions(report, baseline, args.tolerance, args.slack_ms, args.budget_scale)
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,139 @@
+"""
+Benchmark of the per-step object queries of ``GameStateBase`` on instance segmentation frames.
+
+Every step queries ``--objects`` objects of a frame, the way ``get_ll_discrete_action`` and
+``check_obj_visibility`` do during trajectory generation: the interaction point, the compressed
+mask and the number of visible pixels of each object. The previous queries (one ``cv2.inRange``
+over the whole frame per query, visible pixels from a full mask) are compared with the
+``GameStateBase`` methods reading from the per-frame ``InstanceIndex`` (built once per step and
+included in the timing). It checks that both give the same points, masks and pixel counts.
+
+Frames are the ``instance_masks/*.png`` recorded by ``augment_trajectories.py`` (``--frames``),
+or synthetic frames of filled ellipses and rectangles of random colors otherwise.
+
+    python -m embodiedbench.benchmark.bench_instance_index --frames data/full_2.1.0/train/*/*/instance_masks --objects 8
+"""
+import os
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from embodiedbench.envs.eb_alfred.gen import constants
+from embodiedbench.envs.eb_alfred.gen.game_states.game_state_base import GameStateBase
+from embodiedbench.envs.eb_alfred.gen.utils.image_util import compress_mask
+
+
+def legacy_point_of_obj(instance_seg_frame, color):
+    seg_mask = cv2.inRange(instance_seg_frame, color, color)
+    nz_rows, nz_cols = np.nonzero(seg_mask)
+    x0, y0, xmax, ymax = min(nz_cols), min(nz_rows), max(nz_cols), max(nz_rows)
+    cx = int((xmax - x0) / 2 + x0)
+    cy = int((ymax - y0) / 2 + y0)
+    if seg_mask[cy, cx] == 0:
+        non_zero_coords = zip(nz_cols, nz_rows)
+        dist = lambda a, b: (a[0]-b[0])**2 + (a[1]-b[1])**2
+        cx, cy = min(non_zero_coords, key=lambda co: dist(co, (cx, cy)))
+    return list([int(cx), int(cy)])
+
+
+def legacy_mask_of_obj(instance_seg_frame, color):
+    seg_mask = cv2.inRange(instance_seg_frame, color, color)
+    seg_mask = np.array(seg_mask) / 255
+    return compress_mask(seg_mask.astype(int))
+
+
+def legacy_visible_pixels(instance_seg_frame, color):
+    # THOR's instance_masks are full boolean masks of the frame
+    return int(np.sum(np.all(instance_seg_frame == np.array(color), axis=2)))
+
+
+def synthetic_frames(num_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    height, width = constants.DETECTION_SCREEN_HEIGHT, constants.DETECTION_SCREEN_WIDTH
+    ys, xs = np.mgrid[:height, :width]
+    frames = []
+    for _ in range(num_frames):
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        frame[:] = rng.integers(0, 256, size=3)
+        for _ in range(rng.integers(20, 60)):
+            color = rng.integers(0, 256, size=3)
+            cy, cx = rng.integers(0, height), rng.integers(0, width)
+            ry, rx = rng.integers(3, 80), rng.integers(3, 80)
+            if rng.random() < 0.5:
+                frame[((ys - cy) / ry) ** 2 + ((xs - cx) / rx) ** 2 <= 1] = color
+            else:
+                frame[max(cy - ry, 0):cy + ry, max(cx - rx, 0):cx + rx] = color
+        frames.append(frame)
+    return frames
+
+
+def recorded_frames(folders, num_frames):
+    paths = sorted(p for folder in folders for p in glob.glob(os.path.join(folder, '*.png')))[:num_frames]
+    return [cv2.imread(p) for p in paths]
+
+
+class Event(object):
+    def __init__(self, frame, num_objects):
+        self.instance_segmentation_frame = frame
+        colors, counts = np.unique(frame.reshape(-1, 3), axis=0, return_counts=True)
+        colors = [tuple(int(c) for c in color) for color in colors[np.argsort(-counts, kind='stable')]]
+        self.object_id_to_color = {'Object|%d' % i: color for i, color in enumerate(colors[:num_objects])}
+        self.instance_detections2D = {object_id: None for object_id in self.object_id_to_color}
+        self.metadata = {'objects': [{'objectId': object_id, 'visible': True}
+                                     for object_id in self.object_id_to_color]}
+
+
+class Env(object):
+    def __init__(self, event):
+        self.last_event = event
+
+
+class State(object):
+    get_point_of_obj = GameStateBase.get_point_of_obj
+    get_mask_of_obj = GameStateBase.get_mask_of_obj
+    check_obj_visibility = GameStateBase.check_obj_visibility
+
+    def __init__(self, event):
+        self.env = Env(event)
+
+
+def legacy_step(event):
+    frame = np.array(event.instance_segmentation_frame)
+    return [(legacy_point_of_obj(frame, color), legacy_mask_of_obj(frame, color),
+             legacy_visible_pixels(frame, color)) for color in event.object_id_to_color.values()]
+
+
+def indexed_step(event):
+    # a new THOR event per step: the index is built once per frame
+    event.__dict__.pop('_instance_index', None)
+    state = State(event)
+    out = []
+    for object_id in event.object_id_to_color:
+        state.check_obj_visibility({'objectId': object_id}, min_pixels=1)
+        out.append((state.get_point_of_obj(object_id), state.get_mask_of_obj(object_id),
+                    event._instance_index.count(event.object_id_to_color[object_id])))
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the per-step object queries of GameStateBase.')
+    parser.add_argument('--frames', nargs='*', default=[], help='folders of recorded instance mask pngs')
+    parser.add_argument('--num_frames', type=int, default=50)
+    parser.add_argument('--objects', type=int, default=8)
+    args = parser.parse_args()
+
+    frames = recorded_frames(args.frames, args.num_frames) if args.frames else synthetic_frames(args.num_frames)
+    events = [Event(frame, args.objects) for frame in frames]
+    print('{} {} frames, {} objects per step'.format(len(events), 'recorded' if args.frames else 'synthetic',
+                                                     args.objects))
+    print('{:>12} {:>12} {:>10}'.format('', 'ms/step', 'identical'))
+    results = {}
+    for label, step in (('inRange', legacy_step), ('index', indexed_step)):
+        start = time.perf_counter()
+        results[label] = [step(event) for event in events]
+        seconds = time.perf_counter() - start
+        identical = '' if label == 'inRange' else str(results['index'] == results['inRange'])
+        print('{:>12} {:>12.2f} {:>10}'.format(label, seconds * 1e3 / len(events), identical))
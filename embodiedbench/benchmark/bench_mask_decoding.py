@@ -0,0 +1,97 @@
+"""
+Benchmark of the handle mask decoding of ``Scene.get_observation`` at five mask cameras.
+
+Every capture decodes one RGB coded float image per camera, as returned by
+``VisionSensor.capture_rgb``. The previous ``rgb_handles_to_mask`` (scale in place, cast to
+int64, combine three channels) is compared with one ``HandleMaskDecoder`` per camera: time
+per capture, and the memory a capture allocates measured with tracemalloc (the peak,
+temporaries included, and what is kept: the returned masks). It also checks that both
+give the same handles and that the decoder leaves its input unchanged.
+
+The amsolver package needs pyrep, so the decoder module is loaded from its file.
+
+    python -m embodiedbench.benchmark.bench_mask_decoding --sizes 128,256,512
+"""
+import os
+import time
+import argparse
+import tracemalloc
+import importlib.util
+
+import numpy as np
+
+_spec = importlib.util.spec_from_file_location('handle_mask', os.path.join(
+    os.path.dirname(__file__), '..', 'envs', 'eb_manipulation', 'amsolver', 'backend', 'handle_mask.py'))
+handle_mask = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(handle_mask)
+
+NUM_CAMERAS = 5
+
+
+def legacy_rgb_handles_to_mask(rgb_coded_handles):
+    rgb_coded_handles *= 255  # takes rgb range to 0 -> 255
+    rgb_coded_handles = rgb_coded_handles.astype(int)
+    return (rgb_coded_handles[:, :, 0] +
+            rgb_coded_handles[:, :, 1] * 256 +
+            rgb_coded_handles[:, :, 2] * 256 * 256)
+
+
+def coded_images(size, seed=0, num_objects=40):
+    """Float coded images of a few object handles, like the mask sensors render them."""
+    rng = np.random.default_rng(seed)
+    handles = rng.integers(1, 1 << 20, size=num_objects)
+    images = []
+    for _ in range(NUM_CAMERAS):
+        labels = handles[rng.integers(0, num_objects, size=(size // 8, size // 8))]
+        labels = np.kron(labels, np.ones((8, 8), dtype=labels.dtype))
+        rgb = np.stack([labels & 255, (labels >> 8) & 255, (labels >> 16) & 255], axis=-1)
+        images.append((rgb / 255.).astype(np.float32))
+    return images
+
+
+def capture(decoders, images):
+    # capture_rgb returns a new array on every capture
+    return [decode(image.copy()) for decode, image in zip(decoders, images)]
+
+
+def measure(decoders, images, repeats):
+    capture(decoders, images)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        capture(decoders, images)
+    return (time.perf_counter() - start) / repeats
+
+
+def allocations(decoders, images):
+    """Peak bytes allocated during one capture (returned masks and temporaries), and bytes kept."""
+    copies = [image.copy() for image in images]
+    tracemalloc.start()
+    masks = [decode(image) for decode, image in zip(decoders, copies)]
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del masks
+    return peak, kept
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the handle mask decoding.')
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')], default=[128, 256, 512])
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    print('{} mask cameras per capture'.format(NUM_CAMERAS))
+    print('{:>6} {:>8} {:>12} {:>10} {:>10} {:>10}'.format('size', 'decoder', 'ms/capture', 'peak MB',
+                                                         'kept MB', 'identical'))
+    for size in args.sizes:
+        images = coded_images(size)
+        expected = [legacy_rgb_handles_to_mask(image.copy()) for image in images]
+        decoders = [handle_mask.HandleMaskDecoder() for _ in range(NUM_CAMERAS)]
+        originals = [image.copy() for image in images]
+        decoded = [decode(image) for decode, image in zip(decoders, images)]
+        identical = (all(np.array_equal(a, b) for a, b in zip(expected, decoded))
+                     and all(np.array_equal(a, b) for a, b in zip(images, originals)))
+        for label, fns in (('legacy', [legacy_rgb_handles_to_mask] * NUM_CAMERAS), ('reused', decoders)):
+            seconds = measure(fns, images, args.repeats)
+            peak, kept = allocations(fns, images)
+            print('{:>6} {:>8} {:>12.3f} {:>10.2f} {:>10.2f} {:>10}'.format(
+                size, label, seconds * 1e3, peak / 2**20, kept / 2**20, str(identical) if label == 'reused' else ''))
@@ -0,0 +1,166 @@
+"""
+Correctness and throughput benchmark for the tolerant plan parser.
+
+``plan_corpus.jsonl`` holds model outputs with the malformations seen in the planner logs
+(code fences, single quotes, unescaped quotes, raw newlines, trailing commas, ...), one json
+object per line with the ``pattern``, the ``schema`` name, the raw ``text`` and the
+``expected`` plan (null if the output cannot be recovered). Every entry is decoded with
+``parse_plan`` and with the previous ``fix_json`` + ``json.loads`` pipeline, then both are
+timed on the corpus, on its well-formed responses (valid json, possibly fenced) and on
+responses with growing reasoning length. Streaming is measured as the fraction of the
+response that has to arrive before the first action is available.
+
+    python -m embodiedbench.benchmark.bench_plan_parser
+    python -m embodiedbench.benchmark.bench_plan_parser --corpus my_outputs.jsonl --repeat 200
+"""
+import os
+import re
+import json
+import time
+import argparse
+
+from embodiedbench.planner import planner_utils
+from embodiedbench.planner.plan_parser import parse_plan, PlanStreamParser, PlanParseError
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'plan_corpus.jsonl')
+
+
+def legacy_fix_json(json_str):
+    """``fix_json`` before the tolerant parser, kept as the reference for the comparison."""
+    json_str = json_str.replace("'", '"')
+    json_str = json_str.replace('\"s ', "\'s ")
+    json_str = json_str.replace('\"re ', "\'re ")
+    json_str = json_str.replace('\"ll ', "\'ll ")
+    json_str = json_str.replace('\"t ', "\'t ")
+    json_str = json_str.replace('\"d ', "\'d ")
+    json_str = json_str.replace('\"m ', "\'m ")
+    json_str = json_str.replace('\"ve ', "\'ve ")
+    json_str = json_str.replace('```json', '').replace('```', '')
+    pattern = r'("reasoning_and_reflection"\s*:\s*")(?P<value>.*?)(?=",\s*"language_plan")'
+
+    def replacer(match):
+        return match.group(1) + re.sub(r'(?<!\\)"', r'\\"', match.group("value"))
+
+    return re.sub(pattern, replacer, json_str, flags=re.DOTALL)
+
+
+def legacy_parse(text, schema=None):
+    return json.loads(legacy_fix_json(text))
+
+
+def new_parse(text, schema=None):
+    return parse_plan(text, schema)
+
+
+def load_corpus(path):
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entry.setdefault('pattern', 'unlabelled')
+                entry['schema_cls'] = getattr(planner_utils, entry.get('schema') or '', None)
+                entries.append(entry)
+    return entries
+
+
+def check(parse, entry):
+    """True if ``parse`` returns the expected plan, or fails on an unrecoverable output."""
+    try:
+        result = parse(entry['text'], entry['schema_cls'])
+    except (ValueError, KeyError, TypeError):
+        return entry.get('expected') is None
+    if 'expected' not in entry:
+        return True
+    return result == entry['expected']
+
+
+def is_well_formed(text):
+    """True if the json object in the response, without the prose or code fences around it, is valid."""
+    try:
+        return isinstance(json.loads(text[text.find('{'):text.rfind('}') + 1]), dict)
+    except ValueError:
+        return False
+
+
+def time_parse(parse, entries, repeat):
+    total_bytes = sum(len(entry['text'].encode('utf-8')) for entry in entries) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for entry in entries:
+            try:
+                parse(entry['text'], entry['schema_cls'])
+            except (ValueError, KeyError, TypeError):
+                pass
+    seconds = time.perf_counter() - start
+    return {'responses_per_second': len(entries) * repeat / seconds, 'mb_per_second': total_bytes / seconds / 1e6}
+
+
+def first_action_fraction(entry, chunk_size):
+    """Fraction of the response consumed before the first plan item is available (None: never)."""
+    parser = PlanStreamParser(entry['schema_cls'])
+    text = entry['text']
+    try:
+        for end in range(0, len(text), chunk_size):
+            if parser.feed(text[end:end + chunk_size]):
+                return min(end + chunk_size, len(text)) / len(text)
+        parser.close()
+    except PlanParseError:
+        pass
+    return None
+
+
+def long_reasoning_entries(entries, length):
+    """Corpus entries with the reasoning stretched to ``length`` characters."""
+    stretched = []
+    for entry in entries:
+        text = entry['text']
+        for quote in ('"', "'"):
+            key = '{0}reasoning_and_reflection{0}: {0}'.format(quote)
+            index = text.find(key)
+            if index >= 0:
+                filler = ('the agent checks the counter and the sink before acting. ' * (length // 58 + 1))[:length]
+                position = index + len(key)
+                stretched.append(dict(entry, text=text[:position] + filler + text[position:]))
+                break
+    return stretched
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the tolerant plan parser against the legacy fix_json.')
+    parser.add_argument('--corpus', type=str, default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--chunk_size', type=int, default=16, help='characters per streamed chunk')
+    parser.add_argument('--lengths', type=lambda s: [int(x) for x in s.split(',')], default=[1000, 8000, 32000],
+                        help='reasoning lengths for the scaling test')
+    args = parser.parse_args()
+
+    entries = load_corpus(args.corpus)
+    print('{:<34} {:>6} {:>6}'.format('pattern', 'new', 'legacy'))
+    passed = {'new': 0, 'legacy': 0}
+    for entry in entries:
+        ok_new, ok_legacy = check(new_parse, entry), check(legacy_parse, entry)
+        passed['new'] += ok_new
+        passed['legacy'] += ok_legacy
+        print('{:<34} {:>6} {:>6}'.format(entry['pattern'], 'ok' if ok_new else 'FAIL', 'ok' if ok_legacy else 'FAIL'))
+    print('correct: new {}/{}, legacy {}/{}'.format(passed['new'], len(entries), passed['legacy'], len(entries)))
+
+    well_formed = [entry for entry in entries if is_well_formed(entry['text'])]
+    for label, subset in (('corpus', entries), ('well-formed responses', well_formed)):
+        print('\nthroughput over the {} ({} responses, {} repeats)'.format(label, len(subset), args.repeat))
+        for name, parse in (('new', new_parse), ('legacy', legacy_parse)):
+            result = time_parse(parse, subset, args.repeat)
+            print('{:<8} {:>10.0f} responses/s {:>8.2f} MB/s'.format(name, result['responses_per_second'], result['mb_per_second']))
+
+    for length in args.lengths:
+        stretched = long_reasoning_entries(entries, length)
+        repeat = max(1, args.repeat * 1000 // length)
+        rates = {name: time_parse(parse, stretched, repeat) for name, parse in (('new', new_parse), ('legacy', legacy_parse))}
+        print('reasoning {:>6} chars: new {:>8.2f} MB/s, legacy {:>8.2f} MB/s'.format(
+            length, rates['new']['mb_per_second'], rates['legacy']['mb_per_second']))
+
+    fractions = [first_action_fraction(entry, args.chunk_size) for entry in entries]
+    fractions = [fraction for fraction in fractions if fraction is not None]
+    if fractions:
+        print('\nstreaming: first action after {:.0%} of the response on average ({} responses, {} char chunks)'.format(
+            sum(fractions) / len(fractions), len(fractions), args.chunk_size))
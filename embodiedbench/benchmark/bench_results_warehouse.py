@@ -0,0 +1,112 @@
+"""
+Benchmark for the columnar results warehouse.
+
+Builds a synthetic warehouse (default: 100k episodes spread over
+models x experiments x eval sets), then times a full group-by aggregation and a
+single-partition summary. A small directory of episode JSON files is also
+summarized both with the legacy ``average_json_values`` scan and with a cold
+warehouse ingest for comparison.
+
+    python -m embodiedbench.benchmark.bench_results_warehouse --episodes 100000
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import io
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from embodiedbench.evaluator.results_warehouse import ResultsWarehouse, summarize_results
+from embodiedbench.evaluator.summarize_result import average_json_values
+
+MODELS = ['gpt-4o', 'gpt-4o-mini', 'claude-3-5-sonnet', 'gemini-1.5-pro', 'Qwen2-VL-7B-Instruct']
+EXPERIMENTS = ['baseline', 'failure_only', 'success_and_failure', 'success_only']
+EVAL_SETS = ['base', 'common_sense', 'complex_instruction', 'spatial', 'visual_appearance']
+TASK_TYPES = ['pick_and_place_simple', 'pick_clean_then_place_in_recep', 'pick_heat_then_place_in_recep',
+              'pick_cool_then_place_in_recep', 'pick_two_obj_and_place', 'look_at_obj_in_light']
+
+
+def build_synthetic_warehouse(root, num_episodes, seed=0):
+    rng = np.random.default_rng(seed)
+    partitions = [(m, e, s) for m in MODELS for e in EXPERIMENTS for s in EVAL_SETS]
+    per_partition = max(1, num_episodes // len(partitions))
+    warehouse = ResultsWarehouse(root)
+    for model, experiment, eval_set in partitions:
+        table = pa.table({
+            'reward': rng.normal(size=per_partition),
+            'task_success': rng.integers(0, 2, per_partition).astype(np.float64),
+            'task_progress': rng.random(per_partition),
+            'num_steps': rng.integers(1, 30, per_partition).astype(np.float64),
+            'planner_steps': rng.integers(1, 10, per_partition).astype(np.float64),
+            'planner_output_error': rng.integers(0, 3, per_partition).astype(np.float64),
+            'episode_elapsed_seconds': rng.gamma(2.0, 30.0, per_partition),
+            'task_type': pa.array(rng.choice(TASK_TYPES, per_partition).tolist(), type=pa.string()),
+            'episode_num': np.arange(1, per_partition + 1, dtype=np.float64),
+            'source_file': pa.array(['episode_{}_final_res.json'.format(i) for i in range(1, per_partition + 1)]),
+        })
+        partition = warehouse.partition_dir('eb_alfred', model, experiment, eval_set)
+        os.makedirs(partition, exist_ok=True)
+        pq.write_table(table, os.path.join(partition, 'data.parquet'))
+    return warehouse, per_partition * len(partitions)
+
+
+def write_episode_files(results_dir, num_files, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(results_dir, exist_ok=True)
+    for i in range(1, num_files + 1):
+        episode_info = {
+            'reward': float(rng.normal()),
+            'task_success': int(rng.integers(0, 2)),
+            'num_steps': int(rng.integers(1, 30)),
+            'planner_steps': int(rng.integers(1, 10)),
+            'instruction': 'put a clean mug in the coffee machine',
+            'task_type': str(rng.choice(TASK_TYPES)),
+        }
+        with open(os.path.join(results_dir, 'episode_{}_final_res.json'.format(i)), 'w') as f:
+            json.dump(episode_info, f)
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the results warehouse aggregation.')
+    parser.add_argument('--episodes', type=int, default=100000)
+    parser.add_argument('--json_files', type=int, default=2000, help='episode files for the legacy comparison')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='eb_warehouse_bench_')
+    try:
+        warehouse, total = build_synthetic_warehouse(os.path.join(tmp_dir, 'warehouse'), args.episodes)
+        rows, seconds = timed(lambda: warehouse.aggregate(), args.repeat)
+        print('aggregate by model/experiment/eval_set: {} episodes, {} groups, {:.3f}s'.format(total, len(rows), seconds))
+        rows, seconds = timed(lambda: warehouse.aggregate(group_by=['model', 'task_type'], metrics=['task_success']), args.repeat)
+        print('aggregate by model/task_type:           {} episodes, {} groups, {:.3f}s'.format(total, len(rows), seconds))
+        _, seconds = timed(lambda: warehouse.summarize('eb_alfred', MODELS[0], EXPERIMENTS[0], EVAL_SETS[0]), args.repeat)
+        print('single partition summary:               {:.4f}s'.format(seconds))
+
+        results_dir = os.path.join(tmp_dir, 'running', 'results')
+        write_episode_files(results_dir, args.json_files)
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, legacy = timed(lambda: average_json_values(results_dir, target_file='episode_*.json', output_file='legacy.json'), 1)
+            _, cold = timed(lambda: summarize_results(results_dir, 'eb_alfred', 'm', 'e', 'base', output_file=None,
+                                                      warehouse_dir=os.path.join(tmp_dir, 'cold')), 1)
+            _, warm = timed(lambda: summarize_results(results_dir, 'eb_alfred', 'm', 'e', 'base', output_file=None,
+                                                      warehouse_dir=os.path.join(tmp_dir, 'cold')), args.repeat)
+        print('{} episode files: legacy scan {:.3f}s, warehouse cold ingest {:.3f}s, warm {:.4f}s'.format(
+            args.json_files, legacy, cold, warm))
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,198 @@
+"""
+Benchmark of the success checks of ``TaskEnvironment._path_action`` on a replayed path.
+
+The replay is a pour: a cup carried along a path tilts over a container, and its liquid
+balls leave it one after the other and settle in the container, as in ``pour_demo``
+(``NumberCondition`` over one ``DetectedCondition`` per ball). Every simulator query of
+the stand-in objects busy-waits: ``--query_us`` for a pose or a name lookup,
+``--detect_us`` for a proximity check. The success is checked on every substep as
+``Task.success`` does (every condition, every substep) and with ``SuccessMonitor`` in a
+few settings; the benchmark reports substeps per second, the number of detections
+evaluated, and whether the substeps at which the task succeeds (``success_in_path``) are
+the same.
+
+    python -m embodiedbench.benchmark.bench_success_monitor --balls 20 --substeps 400
+"""
+import os
+import time
+import argparse
+import importlib.util
+
+import numpy as np
+
+_spec = importlib.util.spec_from_file_location('success_monitor', os.path.join(
+    os.path.dirname(__file__), '..', 'envs', 'eb_manipulation', 'amsolver', 'backend', 'success_monitor.py'))
+success_monitor = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(success_monitor)
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class ReplayObject(object):
+    """An object whose pose follows a recorded trajectory; every query costs a simulator call."""
+
+    def __init__(self, handle, trajectory, clock, query_s):
+        self._handle = handle
+        self._trajectory = trajectory
+        self._clock = clock
+        self._query_s = query_s
+
+    def get_handle(self):
+        return self._handle
+
+    def get_pose(self):
+        _busy(self._query_s)
+        return self._trajectory[min(self._clock[0], len(self._trajectory) - 1)]
+
+
+class ReplayDetector(ReplayObject):
+    def __init__(self, handle, trajectory, clock, query_s, detect_s, half_size):
+        super().__init__(handle, trajectory, clock, query_s)
+        self._detect_s = detect_s
+        self._half_size = half_size
+
+    def is_detected(self, obj):
+        _busy(self._detect_s)
+        centre = self._trajectory[min(self._clock[0], len(self._trajectory) - 1)][:3]
+        position = obj._trajectory[min(self._clock[0], len(obj._trajectory) - 1)][:3]
+        return bool(np.all(np.abs(position - centre) <= self._half_size))
+
+
+class DetectedCondition(object):
+    """Same contract as amsolver.backend.conditions.DetectedCondition."""
+
+    def __init__(self, obj, detector):
+        self._obj = obj
+        self._detector = detector
+
+    def condition_met(self):
+        # the real condition looks both objects up by name first
+        _busy(2 * self._detector._query_s)
+        return self._detector.is_detected(self._obj), False
+
+    def dependencies(self):
+        return [self._obj, self._detector]
+
+
+class NumberCondition(object):
+    """Same contract as pour_demo.NumberCondition."""
+
+    def __init__(self, conditions, num_bound):
+        self._conditions = conditions
+        self.num_bound = num_bound
+
+    def condition_met(self):
+        count = sum(1 for cond in self._conditions if cond.condition_met()[0])
+        return count >= self.num_bound, False
+
+    def sub_conditions(self):
+        return self._conditions
+
+    def combine(self, results):
+        count = sum(1 for ismet, term in results if ismet)
+        return count >= self.num_bound, False
+
+
+def _pose(positions):
+    poses = np.zeros((len(positions), 7))
+    poses[:, :3] = positions
+    poses[:, 6] = 1.0
+    return poses
+
+
+def record_pour(num_balls, substeps, seed=0):
+    """Trajectories of the cup, its balls and the container over the path."""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, substeps)[:, None]
+    start, above = np.array([0.3, -0.2, 0.9]), np.array([0.0, 0.1, 0.95])
+    cup = start + np.minimum(t / 0.6, 1.0) * (above - start)
+    container = np.tile(np.array([0.0, 0.1, 0.8]), (substeps, 1))
+    balls = []
+    for i in range(num_balls):
+        # balls ride in the cup, leave it while it tilts, fall and settle in the container
+        leave = int(substeps * (0.65 + 0.25 * i / num_balls))
+        settle = min(substeps - 1, leave + substeps // 20)
+        rest = container[0] + rng.uniform(-0.03, 0.03, 3) * [1, 1, 0.3]
+        path = cup.copy() + rng.uniform(-0.01, 0.01, 3)
+        path[leave:settle + 1] = np.linspace(path[leave], rest, settle + 1 - leave)
+        path[settle:] = rest
+        balls.append(path)
+    return _pose(cup), [_pose(b) for b in balls], _pose(container)
+
+
+def build(trajectories, query_s, detect_s, success_rate):
+    cup, balls, container = trajectories
+    clock = [0]
+    detector = ReplayDetector(0, container, clock, query_s, detect_s, half_size=np.array([0.05, 0.05, 0.05]))
+    objects = [ReplayObject(i + 1, b, clock, query_s) for i, b in enumerate(balls)]
+    conditions = [NumberCondition([DetectedCondition(o, detector) for o in objects], len(objects) * success_rate)]
+    return clock, conditions
+
+
+def task_success(conditions):
+    """Task.success."""
+    all_met, should_terminate = True, False
+    for cond in conditions:
+        met, terminate = cond.condition_met()
+        if terminate:
+            should_terminate = True
+            break
+        all_met &= met
+    if all_met:
+        should_terminate = True
+    return all_met, should_terminate
+
+
+def replay(trajectories, query_s, detect_s, substeps, success_rate, monitor_args=None):
+    clock, conditions = build(trajectories, query_s, detect_s, success_rate)
+    monitor = success_monitor.SuccessMonitor(conditions, **monitor_args) if monitor_args is not None else None
+    success_in_path = []
+    start = time.perf_counter()
+    for step in range(substeps):
+        clock[0] = step
+        done = step == substeps - 1
+        if monitor is None:
+            success = task_success(conditions)[0]
+        else:
+            checked = monitor.check(final=done)
+            success = checked is not None and checked[0]
+        if success:
+            success_in_path.append(step)
+    seconds = time.perf_counter() - start
+    evaluations = monitor.evaluations if monitor is not None else substeps * len(conditions[0].sub_conditions())
+    return substeps / seconds, evaluations, success_in_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the success monitor on a replayed pour.')
+    parser.add_argument('--balls', type=int, default=20)
+    parser.add_argument('--substeps', type=int, default=400)
+    parser.add_argument('--query_us', type=float, default=10.0, help='cost of a pose or name lookup')
+    parser.add_argument('--detect_us', type=float, default=50.0, help='cost of a proximity sensor check')
+    parser.add_argument('--success_rate', type=float, default=0.8)
+    args = parser.parse_args()
+
+    trajectories = record_pour(args.balls, args.substeps)
+    query_s, detect_s = args.query_us / 1e6, args.detect_us / 1e6
+    reference = replay(trajectories, query_s, detect_s, args.substeps, args.success_rate)
+    print('{} balls, {} substeps, {} us per lookup, {} us per detection'.format(
+        args.balls, args.substeps, args.query_us, args.detect_us))
+    print('{:>28} {:>12} {:>12} {:>14} {:>14}'.format('', 'substeps/s', 'evaluations', 'first success',
+                                                      'same as every'))
+    configs = [('Task.success every substep', None),
+               ('monitor, exact', {}),
+               ('monitor, tolerance 1e-4', {'tolerance': 1e-4}),
+               ('monitor, every 5th substep', {'check_interval': 5})]
+    for label, monitor_args in configs:
+        rate, evaluations, success_in_path = replay(trajectories, query_s, detect_s, args.substeps,
+                                                    args.success_rate, monitor_args)
+        same = success_in_path == reference[2]
+        if not same and monitor_args and monitor_args.get('check_interval', 1) > 1:
+            # only the checked substeps can report a success
+            same = 'checked: %s' % (set(success_in_path) <= set(reference[2]) and bool(success_in_path) == bool(reference[2]))
+        print('{:>28} {:>12.0f} {:>12} {:>14} {:>14}'.format(
+            label, rate, evaluations, success_in_path[0] if success_in_path else '-', str(same)))
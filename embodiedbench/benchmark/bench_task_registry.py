@@ -0,0 +1,118 @@
+"""
+Benchmark of the cached task registry against the import-and-reload task lookup.
+
+Every task of the package is looked up ``--lookups`` times (as the data generators and
+environments do for every task and episode), once with the previous
+``task_file_to_task_class`` (``import_module`` followed by ``reload`` on every call) and
+once through ``TaskRegistry``. It reports the cumulative lookup time and the per-lookup
+time after warm-up, and checks that both return the classes of the same modules.
+
+The real ``vlm.tasks`` package needs the simulator bindings (pyrep) to import; without
+them, or with ``--synthetic``, a generated package with the same number of task modules
+is used, each defining a task class and a few module-level tables.
+
+    python -m embodiedbench.benchmark.bench_task_registry --lookups 20
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import importlib
+
+MANIPULATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs', 'eb_manipulation')
+sys.path.insert(0, MANIPULATION_DIR)
+from tools.task_registry import TaskRegistry, task_class_name
+
+SYNTHETIC_TASK = '''
+import numpy as np
+
+COLORS = {{'color%d' % i: np.linspace(0, 1, 3) * i for i in range(64)}}
+SIZES = sorted(set(round(0.01 * i, 3) for i in range(2000)))
+
+
+class {class_name}(object):
+    """Generated task {index}."""
+
+    def init_task(self):
+        self.objects = [COLORS['color%d' % i] for i in range(8)]
+
+    def init_episode(self, index):
+        return ['pick the %s object' % name for name in sorted(COLORS)][index % len(COLORS)]
+
+    def variation_count(self):
+        return len(COLORS)
+'''
+
+
+def make_synthetic_package(root, num_tasks):
+    package = os.path.join(root, 'bench_tasks_pkg', 'tasks')
+    os.makedirs(package)
+    open(os.path.join(root, 'bench_tasks_pkg', '__init__.py'), 'w').close()
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    for i in range(num_tasks):
+        name = 'synthetic_task_%d' % i
+        with open(os.path.join(package, name + '.py'), 'w') as f:
+            f.write(SYNTHETIC_TASK.format(class_name=task_class_name(name), index=i))
+    sys.path.insert(0, root)
+    return 'bench_tasks_pkg'
+
+
+def legacy_lookup(task_file, parent_folder):
+    """task_file_to_task_class before the registry."""
+    name = task_file.replace('.py', '')
+    class_name = ''.join([w[0].upper() + w[1:] for w in name.split('_')])
+    mod = importlib.import_module(parent_folder + ".tasks.%s" % name)
+    mod = importlib.reload(mod)
+    return getattr(mod, class_name)
+
+
+def run(lookup, task_names, lookups):
+    first = time.perf_counter()
+    classes = [lookup(name) for name in task_names]
+    warm_up = time.perf_counter() - first
+    start = time.perf_counter()
+    for _ in range(lookups - 1):
+        for name in task_names:
+            lookup(name)
+    rest = time.perf_counter() - start
+    return warm_up, rest, classes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the task class registry.')
+    parser.add_argument('--parent_folder', type=str, default='vlm')
+    parser.add_argument('--lookups', type=int, default=20, help='lookups of every task')
+    parser.add_argument('--synthetic', action='store_true', help='use a generated task package')
+    args = parser.parse_args()
+
+    root = None
+    parent_folder = args.parent_folder
+    task_names = TaskRegistry(parent_folder).task_names()
+    if not args.synthetic:
+        try:
+            importlib.import_module('%s.tasks.%s' % (parent_folder, task_names[0]))
+        except ImportError as e:
+            print('cannot import %s.tasks (%r), using a synthetic package' % (parent_folder, e))
+            args.synthetic = True
+    if args.synthetic:
+        root = tempfile.mkdtemp(prefix='eb_task_registry_')
+        parent_folder = make_synthetic_package(root, len(task_names) or 32)
+        task_names = TaskRegistry(parent_folder).task_names()
+    try:
+        registry = TaskRegistry(parent_folder, hot_reload=False)
+        # the registry first, so its first pass pays for the imports
+        cached = run(registry.get, task_names, args.lookups)
+        legacy = run(lambda name: legacy_lookup(name, parent_folder), task_names, args.lookups)
+        total_lookups = len(task_names) * (args.lookups - 1)
+        print('{} tasks of {}.tasks, {} lookups each'.format(len(task_names), parent_folder, args.lookups))
+        print('{:>10} {:>12} {:>14} {:>16}'.format('', 'first pass s', 'cumulative s', 'per lookup us'))
+        for label, (warm_up, rest, _) in (('reload', legacy), ('registry', cached)):
+            print('{:>10} {:>12.3f} {:>14.3f} {:>16.2f}'.format(label, warm_up, warm_up + rest,
+                                                              rest / max(total_lookups, 1) * 1e6))
+        same = all(a.__module__ == b.__module__ and a.__name__ == b.__name__ for a, b in zip(legacy[2], cached[2]))
+        print('same task classes: {}'.format(same))
+    finally:
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
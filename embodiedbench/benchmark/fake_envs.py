@@ -0,0 +1,620 @@
+"""
+Replay environments for the benchmark harness.
+
+``FakeAlfEnv``, ``FakeHabEnv``, ``FakeNavEnv`` and ``FakeManEnv`` expose the same
+constructor arguments, attributes, ``reset``/``step``/``save_image`` signatures, info
+keys and log files as ``EBAlfEnv``, ``EBHabEnv``, ``EBNavigationEnv`` and ``EBManEnv``,
+but instead of driving a simulator they replay episodes from a ``ReplaySource``:
+
+- a trace directory recorded from the real environments with ``TraceRecorder``, or
+- deterministic synthetic episodes when no trace is available.
+
+Step outcomes are replayed in order regardless of the action that was chosen, and the
+recorded reset/step durations are slept (optionally scaled) so that the evaluation loop
+sees a realistic simulator cost.
+
+Trace layout (one directory per eval set, or a single directory shared by all of them)::
+
+    <trace_dir>/[<eval_set>/]episodes.jsonl   one json episode per line
+    <trace_dir>/[<eval_set>/]frames/*.npy     uint8 HxWx3 frames referenced by the episodes
+
+Each episode holds ``instruction``, ``language_skill_set``, ``reset_seconds``, ``frames``
+(camera key -> frame file), optional ``episode_data``/``task_variation``/``avg_obj_coord``
+and a list of ``steps`` with ``reward``, ``done``, ``info``, ``step_seconds`` and ``frames``.
+"""
+import os
+import json
+import time
+import zlib
+import types
+import random
+
+import numpy as np
+from PIL import Image
+
+from embodiedbench.benchmark.fake_model import LatencyModel
+
+ENV_NAMES = ('eb-alf', 'eb-hab', 'eb-nav', 'eb-man')
+
+EVAL_SETS = {
+    'eb-alf': ['base', 'common_sense', 'complex_instruction', 'spatial', 'visual_appearance', 'long_horizon'],
+    'eb-hab': ['base', 'common_sense', 'complex_instruction', 'spatial_relationship', 'visual_appearance', 'long_horizon'],
+    'eb-nav': ['base', 'common_sense', 'complex_instruction', 'visual_appearance', 'long_horizon'],
+    'eb-man': ['base', 'common_sense', 'complex', 'spatial', 'visual'],
+}
+
+MAN_EVAL_SETS = {
+    'base': ['pick_cube_shape', 'stack_cubes_color', 'place_into_shape_sorter_color', 'wipe_table_direction'],
+    'common_sense': ['pick_cube_shape', 'stack_cubes_color', 'place_into_shape_sorter_color', 'wipe_table_direction'],
+    'complex': ['pick_cube_shape', 'stack_cubes_color', 'place_into_shape_sorter_color', 'wipe_table_direction'],
+    'spatial': ['pick_cube_relative', 'stack_cubes_relative', 'place_into_shape_sorter_relative', 'wipe_table_relative'],
+    'visual': ['pick_cube_shape', 'stack_cubes_color', 'place_into_shape_sorter_color']
+}
+
+NAV_SKILLSET = [
+    "Move forward by 0.25",
+    "Move backward by 0.25",
+    "Move rightward by 0.25",
+    "Move leftward by 0.25",
+    "Rotate to the right by 90 degrees.",
+    "Rotate to the left by 90 degrees.",
+    "Tilt the camera upward by 30 degrees.",
+    "Tilt the camera downward by 30 degrees.",
+]
+
+MAX_EPISODE_STEPS = {'eb-alf': 30, 'eb-hab': 30, 'eb-nav': 20, 'eb-man': 15}
+FRAME_KEYS = {'eb-alf': ['head_rgb'], 'eb-hab': ['head_rgb'], 'eb-nav': ['head_rgb'],
+              'eb-man': ['front_rgb', 'wrist_rgb']}
+
+_ALFRED_TASK_TYPES = ['pick_and_place_simple', 'pick_clean_then_place_in_recep', 'pick_heat_then_place_in_recep',
+                      'pick_cool_then_place_in_recep', 'pick_two_obj_and_place', 'look_at_obj_in_light',
+                      'pick_and_place_with_movable_recep']
+_OBJECTS = ['Apple', 'Mug', 'Bowl', 'Plate', 'Knife', 'Lettuce', 'Book', 'Vase', 'Pillow', 'Laptop']
+
+
+def _synthetic_skill_set(env_name, rng):
+    if env_name == 'eb-nav':
+        return list(NAV_SKILLSET)
+    if env_name == 'eb-man':
+        return []
+    objects = rng.sample(_OBJECTS, 6)
+    if env_name == 'eb-alf':
+        skills = ['find a {}'.format(name) for name in objects] + ['pick up the {}'.format(name) for name in objects]
+        return skills + ['put down the object in hand', 'drop the object in hand']
+    return ['navigate to the {}'.format(name.lower()) for name in objects] + \
+           ['pick up the {}'.format(name.lower()) for name in objects] + ['place at the table']
+
+
+class ReplaySource:
+    """Episodes replayed by the fake environments.
+
+    Args:
+        env_name: one of ``ENV_NAMES``
+        trace_dir: recorded traces; synthetic episodes are generated when it is None
+        num_episodes: episodes per eval set (default: the number of recorded episodes, or 10)
+        resolution: frame size of synthetic episodes
+        seed: seed of the synthetic episodes
+        sim_latency: ``LatencyModel`` spec used for synthetic reset/step durations
+        sim_time_scale: factor applied to every recorded or sampled simulator duration
+    """
+
+    def __init__(self, env_name, trace_dir=None, num_episodes=None, resolution=500, seed=0,
+                 sim_latency='zero', sim_time_scale=1.0):
+        assert env_name in ENV_NAMES, 'Unknown environment {}'.format(env_name)
+        self.env_name = env_name
+        self.trace_dir = trace_dir
+        self.num_episodes = num_episodes
+        self.resolution = resolution
+        self.seed = seed
+        self.sim_latency = LatencyModel(sim_latency, seed=seed, scale=sim_time_scale)
+        self.sim_time_scale = sim_time_scale
+        self._episodes = {}
+
+    def episodes(self, eval_set):
+        if eval_set not in self._episodes:
+            if self.trace_dir is None:
+                count = self.num_episodes if self.num_episodes is not None else 10
+                episodes = [self._synthetic_episode(eval_set, i) for i in range(count)]
+                root = None
+            else:
+                root = os.path.join(self.trace_dir, eval_set)
+                if not os.path.exists(os.path.join(root, 'episodes.jsonl')):
+                    root = self.trace_dir
+                with open(os.path.join(root, 'episodes.jsonl'), 'r', encoding='utf-8') as f:
+                    episodes = [json.loads(line) for line in f if line.strip()]
+                if self.num_episodes is not None:
+                    episodes = [episodes[i % len(episodes)] for i in range(self.num_episodes)]
+            self._episodes[eval_set] = (root, episodes)
+        return self._episodes[eval_set]
+
+    def frame(self, root, ref):
+        """Load a frame, ``ref`` being a frame file of a trace or the seed of a synthetic frame."""
+        if isinstance(ref, str):
+            return np.load(os.path.join(root, ref))
+        rng = np.random.default_rng(ref)
+        tile = rng.integers(0, 256, size=(16, 16, 3), dtype=np.uint8)
+        repeat = -(-self.resolution // 16)
+        return np.repeat(np.repeat(tile, repeat, axis=0), repeat, axis=1)[:self.resolution, :self.resolution]
+
+    def duration(self, recorded):
+        if recorded is None:
+            return self.sim_latency.sample()
+        return recorded * self.sim_time_scale
+
+    def _synthetic_episode(self, eval_set, index):
+        seed = zlib.crc32('{}/{}/{}/{}'.format(self.seed, self.env_name, eval_set, index).encode())
+        rng = random.Random(seed)
+        max_steps = MAX_EPISODE_STEPS[self.env_name]
+        num_steps = rng.randint(3, max_steps)
+        success = rng.random() < 0.5
+        frame_keys = FRAME_KEYS[self.env_name]
+        skill_set = _synthetic_skill_set(self.env_name, rng)
+        episode = {
+            'instruction': 'Synthetic {} task {} number {}.'.format(self.env_name, eval_set, index),
+            'language_skill_set': skill_set,
+            'reset_seconds': None,
+            'frames': {key: seed + j for j, key in enumerate(frame_keys)},
+            'steps': [],
+        }
+        if self.env_name == 'eb-alf':
+            episode['episode_data'] = {'task_type': rng.choice(_ALFRED_TASK_TYPES)}
+        if self.env_name == 'eb-man':
+            episode['task_variation'] = rng.choice(MAN_EVAL_SETS.get(eval_set, MAN_EVAL_SETS['base']))
+            episode['avg_obj_coord'] = str({name: [rng.randint(0, 100) for _ in range(3)]
+                                            for name in rng.sample(['red cube', 'blue cube', 'green star', 'yellow moon'], 3)})
+        for step in range(num_steps):
+            last = step == num_steps - 1
+            task_success = float(success and last)
+            valid = rng.random() > 0.2
+            info = {
+                'task_success': task_success,
+                'task_progress': task_success or round(rng.random() * step / num_steps, 3),
+                'last_action_success': float(valid),
+                'env_feedback': 'Last action executed successfully.' if valid else 'Last action is invalid.',
+            }
+            if self.env_name == 'eb-hab':
+                info['subgoal_reward'] = float(valid) * 0.1
+            if self.env_name == 'eb-nav':
+                info['distance'] = round(rng.random() * 3, 3)
+            episode['steps'].append({
+                'reward': task_success if self.env_name in ('eb-nav', 'eb-man') else rng.random() - 0.5,
+                'done': last and success,
+                'info': info,
+                'step_seconds': None,
+                'frames': {key: seed + 1000 * (step + 1) + j for j, key in enumerate(frame_keys)},
+            })
+        return episode
+
+
+class _ReplayEnv:
+    """Episode bookkeeping shared by the fake environments."""
+    env_name = None
+    replay = None  # ReplaySource, bound by make_env_module
+
+    def __init__(self, eval_set, log_path, down_sample_ratio=1.0, selected_indexes=[], resolution=500):
+        assert eval_set in EVAL_SETS[self.env_name]
+        self.eval_set = eval_set
+        self.resolution = resolution
+        self._root, self.dataset = self.replay.episodes(eval_set)
+        if len(selected_indexes):
+            self.dataset = [self.dataset[i] for i in selected_indexes]
+        elif down_sample_ratio < 1.0:
+            self.dataset = self.dataset[:int(len(self.dataset) * down_sample_ratio)]
+        self.number_of_episodes = len(self.dataset)
+        self.selected_indexes = selected_indexes
+        self._reset = False
+        self._current_episode_num = 0
+        self._current_step = 0
+        self._max_episode_steps = MAX_EPISODE_STEPS[self.env_name]
+        self._cur_invalid_actions = 0
+        self._max_invalid_actions = 10
+        self._episode_start_time = 0
+        self.episode_log = []
+        self.episode_language_instruction = ''
+        self.episode_data = None
+        # the real environments know their action space before the first reset
+        self.language_skill_set = list(self.dataset[0].get('language_skill_set') or []) if self.dataset else []
+        self.log_path = log_path
+        self._episode = None
+        self._frames = {}
+
+    def _load_frames(self, refs):
+        self._frames = {key: self.replay.frame(self._root, ref) for key, ref in refs.items()}
+
+    def _start_episode(self):
+        assert self._current_episode_num < self.number_of_episodes
+        self._episode = self.dataset[self._current_episode_num]
+        time.sleep(self.replay.duration(self._episode.get('reset_seconds')))
+        self._load_frames(self._episode['frames'])
+        self.episode_language_instruction = self._episode['instruction']
+        self.episode_data = self._episode.get('episode_data')
+        if self._episode.get('language_skill_set'):
+            self.language_skill_set = list(self._episode['language_skill_set'])
+        self._current_step = 0
+        self._cur_invalid_actions = 0
+        self._current_episode_num += 1
+        self._reset = True
+        self.episode_log = []
+        self._episode_start_time = time.time()
+
+    def _replay_step(self):
+        """Advance one step and return the recorded ``(reward, done, info)``."""
+        assert self._reset, 'Reset env before stepping'
+        self._current_step += 1
+        steps = self._episode['steps']
+        record = steps[min(self._current_step, len(steps)) - 1]
+        time.sleep(self.replay.duration(record.get('step_seconds')))
+        self._load_frames(record['frames'])
+        done = bool(record['done']) or self._current_step >= len(steps)
+        info = dict(record['info'])
+        return record['reward'], done, info
+
+    def _episode_idx(self):
+        return self._current_episode_num if not len(self.selected_indexes) else self.selected_indexes[self._current_episode_num - 1] + 1
+
+    def _save_frame(self, frame, image_path):
+        Image.fromarray(np.asarray(frame)).save(image_path)
+        return image_path
+
+    def _write_episode_log(self):
+        if not os.path.exists(self.log_path):
+            os.makedirs(self.log_path)
+        filename = 'episode_{}_step_{}.json'.format(self._episode_idx(), self._current_step)
+        if len(self.episode_log):
+            with open(os.path.join(self.log_path, filename), 'w', encoding='utf-8') as f:
+                for item in self.episode_log:
+                    item.pop('object_states', None)
+                    json.dump(item, f, ensure_ascii=False)
+                    f.write('\n')
+
+    def seed(self, seed=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeAlfEnv(_ReplayEnv):
+    env_name = 'eb-alf'
+
+    def __init__(self, eval_set='base', exp_name='', down_sample_ratio=1.0, selected_indexes=[], detection_box=False,
+                 resolution=500, tasks_per_task_type=None, task_selection_seed=42, task_store=None):
+        super().__init__(eval_set, 'running/eb_alfred/{}'.format(exp_name), down_sample_ratio, selected_indexes, resolution)
+        self.detection = detection_box
+        self.feedback_verbosity = 0
+
+    def reset(self):
+        self._start_episode()
+        return {'head_rgb': self._frames['head_rgb']}
+
+    def step(self, action, reasoning=''):
+        reward, done, info = self._replay_step()
+        if not info['last_action_success']:
+            self._cur_invalid_actions += 1
+        if self._current_step >= self._max_episode_steps or info['task_success'] or self._cur_invalid_actions >= self._max_invalid_actions:
+            done = True
+        info['instruction'] = self.episode_language_instruction
+        info['env_step'] = self._current_step
+        info['episode_elapsed_seconds'] = time.time() - self._episode_start_time
+        info['object_states'] = {}
+        info['action_id'] = action
+        info['action_description'] = self.language_skill_set[action] if type(action) == int else action
+        info['reasoning'] = reasoning
+        self.episode_log.append(info)
+        return {'head_rgb': self._frames['head_rgb']}, reward, done, info
+
+    def save_image(self, *args, **kwargs):
+        episode_idx = self._episode_idx()
+        folder = self.log_path + '/images/episode_{}'.format(episode_idx)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        image_path = os.path.join(folder, 'episode_{}_step_{}.png'.format(episode_idx, self._current_step))
+        return self._save_frame(self._frames['head_rgb'], image_path)
+
+    def save_episode_log(self):
+        self._write_episode_log()
+
+
+class FakeHabEnv(_ReplayEnv):
+    env_name = 'eb-hab'
+
+    def __init__(self, eval_set='train', exp_name='', down_sample_ratio=1.0, start_epi_index=0, resolution=500, recording=False):
+        super().__init__(eval_set, 'running/eb_habitat/{}'.format(exp_name), 1.0, [], resolution)
+        self.number_of_episodes = self.number_of_episodes * down_sample_ratio
+        self._current_episode_num = start_epi_index
+        self.is_holding = False
+        self.feedback_verbosity = 1
+        self.recording = recording
+        self.episode_video = []
+
+    def reset(self, **kwargs):
+        self._start_episode()
+        return {'head_rgb': self._frames['head_rgb']}
+
+    def step(self, action, reasoning='', **kwargs):
+        reward, done, info = self._replay_step()
+        if not info['last_action_success']:
+            self._cur_invalid_actions += 1
+        if self._current_step >= self._max_episode_steps or self._cur_invalid_actions >= self._max_invalid_actions:
+            done = True
+        info['env_step'] = self._current_step
+        info['episode_elapsed_seconds'] = time.time() - self._episode_start_time
+        info['action_id'] = action
+        info['action_description'] = self.language_skill_set[action]
+        info['reasoning'] = reasoning
+        info['instruction'] = self.episode_language_instruction
+        info.setdefault('subgoal_reward', 0.0)
+        if info['task_success']:
+            info['task_progress'] = 1.0
+        self.episode_log.append(info)
+        return {'head_rgb': self._frames['head_rgb']}, reward, done, info
+
+    def save_image(self, obs, key='head_rgb'):
+        folder = self.log_path + '/images/episode_{}'.format(self._current_episode_num)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        image_path = os.path.join(folder, 'episode_{}_step_{}.png'.format(self._current_episode_num, self._current_step))
+        return self._save_frame(obs[key], image_path)
+
+    def save_episode_log(self):
+        self._write_episode_log()
+
+
+class FakeNavEnv(_ReplayEnv):
+    env_name = 'eb-nav'
+
+    def __init__(self, eval_set='base', exp_name='test_base', down_sample_ratio=1.0, fov=100, multiview=False,
+                 boundingbox=False, multistep=False, resolution=500, selected_indexes=[]):
+        super().__init__(eval_set, 'running/eb_navigation/{}'.format(exp_name), down_sample_ratio, selected_indexes, resolution)
+        self.language_skill_set = list(NAV_SKILLSET)
+        self.multiview = multiview
+        self.boundingbox = boundingbox
+        self.multistep = multistep
+        self.img_paths = []
+
+    def reset(self, **kwargs):
+        self._start_episode()
+        self.img_paths = []
+        return {'head_rgb': self._frames['head_rgb']}
+
+    def step(self, action, reasoning, i_flag):
+        reward, done, info = self._replay_step()
+        if type(action) != int or action > 7 or action < 0:
+            action = np.random.randint(8)
+        if self._current_step >= self._max_episode_steps or info['task_success']:
+            done = True
+        info['action_description'] = self.language_skill_set[action]
+        info['reasoning'] = reasoning
+        info['instruction'] = self.episode_language_instruction
+        info['env_step'] = self._current_step
+        info['episode_elapsed_seconds'] = time.time() - self._episode_start_time
+        info['action_id'] = action
+        self.episode_log.append(info)
+        self.save_episode_log_per_step(i_flag)
+        self.episode_log = []
+        return {'head_rgb': self._frames['head_rgb']}, reward, done, info
+
+    def save_image(self, *args, **kwargs):
+        if not os.path.exists(self.log_path):
+            os.makedirs(self.log_path)
+        time_stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
+        suffix = 'front_bb' if self.boundingbox else 'front'
+        image_path = os.path.join(self.log_path, 'episode_{}_step_{}_{}_{}.png'.format(self._episode_idx(), self._current_step, time_stamp, suffix))
+        self._save_frame(self._frames['head_rgb'], image_path)
+        if self.multistep:
+            self.img_paths.append(image_path)
+            return self.img_paths[-3:]
+        return image_path
+
+    def save_episode_log_per_step(self, flag):
+        if not os.path.exists(self.log_path):
+            os.makedirs(self.log_path)
+        if len(self.episode_log):
+            with open(os.path.join(self.log_path, 'episode_{}.json'.format(self._episode_idx())), 'a') as f:
+                if flag == 1:
+                    f.write('\n\n')
+                for item in self.episode_log:
+                    json.dump(item, f, ensure_ascii=False)
+                    f.write('\n')
+
+
+class FakeManEnv(_ReplayEnv):
+    env_name = 'eb-man'
+
+    def __init__(self, eval_set, render_mode='human', img_size=(500, 500), down_sample_ratio=1.0, log_path=None,
+                 selected_indexes=[], tasks_per_variation=None, task_selection_seed=42):
+        super().__init__(eval_set, log_path if log_path is not None else 'running/eb_manipulation/{}'.format(eval_set),
+                         down_sample_ratio, selected_indexes, img_size[0])
+        self.task_class = None
+        self.current_task_variation = None
+        self.last_frame_obs = None
+
+    def _observation(self):
+        obs = dict(self._frames)
+        obs['avg_obj_coord'] = self._episode.get('avg_obj_coord', '{}')
+        return obs
+
+    def reset(self):
+        self._start_episode()
+        self.current_task_variation = self._episode['task_variation']
+        self.task_class = self.current_task_variation.split('_')[0]
+        self.last_frame_obs = self._observation()
+        return self.episode_language_instruction, types.SimpleNamespace(**self.last_frame_obs)
+
+    def step(self, discrete_action):
+        reward, done, info = self._replay_step()
+        self.last_frame_obs = self._observation()
+        action_success = info.get('action_success', info.get('last_action_success', 1.0))
+        info = {
+            'env_feedback': info.get('env_feedback', ''),
+            'instruction': self.episode_language_instruction,
+            'env_step': self._current_step,
+            'episode_elapsed_seconds': time.time() - self._episode_start_time,
+            'episode_num': self._current_episode_num,
+            'action': discrete_action,
+            'action_success': float(action_success),
+            'task_success': float(info['task_success']),
+        }
+        if self._current_step >= self._max_episode_steps:
+            done = True
+        self.episode_log.append(info)
+        return self.last_frame_obs, reward, done, info
+
+    def save_image(self, key=['front_rgb']):
+        log_path = self.log_path + '/images/' + f"episode_{self._current_episode_num}"
+        if not os.path.exists(log_path):
+            os.makedirs(log_path)
+        image_path_list = []
+        for cam_view in key:
+            image_path = os.path.join(log_path, 'episode_{}_step_{}_{}.png'.format(self._current_episode_num, self._current_step, cam_view))
+            image_path_list.append(self._save_frame(self.last_frame_obs[cam_view], image_path))
+        return image_path_list
+
+
+def form_object_coord_for_input(obs, task_class, camera_types):
+    """Replayed counterpart of ``eb_man_utils.form_object_coord_for_input``."""
+    return obs.get('avg_obj_coord', '{}'), [], [], []
+
+
+def draw_xyz_coordinate(image_path, resolution):
+    """Re-encode the image like ``eb_man_utils.draw_xyz_coordinate`` does, without the axes overlay."""
+    Image.open(image_path).save(image_path)
+    return image_path
+
+
+def draw_bounding_boxes(image_path_list, world_points, camera_extrinsics_list, camera_intrinsics_list):
+    return image_path_list
+
+
+FAKE_ENV_CLASSES = {'eb-alf': FakeAlfEnv, 'eb-hab': FakeHabEnv, 'eb-nav': FakeNavEnv, 'eb-man': FakeManEnv}
+
+
+def make_env_modules(replay):
+    """Build module objects that stand in for the simulator-backed modules of ``replay.env_name``.
+
+    Returns a dict mapping module names to modules, ready to be placed in ``sys.modules``.
+    """
+    env_name = replay.env_name
+    env_class = type(FAKE_ENV_CLASSES[env_name].__name__, (FAKE_ENV_CLASSES[env_name],), {'replay': replay})
+    modules = {}
+    if env_name == 'eb-alf':
+        module = types.ModuleType('embodiedbench.envs.eb_alfred.EBAlfEnv')
+        module.EBAlfEnv = env_class
+        module.ValidEvalSets = EVAL_SETS[env_name]
+        modules[module.__name__] = module
+    elif env_name == 'eb-hab':
+        # the real package __init__ imports habitat
+        package = types.ModuleType('embodiedbench.envs.eb_habitat')
+        package.__path__ = []
+        module = types.ModuleType('embodiedbench.envs.eb_habitat.EBHabEnv')
+        module.EBHabEnv = env_class
+        module.ValidEvalSets = EVAL_SETS[env_name]
+        package.EBHabEnv = module
+        modules[package.__name__] = package
+        modules[module.__name__] = module
+    elif env_name == 'eb-nav':
+        module = types.ModuleType('embodiedbench.envs.eb_navigation.EBNavEnv')
+        module.EBNavigationEnv = env_class
+        module.ValidEvalSets = EVAL_SETS[env_name]
+        module.DISCRETE_SKILLSET = list(NAV_SKILLSET)
+        modules[module.__name__] = module
+    else:
+        utils = types.ModuleType('embodiedbench.envs.eb_manipulation.eb_man_utils')
+        utils.ROTATION_RESOLUTION = 3
+        utils.VOXEL_SIZE = 100
+        utils.form_object_coord_for_input = form_object_coord_for_input
+        utils.draw_xyz_coordinate = draw_xyz_coordinate
+        utils.draw_bounding_boxes = draw_bounding_boxes
+        modules[utils.__name__] = utils
+        for name in ('embodiedbench.envs.eb_manipulation.EBManEnv_re', 'embodiedbench.envs.eb_manipulation.EBManEnv'):
+            module = types.ModuleType(name)
+            module.EBManEnv = env_class
+            module.EVAL_SETS = MAN_EVAL_SETS
+            module.ValidEvalSets = EVAL_SETS[env_name]
+            modules[name] = module
+    return modules
+
+
+class TraceRecorder:
+    """Wrap a real environment and record what it returns into a trace directory.
+
+    Every attribute is forwarded to the wrapped environment. Recorded episodes are
+    appended to ``<trace_dir>/episodes.jsonl`` when the next episode starts or the
+    environment is closed.
+    """
+
+    def __init__(self, env, env_name, trace_dir):
+        self.__dict__['_env'] = env
+        self.__dict__['_env_name'] = env_name
+        self.__dict__['_trace_dir'] = trace_dir
+        self.__dict__['_episode'] = None
+        os.makedirs(os.path.join(trace_dir, 'frames'), exist_ok=True)
+
+    def __getattr__(self, name):
+        return getattr(self._env, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._env, name, value)
+
+    def _save_frames(self, obs, tag):
+        if not isinstance(obs, dict):
+            obs = vars(obs)
+        refs = {}
+        for key in FRAME_KEYS[self._env_name]:
+            if obs.get(key) is not None:
+                refs[key] = 'frames/{}_{}.npy'.format(tag, key)
+                np.save(os.path.join(self._trace_dir, refs[key]), np.asarray(obs[key], dtype=np.uint8))
+        return refs
+
+    def _flush(self):
+        if self._episode is not None:
+            with open(os.path.join(self._trace_dir, 'episodes.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self._episode, ensure_ascii=False, default=str) + '\n')
+        self.__dict__['_episode'] = None
+
+    def _object_coord(self, obs):
+        from embodiedbench.envs.eb_manipulation.eb_man_utils import form_object_coord_for_input as real_form
+        if not isinstance(obs, dict):
+            obs = vars(obs)
+        return str(real_form(dict(obs), self._env.task_class, ['front_rgb'])[0])
+
+    def reset(self, *args, **kwargs):
+        self._flush()
+        start = time.time()
+        out = self._env.reset(*args, **kwargs)
+        reset_seconds = time.time() - start
+        obs = out[1] if self._env_name == 'eb-man' else out
+        tag = 'e{}_s0'.format(self._env._current_episode_num)
+        episode = {
+            'instruction': self._env.episode_language_instruction,
+            'language_skill_set': list(self._env.language_skill_set or []) if self._env_name != 'eb-man' else [],
+            'reset_seconds': reset_seconds,
+            'frames': self._save_frames(obs, tag),
+            'steps': [],
+        }
+        if self._env_name == 'eb-alf' and self._env.episode_data is not None:
+            episode['episode_data'] = {'task_type': self._env.episode_data.get('task_type', '')}
+        if self._env_name == 'eb-man':
+            episode['task_variation'] = self._env.current_task_variation
+            episode['avg_obj_coord'] = self._object_coord(obs)
+        self.__dict__['_episode'] = episode
+        return out
+
+    def step(self, *args, **kwargs):
+        start = time.time()
+        obs, reward, done, info = self._env.step(*args, **kwargs)
+        step_seconds = time.time() - start
+        keys = ('task_success', 'task_progress', 'last_action_success', 'action_success', 'env_feedback',
+                'subgoal_reward', 'distance')
+        self._episode['steps'].append({
+            'reward': float(reward),
+            'done': bool(done),
+            'info': {key: info[key] for key in keys if key in info},
+            'step_seconds': step_seconds,
+            'frames': self._save_frames(obs, 'e{}_s{}'.format(self._env._current_episode_num, self._env._current_step)),
+        })
+        return obs, reward, done, info
+
+    def close(self):
+        self._flush()
+        return self._env.close()
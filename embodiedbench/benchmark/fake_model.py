@@ -0,0 +1,151 @@
+"""
+Stand-in for ``RemoteModel``/``CustomModel`` used by the benchmark harness.
+
+``FakeModel`` accepts the same constructor arguments as ``RemoteModel`` and answers
+both call styles used by the planners (``respond(message_history)`` for remote models
+and ``respond(prompt, obs)`` for custom models) with a valid plan in the json format
+the planners expect. The time a real model would need is simulated with a
+``LatencyModel``, so the evaluation loop can be profiled without network access.
+"""
+import re
+import json
+import time
+import random
+
+from embodiedbench.tracing import tracer
+
+# mirrors eb_man_utils, which cannot be imported without pyrep
+VOXEL_SIZE = 100
+ROTATION_RESOLUTION = 3
+
+_ACTION_RANGE_PATTERN = re.compile(r'action id \(0 ~ (\d+)\)')
+_ACTION_ID_PATTERN = re.compile(r'action id (\d+):')
+
+
+class LatencyModel:
+    """Deterministic latency distribution.
+
+    Specs have the form ``<kind>:<comma separated arguments>``:
+
+        zero                    no delay
+        const:0.8               fixed delay in seconds
+        uniform:0.5,2.0         uniform between low and high
+        normal:1.2,0.3          gaussian with mean and std, clipped at 0
+        lognormal:0.0,0.5       exp of a gaussian with mu and sigma
+        replay:latencies.json   cycle through recorded latencies (a json list of seconds)
+    """
+
+    KINDS = ('zero', 'const', 'uniform', 'normal', 'lognormal', 'replay')
+
+    def __init__(self, spec='zero', seed=0, scale=1.0):
+        kind, _, args = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError('Unknown latency distribution: {}'.format(spec))
+        self.spec = spec
+        self.kind = kind
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self._replay_index = 0
+        if kind == 'replay':
+            with open(args, 'r') as f:
+                self.params = [float(x) for x in json.load(f)]
+            if not self.params:
+                raise ValueError('No latencies recorded in {}'.format(args))
+        else:
+            self.params = [float(x) for x in args.split(',')] if args else []
+
+    def sample(self):
+        if self.kind == 'zero':
+            value = 0.0
+        elif self.kind == 'const':
+            value = self.params[0]
+        elif self.kind == 'uniform':
+            value = self.rng.uniform(self.params[0], self.params[1])
+        elif self.kind == 'normal':
+            value = max(0.0, self.rng.gauss(self.params[0], self.params[1]))
+        elif self.kind == 'lognormal':
+            value = self.rng.lognormvariate(self.params[0], self.params[1])
+        else:
+            value = self.params[self._replay_index % len(self.params)]
+            self._replay_index += 1
+        return value * self.scale
+
+    def wait(self):
+        seconds = self.sample()
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+
+def _prompt_text(message_history):
+    """Text of the last user message, for both ``respond`` call styles."""
+    if isinstance(message_history, str):
+        return message_history
+    for message in reversed(message_history):
+        if message.get('role') != 'user':
+            continue
+        content = message['content']
+        if isinstance(content, str):
+            return content
+        return '\n'.join(item['text'] for item in content if item.get('type') == 'text')
+    return ''
+
+
+class FakeModel:
+    def __init__(self, model_name, model_type='remote', language_only=False, tp=1, task_type=None,
+                 latency='zero', seed=0, max_plan_length=5, json_error_rate=0.0):
+        """
+        Args:
+            model_name, model_type, language_only, tp, task_type: same as ``RemoteModel``
+            latency: ``LatencyModel`` or latency spec string
+            seed: seed for the generated plans and the latency samples
+            max_plan_length: plans hold between 1 and ``max_plan_length`` actions
+            json_error_rate: fraction of responses that are truncated, invalid json
+        """
+        self.model_name = model_name
+        self.model_type = model_type
+        self.language_only = language_only
+        self.task_type = task_type
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency, seed=seed)
+        self.rng = random.Random(seed)
+        self.max_plan_length = max_plan_length
+        self.json_error_rate = json_error_rate
+        self.num_actions = 1
+        self.num_calls = 0
+
+    def _update_num_actions(self, prompt):
+        match = _ACTION_RANGE_PATTERN.search(prompt)
+        if match:
+            self.num_actions = int(match.group(1)) + 1
+            return
+        ids = _ACTION_ID_PATTERN.findall(prompt)
+        if ids:
+            self.num_actions = max(int(i) for i in ids) + 1
+
+    def _plan(self):
+        length = self.rng.randint(1, self.max_plan_length)
+        if self.task_type == 'manip':
+            rotation_bins = int(360 / ROTATION_RESOLUTION) - 1
+            executable_plan = [{'action': [self.rng.randint(0, VOXEL_SIZE) for _ in range(3)] +
+                                          [self.rng.randint(0, rotation_bins) for _ in range(3)] +
+                                          [self.rng.randint(0, 1)]}
+                               for _ in range(length)]
+        else:
+            executable_plan = [{'action_id': action_id, 'action_name': 'action {}'.format(action_id)}
+                               for action_id in (self.rng.randrange(self.num_actions) for _ in range(length))]
+        return {
+            'visual_state_description': 'synthetic benchmark response',
+            'reasoning_and_reflection': 'synthetic benchmark response',
+            'language_plan': 'synthetic benchmark response',
+            'executable_plan': executable_plan,
+        }
+
+    @tracer.trace('model.respond')
+    def respond(self, message_history, obs=None):
+        self._update_num_actions(_prompt_text(message_history))
+        self.latency.wait()
+        self.num_calls += 1
+        out = json.dumps(self._plan())
+        if self.json_error_rate and self.rng.random() < self.json_error_rate:
+            out = out[:len(out) // 2]
+        return out
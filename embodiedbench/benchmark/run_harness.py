@@ -0,0 +1,335 @@
+"""
+End-to-end benchmark of the evaluation loop without simulators or model APIs.
+
+The real evaluator classes in ``embodiedbench/evaluator`` are run unchanged; only the
+simulator-backed environment modules are replaced by the replay environments of
+``fake_envs`` and ``RemoteModel``/``CustomModel`` by ``FakeModel``. The harness reports
+episodes per hour, a latency breakdown per stage of the loop and memory usage.
+
+Example:
+    python -m embodiedbench.benchmark.run_harness --env eb-alf --episodes 20 --latency lognormal:0.0,0.4
+    python -m embodiedbench.benchmark.run_harness --env eb-man --trace_dir traces/eb_man --sim_time_scale 0.5
+    python -m embodiedbench.benchmark.run_harness --env eb-man-legacy --episodes 10
+
+``eb-man`` runs the ``_re`` manipulation evaluator and ``eb-man-legacy`` the original one; both
+replay the ``eb-man`` episodes.
+
+Traces of the real environments can be recorded on a machine with the simulators installed:
+    python -m embodiedbench.benchmark.run_harness --env eb-nav --record traces/eb_nav --eval_sets base
+"""
+import os
+import sys
+import json
+import time
+import yaml
+import argparse
+import resource
+import importlib
+import functools
+import contextlib
+import tempfile
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+from embodiedbench.benchmark.fake_model import FakeModel, LatencyModel
+from embodiedbench.benchmark.fake_envs import ReplaySource, TraceRecorder, make_env_modules
+
+EVALUATOR_MODULES = {
+    'eb-alf': ('embodiedbench.evaluator.eb_alfred_evaluator', 'EB_AlfredEvaluator'),
+    'eb-hab': ('embodiedbench.evaluator.eb_habitat_evaluator', 'EB_HabitatEvaluator'),
+    'eb-nav': ('embodiedbench.evaluator.eb_navigation_evaluator', 'EB_NavigationEvaluator'),
+    'eb-man': ('embodiedbench.evaluator.eb_manipulation_evaluator_re', 'EB_ManipulationEvaluator'),
+    'eb-man-legacy': ('embodiedbench.evaluator.eb_manipulation_evaluator', 'EB_ManipulationEvaluator'),
+}
+# the evaluators import their environment module on first use, through its module attribute
+ENV_MODULES = {
+    'eb-alf': ('embodiedbench.envs.eb_alfred.EBAlfEnv', 'EBAlfEnv'),
+    'eb-hab': ('embodiedbench.envs.eb_habitat.EBHabEnv', 'EBHabEnv'),
+    'eb-nav': ('embodiedbench.envs.eb_navigation.EBNavEnv', 'EBNavigationEnv'),
+    'eb-man': ('embodiedbench.envs.eb_manipulation.EBManEnv_re', 'EBManEnv'),
+    'eb-man-legacy': ('embodiedbench.envs.eb_manipulation.EBManEnv', 'EBManEnv'),
+}
+PLANNER_MODULES = {
+    'eb-alf': ('embodiedbench.planner.vlm_planner', 'VLMPlanner'),
+    'eb-hab': ('embodiedbench.planner.vlm_planner', 'VLMPlanner'),
+    'eb-nav': ('embodiedbench.planner.nav_planner', 'EBNavigationPlanner'),
+    'eb-man': ('embodiedbench.planner.manip_planner_re', 'ManipPlanner'),
+    'eb-man-legacy': ('embodiedbench.planner.manip_planner', 'ManipPlanner'),
+}
+# harness environments that replay the episodes of another one
+REPLAY_ENV_NAMES = {'eb-man-legacy': 'eb-man'}
+CONFIG_FILES = {'eb-man': 'eb-man_re.yaml', 'eb-man-legacy': 'eb-man.yaml'}
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../configs')
+# stages that do not overlap; the rest of the wall time is evaluator bookkeeping
+TOP_LEVEL_STAGES = ('env.reset', 'env.step', 'env.save_image', 'planner.act', 'summarize')
+
+
+class StageTimer:
+    """Collect wall-clock samples of patched methods, grouped by stage name."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._patches = []
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        samples = self.samples[stage]
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        had_own = name in vars(owner)
+        self._patches.append((owner, name, vars(owner).get(name), had_own))
+        setattr(owner, name, staticmethod(timed) if isinstance(vars(owner).get(name), staticmethod) else timed)
+
+    def restore(self):
+        for owner, name, original, had_own in reversed(self._patches):
+            if had_own:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+        self._patches = []
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.asarray(samples) * 1000
+            stages[stage] = {
+                'count': len(samples),
+                'total_seconds': float(values.sum() / 1000),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p90_ms': float(np.percentile(values, 90)),
+                'p99_ms': float(np.percentile(values, 99)),
+                'max_ms': float(values.max()),
+            }
+        return stages
+
+
+def load_config(env_name, overrides=None):
+    """Evaluator config as ``main.py`` builds it, from ``configs/<env>.yaml`` plus overrides."""
+    config_file = CONFIG_FILES.get(env_name, '{}.yaml'.format(env_name))
+    with open(os.path.join(CONFIG_DIR, config_file), 'r') as f:
+        config = yaml.safe_load(f)
+    config.update(overrides or {})
+    return config
+
+
+@contextlib.contextmanager
+def _isolated_imports():
+    """Drop evaluator and planner modules imported inside the block, so they do not keep fake bindings."""
+    before = set(sys.modules)
+    try:
+        yield
+    finally:
+        for name in set(sys.modules) - before:
+            if name.startswith('embodiedbench.') and not name.startswith('embodiedbench.benchmark'):
+                del sys.modules[name]
+
+
+@contextlib.contextmanager
+def simulated_backends(replay, latency='zero', seed=0, fake_model=True, fake_envs=True, env_name=None, **model_kwargs):
+    """Install the replay environments and ``FakeModel`` for the evaluator of ``env_name``.
+
+    ``env_name`` defaults to ``replay.env_name``. Yields the evaluator class, which has to be
+    imported while the fakes are installed.
+    """
+    env_name = env_name or replay.env_name
+    modules = make_env_modules(replay) if fake_envs else {}
+    saved = {name: sys.modules.get(name) for name in modules}
+    patched = []
+    with _isolated_imports():
+        sys.modules.update(modules)
+        try:
+            if fake_model:
+                planner_module = importlib.import_module(PLANNER_MODULES[env_name][0])
+                instances = []
+
+                def remote_factory(model_name, model_type='remote', language_only=False, tp=1, task_type=None):
+                    instances.append(model_name)
+                    return FakeModel(model_name, model_type, language_only, tp=tp, task_type=task_type,
+                                     latency=LatencyModel(latency, seed=seed + len(instances)),
+                                     seed=seed + len(instances), **model_kwargs)
+
+                def custom_factory(model_name, language_only):
+                    return remote_factory(model_name, 'custom', language_only,
+                                          task_type='manip' if replay.env_name == 'eb-man' else None)
+
+                for name, factory in (('RemoteModel', remote_factory), ('CustomModel', custom_factory)):
+                    patched.append((planner_module, name, getattr(planner_module, name)))
+                    setattr(planner_module, name, factory)
+            module_name, class_name = EVALUATOR_MODULES[env_name]
+            yield getattr(importlib.import_module(module_name), class_name)
+        finally:
+            for module, name, original in patched:
+                setattr(module, name, original)
+            for name, module in saved.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+
+
+def _instrument(timer, evaluator_class, env_name):
+    env_module, env_class_name = ENV_MODULES[env_name]
+    env_class = getattr(importlib.import_module(env_module), env_class_name)
+    planner_module, planner_name = PLANNER_MODULES[env_name]
+    for name in ('reset', 'step', 'save_image'):
+        timer.wrap(env_class, name, 'env.' + name)
+    timer.wrap(getattr(sys.modules[planner_module], planner_name), 'act', 'planner.act')
+    timer.wrap(FakeModel, 'respond', 'model.respond')
+    if REPLAY_ENV_NAMES.get(env_name, env_name) == 'eb-man':
+        timer.wrap(evaluator_class, 'print_task_eval_results', 'summarize')
+    else:
+        timer.wrap(importlib.import_module('embodiedbench.evaluator.results_warehouse'), 'summarize_results', 'summarize')
+
+
+def run_benchmark(env_name, num_episodes=10, eval_sets=('base',), trace_dir=None, latency='zero',
+                  sim_latency='zero', sim_time_scale=1.0, resolution=500, seed=0, config_overrides=None,
+                  workdir=None, trace_memory=False, quiet=True, **model_kwargs):
+    """Run the real evaluator of ``env_name`` against replayed episodes and a fake model.
+
+    Returns a report dict with throughput, per-stage latencies and memory usage.
+    """
+    replay = ReplaySource(REPLAY_ENV_NAMES.get(env_name, env_name), trace_dir=trace_dir, num_episodes=num_episodes,
+                          resolution=resolution, seed=seed, sim_latency=sim_latency, sim_time_scale=sim_time_scale)
+    workdir = os.path.abspath(workdir) if workdir else tempfile.mkdtemp(prefix='eb_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    config = load_config(env_name, {'model_name': 'bench-model', 'model_type': 'remote', 'exp_name': 'bench',
+                                     'eval_sets': list(eval_sets), 'resolution': resolution,
+                                     'warehouse_dir': os.path.join(workdir, 'running/warehouse')})
+    config.update(config_overrides or {})
+
+    timer = StageTimer()
+    cwd = os.getcwd()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        os.chdir(workdir)
+        with simulated_backends(replay, latency=latency, seed=seed, env_name=env_name, **model_kwargs) as evaluator_class:
+            _instrument(timer, evaluator_class, env_name)
+            try:
+                evaluator = evaluator_class(config)
+                evaluator.check_config_valid()
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                    start = time.perf_counter()
+                    evaluator.evaluate_main()
+                    wall_seconds = time.perf_counter() - start
+            finally:
+                timer.restore()
+    finally:
+        os.chdir(cwd)
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+    stages = timer.summary()
+    episodes = stages.get('env.reset', {}).get('count', 0)
+    attributed = sum(stages[stage]['total_seconds'] for stage in TOP_LEVEL_STAGES if stage in stages)
+    return {
+        'env': env_name,
+        'eval_sets': list(eval_sets),
+        'episodes': episodes,
+        'wall_seconds': wall_seconds,
+        'episodes_per_hour': episodes / wall_seconds * 3600 if wall_seconds > 0 else 0.0,
+        'stages': stages,
+        'other_seconds': wall_seconds - attributed,
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'tracemalloc_peak_mb': traced_peak / 2 ** 20 if traced_peak is not None else None,
+        'workdir': workdir,
+    }
+
+
+def record_traces(env_name, trace_dir, eval_sets=('base',), num_episodes=None, real_model=False, latency='zero',
+                  seed=0, config_overrides=None):
+    """Run an evaluator against the real environment and record its episodes for later replay."""
+    config = load_config(env_name, {'eval_sets': list(eval_sets)})
+    if not real_model:
+        config.update({'model_name': 'bench-model', 'model_type': 'remote'})
+    config.update(config_overrides or {})
+    replay = ReplaySource(REPLAY_ENV_NAMES.get(env_name, env_name))
+    with simulated_backends(replay, latency=latency, seed=seed, fake_model=not real_model, fake_envs=False,
+                            env_name=env_name) as evaluator_class:
+        env_module, env_attr = ENV_MODULES[env_name]
+        env_module = importlib.import_module(env_module)
+        real_env_class = getattr(env_module, env_attr)
+
+        def recording_env(*args, **kwargs):
+            env = real_env_class(*args, **kwargs)
+            if num_episodes is not None:
+                env.number_of_episodes = min(env.number_of_episodes, num_episodes)
+            return TraceRecorder(env, replay.env_name, os.path.join(trace_dir, kwargs['eval_set']))
+
+        setattr(env_module, env_attr, recording_env)
+        try:
+            evaluator = evaluator_class(config)
+            evaluator.check_config_valid()
+            evaluator.evaluate_main()
+            if evaluator.env is not None:
+                evaluator.env.close()
+        finally:
+            setattr(env_module, env_attr, real_env_class)
+
+
+def format_report(report):
+    lines = ['{env}: {episodes} episodes in {wall_seconds:.1f}s -> {episodes_per_hour:.1f} episodes/hour'.format(**report),
+             '{:<16}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}'.format('stage', 'count', 'total_s', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')]
+    for stage, values in sorted(report['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+        lines.append('{:<16}{count:>8}{total_seconds:>10.2f}{p50_ms:>10.1f}{p90_ms:>10.1f}{p99_ms:>10.1f}{max_ms:>10.1f}'.format(stage, **values))
+    lines.append('{:<16}{:>8}{:>10.2f}'.format('other', '', report['other_seconds']))
+    memory = 'max rss: {:.1f} MB'.format(report['max_rss_mb'])
+    if report['tracemalloc_peak_mb'] is not None:
+        memory += ', python heap peak: {:.1f} MB'.format(report['tracemalloc_peak_mb'])
+    lines.append(memory)
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the evaluation loop with replayed environments and a fake model.')
+    parser.add_argument('--env', type=str, default='eb-alf', choices=list(EVALUATOR_MODULES))
+    parser.add_argument('--episodes', type=int, default=10, help='episodes per eval set')
+    parser.add_argument('--eval_sets', type=lambda s: s.split(','), default=['base'])
+    parser.add_argument('--trace_dir', type=str, default=None, help='recorded traces to replay (default: synthetic episodes)')
+    parser.add_argument('--latency', type=str, default='zero', help='model latency, e.g. const:1.0 or lognormal:0.0,0.5')
+    parser.add_argument('--sim_latency', type=str, default='zero', help='simulator latency of synthetic episodes')
+    parser.add_argument('--sim_time_scale', type=float, default=1.0, help='scale applied to simulator durations')
+    parser.add_argument('--resolution', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max_plan_length', type=int, default=5)
+    parser.add_argument('--json_error_rate', type=float, default=0.0)
+    parser.add_argument('--config', type=json.loads, default=None, help='json dict of evaluator config overrides')
+    parser.add_argument('--workdir', type=str, default=None)
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the peak python heap (slower)')
+    parser.add_argument('--verbose', action='store_true', help='keep the evaluator output')
+    parser.add_argument('--output', type=str, default=None, help='write the report as json')
+    parser.add_argument('--record', type=str, default=None, help='record traces of the real environment into this directory')
+    parser.add_argument('--real_model', action='store_true', help='use the configured model while recording')
+    parser.add_argument('--trace', action='store_true', help='write per-episode span timings and a Chrome trace')
+    args = parser.parse_args()
+    if args.trace:
+        args.config = dict(args.config or {}, trace=True)
+
+    if args.record is not None:
+        record_traces(args.env, args.record, args.eval_sets, num_episodes=args.episodes, real_model=args.real_model,
+                      latency=args.latency, seed=args.seed, config_overrides=args.config)
+        sys.exit(0)
+
+    report = run_benchmark(args.env, num_episodes=args.episodes, eval_sets=args.eval_sets, trace_dir=args.trace_dir,
+                           latency=args.latency, sim_latency=args.sim_latency, sim_time_scale=args.sim_time_scale,
+                           resolution=args.resolution, seed=args.seed, config_overrides=args.config,
+                           workdir=args.workdir, trace_memory=args.tracemalloc, quiet=not args.verbose,
+                           max_plan_length=args.max_plan_length, json_error_rate=args.json_error_rate)
+    print(format_report(report))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
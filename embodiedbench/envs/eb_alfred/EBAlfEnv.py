@@ -15,6 +15,8 @@ import os
 import time
 import gym
 import json
+import functools
+import collections
 import numpy as np
 from PIL import Image 
 
@@ -22,9 +24,12 @@ from PIL import Image
 import embodiedbench.envs.eb_alfred.utils as utils
 from embodiedbench.envs.eb_alfred.utils import alfred_objs, alfred_open_obj, alfred_pick_obj, alfred_slice_obj, alfred_open_obj, alfred_toggle_obj, alfred_recep
 from embodiedbench.envs.eb_alfred.thor_connector import ThorConnector
+from embodiedbench.envs.eb_alfred.task_store import TaskStore, TASK_STORE_PATH
 from embodiedbench.envs.eb_alfred.data.preprocess import Dataset
 from embodiedbench.envs.eb_alfred.gen import constants
+from embodiedbench.envs.eb_alfred.gen.utils.metadata_index import get_metadata_index
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 
 # global information
 X_DISPLAY = '0'
@@ -85,6 +90,40 @@ def get_global_action_space():
     return action_space
 
 
+ActionTable = collections.namedtuple('ActionTable', ['language_skill_set', 'skill_to_index', 'action_space'])
+
+
+@functools.lru_cache(maxsize=256)
+def get_scene_action_table(scene_name, recept_counts, pickable_counts):
+    """
+    Action space of a scene whose receptacle and pickupable types with multiple instances have the given
+    ((type, count), ...) counts: the global actions and the actions of the additional instances, with
+    the index of every action. Shared by every reset with the same key, do not modify.
+    """
+    add_findable_objs = sorted({key + '_{}'.format(i+1) for key, count in recept_counts for i in range(1, count)})
+    add_pickable_objs = sorted({key + '_{}'.format(i+1) for key, count in pickable_counts for i in range(1, count)})
+
+    # Generate find actions for additional objects
+    action_space = [f"find a {obj}" for obj in add_findable_objs]
+    for obj in add_findable_objs:
+        if obj.split('_')[0] in alfred_open_obj:
+            action_space.extend([
+                f"open the {obj}", 
+                f"close the {obj}"
+            ])
+    for obj in add_pickable_objs:
+        if obj.split('_')[0] in alfred_pick_obj:
+            action_space.extend([
+                f"find a {obj}", 
+            ])
+
+    language_skill_set = get_global_action_space() + action_space
+    skill_to_index = {}
+    for i, skill in enumerate(language_skill_set):
+        skill_to_index.setdefault(skill, i)
+    return ActionTable(language_skill_set, skill_to_index, gym.spaces.Discrete(len(language_skill_set)))
+
+
 class EBAlfEnv(gym.Env):
     """
     Custom OpenAI Gym environment for simulating household robot tasks.
@@ -94,13 +133,15 @@ class EBAlfEnv(gym.Env):
         action_space (gym.spaces.Discrete): Discrete action space 
         language_skill_set (list): Readable action descriptions
     """
-    def __init__(self, eval_set='base', exp_name='', down_sample_ratio=1.0, selected_indexes=[], detection_box=False, resolution=500, tasks_per_task_type=None, task_selection_seed=42):
+    def __init__(self, eval_set='base', exp_name='', down_sample_ratio=1.0, selected_indexes=[], detection_box=False, resolution=500, tasks_per_task_type=None, task_selection_seed=42, task_store=TASK_STORE_PATH):
         """
         Initialize the AI2THOR environment.
         
         Args:
             tasks_per_task_type: 각 task_type당 선택할 task 개수 (None이면 전체 사용)
             task_selection_seed: task 선택 시 사용할 시드
+            task_store: folder of the packed tasks (task_store.py); tasks are read from their json files
+                if the eval set was not packed or if None
         """
         super().__init__()
         self.data_path = ALFRED_SPLIT_PATH
@@ -112,6 +153,7 @@ class EBAlfEnv(gym.Env):
 
         # load dataset
         assert eval_set in ValidEvalSets
+        self.task_store = TaskStore.open(eval_set, task_store, self.data_path) if task_store else None
         self.down_sample_ratio = down_sample_ratio
         self.dataset = self._load_dataset(eval_set)
         if len(selected_indexes):
@@ -156,18 +198,16 @@ class EBAlfEnv(gym.Env):
         self.detection = detection_box # add detection in image
         self.name_to_id_dict = None
         self.id_to_name_dict = None
-        self.language_skill_set = get_global_action_space()
-        self.action_space = gym.spaces.Discrete(len(self.language_skill_set))
+        action_table = get_scene_action_table(None, (), ())
+        self.language_skill_set = action_table.language_skill_set
+        self.skill_to_index = action_table.skill_to_index
+        self.action_space = action_table.action_space
 
 
-    def generate_additional_action_space(self):
+    def generate_additional_action_space(self, scene_name=None):
         """
         Generate additional actions for receptacles with multiple instances
         """
-        # Generate pickup, putdown, and drop actions
-        add_findable_objs = []
-        add_pickable_objs = []
-
         recept_obj_dict = {}
         pickable_obj_dict = {}
         name_to_id_dict = {}
@@ -185,53 +225,39 @@ class EBAlfEnv(gym.Env):
 
     
         # store the mapping for object with multiple instances
-        for key in recept_obj_dict:
-            if len(recept_obj_dict[key]) >= 2:
-                for i in range(len(recept_obj_dict[key])):
-                    if i == 0:
-                        name_to_id_dict[key] = recept_obj_dict[key][i]
-                    else:
-                        name_to_id_dict[key + '_{}'.format(i+1)] = recept_obj_dict[key][i]
-                        add_findable_objs.append(key + '_{}'.format(i+1))
-        
-        for key in pickable_obj_dict:
-            if len(pickable_obj_dict[key]) >= 2:
-                for i in range(len(pickable_obj_dict[key])):
-                    if i == 0:
-                        name_to_id_dict[key] = pickable_obj_dict[key][i]
-                    else:
-                        name_to_id_dict[key + '_{}'.format(i+1)] = pickable_obj_dict[key][i]
-                        add_pickable_objs.append(key + '_{}'.format(i+1))
+        for obj_dict in (recept_obj_dict, pickable_obj_dict):
+            for key in obj_dict:
+                if len(obj_dict[key]) >= 2:
+                    for i in range(len(obj_dict[key])):
+                        if i == 0:
+                            name_to_id_dict[key] = obj_dict[key][i]
+                        else:
+                            name_to_id_dict[key + '_{}'.format(i+1)] = obj_dict[key][i]
 
         id_to_name_dict = {}
         for key in name_to_id_dict:
             id_to_name_dict[name_to_id_dict[key]] = key
 
-        # Generate find actions for additional objects
-        add_findable_objs = sorted(list(set(add_findable_objs)))
-        add_pickable_objs = sorted(list(set(add_pickable_objs)))
-        action_space = [f"find a {obj}" for obj in add_findable_objs]
-        for obj in add_findable_objs:
-            if obj.split('_')[0] in alfred_open_obj:
-                action_space.extend([
-                    f"open the {obj}", 
-                    f"close the {obj}"
-                ])
-        for obj in add_pickable_objs:
-            if obj.split('_')[0] in alfred_pick_obj:
-                action_space.extend([
-                    f"find a {obj}", 
-                ])
-
-        self.language_skill_set = get_global_action_space() + action_space
-        self.action_space = gym.spaces.Discrete(len(self.language_skill_set))
+        # the actions only depend on the types with multiple instances, shared by the resets of a scene
+        scene_name = scene_name or self.env.last_event.metadata.get('sceneName')
+        action_table = get_scene_action_table(
+            scene_name,
+            tuple(sorted((key, len(ids)) for key, ids in recept_obj_dict.items() if len(ids) >= 2)),
+            tuple(sorted((key, len(ids)) for key, ids in pickable_obj_dict.items() if len(ids) >= 2)))
+
+        self.language_skill_set = action_table.language_skill_set
+        self.skill_to_index = action_table.skill_to_index
+        self.action_space = action_table.action_space
         self.name_to_id_dict = name_to_id_dict
         self.id_to_name_dict = id_to_name_dict
 
     def _load_dataset(self, eval_set):
-        with open(self.data_path) as f:
-            dataset_split = json.load(f)
-        dataset = dataset_split[eval_set]
+        if self.task_store is not None:
+            dataset = self.task_store.dataset
+        else:
+            with open(self.data_path) as f:
+                dataset_split = json.load(f)
+            dataset = dataset_split[eval_set]
         if 0 <= self.down_sample_ratio < 1:
             select_every = round(1 / self.down_sample_ratio)
             dataset = dataset[0:len(dataset):select_every]
@@ -242,17 +268,37 @@ class EBAlfEnv(gym.Env):
         """Return current episode"""
         res = None
         try:
-            res = utils.load_task_json(self.dataset[self._current_episode_num])
+            res = self.load_task(self.dataset[self._current_episode_num])
         except:
             print("episode failed to load trying next episode")
             self.current_episode_num += 1
             self.current_episode()
         return res
     
+    def load_task(self, task):
+        """Trajectory data of a task, from the task store if there is one (shared, do not modify)"""
+        if self.task_store is not None:
+            return self.task_store.load(task)
+        return utils.load_task_json(task)
+
+    def prepare_task(self, task):
+        """Trajectory data of a task with its instruction, and the initial action of its scene"""
+        traj_data = self.load_task(task)
+        # copies of the parts that change, the loaded data may be shared
+        anns = list(traj_data['turk_annotations']['anns'])
+        anns[task['repeat_idx']] = dict(anns[task['repeat_idx']], task_desc=task["instruction"])
+        init_action = dict(traj_data['scene']['init_action'])
+        if init_action['action'] == 'TeleportFull':
+            del init_action["rotateOnTeleport"]
+            init_action["standing"] = True
+        return dict(traj_data, turk_annotations=dict(traj_data['turk_annotations'], anns=anns),
+                    scene=dict(traj_data['scene'], init_action=init_action))
+
+    @tracer.trace('sim.reset')
     def _reset_controller(self, task):
         """Restore scene from a task name and replace instruction"""
-        traj_data = utils.load_task_json(task)
-        traj_data['turk_annotations']['anns'][task['repeat_idx']]['task_desc'] = task["instruction"] 
+        with tracer.span('env.load_task'):
+            traj_data = self.prepare_task(task)
         self.episode_data = traj_data
         args_dict = {'data': ALFRED_DATASET_PATH, 'pframe': 300, 'fast_epoch': False,
                     'use_templated_goals': False, 'dout': 'exp/model', 'pp_folder': 'pp',
@@ -271,14 +317,12 @@ class EBAlfEnv(gym.Env):
         logger.info(f"Restoring scene {scene_name}...")
         self.env.reset(scene_name)
         self.env.restore_scene(object_poses, object_toggles, dirty_and_empty)
-        if traj_data['scene']['init_action']['action'] == 'TeleportFull':
-            del traj_data['scene']['init_action']["rotateOnTeleport"]
-            traj_data['scene']['init_action']["standing"] = True
         self.env.step(dict(traj_data['scene']['init_action']))
         self.env.set_task(traj_data, model_args, reward_type='dense', max_episode_length=self._max_episode_steps)
         #############################
-        self.generate_additional_action_space()
+        self.generate_additional_action_space(scene_name)
 
+    @tracer.trace('env.reset')
     def reset(self):
         """
         Reset the environment for a new episode.
@@ -300,6 +344,7 @@ class EBAlfEnv(gym.Env):
         return obs
 
 
+    @tracer.trace('env.step')
     def step(self, action, reasoning=''):
         """
         Execute a single environment step.
@@ -323,14 +368,16 @@ class EBAlfEnv(gym.Env):
             if (self.name_to_id_dict is not None) and lang_action_split[-1] in self.name_to_id_dict: # multiple instances
                 lang_action = ' '.join(lang_action_split[:-1] + [self.name_to_id_dict[lang_action_split[-1]]])
 
-        event = self.env.llm_skill_interact(lang_action)
+        with tracer.span('sim.step'):
+            event = self.env.llm_skill_interact(lang_action)
         if not event['success']:
             self._cur_invalid_actions += 1
         
         ## test calculate reward
-        reward, done = self.env.get_transition_reward()
-        subgoal_met = self.env.get_goal_conditions_met()
-        info['task_success'] = float(self.env.get_goal_satisfied())
+        with tracer.span('sim.reward'):
+            reward, done = self.env.get_transition_reward()
+            subgoal_met = self.env.get_goal_conditions_met()
+            info['task_success'] = float(self.env.get_goal_satisfied())
         info['task_progress'] = subgoal_met[0] / subgoal_met[1]
 
         obs = {
@@ -350,7 +397,7 @@ class EBAlfEnv(gym.Env):
                                     "cooled_objects" : self.env.cooled_objects,
                                     "heated_objects" : self.env.heated_objects,
                                     "cleaned_objects" : self.env.cleaned_objects,
-                                    "visible_objs": [obj['objectType'] for obj in self.env.last_event.metadata['objects'] if obj['visible']]
+                                    "visible_objs": get_metadata_index(self.env.last_event).visible_types()
                                 }
         info['action_id'] = action
         info['action_description'] = self.language_skill_set[action] if type(action) == int else action
@@ -385,6 +432,7 @@ class EBAlfEnv(gym.Env):
     def seed(self, seed=None):
         self.env.random_initilize(seed)
 
+    @tracer.trace('env.save_image')
     def save_image(self, *args, **kwargs):
         """Save current agent view as a PNG image."""
         episode_idx = self._current_episode_num if not len(self.selected_indexes) else self.selected_indexes[self._current_episode_num - 1] + 1
@@ -401,6 +449,7 @@ class EBAlfEnv(gym.Env):
         img.save(image_path)
         return image_path
 
+    @tracer.trace('env.save_log')
     def save_episode_log(self):
         if not os.path.exists(self.log_path):
             os.makedirs(self.log_path)
@@ -422,6 +471,8 @@ class EBAlfEnv(gym.Env):
     def close(self):
         """Terminate the environment."""
         self.env.stop()
+        if self.task_store is not None:
+            self.task_store.close()
 
     
 
@@ -436,8 +487,8 @@ if __name__ == "__main__":
     for _ in range(30):
         # Select  action
         action = int(input('action id: ')) #env.action_space.sample()
-        if action in env.language_skill_set:
-            action = env.language_skill_set.index(action)
+        if action in env.skill_to_index:
+            action = env.skill_to_index[action]
         else:
             action = int(action)
             if action < 0:
@@ -0,0 +1,293 @@
+import os
+import json
+import fcntl
+import argparse
+import numpy as np
+import torch
+import progressbar
+
+
+class FeatureCache(object):
+    '''
+    sharded, append-only store of Resnet features keyed by (trajectory, frame index), memory-mapped on read:
+    <path>/shard_<n>.bin hold up to shard_frames frames each, <path>/index.jsonl has a line per batch of frames
+    written ({"shard", "row", "keys"}) and a line per complete trajectory ({"trajectory", "frames"}), and
+    <path>/meta.json the dtype and frame shape. Writers take <path>/lock, so extraction, training and evaluation
+    processes can share one cache; readers pick up new lines of the index as they go.
+    '''
+
+    def __init__(self, path, shard_frames=4096):
+        self.path = path
+        self.shard_frames = shard_frames
+        self.index = {}
+        self.trajectories = {}
+        self.meta = None
+        # last shard in the index, the one new frames are appended to
+        self.shard = 0
+        self._offset = 0
+        self._shards = {}
+        self._pid = None
+
+    def __getstate__(self):
+        # memory maps are opened again in every process
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def _shard_path(self, shard):
+        return os.path.join(self.path, 'shard_%05d.bin' % shard)
+
+    def _frame_bytes(self):
+        return int(np.dtype(self.meta['dtype']).itemsize * np.prod(self.meta['shape']))
+
+    def refresh(self):
+        '''
+        reads the lines added to the index since the last call
+        '''
+        if self.meta is None:
+            meta_path = os.path.join(self.path, 'meta.json')
+            if not os.path.exists(meta_path):
+                return
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        index_path = os.path.join(self.path, 'index.jsonl')
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # only complete lines (a writer may be in the middle of one)
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if 'trajectory' in record:
+                self.trajectories[record['trajectory']] = record['frames']
+                continue
+            shard, row = record['shard'], record['row']
+            self.shard = max(self.shard, shard)
+            for i, (trajectory, frame) in enumerate(record['keys']):
+                self.index[(trajectory, frame)] = (shard, row + i)
+        self._offset += end
+
+    def missing(self, keys):
+        '''
+        the keys that are not cached
+        '''
+        self.refresh()
+        return [key for key in keys if tuple(key) not in self.index]
+
+    def _rows(self, shard, row):
+        if self._pid != os.getpid():
+            self._shards = {}
+            self._pid = os.getpid()
+        rows = self._shards.get(shard)
+        if rows is None or row >= rows.shape[0]:
+            # shards grow, map them again to see the new frames
+            path = self._shard_path(shard)
+            num_rows = os.path.getsize(path) // self._frame_bytes()
+            rows = self._shards[shard] = np.memmap(path, dtype=self.meta['dtype'], mode='r',
+                                                   shape=(num_rows,) + tuple(self.meta['shape']))
+        return rows
+
+    def get(self, keys):
+        '''
+        features of cached keys, as one array
+        '''
+        self.refresh()
+        locations = [self.index[tuple(key)] for key in keys]
+        out = np.empty((len(keys),) + tuple(self.meta['shape']), dtype=self.meta['dtype'])
+        i = 0
+        while i < len(locations):
+            # runs of consecutive rows are copied at once (the frames of a trajectory are written together)
+            shard, row = locations[i]
+            j = i + 1
+            while j < len(locations) and locations[j] == (shard, row + j - i):
+                j += 1
+            out[i:j] = self._rows(shard, row + j - i - 1)[row:row + j - i]
+            i = j
+        return out
+
+    def put(self, keys, feats):
+        '''
+        adds the features of keys (frames cached by another process meanwhile are skipped)
+        '''
+        feats = np.asarray(feats)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if self.meta is None:
+                    self.meta = {'dtype': feats.dtype.str, 'shape': list(feats.shape[1:])}
+                    with open(os.path.join(self.path, 'meta.json.tmp'), 'w') as f:
+                        json.dump(self.meta, f)
+                    os.replace(os.path.join(self.path, 'meta.json.tmp'), os.path.join(self.path, 'meta.json'))
+                assert feats.dtype.str == self.meta['dtype'] and list(feats.shape[1:]) == self.meta['shape'], \
+                    'features do not match the cache (%s %s)' % (self.meta['dtype'], self.meta['shape'])
+
+                new, seen = [], set()
+                for i, key in enumerate(keys):
+                    key = tuple(key)
+                    if key not in self.index and key not in seen:
+                        seen.add(key)
+                        new.append(i)
+                shard = self.shard
+                while new:
+                    path = self._shard_path(shard)
+                    frame_bytes = self._frame_bytes()
+                    size = os.path.getsize(path) if os.path.exists(path) else 0
+                    row = size // frame_bytes
+                    if row >= self.shard_frames:
+                        shard += 1
+                        continue
+                    n = min(len(new), self.shard_frames - row)
+                    with open(path, 'ab') as f:
+                        # drop the partial frame of a writer killed mid-write
+                        f.truncate(row * frame_bytes)
+                        f.write(np.ascontiguousarray(feats[new[:n]]).tobytes())
+                    batch = [list(tuple(keys[i])) for i in new[:n]]
+                    self._append({'shard': shard, 'row': row, 'keys': batch})
+                    new = new[n:]
+                self.refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def seal(self, trajectory, num_frames):
+        '''
+        marks the frames 0..num_frames-1 of a trajectory (all cached) as the complete trajectory
+        '''
+        assert not self.missing([(trajectory, i) for i in range(num_frames)]), 'frames of %s are missing' % trajectory
+        with open(os.path.join(self.path, 'lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._append({'trajectory': trajectory, 'frames': num_frames})
+                self.refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _append(self, record):
+        with open(os.path.join(self.path, 'index.jsonl'), 'ab') as f:
+            f.write((json.dumps(record) + '\n').encode('utf-8'))
+
+    def has(self, trajectory):
+        self.refresh()
+        return trajectory in self.trajectories
+
+    def load(self, trajectory):
+        '''
+        features of the frames of a complete trajectory, in order
+        '''
+        self.refresh()
+        return torch.from_numpy(self.get([(trajectory, i) for i in range(self.trajectories[trajectory])]))
+
+
+class FeatureStore(object):
+    '''
+    packed Resnet features of one split, memory-mapped on read:
+    <data>/<feat_name>.<split>.bin holds the frames of all trajectories one after the other,
+    <data>/<feat_name>.<split>.index.json their dtype and frame shape, and the first frame and
+    number of frames of every trajectory
+    '''
+
+    def __init__(self, data, feat_pt='feat_conv.pt', cache=None):
+        self.data = data
+        self.feat_name = os.path.splitext(feat_pt)[0]
+        self.feat_pt = feat_pt
+        self.cache = FeatureCache(cache) if isinstance(cache, str) else cache
+        self._index = None
+        self._headers = {}
+        self._frames = {}
+        self._pid = None
+
+    def paths(self, split):
+        prefix = os.path.join(self.data, '%s.%s' % (self.feat_name, split))
+        return prefix + '.bin', prefix + '.index.json'
+
+    def _load_index(self):
+        self._index = {}
+        if not os.path.isdir(self.data):
+            return
+        suffix = '.index.json'
+        for name in sorted(os.listdir(self.data)):
+            if name.startswith(self.feat_name + '.') and name.endswith(suffix):
+                split = name[len(self.feat_name) + 1:-len(suffix)]
+                with open(os.path.join(self.data, name)) as f:
+                    header = json.load(f)
+                self._headers[split] = header
+                for root, span in header['trajectories'].items():
+                    self._index[os.path.join(split, root)] = (split, span)
+
+    def _split_frames(self, split):
+        # memory maps are opened again in every process (e.g. data loader workers)
+        if self._pid != os.getpid():
+            self._frames = {}
+            self._pid = os.getpid()
+        if split not in self._frames:
+            header = self._headers[split]
+            self._frames[split] = np.memmap(self.paths(split)[0], dtype=header['dtype'], mode='r',
+                                            shape=(header['frames'],) + tuple(header['shape']))
+        return self._frames[split]
+
+    def load(self, root):
+        '''
+        features of the trajectory in root (<data>/<split>/<task>), as saved in <root>/<feat_pt>
+        '''
+        if self._index is None:
+            self._load_index()
+        trajectory = os.path.relpath(root, self.data)
+        entry = self._index.get(trajectory)
+        if entry is None:
+            return self.load_unpacked(trajectory)
+        split, (start, length) = entry
+        return torch.from_numpy(np.array(self._split_frames(split)[start:start + length]))
+
+    def load_unpacked(self, trajectory):
+        '''
+        features of a trajectory (<split>/<task>) from the feature cache, or from its <feat_pt>
+        '''
+        if self.cache is not None and self.cache.has(trajectory):
+            return self.cache.load(trajectory)
+        return torch.load(os.path.join(self.data, trajectory, self.feat_pt))
+
+    def pack(self, split, tasks):
+        '''
+        packs the features of the trajectories of a split
+        '''
+        roots = sorted({task['task'] for task in tasks})
+        if not roots:
+            return
+        data_path, index_path = self.paths(split)
+        trajectories, total, dtype, shape = {}, 0, None, None
+        with open(data_path + '.tmp', 'wb') as f:
+            for root in progressbar.progressbar(roots):
+                im = self.load_unpacked(os.path.join(split, root)).cpu().numpy()
+                if dtype is None:
+                    dtype, shape = im.dtype, im.shape[1:]
+                assert im.dtype == dtype and im.shape[1:] == shape, 'features of %s do not match' % root
+                f.write(np.ascontiguousarray(im).tobytes())
+                trajectories[root] = [total, int(im.shape[0])]
+                total += int(im.shape[0])
+        os.replace(data_path + '.tmp', data_path)
+        with open(index_path, 'w') as f:
+            json.dump({'dtype': dtype.str, 'shape': list(shape), 'frames': total,
+                       'trajectories': trajectories}, f)
+        self._index = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', help='dataset folder', default='data/json_feat_2.1.0')
+    parser.add_argument('--splits', help='json file containing train/dev/test splits', default='splits/oct21.json')
+    parser.add_argument('--feat_pt', help='feature file of every trajectory', default='feat_conv.pt')
+    parser.add_argument('--feat_cache', help='feature cache of extract_resnet.py to read features from before the feature files', default=None)
+    args = parser.parse_args()
+
+    with open(args.splits) as f:
+        splits = json.load(f)
+    store = FeatureStore(args.data, args.feat_pt, cache=args.feat_cache)
+    for k, d in splits.items():
+        if 'test' in k:
+            continue
+        print('Packing {}'.format(k))
+        store.pack(k, d)
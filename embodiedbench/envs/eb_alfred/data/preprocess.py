@@ -1,12 +1,15 @@
 import os
 import json
 import revtok
-import torch
 import copy
+import hashlib
+import argparse
+import multiprocessing
 import progressbar
 from vocab import Vocab
 from embodiedbench.envs.eb_alfred.gen.utils.py_util import remove_spaces_and_lower
 from embodiedbench.envs.eb_alfred.gen.utils.game_util import sample_templated_task_desc_from_traj_data
+from embodiedbench.envs.eb_alfred.data.preprocessed_store import task_key, PreprocessedSplit
 
 
 def has_interaction(action):
@@ -20,6 +23,41 @@ def has_interaction(action):
         return True
 
 
+def default_vocab():
+    return {
+        'word': Vocab(['<<pad>>', '<<seg>>', '<<goal>>']),
+        'action_low': Vocab(['<<pad>>', '<<seg>>', '<<stop>>']),
+        'action_high': Vocab(['<<pad>>', '<<seg>>', '<<stop>>']),
+    }
+
+
+def content_hash(raw, k, r_idx, train_mode, settings):
+    '''
+    hash of a trajectory's traj_data.json and of everything its preprocessing depends on
+    '''
+    h = hashlib.sha1(raw)
+    h.update(json.dumps([PreprocessedSplit.VERSION, k, r_idx, train_mode, settings], sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _preprocess_task(job):
+    '''
+    pool worker: preprocesses one trajectory against fresh local vocabularies
+
+    returns the trajectory numericalized with the local indices and, per vocab, the local
+    words in index order with the number of times the trajectory added them
+    '''
+    settings, k, task, train_mode, raw = job
+    args = argparse.Namespace(data=settings['data'], pframe=settings['pframe'],
+                              use_templated_goals=settings['use_templated_goals'])
+    vocab = default_vocab()
+    initial = {name: set(v._index2word) for name, v in vocab.items()}
+    dataset = Dataset(args, vocab)
+    traj = dataset.process_task(k, task, train_mode, json.loads(raw))
+    words = {name: [[w, v.counts[w] - (w in initial[name])] for w in v._index2word] for name, v in vocab.items()}
+    return task_key(task), traj, words
+
+
 class Dataset(object):
 
     def __init__(self, args, vocab=None):
@@ -28,11 +66,7 @@ class Dataset(object):
         self.pframe = args.pframe
 
         if vocab is None:
-            self.vocab = {
-                'word': Vocab(['<<pad>>', '<<seg>>', '<<goal>>']),
-                'action_low': Vocab(['<<pad>>', '<<seg>>', '<<stop>>']),
-                'action_high': Vocab(['<<pad>>', '<<seg>>', '<<stop>>']),
-            }
+            self.vocab = default_vocab()
         else:
             self.vocab = vocab
 
@@ -49,56 +83,158 @@ class Dataset(object):
 
     def preprocess_splits(self, splits):
         '''
-        saves preprocessed data as jsons in specified folder
+        saves preprocessed data as one consolidated file per split in the pp folder
+
+        trajectories are processed across a process pool against local vocabularies, which are
+        merged into self.vocab in split order, so the vocab and the indices are the same as with
+        sequential processing. trajectories whose content hash did not change since the last run
+        are reused from the previous output.
         '''
-        for k, d in splits.items():
-            print('Preprocessing {}'.format(k))
-            train_mode = 'test' not in k
+        workers = getattr(self.args, 'pp_workers', None)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            for k, d in splits.items():
+                print('Preprocessing {}'.format(k))
+                train_mode = 'test' not in k
+
+                # debugging:
+                if self.args.fast_epoch:
+                    d = d[:16]
+
+                self.preprocess_split(k, d, train_mode, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-            # debugging:
-            if self.args.fast_epoch:
-                d = d[:16]
+        # save vocab in dout path
+        # vocab_dout_path = os.path.join(self.args.dout, '%s.vocab' % self.args.pp_folder)
+        # torch.save(self.vocab, vocab_dout_path)
 
-            for task in progressbar.progressbar(d):
-                # load json file
-                json_path = os.path.join(self.args.data, k, task['task'], 'traj_data.json')
-                with open(json_path) as f:
-                    ex = json.load(f)
+        # save vocab in data path
+        # vocab_data_path = os.path.join(self.args.data, '%s.vocab' % self.args.pp_folder)
+        # torch.save(self.vocab, vocab_data_path)
 
-                # copy trajectory
-                r_idx = task['repeat_idx'] # repeat_idx is the index of the annotation for each trajectory
-                traj = ex.copy()
 
-                # root & split
-                traj['root'] = os.path.join(self.args.data, task['task'])
-                traj['split'] = k
-                traj['repeat_idx'] = r_idx
+    def preprocess_split(self, k, d, train_mode, pool=None):
+        '''
+        preprocesses one split, returns the number of trajectories that were processed again
+        '''
+        store = PreprocessedSplit(os.path.join(self.args.data, self.args.pp_folder), k)
+        previous = store.load_index()
+        settings = {
+            'data': self.args.data,
+            'pframe': self.pframe,
+            'use_templated_goals': bool(self.args.use_templated_goals) and train_mode,
+        }
 
-                # numericalize language
-                use_templated_goals = self.args.use_templated_goals and train_mode # templated goals are not available for the test set
-                self.process_language(ex, traj, r_idx, use_templated_goals=use_templated_goals)
+        # hash every trajectory, only the changed ones are processed again
+        keys, hashes, jobs = [], {}, []
+        for task in d:
+            key = task_key(task)
+            json_path = os.path.join(self.args.data, k, task['task'], 'traj_data.json')
+            with open(json_path, 'rb') as f:
+                raw = f.read()
+            digest = content_hash(raw, k, task['repeat_idx'], train_mode, settings)
+            keys.append(key)
+            hashes[key] = digest
+            if key not in previous or previous[key]['hash'] != digest:
+                jobs.append((settings, k, task, train_mode, raw))
+
+        processed = {}
+        results = pool.imap(_preprocess_task, jobs, chunksize=4) if pool is not None else map(_preprocess_task, jobs)
+        for key, traj, words in progressbar.progressbar(results, max_value=len(jobs)):
+            processed[key] = (traj, words)
+
+        # merge the vocabularies in split order and renumber the trajectories
+        lines, index = [], {}
+        changed = len(processed) > 0 or list(previous) != keys
+        for key in keys:
+            if key in processed:
+                traj, words = processed[key]
+                indices = self.merge_words(words)
+                self.renumber(traj, indices)
+                line = json.dumps(traj, sort_keys=True).encode('utf-8')
+            else:
+                words = previous[key]['words']
+                indices = self.merge_words(words)
+                line = store.read_line(previous[key])
+                if indices != previous[key]['indices']:
+                    # a trajectory before it added words: map the old indices to the new ones
+                    traj = json.loads(line)
+                    self.renumber(traj, {name: dict(zip(previous[key]['indices'][name], indices[name]))
+                                         for name in indices})
+                    line = json.dumps(traj, sort_keys=True).encode('utf-8')
+                    changed = True
+            lines.append(line)
+            index[key] = {'hash': hashes[key], 'words': words, 'indices': indices}
+
+        if changed:
+            store.write(keys, lines, index)
+        print('{}: {} of {} trajectories processed, {} reused'.format(k, len(processed), len(keys),
+                                                                        len(keys) - len(processed)))
+        return len(processed)
+
+
+    def merge_words(self, words):
+        '''
+        adds the words of a trajectory's local vocabularies, returns their indices in self.vocab
+        '''
+        indices = {}
+        for name, entries in words.items():
+            vocab = self.vocab[name]
+            indices[name] = []
+            for w, count in entries:
+                if count == 0:
+                    # initial token of the local vocab that the trajectory does not use
+                    indices[name].append(-1)
+                    continue
+                indices[name].append(vocab.word2index(w, train=True))
+                vocab.counts[w] += count - 1
+        return indices
 
-                # numericalize actions for train/valid splits
-                if train_mode: # expert actions are not available for the test set
-                    self.process_actions(ex, traj)
 
-                # check if preprocessing storage folder exists
-                preprocessed_folder = os.path.join(self.args.data, task['task'], self.args.pp_folder)
-                if not os.path.isdir(preprocessed_folder):
-                    os.makedirs(preprocessed_folder)
+    @staticmethod
+    def renumber(traj, indices):
+        '''
+        maps the vocab indices in traj['num'] with indices[vocab name]
+        '''
+        num = traj['num']
+        word = indices['word']
+        num['lang_goal'] = [word[i] for i in num['lang_goal']]
+        num['lang_instr'] = [[word[i] for i in x] for x in num['lang_instr']]
+        if 'action_low' in num:
+            for seg in num['action_low']:
+                for a in seg:
+                    a['action'] = indices['action_low'][a['action']]
+            for a in num['action_high']:
+                a['action'] = indices['action_high'][a['action']]
+                a['action_high_args'] = [indices['action_high'][i] for i in a['action_high_args']]
+
+
+    def process_task(self, k, task, train_mode, ex):
+        '''
+        preprocesses one trajectory (the loaded traj_data.json) of split k
+        '''
+        # copy trajectory
+        r_idx = task['repeat_idx'] # repeat_idx is the index of the annotation for each trajectory
+        traj = ex.copy()
 
-                # save preprocessed json
-                preprocessed_json_path = os.path.join(preprocessed_folder, "ann_%d.json" % r_idx)
-                with open(preprocessed_json_path, 'w') as f:
-                    json.dump(traj, f, sort_keys=True, indent=4)
+        # root & split
+        traj['root'] = os.path.join(self.args.data, task['task'])
+        traj['split'] = k
+        traj['repeat_idx'] = r_idx
 
-        # save vocab in dout path
-        # vocab_dout_path = os.path.join(self.args.dout, '%s.vocab' % self.args.pp_folder)
-        # torch.save(self.vocab, vocab_dout_path)
+        # numericalize language
+        use_templated_goals = self.args.use_templated_goals and train_mode # templated goals are not available for the test set
+        self.process_language(ex, traj, r_idx, use_templated_goals=use_templated_goals)
 
-        # save vocab in data path
-        # vocab_data_path = os.path.join(self.args.data, '%s.vocab' % self.args.pp_folder)
-        # torch.save(self.vocab, vocab_data_path)
+        # numericalize actions for train/valid splits
+        if train_mode: # expert actions are not available for the test set
+            self.process_actions(ex, traj)
+        return traj
 
 
     def process_language(self, ex, traj, r_idx, use_templated_goals=False):
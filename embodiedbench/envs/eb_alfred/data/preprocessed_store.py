@@ -0,0 +1,115 @@
+import os
+import json
+
+
+def task_key(task):
+    return '%s:%d' % (task['task'], task['repeat_idx'])
+
+
+def file_stamp(path):
+    '''
+    (size, mtime) of a file, None if there is none
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class PreprocessedSplit(object):
+    '''
+    consolidated preprocessed trajectories of one split:
+    <split>.jsonl holds one preprocessed trajectory per line, <split>.index.json their offsets,
+    content hashes and vocab words
+    '''
+
+    VERSION = 1
+
+    def __init__(self, folder, split):
+        self.folder = folder
+        self.split = split
+        self.data_path = os.path.join(folder, '%s.jsonl' % split)
+        self.index_path = os.path.join(folder, '%s.index.json' % split)
+
+    def load_index(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.data_path)):
+            return {}
+        with open(self.index_path) as f:
+            index = json.load(f)
+        if index.get('version') != self.VERSION:
+            return {}
+        return index['records']
+
+    def read_line(self, record):
+        with open(self.data_path, 'rb') as f:
+            f.seek(record['offset'])
+            return f.read(record['length'])
+
+    def write(self, keys, lines, index):
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        offset = 0
+        with open(self.data_path + '.tmp', 'wb') as f:
+            for key, line in zip(keys, lines):
+                f.write(line + b'\n')
+                index[key]['offset'] = offset
+                index[key]['length'] = len(line)
+                offset += len(line) + 1
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump({'version': self.VERSION, 'records': index}, f)
+        os.replace(self.data_path + '.tmp', self.data_path)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+
+class PreprocessedStore(object):
+    '''
+    reads preprocessed trajectories from the consolidated split files in <data>/<pp_folder>,
+    and from the per-trajectory <data>/<task>/<pp_folder>/ann_<repeat_idx>.json otherwise.
+    the split indexes are read again when a split file was rewritten since they were loaded
+    '''
+
+    def __init__(self, data, pp_folder):
+        self.data = data
+        self.pp_folder = pp_folder
+        self._records = None
+        self._stamps = {}
+
+    def _load(self):
+        self._records = {}
+        self._stamps = {}
+        folder = os.path.join(self.data, self.pp_folder)
+        if not os.path.isdir(folder):
+            return
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.index.json'):
+                split = PreprocessedSplit(folder, name[:-len('.index.json')])
+                self._stamps[split.data_path] = file_stamp(split.data_path)
+                for key, record in split.load_index().items():
+                    self._records.setdefault(key, (split, record))
+
+    def _entry(self, task):
+        if self._records is None:
+            self._load()
+        entry = self._records.get(task_key(task))
+        if entry is not None and file_stamp(entry[0].data_path) != self._stamps[entry[0].data_path]:
+            self._load()
+            entry = self._records.get(task_key(task))
+        return entry
+
+    def source_path(self, task):
+        '''
+        path of the file that holds the preprocessed trajectory of a task
+        '''
+        entry = self._entry(task)
+        if entry is not None:
+            return entry[0].data_path
+        return os.path.join(self.data, task['task'], self.pp_folder, 'ann_%d.json' % task['repeat_idx'])
+
+    def load(self, task):
+        entry = self._entry(task)
+        if entry is not None:
+            split, record = entry
+            return json.loads(split.read_line(record))
+        with open(self.source_path(task)) as f:
+            return json.load(f)
@@ -1,4 +1,6 @@
-from embodiedbench.envs.eb_alfred.gen.utils.game_util import get_object
+import json
+from functools import lru_cache
+from embodiedbench.envs.eb_alfred.gen.utils.metadata_index import get_metadata_index
 
 class BaseAction(object):
     '''
@@ -23,6 +25,20 @@ class GotoLocationAction(BaseAction):
 
     valid_actions = {'MoveAhead', 'RotateLeft', 'RotateRight', 'LookUp', 'LookDown', 'Teleport', 'TeleportFull'}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # number of actions of the shortest path per (pose, target pose); the distance of the previous pose was
+        # the current one of the step before
+        self.distances = {}
+
+    def get_distance(self, pose, tar_pose):
+        key = (tuple(pose), tar_pose)
+        distance = self.distances.get(key)
+        if distance is None:
+            actions, _ = self.gt_graph.get_shortest_path(pose, tar_pose)
+            distance = self.distances[key] = len(actions)
+        return distance
+
     def get_reward(self, state, prev_state, expert_plan, goal_idx):
         if state.metadata['lastAction'] not in self.valid_actions:
             reward, done = self.rewards['invalid_action'], False
@@ -33,11 +49,8 @@ class GotoLocationAction(BaseAction):
         prev_pose = prev_state.pose_discrete
         tar_pose = tuple([int(i) for i in subgoal['location'].split('|')[1:]])
 
-        prev_actions, _ = self.gt_graph.get_shortest_path(prev_pose, tar_pose)
-        curr_actions, _ = self.gt_graph.get_shortest_path(curr_pose, tar_pose)
-
-        prev_distance = len(prev_actions)
-        curr_distance = len(curr_actions)
+        prev_distance = self.get_distance(prev_pose, tar_pose)
+        curr_distance = self.get_distance(curr_pose, tar_pose)
         reward = (prev_distance - curr_distance) * 0.2 # distance reward factor?
 
         # [DEPRECATED] Old criteria which requires the next subgoal object to be visible
@@ -100,7 +113,7 @@ class PutObjectAction(BaseAction):
         subgoal = expert_plan[goal_idx]['planner_action']
         reward, done = self.rewards['neutral'], False
         target_object_id = subgoal['objectId']
-        recep_object = get_object(subgoal['receptacleObjectId'], state.metadata)
+        recep_object = get_metadata_index(state).get_object(subgoal['receptacleObjectId'])
         if recep_object is not None:
             is_target_in_recep = target_object_id in recep_object['receptacleObjectIds']
             reward, done = (self.rewards['positive'], True) if is_target_in_recep else (self.rewards['negative'], False)
@@ -121,7 +134,7 @@ class OpenObjectAction(BaseAction):
 
         subgoal = expert_plan[goal_idx]['planner_action']
         reward, done = self.rewards['neutral'], False
-        target_recep = get_object(subgoal['objectId'], state.metadata)
+        target_recep = get_metadata_index(state).get_object(subgoal['objectId'])
         if target_recep is not None:
             is_target_open = target_recep['isOpen']
             reward, done = (self.rewards['positive'], True) if is_target_open else (self.rewards['negative'], False)
@@ -142,7 +155,7 @@ class CloseObjectAction(BaseAction):
 
         subgoal = expert_plan[goal_idx]['planner_action']
         reward, done = self.rewards['negative'], False
-        target_recep = get_object(subgoal['objectId'], state.metadata)
+        target_recep = get_metadata_index(state).get_object(subgoal['objectId'])
         if target_recep is not None:
             is_target_closed = not target_recep['isOpen']
             reward, done = (self.rewards['positive'], True) if is_target_closed else (self.rewards['negative'], False)
@@ -163,7 +176,7 @@ class ToggleObjectAction(BaseAction):
 
         subgoal = expert_plan[goal_idx]['planner_action']
         reward, done = self.rewards['neutral'], False
-        target_toggle = get_object(subgoal['objectId'], state.metadata)
+        target_toggle = get_metadata_index(state).get_object(subgoal['objectId'])
         if target_toggle is not None:
             is_target_toggled = target_toggle['isToggled']
             reward, done = (self.rewards['positive'], True) if is_target_toggled else (self.rewards['negative'], False)
@@ -184,7 +197,7 @@ class SliceObjectAction(BaseAction):
 
         subgoal = expert_plan[goal_idx]['planner_action']
         reward, done = self.rewards['neutral'], False
-        target_object = get_object(subgoal['objectId'], state.metadata)
+        target_object = get_metadata_index(state).get_object(subgoal['objectId'])
         if target_object is not None:
             is_target_sliced = target_object['isSliced']
             reward, done = (self.rewards['positive'], True) if is_target_sliced else (self.rewards['negative'], False)
@@ -205,7 +218,7 @@ class CleanObjectAction(BaseAction):
 
         subgoal = expert_plan[goal_idx]['planner_action']
         reward, done = self.rewards['neutral'], False
-        clean_object = get_object(subgoal['cleanObjectId'], state.metadata)
+        clean_object = get_metadata_index(state).get_object(subgoal['cleanObjectId'])
         if clean_object is not None:
             is_obj_clean = clean_object['objectId'] in self.env.cleaned_objects
             reward, done = (self.rewards['positive'], True) if is_obj_clean else (self.rewards['negative'], False)
@@ -228,7 +241,7 @@ class HeatObjectAction(BaseAction):
         next_put_goal_idx = goal_idx+2 # (+1) GotoLocation -> (+2) PutObject (get the objectId from the PutObject action)
         if next_put_goal_idx < len(expert_plan):
             heat_object_id = expert_plan[next_put_goal_idx]['planner_action']['objectId']
-            heat_object = get_object(heat_object_id, state.metadata)
+            heat_object = get_metadata_index(state).get_object(heat_object_id)
             is_obj_hot = heat_object['objectId'] in self.env.heated_objects
             reward, done = (self.rewards['positive'], True) if is_obj_hot else (self.rewards['negative'], False)
         return reward, done
@@ -251,7 +264,7 @@ class CoolObjectAction(BaseAction):
         next_put_goal_idx = goal_idx+2 # (+1) GotoLocation -> (+2) PutObject (get the objectId from the PutObject action)
         if next_put_goal_idx < len(expert_plan):
             cool_object_id = expert_plan[next_put_goal_idx]['planner_action']['objectId']
-            cool_object = get_object(cool_object_id, state.metadata)
+            cool_object = get_metadata_index(state).get_object(cool_object_id)
             is_obj_cool = cool_object['objectId'] in self.env.cooled_objects
             
             # TODO(mohit): support dense rewards for all subgoals
@@ -262,7 +275,7 @@ class CoolObjectAction(BaseAction):
 
             # intermediate reward for opening fridge after object is cooled
             elif is_obj_cool and state.metadata['lastAction']=='OpenObject':
-                target_recep = get_object(subgoal['objectId'], state.metadata)
+                target_recep = get_metadata_index(state).get_object(subgoal['objectId'])
                 if target_recep is not None and not self.env.reopen_reward:
                     if target_recep['isOpen']:
                         self.env.reopen_reward = True
@@ -287,3 +300,32 @@ def get_action(action_type, gt_graph, env, reward_config, strict):
         return action(gt_graph, env, reward_config[action_type_str], strict)
     else:
         raise Exception("Invalid action_type %s" % action_type_str)
+
+
+@lru_cache(maxsize=None)
+def load_reward_config(config_file):
+    '''
+    reward values of a json file, read once per process (do not modify them)
+    '''
+    with open(config_file, 'r') as rc:
+        return json.load(rc)
+
+
+class RewardEngine(object):
+    '''
+    subgoal rewards of an episode: the action of every subgoal of the expert plan is resolved and instantiated once,
+    instead of per step by get_action
+    '''
+
+    def __init__(self, expert_plan, num_subgoals, gt_graph, env, reward_config, strict):
+        self.expert_plan = expert_plan
+        actions = {}
+        self.actions = []
+        for subgoal in expert_plan[:num_subgoals]:
+            action_type = subgoal['planner_action']['action']
+            if action_type not in actions:
+                actions[action_type] = get_action(action_type, gt_graph, env, reward_config, strict)
+            self.actions.append(actions[action_type])
+
+    def get_reward(self, state, prev_state, goal_idx):
+        return self.actions[goal_idx].get_reward(state, prev_state, self.expert_plan, goal_idx)
@@ -1,8 +1,7 @@
-import json
 import numpy as np
 from embodiedbench.envs.eb_alfred.gen.graph import graph_obj
-from embodiedbench.envs.eb_alfred.gen.utils.game_util import get_objects_with_name_and_prop
-from embodiedbench.envs.eb_alfred.env.reward import get_action
+from embodiedbench.envs.eb_alfred.gen.utils.metadata_index import get_metadata_index
+from embodiedbench.envs.eb_alfred.env.reward import RewardEngine, load_reward_config
 
 
 class BaseTask(object):
@@ -35,6 +34,10 @@ class BaseTask(object):
         self.load_reward_config(args.reward_config)
         self.strict = 'strict' in reward_type
 
+        # subgoal rewards and targets, resolved once per episode
+        self.reward_engine = None
+        self.targets = None
+
         # prev state
         self.prev_state = self.env.last_event
 
@@ -42,9 +45,7 @@ class BaseTask(object):
         '''
         load json file with reward values
         '''
-        with open(config_file, 'r') as rc:
-            reward_config = json.load(rc)
-        self.reward_config = reward_config
+        self.reward_config = load_reward_config(config_file)
 
     def load_nav_graph(self):
         '''
@@ -85,12 +86,13 @@ class BaseTask(object):
 
         # get subgoal and action
         expert_plan = self.traj['plan']['high_pddl']
-        action_type = expert_plan[self.goal_idx]['planner_action']['action']
 
         # subgoal reward
         if "dense" in self.reward_type:
-            action = get_action(action_type, self.gt_graph, self.env, self.reward_config, self.strict)
-            sg_reward, sg_done = action.get_reward(state, self.prev_state, expert_plan, self.goal_idx)
+            if self.reward_engine is None:
+                self.reward_engine = RewardEngine(expert_plan, self.num_subgoals, self.gt_graph, self.env,
+                                                  self.reward_config, self.strict)
+            sg_reward, sg_done = self.reward_engine.get_reward(state, self.prev_state, self.goal_idx)
             reward += sg_reward
             if sg_done:
                 self.finished += 1
@@ -145,6 +147,8 @@ class BaseTask(object):
         '''
         returns a dictionary of all targets for the task
         '''
+        if self.targets is not None:
+            return self.targets
         targets = {
             'object': self.get_target('object_target'),
             'parent': self.get_target('parent_target'),
@@ -156,6 +160,7 @@ class BaseTask(object):
         if 'object_sliced' in self.traj['pddl_params'] and self.traj['pddl_params']['object_sliced']:
             targets['object'] += 'Sliced'  # Change, e.g., "Apple" -> "AppleSliced" as pickup target.
 
+        self.targets = targets
         return targets
 
 
@@ -177,8 +182,8 @@ class PickAndPlaceSimpleTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
+        receptacles = get_metadata_index(state).with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
 
         # check if object needs to be sliced
         if 'Sliced' in targets['object']:
@@ -215,8 +220,8 @@ class PickTwoObjAndPlaceTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
+        receptacles = get_metadata_index(state).with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
 
         # check if object needs to be sliced
         if 'Sliced' in targets['object']:
@@ -252,8 +257,8 @@ class LookAtObjInLightTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        toggleables = get_objects_with_name_and_prop(targets['toggle'], 'toggleable', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
+        toggleables = get_metadata_index(state).with_name_and_prop(targets['toggle'], 'toggleable')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
         inventory_objects = state.metadata['inventoryObjects']
 
         # check if object needs to be sliced
@@ -293,8 +298,8 @@ class PickHeatThenPlaceInRecepTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
+        receptacles = get_metadata_index(state).with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
 
         # check if object needs to be sliced
         if 'Sliced' in targets['object']:
@@ -340,8 +345,8 @@ class PickCoolThenPlaceInRecepTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
+        receptacles = get_metadata_index(state).with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
 
         if 'Sliced' in targets['object']:
             ts += 1
@@ -386,8 +391,8 @@ class PickCleanThenPlaceInRecepTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
+        receptacles = get_metadata_index(state).with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
 
         if 'Sliced' in targets['object']:
             ts += 1
@@ -432,9 +437,9 @@ class PickAndPlaceWithMovableRecepTask(BaseTask):
         s = 0
 
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-        movables = get_objects_with_name_and_prop(targets['mrecep'], 'pickupable', state.metadata)
+        receptacles = get_metadata_index(state).with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = get_metadata_index(state).with_name_and_prop(targets['object'], 'pickupable')
+        movables = get_metadata_index(state).with_name_and_prop(targets['mrecep'], 'pickupable')
 
         # check if object needs to be sliced
         if 'Sliced' in targets['object']:
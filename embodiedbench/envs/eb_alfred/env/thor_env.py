@@ -3,10 +3,11 @@ import copy
 import time
 import embodiedbench.envs.eb_alfred.gen.constants as constants
 import numpy as np
-from collections import Counter, OrderedDict
+from collections import OrderedDict
 from embodiedbench.envs.eb_alfred.env.tasks import get_task
 from ai2thor.controller import Controller
 import embodiedbench.envs.eb_alfred.gen.utils.image_util as image_util
+from embodiedbench.envs.eb_alfred.gen.utils.instance_index import get_instance_index
 from embodiedbench.envs.eb_alfred.gen.utils import game_util
 from embodiedbench.envs.eb_alfred.gen.utils.game_util import get_objects_of_type, get_obj_of_type_closest_to_obj
 
@@ -583,23 +584,25 @@ class ThorEnv(Controller):
         elif interact_mask is not None:
             # ground-truth instance segmentation mask from THOR
             instance_segs = np.array(self.last_event.instance_segmentation_frame)
+            instance_index = get_instance_index(self.last_event)
             color_to_object_id = self.last_event.color_to_object_id
 
-            # get object_id for each 1-pixel in the interact_mask
+            # get the instance id of each (sampled) 1-pixel in the interact_mask,
+            # most common first and ties in order of appearance
             nz_rows, nz_cols = np.nonzero(interact_mask)
-            instance_counter = Counter()
-            for i in range(0, len(nz_rows), mask_px_sample):
-                x, y = nz_rows[i], nz_cols[i]
-                instance = tuple(instance_segs[x, y])
-                instance_counter[instance] += 1
+            nz_ids = instance_index.labels[nz_rows, nz_cols]
+            ids, first_idx, counts = np.unique(nz_ids[::mask_px_sample], return_index=True, return_counts=True)
+            most_common = np.lexsort((first_idx, -counts))
+            instance_counter = OrderedDict((instance_index.color_of(ids[i]), int(counts[i])) for i in most_common)
             if debug:
                 print("action_box", "instance_counter", instance_counter)
 
-            # iou scores for all instances
+            # iou scores for all instances, union of instance and interact_mask from the pixel counts
+            intersections = np.bincount(nz_ids, minlength=len(instance_index.codes))
             iou_scores = {}
-            for color_id, intersection_count in instance_counter.most_common():
-                union_count = np.sum(np.logical_or(np.all(instance_segs == color_id, axis=2), interact_mask.astype(bool)))
-                iou_scores[color_id] = intersection_count / float(union_count)
+            for i in most_common:
+                union_count = instance_index.counts[ids[i]] + len(nz_ids) - intersections[ids[i]]
+                iou_scores[instance_index.color_of(ids[i])] = int(counts[i]) / float(union_count)
             iou_sorted_instance_ids = list(OrderedDict(sorted(iou_scores.items(), key=lambda x: x[1], reverse=True)))
 
             # get the most common object ids ignoring the object-in-hand
@@ -1,6 +1,5 @@
-import glob
-import cv2
 import embodiedbench.envs.eb_alfred.gen.constants as constants
+from embodiedbench.envs.eb_alfred.gen.utils.image_util import get_image_writer
 from embodiedbench.envs.eb_alfred.gen.agents.agent_base import AgentBase
 from embodiedbench.envs.eb_alfred.gen.agents.plan_agent import PlanAgent
 from embodiedbench.envs.eb_alfred.gen.game_states.planned_game_state import PlannedGameState
@@ -36,11 +35,8 @@ class SemanticMapPlannerAgent(AgentBase):
             self.terminal = True
 
             if constants.RECORD_VIDEO_IMAGES:
-                im_ind = len(glob.glob(constants.save_path + '/*.png'))
                 for _ in range(10):
-                    cv2.imwrite(constants.save_path + '/%09d.png' % im_ind,
-                                self.game_state.s_t[:, :, ::-1])
-                    im_ind += 1
+                    get_image_writer().save(constants.save_path, self.game_state.s_t[:, :, ::-1])
         else:
             if 'Teleport' in action['action']:
                 start_pose = self.pose
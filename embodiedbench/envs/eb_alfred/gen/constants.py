@@ -29,6 +29,13 @@ MAX_EPISODE_LENGTH = 1000        # maximum number of API steps allowed per traje
 FORCED_SAMPLING = False          # set True for debugging instead of proper sampling
 PRUNE_UNREACHABLE_POINTS = True  # prune navigation points that were deemed unreachable by the proprocessing script
 
+########################################################################################################################
+# Planner
+
+PLANNER_WORKERS = 3              # planner worker processes shared by all PlanParsers of a process
+PLANNER_TIMEOUT = 30             # seconds before a planner run is given up
+PLANNER_CACHE_SIZE = 10000       # plans of previously solved problems kept in memory
+
 ########################################################################################################################
 # Goals
 
@@ -105,6 +112,7 @@ STEPS_AHEAD = 5
 SCENE_PADDING = STEPS_AHEAD * 3
 SCREEN_WIDTH = DETECTION_SCREEN_WIDTH = 500
 SCREEN_HEIGHT = DETECTION_SCREEN_HEIGHT = 500
+FOCAL_LENGTH = SCREEN_WIDTH / 2.0  # in pixels, of THOR's default 90 degree field of view
 MIN_VISIBLE_PIXELS = 10
 
 # (400) / (600*600) ~ 0.13% area of image
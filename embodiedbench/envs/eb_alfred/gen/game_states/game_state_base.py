@@ -1,5 +1,4 @@
 import copy
-import glob
 import random
 import time
 
@@ -10,7 +9,8 @@ import embodiedbench.envs.eb_alfred.gen.constants as constants
 from embodiedbench.envs.eb_alfred.gen.graph import graph_obj
 from embodiedbench.envs.eb_alfred.gen.utils import game_util
 from embodiedbench.envs.eb_alfred.gen.utils.py_util import SetWithGet
-from embodiedbench.envs.eb_alfred.gen.utils.image_util import compress_mask
+from embodiedbench.envs.eb_alfred.gen.utils.image_util import compress_mask, get_image_writer
+from embodiedbench.envs.eb_alfred.gen.utils.instance_index import get_instance_index
 
 
 class GameStateBase(object):
@@ -303,14 +303,15 @@ class GameStateBase(object):
 
     def get_point_of_obj(self, object_id, centroid_type="box_center", visualize_debug=False):
         instance_detections2D = self.env.last_event.instance_detections2D
-        instance_seg_frame = np.array(self.env.last_event.instance_segmentation_frame)
 
         if object_id in instance_detections2D:
             color = self.env.last_event.object_id_to_color[object_id]
-            seg_mask = cv2.inRange(instance_seg_frame, color, color)
-            nz_rows, nz_cols = np.nonzero(seg_mask)
+            index = get_instance_index(self.env.last_event)
+            if index.count(color) == 0:
+                raise Exception("No point for ", object_id)
 
             if centroid_type == "moment":
+                seg_mask = index.mask(color).astype(np.uint8) * 255
                 _, contours, hierarchy = cv2.findContours(seg_mask, 1, 2)
                 moment = cv2.moments(contours[0])
                 if moment["m00"] == 0:
@@ -318,22 +319,16 @@ class GameStateBase(object):
 
                 cx = int(moment['m10']/moment['m00'])
                 cy = int(moment['m01']/moment['m00'])
-            else:
-                x0, y0, xmax, ymax = min(nz_cols), min(nz_rows), max(nz_cols), max(nz_rows)
-                cx = int((xmax - x0) / 2 + x0)
-                cy = int((ymax - y0) / 2 + y0)
 
-            # if centroid not on seg mask (non-convex hull), find the closest point that is on the mask
-            if seg_mask[cy, cx] == 0:
-                non_zero_coords = zip(nz_cols, nz_rows)
-                dist = lambda a, b: (a[0]-b[0])**2 + (a[1]-b[1])**2
-                closest_point = min(non_zero_coords, key=lambda co: dist(co, (cx, cy)))
-                cx, cy = closest_point
+                # if centroid not on seg mask (non-convex hull), find the closest point that is on the mask
+                cx, cy = index.closest_point(color, cx, cy)
+            else:
+                cx, cy = index.point(color)
 
             # plot point on seg mask
             if visualize_debug:
-                seg_mask = cv2.cvtColor(seg_mask, cv2.COLOR_GRAY2RGB)
-                cv2.imshow('img', instance_seg_frame)
+                seg_mask = cv2.cvtColor(index.mask(color).astype(np.uint8) * 255, cv2.COLOR_GRAY2RGB)
+                cv2.imshow('img', np.array(self.env.last_event.instance_segmentation_frame))
                 cv2.imshow('seg', seg_mask)
                 cv2.waitKey(0)
 
@@ -348,13 +343,10 @@ class GameStateBase(object):
 
     def get_mask_of_obj(self, object_id):
         instance_detections2D = self.env.last_event.instance_detections2D
-        instance_seg_frame = np.array(self.env.last_event.instance_segmentation_frame)
 
         if object_id in instance_detections2D:
             color = self.env.last_event.object_id_to_color[object_id]
-            seg_mask = cv2.inRange(instance_seg_frame, color, color)
-            seg_mask = np.array(seg_mask) / 255
-            seg_mask = seg_mask.astype(int)
+            seg_mask = get_instance_index(self.env.last_event).mask(color)
             # Compress the segmentation mask using simple run-length compression.
             run_len_compressed = compress_mask(seg_mask)
             return run_len_compressed
@@ -388,7 +380,6 @@ class GameStateBase(object):
                 self.env.last_event.metadata['lastActionSuccess'] = True
             else:
                 if constants.RECORD_VIDEO_IMAGES:
-                    im_ind = len(glob.glob(constants.save_path + '/*.png'))
                     if 'Teleport' in action['action']:
                         position = self.env.last_event.metadata['agent']['position']
                         rotation = self.env.last_event.metadata['agent']['rotation']
@@ -404,10 +395,7 @@ class GameStateBase(object):
                                 new_action['rotation'] = start_rotation
                                 new_action['horizon'] = start_horizon
                                 self.event = self.env.step(new_action)
-                                cv2.imwrite(constants.save_path + '/%09d.png' % im_ind,
-                                            self.event.frame[:, :, ::-1])
-                                game_util.store_image_name('%09d.png' % im_ind)  # eww... seriously need to clean this up
-                                im_ind += 1
+                                self.write_image(self.event.frame)
                         if np.abs(action['horizon'] - self.env.last_event.metadata['agent']['cameraHorizon']) > 0.001:
                             end_horizon = action['horizon']
                             for xx in np.arange(.1, 1, .1):
@@ -415,20 +403,14 @@ class GameStateBase(object):
                                 new_action['horizon'] = np.round(start_horizon * (1 - xx) + end_horizon * xx, 3)
                                 new_action['rotation'] = start_rotation
                                 self.event = self.env.step(new_action)
-                                cv2.imwrite(constants.save_path + '/%09d.png' % im_ind,
-                                            self.event.frame[:, :, ::-1])
-                                game_util.store_image_name('%09d.png' % im_ind)
-                                im_ind += 1
+                                self.write_image(self.event.frame)
                         if np.abs(action['rotation'] - rotation['y']) > 0.001:
                             end_rotation = action['rotation']
                             for xx in np.arange(.1, 1, .1):
                                 new_action = copy.deepcopy(action)
                                 new_action['rotation'] = np.round(start_rotation * (1 - xx) + end_rotation * xx, 3)
                                 self.event = self.env.step(new_action)
-                                cv2.imwrite(constants.save_path + '/%09d.png' % im_ind,
-                                            self.event.frame[:, :, ::-1])
-                                game_util.store_image_name('%09d.png' % im_ind)
-                                im_ind += 1
+                                self.write_image(self.event.frame)
 
                         self.event = self.env.step(action)
 
@@ -437,27 +419,21 @@ class GameStateBase(object):
                         self.save_image(1)
                         events = self.env.smooth_move_ahead(action)
                         for event in events:
-                            im_ind = len(glob.glob(constants.save_path + '/*.png'))
-                            cv2.imwrite(constants.save_path + '/%09d.png' % im_ind, event.frame[:, :, ::-1])
-                            game_util.store_image_name('%09d.png' % im_ind)
+                            self.write_image(event.frame)
 
                     elif 'Rotate' in action['action']:
                         self.store_ll_action(action)
                         self.save_image(1)
                         events = self.env.smooth_rotate(action)
                         for event in events:
-                            im_ind = len(glob.glob(constants.save_path + '/*.png'))
-                            cv2.imwrite(constants.save_path + '/%09d.png' % im_ind, event.frame[:, :, ::-1])
-                            game_util.store_image_name('%09d.png' % im_ind)
+                            self.write_image(event.frame)
 
                     elif 'Look' in action['action']:
                         self.store_ll_action(action)
                         self.save_image(1)
                         events = self.env.smooth_look(action)
                         for event in events:
-                            im_ind = len(glob.glob(constants.save_path + '/*.png'))
-                            cv2.imwrite(constants.save_path + '/%09d.png' % im_ind, event.frame[:, :, ::-1])
-                            game_util.store_image_name('%09d.png' % im_ind)
+                            self.write_image(event.frame)
 
                     elif 'OpenObject' in action['action']:
                         open_action = dict(action=action['action'],
@@ -870,8 +846,8 @@ class GameStateBase(object):
         for o in self.env.last_event.metadata['objects']:
             if o['objectId'] == action['objectId'] and \
                     "Sliced" not in action['objectId']: # NOTE: ignore slice objects for this check
-                instance_masks = self.env.last_event.instance_masks
-                total_obj_pixels = np.sum(instance_masks[o['objectId']] if o['objectId'] in instance_masks else [0])
+                color = self.env.last_event.object_id_to_color.get(o['objectId'])
+                total_obj_pixels = get_instance_index(self.env.last_event).count(color) if color is not None else 0
                 # print("\tNum. Object Pixels: " + str(total_obj_pixels))
                 if not o['visible'] or (total_obj_pixels < min_pixels):
                     raise Exception("Pickup item not visible! Visible property: " + str(o['visible']) +
@@ -888,15 +864,19 @@ class GameStateBase(object):
         if constants.RECORD_VIDEO_IMAGES:
             im_ind = -1
             for i in range(count):
-                im_ind = len(glob.glob(constants.save_path + '/*.png'))
-                cv2.imwrite(constants.save_path + '/%09d.png' % im_ind, self.env.last_event.frame[:, :, ::-1])
-                game_util.store_image_name('%09d.png' % im_ind)
+                im_ind = self.write_image(self.env.last_event.frame)
 
                 self.env.noop()
             return im_ind
         else:
             return -1
 
+    def write_image(self, frame):
+        # written in the background, numbered in the order of the calls
+        im_ind = get_image_writer().save(constants.save_path, frame[:, :, ::-1])
+        game_util.store_image_name('%09d.png' % im_ind)
+        return im_ind
+
     def process_frame(self):
         self.event = self.env.last_event
         self.pose = game_util.get_pose(self.event)
@@ -365,9 +365,11 @@ class PlannedGameState(GameStateBase, ABC):
             fid.flush()
         constants.data_dict['pddl_state'].append('problem_%s.pddl' % pddl_state_next_idx)
 
-        with open('%s/planner/generated_problems/problem_%s.pddl' % (self.dname, self.problem_id), 'w') as fid:
-            fid.write(pddl_str)
-            fid.flush()
+        # the planner gets the problem through a pipe, the file is only kept for debugging
+        if constants.DEBUG:
+            with open('%s/planner/generated_problems/problem_%s.pddl' % (self.dname, self.problem_id), 'w') as fid:
+                fid.write(pddl_str)
+                fid.flush()
 
         return pddl_str
 
@@ -417,8 +419,8 @@ class PlannedGameState(GameStateBase, ABC):
             # When there are no receptacles, there's nothing to plan.
             # Only happens if called too early (before room exploration).
             if len(self.receptacle_to_point) > 0:
-                self.state_to_pddl()
-                self.plan = self.planner.get_plan()
+                pddl_str = self.state_to_pddl()
+                self.plan = self.planner.get_plan(pddl_str)
             self.need_plan_update = False
             if len(self.plan) == 0:
                 # Problem is solved, plan is empty
@@ -7,11 +7,11 @@ sys.path.append(os.path.join(os.environ['ALFRED_ROOT'], 'gen'))
 import threading
 import time
 
-import cv2
 import numpy as np
 
 import gen.constants as constants
 from env.thor_env import ThorEnv
+from gen.utils.instance_index import get_instance_index
 
 N_PROCS = 40
 
@@ -100,14 +100,10 @@ def get_obj(env, open_test_objs, reachable_points, agent_height, scene_name, goo
 # Derived from function of the same name in game_states/game_state_base.py
 def get_mask_of_obj(env, object_id):
     instance_detections2D = env.last_event.instance_detections2D
-    instance_seg_frame = np.array(env.last_event.instance_segmentation_frame)
 
     if object_id in instance_detections2D:
         color = env.last_event.object_id_to_color[object_id]
-        seg_mask = cv2.inRange(instance_seg_frame, color, color)
-        seg_mask = np.array(seg_mask) / 255
-        seg_mask = seg_mask.astype(int)
-        return np.sum(seg_mask)
+        return get_instance_index(env.last_event).count(color)
     else:
         return None
 
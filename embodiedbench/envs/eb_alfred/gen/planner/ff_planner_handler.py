@@ -1,5 +1,10 @@
+import os
 import pdb
 import ast
+import copy
+import atexit
+import hashlib
+import collections
 import multiprocessing
 import re
 import shlex
@@ -132,18 +137,21 @@ def parse_plan_from_file(self, path):
     return self.parse_plan(lines)
 
 
-def get_plan_from_file(args):
-    domain, filepath, solver_type = args
-
+def run_planner(domain, solver_type, filepath, problem=None, timeout=30):
+    '''
+    runs ff on the problem in filepath, or on the problem string piped to its stdin
+    '''
     start_t = time.time()
     try:
         command = ('ff_planner/ff '
                    '-o %s '
                    '-s %d '
-                   '-f %s ' % (domain, solver_type, filepath))
+                   '-f %s ' % (domain, solver_type, filepath if problem is None else '/dev/stdin'))
         if DEBUG:
             print(command)
-        planner_output = subprocess.check_output(shlex.split(command), timeout=30)
+        planner_output = subprocess.check_output(
+            shlex.split(command), timeout=timeout,
+            input=None if problem is None else problem.encode('utf-8'))
     except subprocess.CalledProcessError as error:
         # Plan is done
         output_str = error.output.decode('utf-8')
@@ -182,6 +190,16 @@ def get_plan_from_file(args):
     return parsed_plan
 
 
+def get_plan_from_file(args):
+    domain, filepath, solver_type = args
+    return run_planner(domain, solver_type, filepath)
+
+
+def get_plan_from_str(args):
+    domain, problem, solver_type, timeout = args
+    return run_planner(domain, solver_type, '<%s>' % problem_name(problem), problem=problem, timeout=timeout)
+
+
 # Example of how to call ff
 # /path/to/Metric-FF-v2.1/ff -o planner/domains/Question_domain.pddl -f planner/exists_problem.pddl
 def get_plan_async(args):
@@ -190,20 +208,118 @@ def get_plan_async(args):
     return get_plan_from_file((domain, filepath, solver_type))
 
 
+def problem_name(problem):
+    match = re.search(r'\(\s*problem\s+([^\s()]+)', problem, re.IGNORECASE)
+    return match.group(1) if match else 'problem'
+
+
+def canonical_problem(problem):
+    '''
+    problem string without comments, problem name, case and whitespace differences (ff ignores them)
+    '''
+    problem = re.sub(r';[^\n]*', '', problem)
+    problem = ' '.join(problem.lower().split())
+    return re.sub(r'\(\s*problem\s+[^\s()]+\s*\)', '(problem)', problem, count=1)
+
+
+class PlannerService(object):
+    '''
+    long-lived pool of planner worker processes shared by the PlanParsers of a process, and a cache
+    of the plans of previously solved problems (keyed by domain, solver type and canonical problem)
+    '''
+
+    def __init__(self, num_workers=None, timeout=None, cache_size=None):
+        self.num_workers = num_workers or constants.PLANNER_WORKERS
+        self.timeout = timeout or constants.PLANNER_TIMEOUT
+        self.cache_size = constants.PLANNER_CACHE_SIZE if cache_size is None else cache_size
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._domain_hashes = {}
+        self._pool = None
+        self._pid = None
+
+    @property
+    def pool(self):
+        # a pool inherited from the parent process (fork) cannot be used
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = multiprocessing.Pool(self.num_workers)
+            self._pid = os.getpid()
+        return self._pool
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.terminate()
+            self._pool.join()
+        self._pool = None
+
+    def domain_hash(self, domain):
+        stat = os.stat(domain)
+        key = (domain, stat.st_mtime_ns, stat.st_size)
+        if key not in self._domain_hashes:
+            with open(domain, 'rb') as f:
+                self._domain_hashes[key] = hashlib.sha1(f.read()).hexdigest()
+        return self._domain_hashes[key]
+
+    def problem_key(self, domain, problem, solver_type):
+        text = '%s\n%d\n%s' % (self.domain_hash(domain), solver_type, canonical_problem(problem))
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def solve(self, domain, problem, solver_types=(3, 4, 5)):
+        '''
+        parsed plans of the problem string, one per solver type
+        '''
+        keys = [self.problem_key(domain, problem, solver_type) for solver_type in solver_types]
+        plans = [self.cache.get(key) for key in keys]
+        missing = [i for i, plan in enumerate(plans) if plan is None]
+        self.hits += len(plans) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            solved = self.pool.map(get_plan_from_str, [(domain, problem, solver_types[i], self.timeout)
+                                                       for i in missing])
+            for i, plan in zip(missing, solved):
+                plans[i] = plan
+                # a timeout may not happen again (e.g. on a less busy machine)
+                if plan[0] != 'timeout' and self.cache_size > 0:
+                    self.cache[keys[i]] = plan
+        for key in keys:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return copy.deepcopy(plans)
+
+
+_planner_service = None
+
+
+def get_planner_service():
+    '''
+    the planner service of this process
+    '''
+    global _planner_service
+    if _planner_service is None:
+        _planner_service = PlannerService()
+        atexit.register(_planner_service.close)
+    return _planner_service
+
+
 class PlanParser(object):
-    def __init__(self, domain_file_path):
+    def __init__(self, domain_file_path, service=None):
         self.domain = domain_file_path
         self.problem_id = -1
-        self.process_pool = multiprocessing.Pool(3)
-        #from multiprocessing.pool import ThreadPool
-        #self.process_pool = ThreadPool(3)
+        self.service = service or get_planner_service()
 
-    def get_plan(self):
-        parsed_plans = self.process_pool.map(get_plan_async, zip([self.domain] * 3, [self.problem_id] * 3, range(3, 6)))
+    def get_plan(self, problem=None):
+        if problem is None:
+            with open('%s/planner/generated_problems/problem_%s.pddl' % (constants.LOG_FILE, self.problem_id)) as f:
+                problem = f.read()
+        parsed_plans = self.service.solve(self.domain, problem, range(3, 6))
         return self.find_best_plan(parsed_plans)
 
     def get_plan_from_file(self, domain_path, filepath):
-        parsed_plans = self.process_pool.map(get_plan_from_file, zip([domain_path] * 3, [filepath] * 3, range(3, 6)))
+        with open(filepath) as f:
+            parsed_plans = self.service.solve(domain_path, f.read(), range(3, 6))
         return self.find_best_plan(parsed_plans)
 
     # Unncessary, planner should be optimal. But the planner produces some weird actions
@@ -233,12 +349,16 @@ class PlanParser(object):
 
 
 class SinglePlanParser(PlanParser):
-    def get_plan(self):
-        parsed_plan = get_plan_async([self.domain, self.problem_id, 3])
+    def get_plan(self, problem=None):
+        if problem is None:
+            with open('%s/planner/generated_problems/problem_%s.pddl' % (constants.LOG_FILE, self.problem_id)) as f:
+                problem = f.read()
+        parsed_plan = self.service.solve(self.domain, problem, (3,))[0]
         return parsed_plan
 
     def get_plan_from_file(self, domain_path, filepath):
-        parsed_plan = get_plan_from_file([domain_path, filepath, 3])
+        with open(filepath) as f:
+            parsed_plan = self.service.solve(domain_path, f.read(), (3,))[0]
         return parsed_plan
 
 
@@ -7,7 +7,6 @@ import json
 import glob
 import os
 import constants
-import cv2
 import shutil
 import numpy as np
 import argparse
@@ -17,10 +16,13 @@ import copy
 import random
 from embodiedbench.envs.eb_alfred.gen.utils.video_util import VideoSaver
 from embodiedbench.envs.eb_alfred.gen.utils.py_util import walklevel
+from embodiedbench.envs.eb_alfred.gen.utils.image_util import AsyncImageWriter
+from embodiedbench.envs.eb_alfred.gen.utils.generation_orchestrator import JobLedger
 from embodiedbench.envs.eb_alfred.env.thor_env import ThorEnv
 
 
 TRAJ_DATA_JSON_FILENAME = "traj_data.json"
+LEDGER_FILENAME = "augment_ledger.jsonl"
 AUGMENTED_TRAJ_DATA_JSON_FILENAME = "augmented_traj_data.json"
 
 ORIGINAL_IMAGES_FORLDER = "raw_images"
@@ -39,6 +41,16 @@ render_settings['renderClassImage'] = True
 
 video_saver = VideoSaver()
 
+# every replay thread writes its images with its own writer, so that waiting for the images of
+# a trajectory does not wait for (or raise the errors of) the trajectories of the other threads
+thread_state = threading.local()
+
+
+def get_image_writer():
+    if not hasattr(thread_state, 'image_writer'):
+        thread_state.image_writer = AsyncImageWriter()
+    return thread_state.image_writer
+
 
 def get_image_index(save_path):
     return len(glob.glob(save_path + '/*.png'))
@@ -70,10 +82,10 @@ def save_image(event, save_path):
     mask_image = event.instance_segmentation_frame
 
     # dump images
-    im_ind = get_image_index(rgb_save_path)
-    cv2.imwrite(rgb_save_path + '/%09d.png' % im_ind, rgb_image)
-    cv2.imwrite(depth_save_path + '/%09d.png' % im_ind, depth_image)
-    cv2.imwrite(mask_save_path + '/%09d.png' % im_ind, mask_image)
+    image_writer = get_image_writer()
+    im_ind = image_writer.save(rgb_save_path, rgb_image)
+    image_writer.save(depth_save_path, depth_image)
+    image_writer.save(mask_save_path, mask_image)
 
     return im_ind
 
@@ -106,6 +118,8 @@ def augment_traj(env, json_file):
     # fresh images list
     traj_data['images'] = list()
 
+    image_writer = get_image_writer()
+    image_writer.discard(root_dir)
     clear_and_create_dir(high_res_images_dir)
     clear_and_create_dir(depth_images_dir)
     clear_and_create_dir(instance_masks_dir)
@@ -192,7 +206,7 @@ def augment_traj(env, json_file):
                 event = env.step(cmd)
 
         # update image list
-        new_img_idx = get_image_index(high_res_images_dir)
+        new_img_idx = image_writer.count(high_res_images_dir)
         last_img_idx = len(traj_data['images'])
         num_new_images = new_img_idx - last_img_idx
         for j in range(num_new_images):
@@ -231,6 +245,7 @@ def augment_traj(env, json_file):
         json.dump(augmented_traj_data, aj, sort_keys=True, indent=4)
 
     # save video
+    image_writer.flush()
     images_path = os.path.join(high_res_images_dir, '*.png')
     video_save_path = os.path.join(high_res_images_dir, 'high_res_video.mp4')
     video_saver.save(images_path, video_save_path)
@@ -259,15 +274,20 @@ def run():
         json_file = traj_list.pop()
         lock.release()
 
+        unit = (os.path.relpath(json_file, args.data_path),)
         print ("Augmenting: " + json_file)
+        ledger.record(unit, 'claimed', trial=unit[0])
         try:
             augment_traj(env, json_file)
+            ledger.record(unit, 'done', trial=unit[0])
         except Exception as e:
             import traceback
             traceback.print_exc()
             print ("Error: " + repr(e))
             print ("Skipping " + json_file)
             skipped_files.append(json_file)
+            get_image_writer().discard(json_file.replace(TRAJ_DATA_JSON_FILENAME, ""))
+            ledger.record(unit, 'failed', trial=unit[0], error=repr(e))
 
     env.stop()
     print("Finished.")
@@ -289,14 +309,22 @@ parser.add_argument('--time_delays', dest='time_delays', action='store_true')
 parser.add_argument('--shuffle', dest='shuffle', action='store_true')
 parser.add_argument('--num_threads', type=int, default=1)
 parser.add_argument('--reward_config', type=str, default='../models/config/rewards.json')
+parser.add_argument('--redo', dest='redo', action='store_true',
+                    help="augment every trajectory again, not only those without a done record in the ledger")
 args = parser.parse_args()
 
+# trajectories augmented by earlier runs (a resumed run skips them)
+ledger = JobLedger(args.data_path, name=LEDGER_FILENAME)
+done = set() if args.redo else set(unit[0] for unit in ledger.state()[0])
+
 # make a list of all the traj_data json files
 for dir_name, subdir_list, file_list in walklevel(args.data_path, level=3):
     if "trial_" in dir_name:
         json_file = os.path.join(dir_name, TRAJ_DATA_JSON_FILENAME)
         if not os.path.isfile(json_file) or 'tests' in dir_name:
             continue
+        if os.path.relpath(json_file, args.data_path) in done:
+            continue
         traj_list.append(json_file)
 
 # random shuffle
@@ -3,9 +3,8 @@ import sys
 sys.path.append(os.path.join(os.environ['ALFRED_ROOT']))
 sys.path.append(os.path.join(os.environ['ALFRED_ROOT'], 'gen'))
 
-import time
-import multiprocessing as mp
 import json
+import functools
 import random
 import shutil
 import argparse
@@ -20,10 +19,13 @@ from embodiedbench.envs.eb_alfred.env.thor_env import ThorEnv
 from embodiedbench.envs.eb_alfred.gen.game_states.task_game_state_full_knowledge import TaskGameStateFullKnowledge
 from embodiedbench.envs.eb_alfred.gen.utils.video_util import VideoSaver
 from embodiedbench.envs.eb_alfred.gen.utils.dataset_management_util import load_successes_from_disk, load_fails_from_disk
+from embodiedbench.envs.eb_alfred.gen.utils.generation_orchestrator import JobLedger, WorkerPool
+from embodiedbench.envs.eb_alfred.gen.utils.image_util import get_image_writer
 
 # params
 RAW_IMAGES_FOLDER = 'raw_images/'
 DATA_JSON_FILENAME = 'traj_data.json'
+MAX_SAMPLES_PER_JOB = 100  # samples drawn before waiting for a worker when they are all in progress
 
 # video saver
 video_saver = VideoSaver()
@@ -382,16 +384,7 @@ def print_successes(succ_traj):
     print("\n##################################")
 
 
-def main(args):
-    # settings
-    constants.DATA_SAVE_PATH = args.save_path
-    print("Force Unsave Data: %s" % str(args.force_unsave))
-
-    # Set up data structure to track dataset balance and use for selecting next parameters.
-    # In actively gathering data, we will try to maximize entropy for each (e.g., uniform spread of goals,
-    # uniform spread over patient objects, uniform recipient objects, and uniform scenes).
-    succ_traj = pd.DataFrame(columns=["goal", "pickup", "movable", "receptacle", "scene"])
-
+def load_scene_databases():
     # objects-to-scene and scene-to-objects database
     for scene_type, ids in constants.SCENE_TYPE.items():
         for id in ids:
@@ -417,65 +410,47 @@ def main(args):
         for s in constants.SCENE_TYPE[st]:
             scene_to_type[str(s)] = st
 
-    # pre-populate counts in this structure using saved trajectories path.
-    succ_traj, full_traj = load_successes_from_disk(args.save_path, succ_traj, args.just_examine, args.repeats_per_cond)
-    if args.just_examine:
-        print_successes(succ_traj)
-        return
-
-    # pre-populate failed trajectories.
-    fail_traj = load_fails_from_disk(args.save_path)
-    print("Loaded %d known failed tuples" % len(fail_traj))
-
-    # create env and agent
-    env = ThorEnv()
-
-    game_state = TaskGameStateFullKnowledge(env)
-    agent = DeterministicPlannerAgent(thread_id=0, game_state=game_state)
 
-    errors = {}  # map from error strings to counts, to be shown after every failure.
-    goal_candidates = constants.GOALS[:]
+def get_pickup_candidates():
     pickup_candidates = list(set().union(*[constants.VAL_RECEPTACLE_OBJECTS[obj]  # Union objects that can be placed.
                                            for obj in constants.VAL_RECEPTACLE_OBJECTS]))
-    pickup_candidates = [p for p in pickup_candidates if constants.OBJ_PARENTS[p] in obj_to_scene_ids]
-    movable_candidates = list(set(constants.MOVABLE_RECEPTACLES).intersection(obj_to_scene_ids.keys()))
-    receptacle_candidates = [obj for obj in constants.VAL_RECEPTACLE_OBJECTS
-                             if obj not in constants.MOVABLE_RECEPTACLES and obj in obj_to_scene_ids] + \
-                            [obj for obj in constants.VAL_ACTION_OBJECTS["Toggleable"]
-                             if obj in obj_to_scene_ids]
-
-    # toaster isn't interesting in terms of producing linguistic diversity
-    receptacle_candidates.remove('Toaster')
-    receptacle_candidates.sort()
-
-    scene_candidates = list(scene_id_to_objs.keys())
-
-    n_until_load_successes = args.async_load_every_n_samples
-    print_successes(succ_traj)
-    task_sampler = sample_task_params(succ_traj, full_traj, fail_traj,
-                                      goal_candidates, pickup_candidates, movable_candidates,
-                                      receptacle_candidates, scene_candidates)
-
-    # main generation loop
-    # keeps trying out new task tuples as trajectories either fail or suceed
-    while True:
-
-        sampled_task = next(task_sampler)
-        print(sampled_task)  # DEBUG
-        if sampled_task is None:
-            sys.exit("No valid tuples left to sample (all are known to fail or already have %d trajectories" %
-                     args.repeats_per_cond)
-        gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene = sampled_task
-        print("sampled tuple: " + str((gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene)))
-
+    return [p for p in pickup_candidates if constants.OBJ_PARENTS[p] in obj_to_scene_ids]
+
+
+class TrajectoryWorker(object):
+    '''
+    generation worker process: one THOR env, game state and agent, reused for every unit it is given
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        constants.DATA_SAVE_PATH = args.save_path
+        if not scene_id_to_objs:
+            load_scene_databases()
+        self.pickup_candidates = get_pickup_candidates()
+        self.ledger = JobLedger(args.save_path)
+
+        # create env and agent
+        self.env = ThorEnv()
+        self.game_state = TaskGameStateFullKnowledge(self.env)
+        self.agent = DeterministicPlannerAgent(thread_id=0, game_state=self.game_state)
+
+    def close(self):
+        self.env.stop()
+
+    def run(self, job):
+        '''
+        tries to generate job['target'] trajectories of the (goal, pickup, movable, receptacle, scene) unit
+        '''
+        args, env, agent = self.args, self.env, self.agent
+        unit = job['unit']
+        gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene = unit
         tries_remaining = args.trials_before_fail
         # only try to get the number of trajectories left to make this tuple full.
-        target_remaining = args.repeats_per_cond - len(succ_traj.loc[(succ_traj['goal'] == gtype) &
-                                                                (succ_traj['pickup'] == pickup_obj) &
-                                                                (succ_traj['movable'] == movable_obj) &
-                                                                (succ_traj['receptacle'] == receptacle_obj) &
-                                                                (succ_traj['scene'] == str(sampled_scene))])
+        target_remaining = job['target']
         num_place_fails = 0  # count of errors related to placement failure for no valid positions.
+        successes = 0
+        errors = []
 
         # continue until we're (out of tries + have never succeeded) or (have gathered the target number of instances)
         while tries_remaining > 0 and target_remaining > 0:
@@ -484,6 +459,8 @@ def main(args):
             constants.pddl_goal_type = gtype
             print("PDDLGoalType: " + constants.pddl_goal_type)
             task_id = create_dirs(gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene)
+            self.ledger.record(unit, 'claimed', trial=task_id,
+                               path=constants.save_path.replace(RAW_IMAGES_FOLDER, ''))
 
             # setup data dictionary
             setup_data_dict()
@@ -503,7 +480,7 @@ def main(args):
                     constraint_objs['repeat'].append((movable_obj,
                                                       np.random.randint(1, constants.PICKUP_REPEAT_MAX + 1)))
                 for obj_type in scene_id_to_objs[str(sampled_scene)]:
-                    if (obj_type in pickup_candidates and
+                    if (obj_type in self.pickup_candidates and
                             obj_type != constants.OBJ_PARENTS[pickup_obj] and obj_type != movable_obj):
                         constraint_objs['repeat'].append((obj_type,
                                                           np.random.randint(1, constants.MAX_NUM_OF_OBJ_INSTANCES + 1)))
@@ -569,6 +546,7 @@ def main(args):
                     print(traceback.format_exc())
 
                 deleted = delete_save(args.in_parallel)
+                self.ledger.record(unit, 'failed', trial=task_id, error=str(e)[:120])
                 if not deleted:  # another thread is filling this task successfully, so leave it alone.
                     target_remaining = 0  # stop trying to do this task.
                 else:
@@ -579,64 +557,199 @@ def main(args):
                     else:  # generic error
                         tries_remaining -= 1
 
-                estr = str(e)
-                if len(estr) > 120:
-                    estr = estr[:120]
-                if estr not in errors:
-                    errors[estr] = 0
-                errors[estr] += 1
-                print("%%%%%%%%%%")
-                es = sum([errors[er] for er in errors])
-                print("\terrors (%d):" % es)
-                for er, v in sorted(errors.items(), key=lambda kv: kv[1], reverse=True):
-                    if v / es < 0.01:  # stop showing below 1% of errors.
-                        break
-                    print("\t(%.2f) (%d)\t%s" % (v / es, v, er))
-                print("%%%%%%%%%%")
-
+                errors.append(str(e))
                 continue
 
             if args.force_unsave:
                 delete_save(args.in_parallel)
+            self.ledger.record(unit, 'done', trial=task_id, unsaved=args.force_unsave)
+
+            successes += 1
+            target_remaining -= 1
+            tries_remaining += args.trials_before_fail  # on success, add more tries for future successes
+
+        return {'successes': successes, 'tries_remaining': tries_remaining, 'target_remaining': target_remaining,
+                'errors': errors}
+
+
+def remove_unfinished_trials(ledger):
+    '''
+    removes the trials claimed in a previous run that were never finished (partial outputs of a crashed worker)
+    '''
+    removed = ledger.fail_unfinished()
+    for unit, path in removed:
+        print("Removed unfinished trial '%s'" % path)
+    return len(removed)
+
+
+def main(args):
+    # settings
+    constants.DATA_SAVE_PATH = args.save_path
+    print("Force Unsave Data: %s" % str(args.force_unsave))
 
-            # add to save structure.
-            succ_traj = succ_traj.append({
+    # Set up data structure to track dataset balance and use for selecting next parameters.
+    # In actively gathering data, we will try to maximize entropy for each (e.g., uniform spread of goals,
+    # uniform spread over patient objects, uniform recipient objects, and uniform scenes).
+    succ_traj = pd.DataFrame(columns=["goal", "pickup", "movable", "receptacle", "scene"])
+
+    load_scene_databases()
+
+    # trials a crashed worker of a previous run left behind
+    ledger = JobLedger(args.save_path)
+    if not args.just_examine:
+        remove_unfinished_trials(ledger)
+
+    # pre-populate counts in this structure using saved trajectories path.
+    succ_traj, full_traj = load_successes_from_disk(args.save_path, succ_traj, args.just_examine, args.repeats_per_cond)
+    if args.just_examine:
+        print_successes(succ_traj)
+        return
+
+    # pre-populate failed trajectories.
+    fail_traj = load_fails_from_disk(args.save_path)
+    print("Loaded %d known failed tuples" % len(fail_traj))
+
+    goal_candidates = constants.GOALS[:]
+    pickup_candidates = get_pickup_candidates()
+    movable_candidates = list(set(constants.MOVABLE_RECEPTACLES).intersection(obj_to_scene_ids.keys()))
+    receptacle_candidates = [obj for obj in constants.VAL_RECEPTACLE_OBJECTS
+                             if obj not in constants.MOVABLE_RECEPTACLES and obj in obj_to_scene_ids] + \
+                            [obj for obj in constants.VAL_ACTION_OBJECTS["Toggleable"]
+                             if obj in obj_to_scene_ids]
+
+    # toaster isn't interesting in terms of producing linguistic diversity
+    receptacle_candidates.remove('Toaster')
+    receptacle_candidates.sort()
+
+    scene_candidates = list(scene_id_to_objs.keys())
+
+    print_successes(succ_traj)
+    run = {'succ_traj': succ_traj, 'fail_traj': fail_traj, 'sampler': None, 'exhausted': False,
+           'n_until_load_successes': args.async_load_every_n_samples}
+    in_progress = set()
+    crashes = {}  # map from tuples to the number of jobs on them whose worker crashed.
+    errors = {}  # map from error strings to counts, to be shown after every failure.
+
+    def new_sampler():
+        return sample_task_params(run['succ_traj'], full_traj, run['fail_traj'],
+                                  goal_candidates, pickup_candidates, movable_candidates,
+                                  receptacle_candidates, scene_candidates)
+
+    def next_job():
+        if run['sampler'] is None:
+            run['sampler'] = new_sampler()
+        # tuples being generated by another worker are sampled again
+        for _ in range(MAX_SAMPLES_PER_JOB):
+            sampled_task = next(run['sampler'], None)
+            print(sampled_task)  # DEBUG
+            if sampled_task is None:
+                # Discovered that there are no valid assignments remaining (apart from the ones in progress).
+                run['sampler'] = None
+                run['exhausted'] = not in_progress
+                return None
+            if sampled_task not in in_progress:
+                break
+        else:
+            return None
+        gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene = sampled_task
+        print("sampled tuple: " + str((gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene)))
+        succ_traj = run['succ_traj']
+        target = args.repeats_per_cond - len(succ_traj.loc[(succ_traj['goal'] == gtype) &
+                                                           (succ_traj['pickup'] == pickup_obj) &
+                                                           (succ_traj['movable'] == movable_obj) &
+                                                           (succ_traj['receptacle'] == receptacle_obj) &
+                                                           (succ_traj['scene'] == str(sampled_scene))])
+        in_progress.add(sampled_task)
+        return {'unit': sampled_task, 'target': target}
+
+    def mark_exhausted(sampled_task):
+        gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene = sampled_task
+        new_fails = [(gtype, pickup_obj, movable_obj, receptacle_obj, str(sampled_scene))]
+        run['fail_traj'] = load_fails_from_disk(args.save_path, to_write=new_fails)
+        ledger.record(sampled_task, 'exhausted')
+        print("%%%%%%%%%%")
+        print("failures (%d)" % len(run['fail_traj']))
+        print("%%%%%%%%%%")
+
+    def on_result(job, result):
+        sampled_task = job['unit']
+        in_progress.discard(sampled_task)
+        gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene = sampled_task
+        if 'error' in result:
+            # the worker crashed: its trial is removed and recorded as failed, the tuple can be sampled again
+            print("Worker failed on %s:\n%s" % (str(sampled_task), result['error']))
+            error = result['error'].strip().splitlines()[-1][:120]
+            for unit, path in ledger.fail_unfinished(sampled_task, pid=result['pid'], error=error):
+                print("Removed crashed trial '%s'" % path)
+
+            # a tuple that keeps crashing its worker without a success is flagged as not possible.
+            crashes[sampled_task] = crashes.get(sampled_task, 0) + 1
+            if crashes[sampled_task] >= args.trials_before_fail and job['target'] == args.repeats_per_cond \
+                    and not ledger.state()[0].get(sampled_task):
+                print("Worker crashed %d times on %s" % (crashes[sampled_task], str(sampled_task)))
+                mark_exhausted(sampled_task)
+            return
+
+        # add to save structure.
+        for _ in range(result['successes']):
+            run['succ_traj'] = run['succ_traj'].append({
                 "goal": gtype,
                 "movable": movable_obj,
                 "pickup": pickup_obj,
                 "receptacle": receptacle_obj,
                 "scene": str(sampled_scene)}, ignore_index=True)
-            target_remaining -= 1
-            tries_remaining += args.trials_before_fail  # on success, add more tries for future successes
 
-        # if this combination resulted in a certain number of failures with no successes, flag it as not possible.
-        if tries_remaining == 0 and target_remaining == args.repeats_per_cond:
-            new_fails = [(gtype, pickup_obj, movable_obj, receptacle_obj, str(sampled_scene))]
-            fail_traj = load_fails_from_disk(args.save_path, to_write=new_fails)
+        for estr in result['errors']:
+            if len(estr) > 120:
+                estr = estr[:120]
+            if estr not in errors:
+                errors[estr] = 0
+            errors[estr] += 1
+        if result['errors']:
             print("%%%%%%%%%%")
-            print("failures (%d)" % len(fail_traj))
-            # print("\t" + "\n\t".join([str(ft) for ft in fail_traj]))
+            es = sum([errors[er] for er in errors])
+            print("\terrors (%d):" % es)
+            for er, v in sorted(errors.items(), key=lambda kv: kv[1], reverse=True):
+                if v / es < 0.01:  # stop showing below 1% of errors.
+                    break
+                print("\t(%.2f) (%d)\t%s" % (v / es, v, er))
             print("%%%%%%%%%%")
 
+        # if this combination resulted in a certain number of failures with no successes, flag it as not possible.
+        if result['tries_remaining'] == 0 and result['target_remaining'] == args.repeats_per_cond:
+            mark_exhausted(sampled_task)
+
         # if this combination gave us the repeats we wanted, note it as filled.
-        if target_remaining == 0:
+        if result['target_remaining'] == 0:
             full_traj.add((gtype, pickup_obj, movable_obj, receptacle_obj, sampled_scene))
 
-        # if we're sharing with other processes, reload successes from disk to update local copy with others' additions.
-        if args.in_parallel:
-            if n_until_load_successes > 0:
-                n_until_load_successes -= 1
-            else:
+        # sample from the updated successes and failures from time to time
+        if run['n_until_load_successes'] > 0:
+            run['n_until_load_successes'] -= 1
+        else:
+            # if we're sharing with other processes, reload successes from disk to update local copy with others' additions.
+            if args.in_parallel:
                 print("Reloading trajectories from disk because of parallel processes...")
-                succ_traj = pd.DataFrame(columns=succ_traj.columns)  # Drop all rows.
-                succ_traj, full_traj = load_successes_from_disk(args.save_path, succ_traj, False, args.repeats_per_cond)
+                succ_traj = pd.DataFrame(columns=run['succ_traj'].columns)  # Drop all rows.
+                succ_traj, reloaded_full_traj = load_successes_from_disk(args.save_path, succ_traj, False,
+                                                                         args.repeats_per_cond)
+                full_traj.update(reloaded_full_traj)
+                run['succ_traj'] = succ_traj
                 print("... Loaded %d trajectories" % len(succ_traj.index))
-                n_until_load_successes = args.async_load_every_n_samples
-                print_successes(succ_traj)
-                task_sampler = sample_task_params(succ_traj, full_traj, fail_traj,
-                                                  goal_candidates, pickup_candidates, movable_candidates,
-                                                  receptacle_candidates, scene_candidates)
-                print("... Created fresh instance of sample_task_params generator")
+            run['n_until_load_successes'] = args.async_load_every_n_samples
+            print_successes(run['succ_traj'])
+            run['sampler'] = None
+            print("... Created fresh instance of sample_task_params generator")
+
+    # worker processes, each with its own THOR env for all the units it generates
+    pool = WorkerPool(functools.partial(TrajectoryWorker, args), max(1, args.num_threads))
+    try:
+        pool.run(next_job, on_result)
+    finally:
+        pool.close()
+    if run['exhausted']:
+        sys.exit("No valid tuples left to sample (all are known to fail or already have %d trajectories" %
+                 args.repeats_per_cond)
 
 
 def create_dirs(gtype, pickup_obj, movable_obj, receptacle_obj, scene_num):
@@ -652,6 +765,8 @@ def create_dirs(gtype, pickup_obj, movable_obj, receptacle_obj, scene_num):
 
 
 def save_video():
+    # images are written in the background
+    get_image_writer().flush()
     images_path = constants.save_path + '*.png'
     video_path = os.path.join(constants.save_path.replace(RAW_IMAGES_FOLDER, ''), 'video.mp4')
     video_saver.save(images_path, video_path)
@@ -681,6 +796,7 @@ def dump_data_dict():
 
 def delete_save(in_parallel):
     save_folder = constants.save_path.replace(RAW_IMAGES_FOLDER, '')
+    get_image_writer().discard(save_folder)
     if os.path.exists(save_folder):
         try:
             shutil.rmtree(save_folder)
@@ -692,17 +808,6 @@ def delete_save(in_parallel):
     return True
 
 
-def parallel_main(args):
-    procs = [mp.Process(target=main, args=(args,)) for _ in range(args.num_threads)]
-    try:
-        for proc in procs:
-            proc.start()
-            time.sleep(0.1)
-    finally:
-        for proc in procs:
-            proc.join()
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
@@ -713,7 +818,7 @@ if __name__ == "__main__":
     parser.add_argument('--x_display', type=str, required=False, default=constants.X_DISPLAY, help="x_display id")
     parser.add_argument("--just_examine", action='store_true', help="just examine what data is gathered; don't gather more")
     parser.add_argument("--in_parallel", action='store_true', help="this collection will run in parallel with others, so load from disk on every new sample")
-    parser.add_argument("-n", "--num_threads", type=int, default=0, help="number of processes for parallel mode")
+    parser.add_argument("-n", "--num_threads", type=int, default=0, help="number of worker processes (each with its own THOR env)")
     parser.add_argument('--json_file', type=str, default="", help="path to json file with trajectory dump")
 
     # params
@@ -723,7 +828,4 @@ if __name__ == "__main__":
 
     parse_args = parser.parse_args()
 
-    if parse_args.in_parallel and parse_args.num_threads > 1:
-        parallel_main(parse_args)
-    else:
-        main(parse_args)
+    main(parse_args)
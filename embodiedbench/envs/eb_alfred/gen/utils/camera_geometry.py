@@ -0,0 +1,74 @@
+import functools
+
+import numpy as np
+import embodiedbench.envs.eb_alfred.gen.constants as constants
+
+
+@functools.lru_cache(maxsize=256)
+def rotation_matrix(rotation, horizon):
+    '''
+    world to camera rotation of an agent rotation (in multiples of 90 degrees) and camera horizon (in degrees),
+    read-only
+    '''
+    assert(rotation in {0, 1, 2, 3}), 'rotation was %s' % str(rotation)
+    sin_x = np.sin(-horizon * np.pi / 180)
+    cos_x = np.cos(-horizon * np.pi / 180)
+    x_rotation = np.array([
+        [1, 0, 0],
+        [0, cos_x, -sin_x],
+        [0, sin_x, cos_x]], dtype=np.float32)
+    sin_y = np.sin((-rotation % 4) * 90 * np.pi / 180)
+    cos_y = np.cos((-rotation % 4) * 90 * np.pi / 180)
+    y_rotation = np.array([
+        [cos_y, 0, sin_y],
+        [0, 1, 0],
+        [-sin_y, 0, cos_y]], dtype=np.float32)
+    matrix = np.matmul(x_rotation, y_rotation)
+    matrix.flags.writeable = False
+    return matrix
+
+
+@functools.lru_cache(maxsize=256)
+def inverse_rotation_matrix(rotation, horizon):
+    '''
+    camera to world rotation, read-only
+    '''
+    matrix = np.linalg.inv(rotation_matrix(rotation, horizon))
+    matrix.flags.writeable = False
+    return matrix
+
+
+class CameraGeometry(object):
+    '''
+    pinhole camera of a width x height frame, the focal length is constants.FOCAL_LENGTH scaled to the width
+    '''
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.focal_length = constants.FOCAL_LENGTH * width / constants.SCREEN_WIDTH
+
+    def world_to_camera(self, coordinates, pose, camera_height):
+        '''
+        [n, (x, y, depth)] pixel coordinates and depth (in mm) of [n, (xzy)] world coordinates
+        '''
+        xyz = coordinates[:, [0, 2, 1]]
+        xyz -= np.array([pose[0], camera_height, pose[1]])
+        xyd = np.dot(xyz, rotation_matrix(pose[2], pose[3]).T)
+        xyd *= (1000 * constants.AGENT_STEP_SIZE)
+        depth = np.maximum(xyd[:, -1], 0.01)
+        x_points = xyd[:, 0] * self.focal_length / depth + self.width / 2
+        y_points = self.height - (xyd[:, 1] * self.focal_length / depth + self.height / 2)
+        return np.stack((x_points, y_points, depth)).T
+
+
+_camera_geometries = {}
+
+
+def get_camera_geometry(width=constants.SCREEN_WIDTH, height=constants.SCREEN_HEIGHT):
+    '''
+    the camera geometry of a frame size, created on first use
+    '''
+    geometry = _camera_geometries.get((width, height))
+    if geometry is None:
+        geometry = _camera_geometries[(width, height)] = CameraGeometry(width, height)
+    return geometry
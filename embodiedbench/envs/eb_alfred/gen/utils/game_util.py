@@ -4,6 +4,7 @@ import cv2
 import numpy as np
 import embodiedbench.envs.eb_alfred.gen.constants as constants
 import embodiedbench.envs.eb_alfred.gen.goal_library as glib
+from embodiedbench.envs.eb_alfred.gen.utils import camera_geometry
 
 
 def get_pose(event):
@@ -28,6 +29,9 @@ def imresize(image, size, rescale=True):
     if image.shape[0] != size[0] or image.shape[1] != size[1]:
         image = cv2.resize(image, size)
     if rescale:
+        if image.dtype == np.uint8:
+            # one pass instead of a float32 copy divided in place
+            return np.divide(image, np.float32(255.0))
         if image.dtype != np.float32:
             image = image.astype(np.float32)
         image /= 255.0
@@ -39,7 +43,7 @@ def depth_imresize(image, size, rescale=True, max_depth=constants.MAX_DEPTH):
         return None
     if image.shape[0] != size[0] or image.shape[1] != size[1]:
         image = cv2.resize(image, size)
-    image[image > max_depth] = max_depth
+    np.minimum(image, max_depth, out=image)
     if rescale:
         if image.dtype != np.float32:
             image = image.astype(np.float32)
@@ -69,35 +73,22 @@ def get_camera_matrix(pose, camera_height):
 
 
 def get_rotation_matrix(pose):
-    assert(pose[2] in {0, 1, 2, 3}), 'rotation was %s' % str(pose[2])
-    sin_x = np.sin(-pose[3] * np.pi / 180)
-    cos_x = np.cos(-pose[3] * np.pi / 180)
-    x_rotation = np.matrix([
-        [1, 0, 0],
-        [0, cos_x, -sin_x],
-        [0, sin_x, cos_x]], dtype=np.float32)
-    sin_y = np.sin((-pose[2] % 4) * 90 * np.pi / 180)
-    cos_y = np.cos((-pose[2] % 4) * 90 * np.pi / 180)
-    y_rotation = np.matrix([
-        [cos_y, 0, sin_y],
-        [0, 1, 0],
-        [-sin_y, 0, cos_y]], dtype=np.float32)
-    rotation_matrix = np.matmul(x_rotation, y_rotation)
-    return rotation_matrix
+    return np.matrix(camera_geometry.rotation_matrix(pose[2], pose[3]))
 
 
 def depth_to_world_coordinates(depth, pose, camera_height):
-    x_points = np.arange(-constants.SCREEN_WIDTH / 2, constants.SCREEN_WIDTH / 2, dtype=depth.dtype)
-    x_vals = (depth * x_points / constants.FOCAL_LENGTH)
+    height, width = depth.shape
+    focal_length = camera_geometry.get_camera_geometry(width, height).focal_length
+    x_points = np.arange(-width / 2, width / 2, dtype=depth.dtype)
+    x_vals = (depth * x_points / focal_length)
 
-    y_points = np.arange(constants.SCREEN_HEIGHT / 2, -constants.SCREEN_HEIGHT / 2, -1, dtype=depth.dtype)
-    y_vals = (depth.T * y_points / constants.FOCAL_LENGTH).T
+    y_points = np.arange(height / 2, -height / 2, -1, dtype=depth.dtype)
+    y_vals = (depth.T * y_points / focal_length).T
 
     z_vals = depth
     xyz = np.stack((x_vals, y_vals, z_vals), axis=2) / (1000 * constants.AGENT_STEP_SIZE)
-    rotation_matrix = np.linalg.inv(get_rotation_matrix(pose))
-    xyz = np.array(np.dot(rotation_matrix, xyz.reshape(-1, 3).T).T).reshape(
-        constants.SCREEN_HEIGHT, constants.SCREEN_WIDTH, 3)
+    rotation_matrix = camera_geometry.inverse_rotation_matrix(pose[2], pose[3])
+    xyz = np.dot(rotation_matrix, xyz.reshape(-1, 3).T).T.reshape(height, width, 3)
     xzy = xyz[:, :, [0, 2, 1]]
     xzy += np.array([pose[0], pose[1], camera_height])
     return xzy
@@ -105,16 +96,7 @@ def depth_to_world_coordinates(depth, pose, camera_height):
 
 # coordinates should be [n, (xzy)]
 def world_to_camera_coordinates(coordinates, pose, camera_height):
-    coordinates = coordinates.copy()
-    coordinates -= np.array([pose[0], pose[1], camera_height])
-    xyz = coordinates[:, [0, 2, 1]]  # [n, (xyz)]
-    rotation_matrix = get_rotation_matrix(pose)
-    xyd = np.array(np.dot(rotation_matrix, xyz.T).T)
-    xyd *= (1000 * constants.AGENT_STEP_SIZE)
-    depth = np.maximum(xyd[:, -1], 0.01)
-    x_points = xyd[:, 0] * constants.FOCAL_LENGTH / depth + constants.SCREEN_WIDTH / 2
-    y_points = constants.SCREEN_HEIGHT - (xyd[:, 1] * constants.FOCAL_LENGTH / depth + constants.SCREEN_HEIGHT / 2)
-    return np.stack((x_points, y_points, depth)).T
+    return camera_geometry.get_camera_geometry().world_to_camera(coordinates, pose, camera_height)
 
 
 def get_templated_action_str(plan, idx=0):
@@ -310,28 +292,35 @@ def get_visible_objs(objs):
     return [obj for obj in objs if obj['visible']]
 
 
+def grid_bounds(obj_bounds, scene_bounds):
+    '''
+    [..., (x0, z0, x1, z1)] bounds in meters to grid cells inside the scene bounds, relative to the scene origin
+    '''
+    obj_bounds = np.round(obj_bounds / constants.AGENT_STEP_SIZE).astype(np.int32)
+    obj_bounds[..., [2, 3]] = np.maximum(obj_bounds[..., [2, 3]], obj_bounds[..., [0, 1]] + 1)
+    obj_bounds[..., [0, 2]] = np.clip(obj_bounds[..., [0, 2]], scene_bounds[0], scene_bounds[0] + scene_bounds[2])
+    obj_bounds[..., [1, 3]] = np.clip(obj_bounds[..., [1, 3]], scene_bounds[1], scene_bounds[1] + scene_bounds[3])
+    obj_bounds -= np.array(scene_bounds)[[0, 1, 0, 1]]
+    return obj_bounds
+
+
 def get_object_bounds(obj, scene_bounds):
     # obj_bounds = np.array(obj['bounds3D'])[[0, 2, 3, 5]]  # Get X and Z out
     # Get a 'box' that is a singular point in (x,z) based on object position in place of now-unavailable 'bounds3d'
     obj_bounds = np.array([obj['position']['x'], obj['position']['z'], obj['position']['x'], obj['position']['z']])
-    obj_bounds /= constants.AGENT_STEP_SIZE
-    obj_bounds = np.round(obj_bounds).astype(np.int32)
-    obj_bounds[[2, 3]] = np.maximum(obj_bounds[[2, 3]], obj_bounds[[0, 1]] + 1)
-    obj_bounds[[0, 2]] = np.clip(obj_bounds[[0, 2]], scene_bounds[0], scene_bounds[0] + scene_bounds[2])
-    obj_bounds[[1, 3]] = np.clip(obj_bounds[[1, 3]], scene_bounds[1], scene_bounds[1] + scene_bounds[3])
-    obj_bounds -= np.array(scene_bounds)[[0, 1, 0, 1]]
-    return obj_bounds
+    return grid_bounds(obj_bounds, scene_bounds)
+
+
+def get_objects_bounds(objs, scene_bounds):
+    '''
+    get_object_bounds of every object, as an [n, 4] array
+    '''
+    positions = np.array([[obj['position']['x'], obj['position']['z']] for obj in objs], dtype=np.float64).reshape(-1, 2)
+    return grid_bounds(np.concatenate((positions, positions), axis=1), scene_bounds)
 
 
 def get_object_bounds_batch(boxes, scene_bounds):
-    obj_bounds = boxes[:, [0, 2, 3, 5]]  # Get X and Z out
-    obj_bounds /= constants.AGENT_STEP_SIZE
-    obj_bounds = np.round(obj_bounds).astype(np.int32)
-    obj_bounds[:, [2, 3]] = np.maximum(obj_bounds[:, [2, 3]], obj_bounds[:, [0, 1]] + 1)
-    obj_bounds[:, [0, 2]] = np.clip(obj_bounds[:, [0, 2]], scene_bounds[0], scene_bounds[0] + scene_bounds[2])
-    obj_bounds[:, [1, 3]] = np.clip(obj_bounds[:, [1, 3]], scene_bounds[1], scene_bounds[1] + scene_bounds[3])
-    obj_bounds -= np.array(scene_bounds)[[0, 1, 0, 1]]
-    return obj_bounds
+    return grid_bounds(boxes[:, [0, 2, 3, 5]], scene_bounds)  # Get X and Z out
 
 
 def get_task_str(object_ind, receptacle_ind=None, toggle_ind=None, mrecep_ind=None):
@@ -0,0 +1,199 @@
+"""
+Job ledger and worker pool of the ALFRED trajectory generation scripts.
+
+``JobLedger`` is an append-only ``<save_path>/ledger.jsonl``. A worker records a trial as
+``claimed`` before it writes anything, and as ``done`` or ``failed`` when it is over; units
+(e.g. the (goal, pickup, movable, receptacle, scene) tuples of generate_trajectories) that
+will not be tried again are recorded as ``exhausted``. Records are single ``O_APPEND``
+writes, so workers need no lock, and a trial is counted once however often its ``done``
+record was written. Trials that were claimed but never finished are the partial outputs of a
+crashed worker: the trial of a job whose worker crashed is removed when its result comes in,
+and on resume, those of a run that was killed are removed before anything else is read from disk.
+
+``WorkerPool`` starts worker processes that set up their simulator once and then run job
+after job on it. Jobs are handed out one per idle worker by the parent, which decides what
+to run next from the results so far. A worker process that dies is replaced. A job that raised
+or whose worker died is reported with an ``{'error', 'pid'}`` result, ``pid`` being the worker
+process that ran it.
+
+This module does not depend on THOR; the simulator work is done by the worker objects of the
+generation scripts.
+"""
+import os
+import json
+import queue
+import shutil
+import traceback
+import multiprocessing as mp
+
+LEDGER_FILE = 'ledger.jsonl'
+
+
+class JobLedger(object):
+    '''
+    persistent record of the trials of every unit
+    '''
+
+    def __init__(self, save_path, name=LEDGER_FILE):
+        self.path = os.path.join(save_path, name)
+        if not os.path.isdir(save_path):
+            os.makedirs(save_path)
+
+    def append(self, record):
+        # a single short write with O_APPEND is atomic, workers do not need a lock
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def record(self, unit, status, trial=None, **info):
+        self.append(dict(info, unit=list(unit), status=status, trial=trial, pid=os.getpid()))
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # last line of a process killed while writing
+                    continue
+        return records
+
+    def state(self):
+        '''
+        done trials per unit, failed trial count per unit, exhausted units and unfinished trials
+        (claimed trial -> (unit, path)), from the ledger
+        '''
+        done, failed, exhausted, claimed = {}, {}, set(), {}
+        finished = set()
+        for record in self.records():
+            unit, trial, status = tuple(record['unit']), record.get('trial'), record['status']
+            if status == 'claimed':
+                claimed[trial] = (unit, record.get('path'))
+            elif status == 'done':
+                done.setdefault(unit, set()).add(trial)
+                finished.add(trial)
+            elif status == 'failed':
+                if trial not in finished:
+                    failed[unit] = failed.get(unit, 0) + 1
+                finished.add(trial)
+            elif status == 'exhausted':
+                exhausted.add(unit)
+        unfinished = {trial: v for trial, v in claimed.items() if trial not in finished}
+        return done, failed, exhausted, unfinished
+
+    def fail_unfinished(self, unit=None, pid=None, error='unfinished'):
+        '''
+        removes the outputs of the claimed, never finished trials (of unit and claimed by worker process pid,
+        if given) and records them as failed, returns their (unit, path)
+        '''
+        claimed, finished = {}, set()
+        for record in self.records():
+            if record['status'] == 'claimed':
+                claimed[record.get('trial')] = record
+            elif record['status'] in ('done', 'failed'):
+                finished.add(record.get('trial'))
+        removed = []
+        for trial, record in claimed.items():
+            if trial in finished:
+                continue
+            if unit is not None and tuple(record['unit']) != tuple(unit):
+                continue
+            if pid is not None and record.get('pid') != pid:
+                continue
+            path = record.get('path')
+            if path is not None and os.path.exists(path):
+                shutil.rmtree(path)
+            self.record(record['unit'], 'failed', trial=trial, error=error)
+            removed.append((tuple(record['unit']), path))
+        return removed
+
+
+def _worker(worker_id, worker_factory, jobs, results):
+    worker = worker_factory()
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            try:
+                result = worker.run(job)
+            except Exception:
+                result = {'error': traceback.format_exc(), 'pid': os.getpid()}
+            results.put((worker_id, result))
+    finally:
+        close = getattr(worker, 'close', None)
+        if close is not None:
+            close()
+
+
+class WorkerPool(object):
+    '''
+    worker processes that each create their worker (and simulator) once with worker_factory()
+    and run the jobs handed to them with worker.run(job)
+    '''
+
+    def __init__(self, worker_factory, num_workers, poll_seconds=1.0):
+        self.worker_factory = worker_factory
+        self.num_workers = max(1, num_workers)
+        self.poll_seconds = poll_seconds
+        self.results = mp.Queue()
+        self.jobs = [None] * self.num_workers
+        self.processes = [None] * self.num_workers
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+
+    def _spawn(self, worker_id):
+        self.jobs[worker_id] = mp.Queue()
+        self.processes[worker_id] = mp.Process(target=_worker, args=(worker_id, self.worker_factory,
+                                                                     self.jobs[worker_id], self.results))
+        self.processes[worker_id].start()
+
+    def run(self, next_job, on_result):
+        '''
+        hands out the jobs of next_job() to idle workers and calls on_result(job, result) for every
+        finished job (result {'error', 'pid'} if the job raised or the worker died); next_job() returns None
+        when there is nothing
+        to run for now, and the run ends when it does so with no job in progress
+        '''
+        idle = list(range(self.num_workers))
+        busy = {}
+        while True:
+            while idle:
+                job = next_job()
+                if job is None:
+                    break
+                worker_id = idle.pop()
+                busy[worker_id] = job
+                self.jobs[worker_id].put(job)
+            if not busy:
+                return
+            try:
+                worker_id, result = self.results.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                for worker_id in list(busy):
+                    if not self.processes[worker_id].is_alive():
+                        print("Worker %d died (exit code %s), restarting it" %
+                              (worker_id, self.processes[worker_id].exitcode))
+                        job = busy.pop(worker_id)
+                        process = self.processes[worker_id]
+                        self._spawn(worker_id)
+                        idle.append(worker_id)
+                        on_result(job, {'error': 'worker died (exit code %s)' % process.exitcode,
+                                        'pid': process.pid})
+                continue
+            job = busy.pop(worker_id)
+            idle.append(worker_id)
+            on_result(job, result)
+
+    def close(self):
+        for worker_id, process in enumerate(self.processes):
+            if process.is_alive():
+                self.jobs[worker_id].put(None)
+        for process in self.processes:
+            process.join()
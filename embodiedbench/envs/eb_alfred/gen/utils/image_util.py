@@ -1,3 +1,8 @@
+import os
+import glob
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import embodiedbench.envs.eb_alfred.gen.constants as constants
 
@@ -25,33 +30,156 @@ def decompress_mask(compressed_mask):
     '''
     decompress compressed mask array
     '''
-    mask = np.zeros((constants.DETECTION_SCREEN_WIDTH, constants.DETECTION_SCREEN_HEIGHT))
-    for start_idx, run_len in compressed_mask:
-        for idx in range(start_idx, start_idx + run_len):
-            mask[idx // constants.DETECTION_SCREEN_WIDTH, idx % constants.DETECTION_SCREEN_HEIGHT] = 1
-    return mask
+    return decompress_masks([compressed_mask])[0]
+
+
+def decompress_masks(compressed_masks):
+    '''
+    decompress a list of compressed mask arrays into one (N, height, width) array
+    '''
+    num_pixels = constants.DETECTION_SCREEN_WIDTH * constants.DETECTION_SCREEN_HEIGHT
+    masks = np.zeros((len(compressed_masks), num_pixels))
+    runs = [np.asarray(compressed_mask, dtype=np.int64).reshape(-1, 2) for compressed_mask in compressed_masks]
+    if runs:
+        mask_idx = np.repeat(np.arange(len(runs)), [len(r) for r in runs])
+        runs = np.concatenate(runs)
+        starts, run_lens = runs[:, 0], np.maximum(runs[:, 1], 0)
+        # pixel indices of every run: start + 0 .. start + run_len - 1
+        run_offsets = np.cumsum(run_lens) - run_lens
+        idx = np.repeat(starts - run_offsets, run_lens) + np.arange(run_lens.sum())
+        if idx.size and (idx.max() >= num_pixels or idx.min() < -num_pixels):
+            raise IndexError('run outside of the %d pixel mask' % num_pixels)
+        masks[np.repeat(mask_idx, run_lens), idx] = 1
+    return masks.reshape(len(compressed_masks), constants.DETECTION_SCREEN_WIDTH, constants.DETECTION_SCREEN_HEIGHT)
 
 
 def compress_mask(seg_mask):
     '''
     compress mask array
     '''
-    run_len_compressed = []  # list of lists of run lengths for 1s, which are assumed to be less frequent.
-    idx = 0
-    curr_run = False
-    run_len = 0
-    for x_idx in range(len(seg_mask)):
-        for y_idx in range(len(seg_mask[x_idx])):
-            if seg_mask[x_idx][y_idx] == 1 and not curr_run:
-                curr_run = True
-                run_len_compressed.append([idx, None])
-            if seg_mask[x_idx][y_idx] == 0 and curr_run:
-                curr_run = False
-                run_len_compressed[-1][1] = run_len
-                run_len = 0
-            if curr_run:
-                run_len += 1
-            idx += 1
-    if curr_run:
-        run_len_compressed[-1][1] = run_len
-    return run_len_compressed
\ No newline at end of file
+    # list of [start, run length] of the runs of 1s, which are assumed to be less frequent.
+    return compress_masks(np.asarray(seg_mask)[np.newaxis])[0]
+
+
+def compress_masks(seg_masks):
+    '''
+    compress a stack of mask arrays (N, height, width)
+    '''
+    seg_masks = np.asarray(seg_masks)
+    num_masks = len(seg_masks)
+    if num_masks == 0:
+        return []
+    flat = seg_masks.reshape(num_masks, -1)
+    on = flat == 1
+    other = ~on & (flat != 0)
+    if other.any():
+        # a run starts at a 1 and ends at a 0, other values keep the current state
+        num_pixels = flat.shape[1]
+        last = np.where(other, -1, np.arange(num_pixels))
+        last = np.maximum.accumulate(last, axis=1)
+        on = np.take_along_axis(on, np.maximum(last, 0), axis=1) & (last >= 0)
+    # run starts and ends are the rising and falling edges of the padded masks
+    padded = np.zeros((num_masks, flat.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = on
+    edges = np.flatnonzero(np.diff(padded, axis=1))
+    mask_idx, pixel_idx = np.divmod(edges, flat.shape[1] + 1)
+    starts, ends = pixel_idx[0::2], pixel_idx[1::2]
+    counts = np.bincount(mask_idx[0::2], minlength=num_masks)
+    runs = np.stack([starts, ends - starts], axis=1).tolist()
+    splits = np.cumsum(counts)[:-1]
+    return [runs[i:j] for i, j in zip(np.concatenate([[0], splits]), np.concatenate([splits, [len(runs)]]))]
+
+
+def mask_to_bytes(compressed_mask):
+    '''
+    binary form of a compressed mask: little-endian uint32 (start, run length) pairs
+    '''
+    return np.asarray(compressed_mask, dtype='<u4').reshape(-1, 2).tobytes()
+
+
+def mask_from_bytes(buf):
+    '''
+    compressed mask (list of [start, run length]) from the output of mask_to_bytes
+    '''
+    return np.frombuffer(buf, dtype='<u4').reshape(-1, 2).tolist()
+
+
+class AsyncImageWriter(object):
+    '''
+    writes numbered pngs (<folder>/%09d.png) on background threads, so the simulator does not wait
+    for the png encoding; images are numbered by a per-folder counter instead of counting the files
+    '''
+
+    def __init__(self, num_threads=2, max_pending=64):
+        self.executor = ThreadPoolExecutor(num_threads)
+        self.max_pending = max_pending
+        self.pending = collections.deque()
+        self.counts = {}
+
+    def save(self, folder, image):
+        '''
+        queues image as the next png of folder, returns its index
+        '''
+        folder = os.path.normpath(folder)
+        im_ind = self.count(folder)
+        self.counts[folder] += 1
+        self.write(os.path.join(folder, '%09d.png' % im_ind), image)
+        return im_ind
+
+    def count(self, folder):
+        '''
+        number of pngs of folder, written or queued
+        '''
+        folder = os.path.normpath(folder)
+        if folder not in self.counts:
+            self.counts[folder] = len(glob.glob(os.path.join(folder, '*.png')))
+        return self.counts[folder]
+
+    def write(self, path, image):
+        import cv2
+        # frames are not modified after they are queued, only views (e.g. bgr flips) need a copy
+        image = np.ascontiguousarray(image)
+        self.pending.append((path, self.executor.submit(cv2.imwrite, path, image)))
+        while len(self.pending) > self.max_pending:
+            self._wait(*self.pending.popleft())
+
+    def _wait(self, path, future):
+        if not future.result():
+            raise IOError('could not write %s' % path)
+
+    def flush(self):
+        '''
+        waits until every queued image is written
+        '''
+        while self.pending:
+            self._wait(*self.pending.popleft())
+
+    def discard(self, folder):
+        '''
+        waits for the queued images and forgets the counters of folder and its subfolders (before it is deleted)
+        '''
+        folder = os.path.normpath(folder)
+        while self.pending:
+            path, future = self.pending.popleft()
+            if path.startswith(folder + os.sep):
+                future.exception()
+            else:
+                self._wait(path, future)
+        for f in [f for f in self.counts if f == folder or f.startswith(folder + os.sep)]:
+            del self.counts[f]
+
+
+_image_writer = None
+_image_writer_pid = None
+
+
+def get_image_writer():
+    '''
+    the image writer of this process
+    '''
+    global _image_writer, _image_writer_pid
+    # the threads of a writer inherited from the parent process (fork) do not exist here
+    if _image_writer is None or _image_writer_pid != os.getpid():
+        _image_writer = AsyncImageWriter()
+        _image_writer_pid = os.getpid()
+    return _image_writer
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def color_code(color):
+    '''
+    integer code of an rgb color
+    '''
+    return (int(color[0]) << 16) | (int(color[1]) << 8) | int(color[2])
+
+
+def color_codes(frame):
+    '''
+    integer codes of the pixels of an rgb frame
+    '''
+    frame = np.asarray(frame)
+    return ((frame[:, :, 0].astype(np.int64) << 16) |
+            (frame[:, :, 1].astype(np.int64) << 8) |
+            frame[:, :, 2].astype(np.int64))
+
+
+class InstanceIndex(object):
+    '''
+    index of an instance segmentation frame, built in one pass: every pixel is labeled with the
+    compact id of its color, and the pixels, pixel count, bounding box and centroid of every
+    color are kept per id
+    '''
+
+    def __init__(self, instance_seg_frame):
+        codes = color_codes(instance_seg_frame)
+        self.height, self.width = codes.shape
+        self.codes, labels = np.unique(codes.ravel(), return_inverse=True)
+        self.labels = labels.reshape(self.height, self.width)
+        self.ids = {int(code): i for i, code in enumerate(self.codes)}
+        self.counts = np.bincount(labels, minlength=len(self.codes))
+
+        # flat pixel indices grouped by id, in row-major order within an id (as np.nonzero)
+        self.pixels_by_id = np.argsort(labels, kind='stable')
+        self.starts = np.cumsum(self.counts) - self.counts
+        rows, cols = np.divmod(self.pixels_by_id, self.width)
+        self.y0 = rows[self.starts]
+        self.y1 = rows[self.starts + self.counts - 1]
+        self.x0 = np.minimum.reduceat(cols, self.starts)
+        self.x1 = np.maximum.reduceat(cols, self.starts)
+        self.cy = np.add.reduceat(rows, self.starts) / self.counts
+        self.cx = np.add.reduceat(cols, self.starts) / self.counts
+
+    def id_of(self, color):
+        return self.ids.get(color_code(color))
+
+    def color_of(self, i):
+        code = int(self.codes[i])
+        return (code >> 16) & 255, (code >> 8) & 255, code & 255
+
+    def count(self, color):
+        i = self.id_of(color)
+        return 0 if i is None else int(self.counts[i])
+
+    def mask(self, color):
+        '''
+        boolean mask of the pixels of a color
+        '''
+        i = self.id_of(color)
+        if i is None:
+            return np.zeros((self.height, self.width), dtype=bool)
+        return self.labels == i
+
+    def pixels(self, color):
+        '''
+        rows and columns of the pixels of a color, in the order of np.nonzero(mask)
+        '''
+        i = self.id_of(color)
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.divmod(self.pixels_by_id[self.starts[i]:self.starts[i] + self.counts[i]], self.width)
+
+    def bbox(self, color):
+        '''
+        [x0, y0, xmax, ymax] of the pixels of a color
+        '''
+        i = self.id_of(color)
+        if i is None:
+            return None
+        return [int(self.x0[i]), int(self.y0[i]), int(self.x1[i]), int(self.y1[i])]
+
+    def centroid(self, color):
+        i = self.id_of(color)
+        if i is None:
+            return None
+        return float(self.cx[i]), float(self.cy[i])
+
+    def closest_point(self, color, cx, cy):
+        '''
+        (cx, cy) if it is on the pixels of a color, else the closest pixel (first in row-major order)
+        '''
+        i = self.id_of(color)
+        if i is None:
+            return None
+        if self.labels[cy, cx] == i:
+            return cx, cy
+        rows, cols = self.pixels(color)
+        closest = np.argmin((cols - cx) ** 2 + (rows - cy) ** 2)
+        return int(cols[closest]), int(rows[closest])
+
+    def point(self, color):
+        '''
+        center of the bounding box of a color, or the closest pixel of the color to it (non-convex hull)
+        '''
+        bbox = self.bbox(color)
+        if bbox is None:
+            return None
+        x0, y0, xmax, ymax = bbox
+        return self.closest_point(color, int((xmax - x0) / 2 + x0), int((ymax - y0) / 2 + y0))
+
+
+def get_instance_index(event):
+    '''
+    instance index of the segmentation frame of a THOR event, built on first use
+    '''
+    index = getattr(event, '_instance_index', None)
+    if index is None:
+        index = event._instance_index = InstanceIndex(event.instance_segmentation_frame)
+    return index
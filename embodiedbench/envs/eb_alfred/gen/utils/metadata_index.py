@@ -0,0 +1,46 @@
+class MetadataIndex(object):
+    '''
+    index of the object metadata of a THOR event: objects by id, built in one pass, and the
+    objects matching a (name, property) query, kept per query
+    '''
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.objects = metadata['objects']
+        self.by_id = {}
+        for obj in self.objects:
+            # the first object of an id, as game_util.get_object
+            self.by_id.setdefault(obj['objectId'], obj)
+        self._queries = {}
+        self._visible_types = None
+
+    def get_object(self, object_id):
+        return self.by_id.get(object_id)
+
+    def with_name_and_prop(self, name, prop):
+        '''
+        objects whose id contains name and whose prop is set, as game_util.get_objects_with_name_and_prop
+        '''
+        key = (name, prop)
+        objs = self._queries.get(key)
+        if objs is None:
+            objs = self._queries[key] = [obj for obj in self.objects if name in obj['objectId'] and obj[prop]]
+        return objs
+
+    def visible_types(self):
+        '''
+        types of the visible objects, in metadata order (shared, do not modify)
+        '''
+        if self._visible_types is None:
+            self._visible_types = [obj['objectType'] for obj in self.objects if obj['visible']]
+        return self._visible_types
+
+
+def get_metadata_index(event):
+    '''
+    metadata index of a THOR event, built on first use
+    '''
+    index = getattr(event, '_metadata_index', None)
+    if index is None or index.metadata is not event.metadata:
+        index = event._metadata_index = MetadataIndex(event.metadata)
+    return index
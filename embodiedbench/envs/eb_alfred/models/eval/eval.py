@@ -1,12 +1,16 @@
 import json
+import queue
 import pprint
 import random
 import time
+import traceback
 import torch
 import torch.multiprocessing as mp
-from models.nn.resnet import Resnet
+from models.nn.resnet import Resnet, FrameFeatureCache
 from data.preprocess import Dataset
+from data.preprocessed_store import PreprocessedStore
 from importlib import import_module
+from model_server import serve, PolicyClient
 
 class Eval(object):
 
@@ -25,31 +29,40 @@ class Eval(object):
             self.splits = json.load(f)
             pprint.pprint({k: len(v) for k, v in self.splits.items()})
 
-        # load model
+        # load model (the model server loads its own, only the args and vocab of the checkpoint are kept here)
         print("Loading: ", self.args.model_path)
-        M = import_module(self.args.model)
-        self.model, optimizer = M.Module.load(self.args.model_path)
-        self.model.share_memory()
-        self.model.eval()
-        self.model.test_mode = True
+        if self.use_model_server():
+            self.model = None
+            save = torch.load(self.args.model_path, map_location='cpu')
+            self.model_args, vocab = save['args'], save['vocab']
+            del save
+        else:
+            M = import_module(self.args.model)
+            self.model, optimizer = M.Module.load(self.args.model_path)
+            self.model.share_memory()
+            self.model.eval()
+            self.model.test_mode = True
+            self.model_args, vocab = self.model.args, self.model.vocab
 
         # updated args
-        self.model.args.dout = self.args.model_path.replace(self.args.model_path.split('/')[-1], '')
-        self.model.args.data = self.args.data if self.args.data else self.model.args.data
+        self.model_args.dout = self.args.model_path.replace(self.args.model_path.split('/')[-1], '')
+        self.model_args.data = self.args.data if self.args.data else self.model_args.data
 
         # preprocess and save
         if args.preprocess:
-            print("\nPreprocessing dataset and saving to %s folders ... This is will take a while. Do this once as required:" % self.model.args.pp_folder)
-            self.model.args.fast_epoch = self.args.fast_epoch
-            dataset = Dataset(self.model.args, self.model.vocab)
+            print("\nPreprocessing dataset and saving to %s folders ... This is will take a while. Do this once as required:" % self.model_args.pp_folder)
+            self.model_args.fast_epoch = self.args.fast_epoch
+            dataset = Dataset(self.model_args, vocab)
             dataset.preprocess_splits(self.splits)
 
-        # load resnet
+        # load resnet (the model server loads its own)
         args.visual_model = 'resnet18'
-        self.resnet = Resnet(args, eval=True, share_memory=True, use_conv_feat=True)
+        self.resnet = None if self.use_model_server() else Resnet(args, eval=True, share_memory=True, use_conv_feat=True)
+        if self.resnet is not None and getattr(args, 'frame_cache', 0):
+            self.resnet = FrameFeatureCache(self.resnet, args.frame_cache)
 
         # gpu
-        if self.args.gpu:
+        if self.args.gpu and self.model is not None:
             self.model = self.model.to(torch.device('cuda'))
 
         # success and failure lists
@@ -75,10 +88,17 @@ class Eval(object):
             task_queue.put(traj)
         return task_queue
 
+    def use_model_server(self):
+        return getattr(self.args, 'model_server', False)
+
     def spawn_threads(self):
         '''
         spawn multiple threads to run eval in parallel
         '''
+        if self.use_model_server():
+            self.spawn_model_server()
+            return
+
         task_queue = self.queue_tasks()
 
         # start threads
@@ -96,6 +116,85 @@ class Eval(object):
         # save
         self.save_results()
 
+    def spawn_model_server(self):
+        '''
+        run eval in simulator worker processes that share one model server process: the workers only run THOR
+        and send their frames to the server, which holds the only model and Resnet and batches the steps of
+        the workers; the workers put their results on a queue that this process reads
+        '''
+        task_queue = self.queue_tasks()
+        num_workers = self.args.num_threads
+        for _ in range(num_workers):
+            task_queue.put(None)
+
+        requests, results = mp.Queue(), mp.Queue()
+        responses = [mp.Queue() for _ in range(num_workers)]
+        server = mp.Process(target=serve, args=(None, self.args, requests, responses, self.model_args))
+        server.start()
+
+        workers = []
+        for n in range(num_workers):
+            worker = mp.Process(target=self.run_worker, args=(n, self.args, self.model_args, task_queue,
+                                                              requests, responses[n], results, server.pid))
+            worker.start()
+            workers.append(worker)
+
+        # results are logged here, in the order they arrive; the workers are stopped if the server dies
+        while any(w.is_alive() for w in workers) or not results.empty():
+            if not server.is_alive():
+                for w in workers:
+                    w.terminate()
+                    w.join()
+                raise RuntimeError("model server exited with code %s" % server.exitcode)
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self.log_result(result)
+
+        for w in workers:
+            w.join()
+        requests.put(('stop', None, None))
+        server.join()
+
+        # save
+        self.save_results()
+
+    @classmethod
+    def make_env(cls):
+        # THOR is only imported by the processes that run it
+        from env.thor_env import ThorEnv
+        return ThorEnv()
+
+    @classmethod
+    def run_worker(cls, worker_id, args, model_args, task_queue, requests, responses, results, server_pid=None):
+        '''
+        simulator worker of the model server: evaluates tasks until it gets None, or the server is gone
+        '''
+        # start THOR
+        env = cls.make_env()
+        policy = PolicyClient(worker_id, requests, responses, server_pid)
+        tasks = PreprocessedStore(model_args.data, model_args.pp_folder)
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+
+            try:
+                traj = tasks.load(task)
+                r_idx = task['repeat_idx']
+                print("Evaluating: %s" % (traj['root']))
+                results.put(cls.run_episode(env, policy, r_idx, traj, args))
+            except Exception as e:
+                traceback.print_exc()
+                print("Error: " + repr(e))
+                if not policy.server_alive():
+                    break
+
+        # stop THOR
+        env.stop()
+
     @classmethod
     def setup_scene(cls, env, traj_data, r_idx, args, reward_type='dense'):
         '''
@@ -128,6 +227,13 @@ class Eval(object):
     def evaluate(cls, env, model, r_idx, resnet, traj_data, args, lock, successes, failures):
         raise NotImplementedError()
 
+    @classmethod
+    def run_episode(cls, env, policy, r_idx, traj_data, args):
+        raise NotImplementedError()
+
+    def log_result(self, result):
+        raise NotImplementedError()
+
     def save_results(self):
         raise NotImplementedError()
 
@@ -30,6 +30,9 @@ if __name__ == '__main__':
     parser.add_argument('--gpu', dest='gpu', action='store_true')
     parser.add_argument('--use_templated_goals', help='use templated goals instead of human-annotated goal descriptions (only available for train set)', action='store_true')
     parser.add_argument('--num_threads', type=int, default=1)
+    parser.add_argument('--model_server', dest='model_server', action='store_true', help='simulator workers share one model server process that batches their steps (task eval only)')
+    parser.add_argument('--server_batch_wait', type=float, default=0.005, help='seconds the model server waits for the frames of other workers to batch')
+    parser.add_argument('--frame_cache', type=int, default=0, help='number of recent frames whose Resnet features are kept in memory (0: none)')
 
     # eval params
     parser.add_argument('--max_steps', type=int, default=1000, help='max steps before episode termination')
@@ -47,6 +50,8 @@ if __name__ == '__main__':
 
     # parse arguments
     args = parser.parse_args()
+    if args.model_server and args.subgoals:
+        parser.error("--model_server does not support --subgoals (the expert unroll steps the model per worker)")
 
     # eval mode
     if args.subgoals:
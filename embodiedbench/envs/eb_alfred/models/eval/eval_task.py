@@ -1,10 +1,8 @@
 import os
 import json
-import numpy as np
-from PIL import Image
 from datetime import datetime
 from eval import Eval
-from env.thor_env import ThorEnv
+from model_server import LocalPolicy
 
 class EvalTask(Eval):
     '''
@@ -17,7 +15,7 @@ class EvalTask(Eval):
         evaluation loop
         '''
         # start THOR
-        env = ThorEnv()
+        env = cls.make_env()
 
         while True:
             if task_queue.qsize() == 0:
@@ -42,16 +40,25 @@ class EvalTask(Eval):
 
     @classmethod
     def evaluate(cls, env, model, r_idx, resnet, traj_data, args, lock, successes, failures, results):
-        # reset model
-        model.reset()
+        log_entry, success = cls.run_episode(env, LocalPolicy(model, resnet), r_idx, traj_data, args)
+
+        # log success/fails
+        lock.acquire()
+        cls.update_stats(log_entry, success, successes, failures, results)
+        lock.release()
+
+    @classmethod
+    def run_episode(cls, env, policy, r_idx, traj_data, args):
+        '''
+        roll out the policy on a task, returns its log entry and whether it succeeded
+        '''
+        # reset model and extract language features
+        policy.reset(traj_data)
 
         # setup scene
         reward_type = 'dense'
         cls.setup_scene(env, traj_data, r_idx, args, reward_type=reward_type)
 
-        # extract language features
-        feat = model.featurize([traj_data], load_mask=False)
-
         # goal instr
         goal_instr = traj_data['turk_annotations']['anns'][r_idx]['task_desc']
 
@@ -64,24 +71,14 @@ class EvalTask(Eval):
             if t >= args.max_steps:
                 break
 
-            # extract visual features
-            curr_image = Image.fromarray(np.uint8(env.last_event.frame))
-            feat['frames'] = resnet.featurize([curr_image], batch=1).unsqueeze(0)
-
-            # forward model
-            m_out = model.step(feat)
-            m_pred = model.extract_preds(m_out, [traj_data], feat, clean_special_tokens=False)
-            m_pred = list(m_pred.values())[0]
+            # forward model on the current frame
+            action, mask = policy.act(env.last_event.frame)
 
             # check if <<stop>> was predicted
-            if m_pred['action_low'] == cls.STOP_TOKEN:
+            if action == cls.STOP_TOKEN:
                 print("\tpredicted STOP")
                 break
 
-            # get action and mask
-            action, mask = m_pred['action_low'], m_pred['action_low_mask'][0]
-            mask = np.squeeze(mask, axis=0) if model.has_interaction(action) else None
-
             # print action
             if args.debug:
                 print(action)
@@ -119,8 +116,6 @@ class EvalTask(Eval):
         plw_s_spl = s_spl * path_len_weight
         plw_pc_spl = pc_spl * path_len_weight
 
-        # log success/fails
-        lock.acquire()
         log_entry = {'trial': traj_data['task_id'],
                      'type': traj_data['task_type'],
                      'repeat_idx': int(r_idx),
@@ -134,6 +129,13 @@ class EvalTask(Eval):
                      'path_len_weighted_goal_condition_spl': float(plw_pc_spl),
                      'path_len_weight': int(path_len_weight),
                      'reward': float(reward)}
+        return log_entry, success
+
+    @classmethod
+    def update_stats(cls, log_entry, success, successes, failures, results):
+        '''
+        add an episode to the successes or failures and update the results
+        '''
         if success:
             successes.append(log_entry)
         else:
@@ -165,7 +167,9 @@ class EvalTask(Eval):
             else:
                 results[task_type] = {}
 
-        lock.release()
+    def log_result(self, result):
+        log_entry, success = result
+        self.update_stats(log_entry, success, self.successes, self.failures, self.results)
 
     @classmethod
     def get_metrics(cls, successes, failures):
@@ -6,11 +6,10 @@ sys.path.append(os.path.join(os.environ['ALFRED_ROOT'], 'models'))
 
 import json
 import argparse
-import numpy as np
-from PIL import Image
 from datetime import datetime
 from eval_task import EvalTask
 from env.thor_env import ThorEnv
+from model_server import LocalPolicy
 import torch.multiprocessing as mp
 
 
@@ -49,15 +48,24 @@ class Leaderboard(EvalTask):
 
     @classmethod
     def evaluate(cls, env, model, r_idx, resnet, traj_data, args, lock, splits, seen_actseqs, unseen_actseqs):
-        # reset model
-        model.reset()
+        task_id, actseq = cls.run_episode(env, LocalPolicy(model, resnet), r_idx, traj_data, args)
+
+        # log action sequences
+        lock.acquire()
+        cls.update_actseqs(task_id, actseq, splits, seen_actseqs, unseen_actseqs)
+        lock.release()
+
+    @classmethod
+    def run_episode(cls, env, policy, r_idx, traj_data, args):
+        '''
+        roll out the policy on a task, returns its task id and action sequence
+        '''
+        # reset model and extract language features
+        policy.reset(traj_data)
 
         # setup scene
         cls.setup_scene(env, traj_data, r_idx, args)
 
-        # extract language features
-        feat = model.featurize([traj_data], load_mask=False)
-
         # goal instr
         goal_instr = traj_data['turk_annotations']['anns'][r_idx]['task_desc']
 
@@ -70,24 +78,14 @@ class Leaderboard(EvalTask):
             if t >= args.max_steps:
                 break
 
-            # extract visual features
-            curr_image = Image.fromarray(np.uint8(env.last_event.frame))
-            feat['frames'] = resnet.featurize([curr_image], batch=1).unsqueeze(0)
-
-            # forward model
-            m_out = model.step(feat)
-            m_pred = model.extract_preds(m_out, [traj_data], feat, clean_special_tokens=False)
-            m_pred = list(m_pred.values())[0]
+            # forward model on the current frame
+            action, mask = policy.act(env.last_event.frame)
 
             # check if <<stop>> was predicted
-            if m_pred['action_low'] == cls.STOP_TOKEN:
+            if action == cls.STOP_TOKEN:
                 print("\tpredicted STOP")
                 break
 
-            # get action and mask
-            action, mask = m_pred['action_low'], m_pred['action_low_mask'][0]
-            mask = np.squeeze(mask, axis=0) if model.has_interaction(action) else None
-
             # use predicted action and mask (if available) to interact with the env
             t_success, _, _, err, api_action = env.va_interact(action, interact_mask=mask, smooth_nav=False)
 
@@ -105,19 +103,16 @@ class Leaderboard(EvalTask):
             t += 1
 
         # actseq
-        seen_ids = [t['task'] for t in splits['tests_seen']]
-        actseq = {traj_data['task_id']: actions}
+        return traj_data['task_id'], {traj_data['task_id']: actions}
 
-        # log action sequences
-        lock.acquire()
-
-        if traj_data['task_id'] in seen_ids:
+    @classmethod
+    def update_actseqs(cls, task_id, actseq, splits, seen_actseqs, unseen_actseqs):
+        seen_ids = [t['task'] for t in splits['tests_seen']]
+        if task_id in seen_ids:
             seen_actseqs.append(actseq)
         else:
             unseen_actseqs.append(actseq)
 
-        lock.release()
-
     @classmethod
     def setup_scene(cls, env, traj_data, r_idx, args, reward_type='dense'):
         '''
@@ -160,6 +155,11 @@ class Leaderboard(EvalTask):
         '''
         spawn multiple threads to run eval in parallel
         '''
+        if self.use_model_server():
+            self.model.test_mode = True
+            self.spawn_model_server()
+            return
+
         task_queue = self.queue_tasks()
 
         # start threads
@@ -178,6 +178,10 @@ class Leaderboard(EvalTask):
         # save
         self.save_results()
 
+    def log_result(self, result):
+        task_id, actseq = result
+        self.update_actseqs(task_id, actseq, self.splits, self.seen_actseqs, self.unseen_actseqs)
+
     def create_stats(self):
         '''
         storage for seen and unseen actseqs
@@ -213,6 +217,9 @@ if __name__ == '__main__':
     parser.add_argument('--preprocess', dest='preprocess', action='store_true')
     parser.add_argument('--gpu', dest='gpu', action='store_true')
     parser.add_argument('--num_threads', type=int, default=1)
+    parser.add_argument('--model_server', dest='model_server', action='store_true', help='simulator workers share one model server process that batches their steps')
+    parser.add_argument('--server_batch_wait', type=float, default=0.005, help='seconds the model server waits for the frames of other workers to batch')
+    parser.add_argument('--frame_cache', type=int, default=0, help='number of recent frames whose Resnet features are kept in memory (0: none)')
 
     # parse arguments
     args = parser.parse_args()
@@ -0,0 +1,192 @@
+import os
+import queue
+import traceback
+import numpy as np
+import torch
+from PIL import Image
+from importlib import import_module
+from models.nn.resnet import Resnet, FrameFeatureCache
+
+
+class LocalPolicy(object):
+    '''
+    policy of a worker that runs its own model and Resnet (one step per call)
+    '''
+
+    def __init__(self, model, resnet):
+        self.model = model
+        self.resnet = resnet
+
+    def reset(self, traj_data):
+        self.model.reset()
+        self.traj_data = traj_data
+
+        # extract language features
+        self.feat = self.model.featurize([traj_data], load_mask=False)
+
+    def act(self, frame):
+        '''
+        predicted low-level action and interaction mask (None if the action does not interact) for a frame
+        '''
+        # extract visual features
+        curr_image = Image.fromarray(np.uint8(frame))
+        self.feat['frames'] = self.resnet.featurize([curr_image], batch=1).unsqueeze(0)
+
+        # forward model
+        m_out = self.model.step(self.feat)
+        m_pred = self.model.extract_preds(m_out, [self.traj_data], self.feat, clean_special_tokens=False)
+        m_pred = list(m_pred.values())[0]
+
+        # get action and mask
+        action, mask = m_pred['action_low'], m_pred['action_low_mask'][0]
+        mask = np.squeeze(mask, axis=0) if self.model.has_interaction(action) else None
+        return action, mask
+
+
+class PolicyClient(object):
+    '''
+    policy of a simulator worker whose model runs in the model server process (server_pid): a call waits for the
+    response poll seconds at a time and fails if the server has exited in the meantime
+    '''
+
+    def __init__(self, worker_id, requests, responses, server_pid=None, poll=1.0):
+        self.worker_id = worker_id
+        self.requests = requests
+        self.responses = responses
+        self.server_pid = server_pid
+        self.poll = poll
+
+    def server_alive(self):
+        if self.server_pid is None:
+            return True
+        try:
+            os.kill(self.server_pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def call(self, kind, payload):
+        self.requests.put((kind, self.worker_id, payload))
+        while True:
+            try:
+                status, value = self.responses.get(timeout=self.poll)
+                break
+            except queue.Empty:
+                if not self.server_alive():
+                    raise RuntimeError("model server (pid %d) exited" % self.server_pid) from None
+        if status == 'error':
+            raise RuntimeError("model server failed:\n%s" % value)
+        return value
+
+    def reset(self, traj_data):
+        self.call('reset', traj_data)
+
+    def act(self, frame):
+        return self.call('step', np.uint8(frame))
+
+
+class ModelServer(object):
+    '''
+    the only model and Resnet of an evaluation, shared by its simulator workers: the steps that arrive together (or
+    within args.server_batch_wait seconds of each other) are run as one batch, with one Resnet forward for all
+    frames and the decoder steps batched across episodes (see Module.step_batch)
+    '''
+
+    def __init__(self, model, args, num_workers):
+        self.model = model
+        self.args = args
+        self.num_workers = num_workers
+        self.batch_wait = getattr(args, 'server_batch_wait', 0.005)
+
+        # load resnet
+        args.visual_model = 'resnet18'
+        self.resnet = Resnet(args, eval=True, share_memory=False, use_conv_feat=True)
+        if getattr(args, 'frame_cache', 0):
+            self.resnet = FrameFeatureCache(self.resnet, args.frame_cache)
+
+        # episode (traj_data, internal states) of every worker
+        self.episodes = {}
+        self.num_steps, self.num_batches = 0, 0
+
+    def reset(self, worker_id, traj_data):
+        feat = self.model.featurize([traj_data], load_mask=False)
+        with torch.no_grad():
+            self.episodes[worker_id] = traj_data, self.model.init_state(feat)
+
+    def step(self, batch):
+        '''
+        predicted (action, mask) of each (worker_id, frame) of batch
+        '''
+        images = [Image.fromarray(frame) for _, frame in batch]
+        r_states = [self.episodes[worker_id][1] for worker_id, _ in batch]
+        with torch.no_grad():
+            frames = self.resnet.featurize(images, batch=len(images))
+            outs = self.model.step_batch(frames, r_states)
+
+        preds = []
+        for (worker_id, _), (out_action_low, out_action_low_mask) in zip(batch, outs):
+            feat = {'out_action_low': out_action_low.unsqueeze(0),
+                    'out_action_low_mask': out_action_low_mask.unsqueeze(0)}
+            m_pred = self.model.extract_preds(feat, [self.episodes[worker_id][0]], feat, clean_special_tokens=False)
+            m_pred = list(m_pred.values())[0]
+            action, mask = m_pred['action_low'], m_pred['action_low_mask'][0]
+            mask = np.squeeze(mask, axis=0) if self.model.has_interaction(action) else None
+            preds.append((action, mask))
+        self.num_steps += len(batch)
+        self.num_batches += 1
+        return preds
+
+    def serve(self, requests, responses):
+        '''
+        answers the requests of the workers until a stop request
+        '''
+        while True:
+            kind, worker_id, payload = requests.get()
+            batch = []
+            while True:
+                if kind == 'stop':
+                    print("Model server: %d steps in %d batches" % (self.num_steps, self.num_batches))
+                    return
+                elif kind == 'reset':
+                    try:
+                        self.reset(worker_id, payload)
+                        responses[worker_id].put(('ok', None))
+                    except Exception:
+                        responses[worker_id].put(('error', traceback.format_exc()))
+                elif kind == 'step':
+                    batch.append((worker_id, payload))
+
+                # gather the frames of the other workers, unless they are all waiting already
+                if len(batch) >= self.num_workers:
+                    break
+                try:
+                    kind, worker_id, payload = requests.get(timeout=self.batch_wait)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    for (worker_id, _), pred in zip(batch, self.step(batch)):
+                        responses[worker_id].put(('ok', pred))
+                except Exception:
+                    error = traceback.format_exc()
+                    for worker_id, _ in batch:
+                        responses[worker_id].put(('error', error))
+
+
+def serve(model, args, requests, responses, model_args=None):
+    '''
+    model server process; without a model, it loads the one of args.model_path (with model_args, the args the
+    evaluation updated)
+    '''
+    if model is None:
+        model, _ = import_module(args.model).Module.load(args.model_path)
+        if model_args is not None:
+            model.args = model_args
+        if args.gpu:
+            model = model.to(torch.device('cuda'))
+    model.eval()
+    model.test_mode = True
+    ModelServer(model, args, len(responses)).serve(requests, responses)
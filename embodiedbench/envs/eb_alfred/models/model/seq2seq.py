@@ -7,7 +7,40 @@ import collections
 import numpy as np
 from torch import nn
 from tensorboardX import SummaryWriter
-from tqdm import trange
+from tqdm import tqdm, trange
+from torch.utils.data import DataLoader
+from data.preprocessed_store import PreprocessedStore
+
+
+def pin(x):
+    '''
+    pins the tensors of a collated batch input
+    '''
+    if torch.is_tensor(x):
+        return x.pin_memory()
+    if isinstance(x, tuple):
+        return tuple(pin(v) for v in x)
+    if isinstance(x, list):
+        return [pin(v) for v in x]
+    if isinstance(x, dict):
+        for k, v in x.items():
+            x[k] = pin(v)
+    return x
+
+
+class LoadedBatch(object):
+    '''
+    trajectories and collated input of a batch assembled by a data loader worker;
+    only the input tensors are pinned, not the trajectory jsons
+    '''
+
+    def __init__(self, batch, feat):
+        self.batch = batch
+        self.feat = feat
+
+    def pin_memory(self):
+        self.feat = pin(self.feat)
+        return self
 
 class Module(nn.Module):
 
@@ -225,7 +258,16 @@ class Module(nn.Module):
         total_loss = sum(total_loss) / len(total_loss)
         return p_dev, dev_iter, total_loss, m_dev
 
-    def featurize(self, batch):
+    def featurize(self, batch, load_mask=True, load_frames=True):
+        '''
+        tensorize and pad batch input
+        '''
+        return self.tensorize(self.collate(batch, load_mask=load_mask, load_frames=load_frames))
+
+    def collate(self, batch, load_mask=True, load_frames=True):
+        raise NotImplementedError()
+
+    def tensorize(self, feat):
         raise NotImplementedError()
 
     def forward(self, feat, max_decode=100):
@@ -265,10 +307,10 @@ class Module(nn.Module):
         '''
         load preprocessed json from disk
         '''
-        json_path = os.path.join(self.args.data, task['task'], '%s' % self.args.pp_folder, 'ann_%d.json' % task['repeat_idx'])
-        with open(json_path) as f:
-            data = json.load(f)
-        return data
+        store = getattr(self, '_pp_store', None)
+        if store is None or store.data != self.args.data:
+            store = self._pp_store = PreprocessedStore(self.args.data, self.args.pp_folder)
+        return store.load(task)
 
     def get_task_root(self, ex):
         '''
@@ -276,15 +318,30 @@ class Module(nn.Module):
         '''
         return os.path.join(self.args.data, ex['split'], *(ex['root'].split('/')[-2:]))
 
+    def load_batch(self, tasks):
+        '''
+        loads and collates a batch of tasks (in the data loader workers)
+        '''
+        batch = [self.load_task_json(task) for task in tasks]
+        return LoadedBatch(batch, self.collate(batch))
+
     def iterate(self, data, batch_size):
         '''
         breaks dataset into batch_size chunks for training
+
+        with args.loader_workers > 0 the batches are loaded and collated in background worker
+        processes, args.prefetch batches ahead per worker (into pinned memory when on gpu)
         '''
-        for i in trange(0, len(data), batch_size, desc='batch'):
-            tasks = data[i:i+batch_size]
-            batch = [self.load_task_json(task) for task in tasks]
-            feat = self.featurize(batch)
-            yield batch, feat
+        chunks = [data[i:i+batch_size] for i in range(0, len(data), batch_size)]
+        workers = getattr(self.args, 'loader_workers', 0) or 0
+        if workers > 0:
+            loader = DataLoader(chunks, batch_size=None, shuffle=False, num_workers=workers,
+                                collate_fn=self.load_batch, pin_memory=bool(self.args.gpu),
+                                prefetch_factor=getattr(self.args, 'prefetch', None) or 2)
+        else:
+            loader = map(self.load_batch, chunks)
+        for loaded in tqdm(loader, total=len(chunks), desc='batch'):
+            yield loaded.batch, self.tensorize(loaded.feat)
 
     def zero_input(self, x, keep_end_token=True):
         '''
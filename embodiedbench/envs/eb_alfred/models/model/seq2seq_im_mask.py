@@ -8,7 +8,8 @@ from torch.nn import functional as F
 from torch.nn.utils.rnn import pad_sequence, pack_padded_sequence, pad_packed_sequence
 from model.seq2seq import Module as Base
 from models.utils.metric import compute_f1, compute_exact
-from gen.utils.image_util import decompress_mask
+from gen.utils.image_util import decompress_mask, decompress_masks
+from data.feature_store import FeatureStore
 
 
 class Module(Base):
@@ -60,11 +61,10 @@ class Module(Base):
         # reset model
         self.reset()
 
-    def featurize(self, batch, load_mask=True, load_frames=True):
+    def collate(self, batch, load_mask=True, load_frames=True):
         '''
-        tensorize and pad batch input
+        pad batch input into cpu tensors (uses no model parameters, runs in the data loader workers)
         '''
-        device = torch.device('cuda') if self.args.gpu else torch.device('cpu')
         feat = collections.defaultdict(list)
 
         for ex in batch:
@@ -104,7 +104,7 @@ class Module(Base):
             # load Resnet features from disk
             if load_frames and not self.test_mode:
                 root = self.get_task_root(ex)
-                im = torch.load(os.path.join(root, self.feat_pt))
+                im = self.load_frames(root)
 
                 num_low_actions = len(ex['plan']['low_actions']) + 1  # +1 for additional stop action
                 num_feat_frames = im.shape[0]
@@ -133,7 +133,8 @@ class Module(Base):
 
                 # low-level action mask
                 if load_mask:
-                    feat['action_low_mask'].append([self.decompress_mask(a['mask']) for a in ex['num']['action_low'] if a['mask'] is not None])
+                    masks = decompress_masks([a['mask'] for a in ex['num']['action_low'] if a['mask'] is not None])
+                    feat['action_low_mask'].append(masks[:, np.newaxis])
 
                 # low-level valid interact
                 feat['action_low_valid_interact'].append([a['valid_interact'] for a in ex['num']['action_low']])
@@ -142,31 +143,64 @@ class Module(Base):
         # tensorization and padding
         for k, v in feat.items():
             if k in {'lang_goal_instr'}:
-                # language embedding and padding
-                seqs = [torch.tensor(vv, device=device) for vv in v]
+                # language padding (embedded in tensorize)
+                seqs = [torch.tensor(vv) for vv in v]
                 pad_seq = pad_sequence(seqs, batch_first=True, padding_value=self.pad)
                 seq_lengths = np.array(list(map(len, v)))
-                embed_seq = self.emb_word(pad_seq)
-                packed_input = pack_padded_sequence(embed_seq, seq_lengths, batch_first=True, enforce_sorted=False)
-                feat[k] = packed_input
+                feat[k] = (pad_seq, seq_lengths)
             elif k in {'action_low_mask'}:
                 # mask padding
-                seqs = [torch.tensor(vv, device=device, dtype=torch.float) for vv in v]
+                seqs = [torch.tensor(np.array(vv), dtype=torch.float) for vv in v]
                 feat[k] = seqs
             elif k in {'subgoal_progress', 'subgoals_completed'}:
                 # auxillary padding
-                seqs = [torch.tensor(vv, device=device, dtype=torch.float) for vv in v]
+                seqs = [torch.tensor(vv, dtype=torch.float) for vv in v]
+                pad_seq = pad_sequence(seqs, batch_first=True, padding_value=self.pad)
+                feat[k] = pad_seq
+            elif k in {'frames'}:
+                # Resnet features are tensors already
+                seqs = [torch.as_tensor(vv, dtype=torch.float) for vv in v]
                 pad_seq = pad_sequence(seqs, batch_first=True, padding_value=self.pad)
                 feat[k] = pad_seq
             else:
                 # default: tensorize and pad sequence
-                seqs = [torch.tensor(vv, device=device, dtype=torch.float if ('frames' in k) else torch.long) for vv in v]
+                seqs = [torch.tensor(vv, dtype=torch.long) for vv in v]
                 pad_seq = pad_sequence(seqs, batch_first=True, padding_value=self.pad)
                 feat[k] = pad_seq
 
         return feat
 
 
+    def tensorize(self, feat):
+        '''
+        move collated batch input to the model device and embed the language
+        '''
+        device = torch.device('cuda') if self.args.gpu else torch.device('cpu')
+        for k, v in feat.items():
+            if k in {'lang_goal_instr'}:
+                # language embedding
+                pad_seq, seq_lengths = v
+                embed_seq = self.emb_word(pad_seq.to(device, non_blocking=True))
+                packed_input = pack_padded_sequence(embed_seq, seq_lengths, batch_first=True, enforce_sorted=False)
+                feat[k] = packed_input
+            elif k in {'action_low_mask'}:
+                feat[k] = [vv.to(device, non_blocking=True) for vv in v]
+            else:
+                feat[k] = v.to(device, non_blocking=True)
+        return feat
+
+
+    def load_frames(self, root):
+        '''
+        Resnet features of a trajectory, from the packed feature store or the feature cache if there is one
+        '''
+        store = getattr(self, '_feat_store', None)
+        if store is None or store.data != self.args.data:
+            store = self._feat_store = FeatureStore(self.args.data, self.feat_pt,
+                                                    cache=getattr(self.args, 'feat_cache', None))
+        return store.load(root)
+
+
     def serialize_lang_action(self, feat):
         '''
         append segmented instr language and low-level actions into single sequences
@@ -251,6 +285,45 @@ class Module(Base):
         return feat
 
 
+    def init_state(self, feat):
+        '''
+        internal states of a new episode, for step_batch (used for batched real-time execution during eval)
+        '''
+        cont_lang, enc_lang = self.encode_lang(feat)
+        return {
+            'state_t': (cont_lang, torch.zeros_like(cont_lang)),
+            'e_t': self.dec.go.repeat(enc_lang.size(0), 1),
+            'cont_lang': cont_lang,
+            'enc_lang': enc_lang
+        }
+
+    def step_batch(self, frames, r_states):
+        '''
+        forward a single time-step of several episodes (frames are their Resnet features, r_states their states
+        from init_state, updated in place) and return (out_action_low, out_action_low_mask) of each as step() does;
+        episodes with the same language length are decoded together, so the attention over language sees no padding
+        '''
+        groups = collections.OrderedDict()
+        for i, r_state in enumerate(r_states):
+            groups.setdefault(r_state['enc_lang'].size(1), []).append(i)
+
+        outs = [None] * len(r_states)
+        for idx in groups.values():
+            states = [r_states[i] for i in idx]
+            enc_lang = torch.cat([s['enc_lang'] for s in states], dim=0)
+            e_t = torch.cat([s['e_t'] for s in states], dim=0)
+            state_tm1 = tuple(torch.cat([s['state_t'][k] for s in states], dim=0) for k in range(2))
+
+            # decode and save embedding and hidden states
+            out_action_low, out_action_low_mask, state_t, *_ = self.dec.step(enc_lang, frames[idx], e_t=e_t, state_tm1=state_tm1)
+            e_t = self.dec.emb(out_action_low.max(1)[1])
+            for j, (i, s) in enumerate(zip(idx, states)):
+                s['state_t'] = [x[j:j+1] for x in state_t]
+                s['e_t'] = e_t[j:j+1]
+                outs[i] = out_action_low[j:j+1], out_action_low_mask[j:j+1]
+        return outs
+
+
     def extract_preds(self, out, batch, feat, clean_special_tokens=True):
         '''
         output processing
@@ -1,15 +1,19 @@
+import hashlib
+import collections
+import numpy as np
 import torch
 import torch.nn as nn
+from PIL import Image
 from torchvision import models, transforms
 
 
 class Resnet18(object):
     '''
-    pretrained Resnet18 from torchvision
+    pretrained Resnet18 from torchvision (random weights if args.pretrained_resnet is False, e.g. offline)
     '''
 
     def __init__(self, args, eval=True, share_memory=False, use_conv_feat=True):
-        self.model = models.resnet18(pretrained=True)
+        self.model = models.resnet18(pretrained=getattr(args, 'pretrained_resnet', True))
 
         if args.gpu:
             self.model = self.model.to(torch.device('cuda'))
@@ -89,4 +93,75 @@ class Resnet(object):
             for i in range(0, images_normalized.size(0), batch):
                 b = images_normalized[i:i+batch]
                 out.append(self.resnet_model.extract(b))
-        return torch.cat(out, dim=0)
\ No newline at end of file
+        return torch.cat(out, dim=0)
+
+class FeatureExtractor(object):
+    '''
+    Resnet features of frames, through a FeatureCache: only the frames that are not cached yet are featurized, in
+    batches that span trajectories, and their features are added to the cache
+    '''
+
+    def __init__(self, resnet, cache, batch=32):
+        self.resnet = resnet
+        self.cache = cache
+        self.batch = batch
+
+    def extract(self, frames):
+        '''
+        caches the features of frames, an iterable of ((trajectory, frame index), image) where image is a PIL image,
+        an array or a path to one (loaded only if the frame is not cached); returns the number of frames featurized
+        '''
+        keys, images, done = [], [], 0
+        for key, image in frames:
+            keys.append(key)
+            images.append(image)
+            if len(keys) >= self.batch:
+                done += self._extract(keys, images)
+                keys, images = [], []
+        if keys:
+            done += self._extract(keys, images)
+        return done
+
+    def _extract(self, keys, images):
+        missing = set(map(tuple, self.cache.missing(keys)))
+        todo = [(tuple(key), image) for key, image in zip(keys, images) if tuple(key) in missing]
+        if not todo:
+            return 0
+        loaded = [Image.open(image) if isinstance(image, str) else
+                  Image.fromarray(image) if isinstance(image, np.ndarray) else image for _, image in todo]
+        feats = self.resnet.featurize(loaded, batch=self.batch)
+        self.cache.put([key for key, _ in todo], feats.cpu().numpy())
+        return len(todo)
+
+
+class FrameFeatureCache(object):
+    '''
+    Resnet.featurize with the features of the last size frames kept in memory, keyed by their pixels: an evaluated
+    agent sees the same frame again after an action that failed or did not change the view
+    '''
+
+    def __init__(self, resnet, size=256):
+        self.resnet = resnet
+        self.gpu = resnet.gpu
+        self.size = size
+        self.feats = collections.OrderedDict()
+
+    @staticmethod
+    def frame_key(image):
+        image = np.ascontiguousarray(image)
+        return hashlib.sha1(image.tobytes()).hexdigest() + str(image.shape)
+
+    def featurize(self, images, batch=32):
+        keys = [self.frame_key(np.asarray(image)) for image in images]
+        todo = [i for i, key in enumerate(keys) if key not in self.feats]
+        if todo:
+            feats = self.resnet.featurize([images[i] for i in todo], batch=batch)
+            for i, feat in zip(todo, feats):
+                self.feats[keys[i]] = feat
+        out = []
+        for key in keys:
+            self.feats.move_to_end(key)
+            out.append(self.feats[key])
+        while len(self.feats) > self.size:
+            self.feats.popitem(last=False)
+        return torch.stack(out, dim=0)
@@ -21,14 +21,18 @@ if __name__ == '__main__':
     parser.add_argument('--seed', help='random seed', default=123, type=int)
     parser.add_argument('--data', help='dataset folder', default='data/json_feat_2.1.0')
     parser.add_argument('--splits', help='json file containing train/dev/test splits', default='splits/oct21.json')
-    parser.add_argument('--preprocess', help='store preprocessed data to json files', action='store_true')
+    parser.add_argument('--preprocess', help='store preprocessed data to one file per split', action='store_true')
     parser.add_argument('--pp_folder', help='folder name for preprocessed data', default='pp')
+    parser.add_argument('--feat_cache', help='feature cache of extract_resnet.py to read Resnet features from (before the feature files)', default=None)
+    parser.add_argument('--pp_workers', help='preprocessing processes (default: one per cpu)', default=None, type=int)
     parser.add_argument('--save_every_epoch', help='save model after every epoch (warning: consumes a lot of space)', action='store_true')
     parser.add_argument('--model', help='model to use', default='seq2seq_im')
     parser.add_argument('--gpu', help='use gpu', action='store_true')
     parser.add_argument('--dout', help='where to save model', default='exp/model:{model}')
     parser.add_argument('--use_templated_goals', help='use templated goals instead of human-annotated goal descriptions (only available for train set)', action='store_true')
     parser.add_argument('--resume', help='load a checkpoint')
+    parser.add_argument('--loader_workers', help='processes loading batches in the background (0: load in the training loop)', default=2, type=int)
+    parser.add_argument('--prefetch', help='batches loaded ahead per loader worker', default=2, type=int)
 
     # hyper parameters
     parser.add_argument('--batch', help='batch size', default=8, type=int)
@@ -5,11 +5,26 @@ sys.path.append(os.path.join(os.environ['ALFRED_ROOT'], 'models'))
 
 import torch
 import os
-from PIL import Image
-from nn.resnet import Resnet
+from data.feature_store import FeatureCache
+from nn.resnet import Resnet, FeatureExtractor
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
 
 
+def image_folders(data, img_folder):
+    '''
+    (trajectory, sorted image paths) of every image folder of data
+    '''
+    for root, dirs, files in os.walk(data):
+        dirs.sort()
+        if os.path.basename(root) == img_folder:
+            fimages = sorted([os.path.join(root, f) for f in files
+                              if (f.endswith('.png') or (f.endswith('.jpg')))])
+            if len(fimages) > 0:
+                yield os.path.relpath(os.path.dirname(root), data), fimages
+            else:
+                print('empty; skipping {}'.format(root))
+
+
 if __name__ == '__main__':
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
 
@@ -21,34 +36,40 @@ if __name__ == '__main__':
     parser.add_argument('--visual_model', default='resnet18', help='model type: maskrcnn or resnet18', choices=['maskrcnn', 'resnet18'])
     parser.add_argument('--filename', help='filename of feat', default='feat_conv.pt')
     parser.add_argument('--img_folder', help='folder containing raw images', default='raw_images')
+    parser.add_argument('--cache', help='feature cache (frames already in it are not featurized again; default: <data>/feat_cache)', default=None)
+    parser.add_argument('--no_pt', help='only fill the feature cache, without a feature file per trajectory', action='store_true')
 
     # parser
     args = parser.parse_args()
 
     # load resnet model
-    extractor = Resnet(args, eval=True)
+    cache = FeatureCache(args.cache or os.path.join(args.data, 'feat_cache'))
+    extractor = FeatureExtractor(Resnet(args, eval=True), cache, batch=args.batch)
     skipped = []
 
-    for root, dirs, files in os.walk(args.data):
-        if os.path.basename(root) == args.img_folder:
-            fimages = sorted([os.path.join(root, f) for f in files
-                              if (f.endswith('.png') or (f.endswith('.jpg')))])
-            if len(fimages) > 0:
-                if args.skip_existing and os.path.isfile(os.path.join(root, 'feat_conv.pt')):
-                    continue
-                try:
-                    print('{}'.format(root))
-                    image_loader = Image.open if isinstance(fimages[0], str) else Image.fromarray
-                    images = [image_loader(f) for f in fimages]
-                    feat = extractor.featurize(images, batch=args.batch)
-                    torch.save(feat.cpu(), os.path.join(root.replace('raw_images', ''), args.filename))
-                except Exception as e:
-                    print(e)
-                    print("Skipping " + root)
-                    skipped.append(root)
+    # frames of all trajectories, so that batches span trajectories
+    folders = [(trajectory, fimages) for trajectory, fimages in image_folders(args.data, args.img_folder)
+               if not (args.skip_existing and os.path.isfile(os.path.join(args.data, trajectory, args.filename)))]
+    frames = (((trajectory, i), f) for trajectory, fimages in folders if not cache.has(trajectory)
+              for i, f in enumerate(fimages))
+    try:
+        print('Featurized {} frames'.format(extractor.extract(frames)))
+    except Exception as e:
+        # frames featurized so far stay in the cache, the rest is featurized one trajectory at a time below
+        print(e)
 
-            else:
-                print('empty; skipping {}'.format(root))
+    for trajectory, fimages in folders:
+        try:
+            if not cache.has(trajectory):
+                extractor.extract(((trajectory, i), f) for i, f in enumerate(fimages))
+                cache.seal(trajectory, len(fimages))
+            if not args.no_pt:
+                print('{}'.format(trajectory))
+                torch.save(cache.load(trajectory), os.path.join(args.data, trajectory, args.filename))
+        except Exception as e:
+            print(e)
+            print("Skipping " + trajectory)
+            skipped.append(trajectory)
 
     print("Skipped:")
-    print(skipped)
\ No newline at end of file
+    print(skipped)
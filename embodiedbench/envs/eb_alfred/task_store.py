@@ -0,0 +1,176 @@
+"""
+Compact binary store of the ALFRED tasks of an eval set, for the resets of EBAlfEnv.
+
+A reset used to parse the whole preprocessed trajectory json of its task (language
+numericalization, low-level actions with their API calls, image names, ...) to read a few
+fields. The store keeps only the fields the env and its reward tasks use, per eval set:
+
+    <folder>/<eval_set>.bin           zlib-compressed compact json records, one per task
+    <folder>/<eval_set>.index.json    the eval set of splits.json, and the offset, length and
+                                      source file stamp of every record
+
+Tasks are read through ``utils.load_task_json`` (the packed per-split files of
+data/preprocess.py). A record is used as long as the file its task was read from keeps its
+stamp, so preprocessing a split again makes its tasks fall back to that file.
+
+Build it once per eval set (again after the data or the splits change):
+
+    python -m embodiedbench.envs.eb_alfred.task_store --eval_sets base,common_sense
+"""
+import os
+import json
+import zlib
+import argparse
+import collections
+
+from embodiedbench.envs.eb_alfred import utils
+from embodiedbench.envs.eb_alfred.data.preprocessed_store import task_key, file_stamp
+
+TASK_STORE_PATH = os.path.join(os.path.dirname(__file__), 'data/task_store')
+SPLIT_PATH = os.path.join(os.path.dirname(__file__), 'data/splits/splits.json')
+MAGIC = b'ALFTASK1'
+VERSION = 1
+
+SCENE_FIELDS = ('floor_plan', 'scene_num', 'object_poses', 'object_toggles', 'dirty_and_empty', 'init_action')
+
+
+def compact_task(traj_data):
+    '''
+    the fields of a trajectory json that EBAlfEnv and the reward tasks read: scene, plan (low-level actions
+    reduced to their subgoal index), pddl params and instructions
+    '''
+    plan = traj_data['plan']
+    return {
+        'task_id': traj_data.get('task_id'),
+        'task_type': traj_data['task_type'],
+        'pddl_params': traj_data['pddl_params'],
+        'scene': {k: v for k, v in traj_data['scene'].items() if k in SCENE_FIELDS},
+        'plan': {'high_pddl': plan['high_pddl'],
+                 'low_actions': [{'high_idx': a['high_idx']} for a in plan['low_actions']]},
+        'turk_annotations': {'anns': [{'task_desc': a['task_desc'], 'high_descs': a['high_descs']}
+                                      for a in traj_data['turk_annotations']['anns']]},
+    }
+
+
+def encode_task(traj_data):
+    return zlib.compress(json.dumps(compact_task(traj_data), separators=(',', ':')).encode('utf-8'))
+
+
+def build_task_store(eval_set, folder=TASK_STORE_PATH, split_path=SPLIT_PATH, data=None):
+    '''
+    packs the tasks of an eval set of splits.json
+    '''
+    with open(split_path) as f:
+        dataset = json.load(f)[eval_set]
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    data_path = os.path.join(folder, '%s.bin' % eval_set)
+    index_path = os.path.join(folder, '%s.index.json' % eval_set)
+    preprocessed = utils.preprocessed_store(data)
+    records = {}
+    with open(data_path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+        for task in dataset:
+            key = task_key(task)
+            if key in records:
+                continue
+            record = encode_task(preprocessed.load(task))
+            f.write(record)
+            records[key] = {'offset': offset, 'length': len(record),
+                            'stamp': file_stamp(preprocessed.source_path(task))}
+            offset += len(record)
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump({'version': VERSION, 'splits': file_stamp(split_path), 'dataset': dataset, 'records': records}, f)
+    os.replace(data_path + '.tmp', data_path)
+    os.replace(index_path + '.tmp', index_path)
+    return len(records)
+
+
+class TaskStore(object):
+    '''
+    tasks of an eval set from its packed file: records are read by offset, and the decoded tasks of the last
+    cache_size resets are kept. Tasks are shared between the loads of a task, do not modify them. Tasks whose
+    source file (see utils.task_json_path) changed since the store was built are read from that file.
+    '''
+
+    def __init__(self, eval_set, folder=TASK_STORE_PATH, data=None, cache_size=64):
+        self.eval_set = eval_set
+        self.data_path = os.path.join(folder, '%s.bin' % eval_set)
+        self.index_path = os.path.join(folder, '%s.index.json' % eval_set)
+        self.data = data
+        self.cache_size = cache_size
+        self.dataset = None
+        self.records = {}
+        self._cache = collections.OrderedDict()
+        self._file = None
+        self._pid = None
+
+    @classmethod
+    def open(cls, eval_set, folder=TASK_STORE_PATH, split_path=SPLIT_PATH, data=None, cache_size=64):
+        '''
+        the store of an eval set, None if it was not built or splits.json changed since
+        '''
+        store = cls(eval_set, folder, data, cache_size)
+        if not (os.path.exists(store.index_path) and os.path.exists(store.data_path)):
+            return None
+        with open(store.index_path) as f:
+            index = json.load(f)
+        if index.get('version') != VERSION or index.get('splits') != file_stamp(split_path):
+            return None
+        store.dataset = index['dataset']
+        store.records = index['records']
+        return store
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+    def _read(self, record):
+        # the file is opened again in every process
+        if self._file is None or self._pid != os.getpid():
+            self._file = open(self.data_path, 'rb')
+            self._pid = os.getpid()
+        self._file.seek(record['offset'])
+        return self._file.read(record['length'])
+
+    def load(self, task):
+        '''
+        compact trajectory of a task (see compact_task)
+        '''
+        key = task_key(task)
+        traj_data = self._cache.get(key)
+        if traj_data is not None:
+            self._cache.move_to_end(key)
+            return traj_data
+
+        record = self.records.get(key)
+        stamp = file_stamp(utils.task_json_path(task, self.data))
+        if record is not None and (stamp is None or stamp == record['stamp']):
+            traj_data = json.loads(zlib.decompress(self._read(record)))
+        else:
+            traj_data = compact_task(utils.load_task_json(task, self.data))
+        self._cache[key] = traj_data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return traj_data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the ALFRED tasks of eval sets for EBAlfEnv.')
+    parser.add_argument('--eval_sets', help='comma separated eval sets of splits.json (default: all)', default=None)
+    parser.add_argument('--folder', default=TASK_STORE_PATH)
+    parser.add_argument('--splits', default=SPLIT_PATH)
+    parser.add_argument('--data', help='folder of the trajectory jsons (default: data/json_2.1.0)', default=None)
+    args = parser.parse_args()
+
+    with open(args.splits) as f:
+        eval_sets = args.eval_sets.split(',') if args.eval_sets else list(json.load(f))
+    for eval_set in eval_sets:
+        print('{}: {} tasks'.format(eval_set, build_task_store(eval_set, args.folder, args.splits, args.data)))
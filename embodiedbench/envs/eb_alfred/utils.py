@@ -1,8 +1,9 @@
-import os, json, re
+import os, re
 import string
 import numpy as np
 import subprocess
 from PIL import Image, ImageDraw, ImageFont
+from embodiedbench.envs.eb_alfred.data.preprocessed_store import PreprocessedStore
 
 alfred_objs = ['Cart', 'Potato', 'Faucet', 'Ottoman', 'CoffeeMachine', 'Candle', 'CD', 'Pan', 'Watch',
                 'HandTowel', 'SprayBottle', 'BaseballBat', 'CellPhone', 'Kettle', 'Mug', 'StoveBurner', 'Bowl',
@@ -67,15 +68,33 @@ class dotdict(dict):
     __delattr__ = dict.__delitem__
 
 
-def load_task_json(task):
+_preprocessed_stores = {}
+
+
+def preprocessed_store(data=None):
+    '''
+    reader of the preprocessed trajectories in data (default data/json_2.1.0), shared per folder
+    '''
+    data = data or os.path.join(os.path.dirname(__file__), 'data/json_2.1.0')
+    store = _preprocessed_stores.get(data)
+    if store is None:
+        store = _preprocessed_stores[data] = PreprocessedStore(data, 'pp')
+    return store
+
+
+def task_json_path(task, data=None):
+    '''
+    path of the file that holds the preprocessed json of a task: the packed file of its split
+    (data/preprocess.py), or its pp/ann_<repeat_idx>.json
+    '''
+    return preprocessed_store(data).source_path(task)
+
+
+def load_task_json(task, data=None):
     '''
     load preprocessed json from disk
     '''
-    json_path = os.path.join(os.path.dirname(__file__), 'data/json_2.1.0', task['task'], 'pp',
-                             'ann_%d.json' % task['repeat_idx'])
-    with open(json_path) as f:
-        data = json.load(f)
-    return data
+    return preprocessed_store(data).load(task)
 
 
 def print_gpu_usage(msg):
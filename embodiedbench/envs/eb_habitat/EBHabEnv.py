@@ -34,6 +34,7 @@ import embodiedbench.envs.eb_habitat.config
 import embodiedbench.envs.eb_habitat.measures
 from embodiedbench.envs.eb_habitat.utils import observations_to_image, merge_to_file, draw_text
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 
 HABITAT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config/task/language_rearrangement.yaml')
 
@@ -170,13 +171,15 @@ class EBHabEnv(gym.Env):
         return self.env.current_episode(all_info)
 
 
+    @tracer.trace('env.reset')
     def reset(self, **kwargs):
         """
         Reset the environment for a new episode. The env will iterate over all the task data from the dataset
         Returns: observation
         """
         assert self._current_episode_num <= self.number_of_episodes
-        obs, info = self.env.reset(return_info=True, **kwargs)
+        with tracer.span('sim.reset'):
+            obs, info = self.env.reset(return_info=True, **kwargs)
         logger.info('Episode {}: {}'.format(str(self._current_episode_num), str(self.current_episode())))
         self.episode_language_instruction = info['lang_goal']
         self.episode_data = self.dataset.episodes[self._current_episode_num]
@@ -244,6 +247,7 @@ class EBHabEnv(gym.Env):
         # env_feedback += ' The current task progress is {}.'.format(info['task_progress'])
         return env_feedback
 
+    @tracer.trace('env.step')
     def step(self, action, reasoning='', **kwargs):
         """
         Execute a single environment step.
@@ -254,7 +258,8 @@ class EBHabEnv(gym.Env):
         """
         assert self._reset, 'Reset env before stepping'
         self._current_step += 1
-        obs, reward, done, info = self.env.step(action, **kwargs)
+        with tracer.span('sim.step'):
+            obs, reward, done, info = self.env.step(action, **kwargs)
         if self.recording:
             self.episode_video.append(self.env.render("rgb_array"))
 
@@ -283,6 +288,7 @@ class EBHabEnv(gym.Env):
     def seed(self, seed=None):
         self.env.seed(seed)
 
+    @tracer.trace('env.save_image')
     def save_image(self, obs, key='head_rgb'):
         """Save current agent observation as a PNG image."""
         folder = self.log_path + '/images/episode_{}'.format(self._current_episode_num)
@@ -294,6 +300,7 @@ class EBHabEnv(gym.Env):
         img.save(image_path)
         return image_path
 
+    @tracer.trace('env.save_log')
     def save_episode_log(self):
         if not os.path.exists(self.log_path):
             os.makedirs(self.log_path)
@@ -19,6 +19,7 @@ import os
 import time
 from PIL import Image
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 
 EVAL_SETS = {
     'base': ['pick_cube_shape', 'stack_cubes_color', 'place_into_shape_sorter_color', 'wipe_table_direction'],
@@ -152,6 +153,7 @@ class EBManEnv(gym.Env):
         if mode == 'rgb_array':
             return self._gym_cam.capture_rgb()
 
+    @tracer.trace('env.reset')
     def reset(self):
         """
         Reset the environment for a new episode.
@@ -168,11 +170,13 @@ class EBManEnv(gym.Env):
         self.task = self.env.get_task(self.dataset[self._current_episode_num - 1][0])
         self.current_task_variation = self.dataset[self._current_episode_num - 1][-1]
         self.task_class = self.current_task_variation.split('_')[0]
-        descriptions, obs = self.task.load_config(self.dataset[self._current_episode_num - 1][1], self.dataset[self._current_episode_num - 1][2], self.dataset[self._current_episode_num - 1][3])
+        with tracer.span('sim.reset'):
+            descriptions, obs = self.task.load_config(self.dataset[self._current_episode_num - 1][1], self.dataset[self._current_episode_num - 1][2], self.dataset[self._current_episode_num - 1][3])
         self.episode_language_instruction = descriptions[0]
         self.last_frame_obs = vars(obs)
         return descriptions[0], obs
     
+    @tracer.trace('env.step')
     def step(self, discrete_action):
         assert self._reset, "Reset the environment before stepping."
         info = {}
@@ -180,7 +184,8 @@ class EBManEnv(gym.Env):
         action_success = False
         try:
             action = get_continous_action_from_discrete(discrete_action)
-            obs, reward, terminate = self.task.step(action)
+            with tracer.span('sim.step'):
+                obs, reward, terminate = self.task.step(action)
             if self.current_task_variation.startswith('stack'):
                 if terminate:
                     if action[-1] == 0.0:
@@ -190,7 +195,8 @@ class EBManEnv(gym.Env):
                     elif action[-1] == 1.0:
                         action[2] += 0.03
                         logger.debug("checking if the object is stacked properly ...")
-                        obs, reward, terminate = self.task.step(action)
+                        with tracer.span('sim.step'):
+                            obs, reward, terminate = self.task.step(action)
                         if terminate and reward == 1.0:
                             logger.debug("stacking is successful ...")
                             reward = 1.0
@@ -229,6 +235,7 @@ class EBManEnv(gym.Env):
     def close(self) -> None:
         self.env.shutdown()
     
+    @tracer.trace('env.save_image')
     def save_image(self, key=['front_rgb']) -> str:
         log_path = self.log_path + '/images/' + f"episode_{self._current_episode_num}"
         if not os.path.exists(log_path):
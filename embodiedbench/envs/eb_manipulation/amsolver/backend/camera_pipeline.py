@@ -0,0 +1,94 @@
+"""
+Camera pipeline of ``Scene.get_observation``.
+
+The simulator is not thread safe, so every call into it (rendering, reading a sensor
+buffer, the clipping planes and camera matrices) stays on the calling thread, in the
+order the cameras were read before. The noise models are applied there too, right after
+each readout: they draw from the global numpy generator, so the random sequence, and with
+it the observation, stays the same. What only needs numpy runs on a small thread pool
+while the next camera is read out: scaling rgb to uint8, converting depth to meters and
+then to a point cloud, and decoding the handle masks.
+"""
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+
+def _completed(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _finish_camera(pointcloud_fn, rgb, depth, get_depth, planes, camera_params):
+    if rgb is not None:
+        # the capture buffer is ours, so scale it in place instead of allocating a float copy
+        scaled = np.multiply(rgb, 255., out=rgb if rgb.flags.writeable else None)
+        rgb = np.clip(scaled.astype(np.uint8), 0, 255)
+    pcd = None
+    if camera_params is not None:
+        depth_m = depth
+        if planes is not None:
+            near, far = planes
+            depth_m = near + depth * (far - near)
+        pcd = pointcloud_fn(depth_m, *camera_params)
+        if not get_depth:
+            depth = None
+    return rgb, depth, pcd
+
+
+class CameraPipeline(object):
+    """Reads the cameras on the calling thread and post-processes them on ``workers`` threads.
+
+    Args:
+        pointcloud_fn: ``VisionSensor.pointcloud_from_depth_and_camera_params``.
+        workers: post-processing threads; 0 processes every camera on the calling thread.
+    """
+
+    def __init__(self, pointcloud_fn, workers=None):
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        self._pointcloud_fn = pointcloud_fn
+        self._workers = workers
+        self._pool = None
+
+    def _submit(self, fn, *args):
+        if self._workers <= 0:
+            return _completed(fn(*args))
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='camera')
+        return self._pool.submit(fn, *args)
+
+    def read_camera(self, sensor, get_rgb, get_depth, get_pcd, rgb_noise, depth_noise, depth_in_meters):
+        """Future of the (rgb, depth, point cloud) of one camera, like the previous ``get_rgb_depth``."""
+        rgb = depth = planes = camera_params = None
+        if sensor is None or not (get_rgb or get_depth):
+            return _completed((None, None, None))
+        sensor.handle_explicitly()
+        if get_rgb:
+            rgb = sensor.capture_rgb()
+            if rgb_noise is not None:
+                rgb = rgb_noise.apply(rgb)
+        if get_depth or get_pcd:
+            depth = sensor.capture_depth(depth_in_meters)
+            if depth_noise is not None:
+                depth = depth_noise.apply(depth)
+        if get_pcd:
+            if not depth_in_meters:
+                planes = (sensor.get_near_clipping_plane(), sensor.get_far_clipping_plane())
+            # the camera parameters VisionSensor.pointcloud_from_depth reads
+            camera_params = (sensor.get_matrix(), sensor.get_intrinsic_matrix())
+        return self._submit(_finish_camera, self._pointcloud_fn, rgb, depth, get_depth, planes, camera_params)
+
+    def read_mask(self, sensor, mask_fn):
+        """Future of the mask of one mask sensor, decoded by ``mask_fn``."""
+        if sensor is None:
+            return _completed(None)
+        sensor.handle_explicitly()
+        return self._submit(mask_fn, sensor.capture_rgb())
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -16,6 +16,18 @@ class Condition(object):
         # Used if the conditions store any state.
         pass
 
+    def dependencies(self):
+        # Objects whose poses alone decide the result, or None if the condition has to be
+        # evaluated every time (it keeps state or reads something else).
+        return None
+
+    def sub_conditions(self):
+        # Conditions whose results combine() turns into this one's, or None.
+        return None
+
+    def combine(self, results):
+        raise NotImplementedError()
+
 
 class ColorCondition(object):
     def _init_(self, shape: Shape, success_rgb: List[float]):
@@ -90,6 +102,9 @@ class DetectedCondition(Condition):
         except:
             return False, False
 
+    def dependencies(self):
+        return [Object.get_object(self._obj), ProximitySensor(self._detector)]
+
 class NothingGrasped(Condition):
     def __init__(self, gripper: Gripper):
         self._gripper = gripper
@@ -127,6 +142,9 @@ class DetectedSeveralCondition(Condition):
             met = True
         return met, False
 
+    def dependencies(self):
+        return list(self._objects) + [self._detector]
+
 
 class EmptyCondition(Condition):
 
@@ -209,4 +227,14 @@ class ConditionSet(Condition):
         return met, False
 
     def reset(self):
-        self._current_condition_index = 0
\ No newline at end of file
+        self._current_condition_index = 0
+
+    def sub_conditions(self):
+        # in order the progress through the conditions is state
+        return None if self._order_matters else self._conditions
+
+    def combine(self, results):
+        met = True
+        for ismet, term in results:
+            met &= ismet
+        return met, False
\ No newline at end of file
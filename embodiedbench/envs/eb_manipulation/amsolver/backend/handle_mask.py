@@ -0,0 +1,54 @@
+"""
+Decoding of the RGB coded handle masks of the mask vision sensors.
+
+A mask sensor renders every object in the colour of its handle, ``handle = R + G * 256 +
+B * 256 * 256`` with the channels in [0, 1] (or in [0, 255] once saved as png). Instead of
+scaling the image and combining three full size integer channels, the decoder truncates
+the channels into a reusable (h, w, 4) uint8 buffer whose fourth channel stays zero; viewed
+as little-endian int32 that buffer already holds the handles.
+"""
+import numpy as np
+
+_HANDLE_DTYPE = np.dtype('<i4')
+
+
+class HandleMaskDecoder(object):
+    """Decodes the masks of one sensor, keeping its scratch buffer between captures.
+
+    Not thread safe: use one decoder per sensor (or per thread).
+    """
+
+    def __init__(self):
+        self._packed = None
+
+    def _buffer(self, shape):
+        if self._packed is None or self._packed.shape[:2] != shape:
+            self._packed = np.zeros(shape + (4,), dtype=np.uint8)
+        return self._packed
+
+    def __call__(self, rgb_coded_handles, out=None):
+        """(h, w) int32 handles of an (h, w, 3) coded image, which is left unchanged.
+
+        Float images are taken as [0, 1] and truncated after scaling, like the previous
+        ``astype(int)``; uint8 images are used as they are. The result is written into
+        ``out`` if given, otherwise into a new array owned by the caller.
+        """
+        rgb_coded_handles = np.asarray(rgb_coded_handles)
+        packed = self._buffer(rgb_coded_handles.shape[:2])
+        channels = packed[:, :, :3]
+        if rgb_coded_handles.dtype == np.uint8:
+            np.copyto(channels, rgb_coded_handles[:, :, :3])
+        else:
+            # the product is cast to uint8 chunk by chunk, no full size float temporary
+            np.multiply(rgb_coded_handles[:, :, :3], 255, out=channels, casting='unsafe')
+        handles = packed.view(_HANDLE_DTYPE)[:, :, 0]
+        if out is None:
+            return handles.astype(np.int32)
+        np.copyto(out, handles)
+        return out
+
+
+def rgb_handles_to_mask(rgb_coded_handles, out=None):
+    # rgb_coded_handles should be (w, h, c)
+    # Handle encoded as : handle = R + G * 256 + B * 256 * 256
+    return HandleMaskDecoder()(rgb_coded_handles, out=out)
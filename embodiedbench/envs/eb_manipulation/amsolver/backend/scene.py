@@ -9,15 +9,15 @@ from pyrep.objects import Dummy
 from pyrep.objects.shape import Shape
 from pyrep.objects.vision_sensor import VisionSensor
 
+from amsolver.backend.camera_pipeline import CameraPipeline
 from amsolver.backend.exceptions import (
     WaypointError, BoundaryError, NoWaypointsError, DemoError)
 from amsolver.backend.observation import Observation
 from amsolver.backend.robot import Robot
 from amsolver.backend.spawn_boundary import SpawnBoundary
 from amsolver.backend.task import Task
-from amsolver.backend.utils import WriteCustomDataBlock, import_distractors, rgb_handles_to_mask
+from amsolver.backend.utils import WriteCustomDataBlock, import_distractors, HandleMaskDecoder
 from amsolver.demo import Demo
-from amsolver.noise_model import NoiseModel
 from amsolver.observation_config import ObservationConfig, CameraConfig
 
 STEPS_BEFORE_EPISODE_START = 10
@@ -29,7 +29,8 @@ class Scene(object):
     environment. Responsible for moving all the objects. """
 
     def __init__(self, pyrep: PyRep, robot: Robot,
-                 obs_config=ObservationConfig(), add_distractors=False):
+                 obs_config=ObservationConfig(), add_distractors=False,
+                 camera_workers=None):
         self._pyrep = pyrep
         self._robot = robot
         self._obs_config = obs_config
@@ -51,6 +52,10 @@ class Scene(object):
         self._cam_overhead_mask = VisionSensor('cam_overhead_mask')
         self._cam_wrist_mask = VisionSensor('cam_wrist_mask')
         self._cam_front_mask = VisionSensor('cam_front_mask')
+        # one per mask sensor, they keep their decoding buffer between captures
+        self._mask_decoders = [HandleMaskDecoder() for _ in range(5)]
+        self._camera_pipeline = CameraPipeline(
+            VisionSensor.pointcloud_from_depth_and_camera_params, camera_workers)
         self._has_init_task = self._has_init_episode = False
         self._variation_index = 0
         self.add_distractors = add_distractors
@@ -93,6 +98,10 @@ class Scene(object):
         self._has_init_task = self._has_init_episode = False
         self._variation_index = 0
 
+    def close(self) -> None:
+        """Stops the camera post-processing threads. """
+        self._camera_pipeline.close()
+
     def unload(self) -> None:
         """Clears the scene. i.e. removes all tasks. """
         if self._active_task is not None:
@@ -199,68 +208,42 @@ class Scene(object):
         fc_ob = self._obs_config.front_camera
 
         lsc_mask_fn, rsc_mask_fn, oc_mask_fn, wc_mask_fn, fc_mask_fn = [
-            (rgb_handles_to_mask if c.masks_as_one_channel else lambda x: x
-             ) for c in [lsc_ob, rsc_ob, oc_ob, wc_ob, fc_ob]]
-
-        def get_rgb_depth(sensor: VisionSensor, get_rgb: bool, get_depth: bool,
-                          get_pcd: bool, rgb_noise: NoiseModel,
-                          depth_noise: NoiseModel, depth_in_meters: bool):
-            rgb = depth = pcd = None
-            if sensor is not None and (get_rgb or get_depth):
-                sensor.handle_explicitly()
-                if get_rgb:
-                    rgb = sensor.capture_rgb()
-                    if rgb_noise is not None:
-                        rgb = rgb_noise.apply(rgb)
-                    rgb = np.clip((rgb * 255.).astype(np.uint8), 0, 255)
-                if get_depth or get_pcd:
-                    depth = sensor.capture_depth(depth_in_meters)
-                    if depth_noise is not None:
-                        depth = depth_noise.apply(depth)
-                if get_pcd:
-                    depth_m = depth
-                    if not depth_in_meters:
-                        near = sensor.get_near_clipping_plane()
-                        far = sensor.get_far_clipping_plane()
-                        depth_m = near + depth * (far - near)
-                    pcd = sensor.pointcloud_from_depth(depth_m)
-                    if not get_depth:
-                        depth = None
-            return rgb, depth, pcd
-
-        def get_mask(sensor: VisionSensor, mask_fn):
-            mask = None
-            if sensor is not None:
-                sensor.handle_explicitly()
-                mask = mask_fn(sensor.capture_rgb())
-            return mask
-
-        left_shoulder_rgb, left_shoulder_depth, left_shoulder_pcd = get_rgb_depth(
-            self._cam_over_shoulder_left, lsc_ob.rgb, lsc_ob.depth, lsc_ob.point_cloud,
-            lsc_ob.rgb_noise, lsc_ob.depth_noise, lsc_ob.depth_in_meters)
-        right_shoulder_rgb, right_shoulder_depth, right_shoulder_pcd = get_rgb_depth(
-            self._cam_over_shoulder_right, rsc_ob.rgb, rsc_ob.depth, rsc_ob.point_cloud,
-            rsc_ob.rgb_noise, rsc_ob.depth_noise, rsc_ob.depth_in_meters)
-        overhead_rgb, overhead_depth, overhead_pcd = get_rgb_depth(
-            self._cam_overhead, oc_ob.rgb, oc_ob.depth, oc_ob.point_cloud,
-            oc_ob.rgb_noise, oc_ob.depth_noise, oc_ob.depth_in_meters)
-        wrist_rgb, wrist_depth, wrist_pcd = get_rgb_depth(
-            self._cam_wrist, wc_ob.rgb, wc_ob.depth, wc_ob.point_cloud,
-            wc_ob.rgb_noise, wc_ob.depth_noise, wc_ob.depth_in_meters)
-        front_rgb, front_depth, front_pcd = get_rgb_depth(
-            self._cam_front, fc_ob.rgb, fc_ob.depth, fc_ob.point_cloud,
-            fc_ob.rgb_noise, fc_ob.depth_noise, fc_ob.depth_in_meters)
-
-        left_shoulder_mask = get_mask(self._cam_over_shoulder_left_mask,
-                                      lsc_mask_fn) if lsc_ob.mask else None
-        right_shoulder_mask = get_mask(self._cam_over_shoulder_right_mask,
-                                      rsc_mask_fn) if rsc_ob.mask else None
-        overhead_mask = get_mask(self._cam_overhead_mask,
-                                 oc_mask_fn) if oc_ob.mask else None
-        wrist_mask = get_mask(self._cam_wrist_mask,
-                              wc_mask_fn) if wc_ob.mask else None
-        front_mask = get_mask(self._cam_front_mask,
-                              fc_mask_fn) if fc_ob.mask else None
+            (decoder if c.masks_as_one_channel else lambda x: x
+             ) for c, decoder in zip([lsc_ob, rsc_ob, oc_ob, wc_ob, fc_ob], self._mask_decoders)]
+
+        # sensor readout here, post-processing of the previous cameras meanwhile on the pool
+        pipeline = self._camera_pipeline
+        cameras = [
+            pipeline.read_camera(
+                self._cam_over_shoulder_left, lsc_ob.rgb, lsc_ob.depth, lsc_ob.point_cloud,
+                lsc_ob.rgb_noise, lsc_ob.depth_noise, lsc_ob.depth_in_meters),
+            pipeline.read_camera(
+                self._cam_over_shoulder_right, rsc_ob.rgb, rsc_ob.depth, rsc_ob.point_cloud,
+                rsc_ob.rgb_noise, rsc_ob.depth_noise, rsc_ob.depth_in_meters),
+            pipeline.read_camera(
+                self._cam_overhead, oc_ob.rgb, oc_ob.depth, oc_ob.point_cloud,
+                oc_ob.rgb_noise, oc_ob.depth_noise, oc_ob.depth_in_meters),
+            pipeline.read_camera(
+                self._cam_wrist, wc_ob.rgb, wc_ob.depth, wc_ob.point_cloud,
+                wc_ob.rgb_noise, wc_ob.depth_noise, wc_ob.depth_in_meters),
+            pipeline.read_camera(
+                self._cam_front, fc_ob.rgb, fc_ob.depth, fc_ob.point_cloud,
+                fc_ob.rgb_noise, fc_ob.depth_noise, fc_ob.depth_in_meters)]
+        masks = [
+            pipeline.read_mask(sensor, mask_fn) if ob.mask else None
+            for sensor, mask_fn, ob in zip(
+                [self._cam_over_shoulder_left_mask, self._cam_over_shoulder_right_mask,
+                 self._cam_overhead_mask, self._cam_wrist_mask, self._cam_front_mask],
+                [lsc_mask_fn, rsc_mask_fn, oc_mask_fn, wc_mask_fn, fc_mask_fn],
+                [lsc_ob, rsc_ob, oc_ob, wc_ob, fc_ob])]
+
+        (left_shoulder_rgb, left_shoulder_depth, left_shoulder_pcd), \
+            (right_shoulder_rgb, right_shoulder_depth, right_shoulder_pcd), \
+            (overhead_rgb, overhead_depth, overhead_pcd), \
+            (wrist_rgb, wrist_depth, wrist_pcd), \
+            (front_rgb, front_depth, front_pcd) = [c.result() for c in cameras]
+        left_shoulder_mask, right_shoulder_mask, overhead_mask, wrist_mask, front_mask = [
+            m.result() if m is not None else None for m in masks]
 
         obs = Observation(
             left_shoulder_rgb=left_shoulder_rgb,
@@ -0,0 +1,88 @@
+"""
+Success checking of a task while a path is executed substep by substep.
+
+``SuccessMonitor`` gives the same answer as ``Task.success`` but avoids repeating work:
+
+* a condition that lists the objects it depends on (``Condition.dependencies``) is only
+  evaluated again once one of them moved by more than ``tolerance`` since its last
+  evaluation; the poses are read once per substep and shared between the conditions;
+* a condition combining others (``Condition.sub_conditions``, like the count of detected
+  balls of pour_demo) is combined from its children, each cached on its own;
+* conditions that keep state or do not list their objects are evaluated every time;
+* with ``check_interval`` > 1 only every n-th substep is checked, and the last substep of
+  the path always is.
+
+With the defaults (every substep, zero tolerance) the results are the same as calling
+``Task.success`` on every substep.
+"""
+import numpy as np
+
+
+class SuccessMonitor(object):
+
+    def __init__(self, conditions, check_interval=1, tolerance=0.0):
+        self._interval = max(1, int(check_interval))
+        self._tolerance = tolerance
+        self._plans = [self._plan(cond) for cond in conditions]
+        # per cached condition: (met, terminate, poses of its objects when evaluated)
+        self._last = {}
+        self._substep = 0
+        self.evaluations = 0
+        self.reused = 0
+
+    def _plan(self, cond):
+        sub_conditions = getattr(cond, 'sub_conditions', lambda: None)()
+        if sub_conditions is not None:
+            return cond, None, [self._plan(child) for child in sub_conditions]
+        dependencies = None
+        if hasattr(cond, 'dependencies'):
+            try:
+                dependencies = cond.dependencies()
+            except Exception:
+                # objects that cannot be resolved now: evaluate the condition every time
+                dependencies = None
+        return cond, dependencies, None
+
+    def check(self, final=False):
+        """(success, terminate) of the current substep, or None if it is not checked.
+
+        Call once per substep, with ``final`` on the last substep of the path.
+        """
+        self._substep += 1
+        if not final and self._substep % self._interval != 0:
+            return None
+        poses = {}
+        all_met = True
+        should_terminate = False
+        for plan in self._plans:
+            met, terminate = self._evaluate(plan, poses)
+            if terminate:
+                # Broken constraint
+                should_terminate = True
+                break
+            all_met &= met
+        if all_met:
+            should_terminate = True
+        return all_met, should_terminate
+
+    def _evaluate(self, plan, poses):
+        cond, objects, children = plan
+        if children is not None:
+            return cond.combine([self._evaluate(child, poses) for child in children])
+        if objects is None:
+            self.evaluations += 1
+            return cond.condition_met()
+        current = []
+        for obj in objects:
+            handle = obj.get_handle()
+            if handle not in poses:
+                poses[handle] = np.asarray(obj.get_pose())
+            current.append(poses[handle])
+        last = self._last.get(id(cond))
+        if last is not None and all(np.max(np.abs(a - b)) <= self._tolerance for a, b in zip(current, last[2])):
+            self.reused += 1
+            return last[0], last[1]
+        self.evaluations += 1
+        met, terminate = cond.condition_met()
+        self._last[id(cond)] = (met, terminate, current)
+        return met, terminate
@@ -1,7 +1,6 @@
 #Modified From the rlbench: https://github.com/stepjam/RLBench
 from copy import deepcopy
 import json
-import pickle
 from platform import release
 import numpy as np
 import os
@@ -20,6 +19,7 @@ from amsolver.backend.robot import Robot
 from amsolver.backend.spawn_boundary import BoundingBox, SpawnBoundary
 from amsolver.backend.task import Task
 from amsolver.backend.utils import WriteCustomDataBlock, execute_grasp, execute_path, get_relative_position_xy, get_sorted_grasp_pose, test_reachability
+from tools.grasp_pose_store import load_grasp_poses
 
 gripper_step = 0.5
 def fast_path_test(point, robot):
@@ -49,8 +49,7 @@ class VLM_Object(Shape):
             part.local_grasp = None
             if "local_grasp_pose_path" in p:
                 grasp_pose_path = os.path.join(os.path.dirname(model_path),p["local_grasp_pose_path"])
-                with open(grasp_pose_path, 'rb') as f:
-                    part.local_grasp = pickle.load(f)
+                part.local_grasp = load_grasp_poses(grasp_pose_path)
             part.property = p["property"]
             if self.exists(p["name"]+"_visual"+str(instance_id)):
                 part.set_transparency(0)
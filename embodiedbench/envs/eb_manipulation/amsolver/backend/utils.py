@@ -20,6 +20,7 @@ from amsolver.backend.robot import Robot
 from pyrep.objects.cartesian_path import CartesianPath
 from amsolver.const import colors
 from amsolver.backend.spawn_boundary import BoundaryObject, BoundingBox, SpawnBoundary
+from amsolver.backend.handle_mask import HandleMaskDecoder, rgb_handles_to_mask
 from copy import deepcopy
 from pyrep.backend import sim
 from scipy.spatial.transform import Rotation as R
@@ -30,7 +31,8 @@ import os
 _manipulation_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 if _manipulation_dir not in sys.path:
     sys.path.insert(0, _manipulation_dir)
-from tools.grasploc import Grasploc, define_default_args
+from tools.grasp_pose_store import GraspPoseStore, make_spec, write_spec, grasp_poses_for_mesh
+from tools.task_registry import get_task_registry
 
 def ClipFloatValues(float_array, min_value, max_value):
   """Clips values to the range [min_value, max_value].
@@ -200,25 +202,11 @@ def image_to_float_array(image, scale_factor=None):
   return scaled_array
 
 
-def task_file_to_task_class(task_file, parent_folder = 'amsolver'):
-  import importlib
-  name = task_file.replace('.py', '')
-  class_name = ''.join([w[0].upper() + w[1:] for w in name.split('_')])
-  mod = importlib.import_module(parent_folder+".tasks.%s" % name)
-  mod = importlib.reload(mod)
-  task_class = getattr(mod, class_name)
-  return task_class
+def task_file_to_task_class(task_file, parent_folder = 'amsolver', reload = False):
+  # cached per process, pass reload=True to re-import an edited task
+  return get_task_registry(parent_folder).get(task_file, reload=reload)
 
 
-def rgb_handles_to_mask(rgb_coded_handles):
-  # rgb_coded_handles should be (w, h, c)
-  # Handle encoded as : handle = R + G * 256 + B * 256 * 256
-  rgb_coded_handles *= 255  # takes rgb range to 0 -> 255
-  rgb_coded_handles = rgb_coded_handles.astype(int)
-  return (rgb_coded_handles[:, :, 0] +
-          rgb_coded_handles[:, :, 1] * 256 +
-          rgb_coded_handles[:, :, 2] * 256 * 256)
-
 '''
 New functions
 '''
@@ -413,20 +401,21 @@ def pose_differences(pose1, pose2):
   return translate_diff, quat_diff
   
 def get_sorted_grasp_pose(obj_pose, local_grasp_pose, sort_key="vertical"):
-  grasp_pose = np.einsum('ij,kjl->kil', obj_pose, local_grasp_pose)
-  angle_z_z_axis = grasp_pose[:,2, 2]
-  angle_z_x_axis = grasp_pose[:,0, 2]
-  grasp_pose = grasp_pose[np.logical_and(angle_z_z_axis<0.1, angle_z_x_axis>-0.1)]
-  np.random.shuffle(grasp_pose)
+  # filter on the rotated approach axis first, then transform only the kept poses
+  approach = obj_pose[:3, :3] @ local_grasp_pose[:, :3, 2].T
+  keep = np.flatnonzero(np.logical_and(approach[2]<0.1, approach[0]>-0.1))
+  grasp_pose = np.einsum('ij,kjl->kil', obj_pose, local_grasp_pose[keep])
+  # random order of equal keys, same random stream as shuffling the poses
+  order = np.random.permutation(len(grasp_pose))
   if sort_key=="vertical":
-    axis_angle = grasp_pose[:,2, 2]
+    axis_angle = grasp_pose[order, 2, 2]
   elif sort_key=="horizontal":
-    axis_angle = abs(grasp_pose[:,2, 2])-grasp_pose[:,0, 2]**2
+    axis_angle = abs(grasp_pose[order, 2, 2])-grasp_pose[order, 0, 2]**2
     # sort_select = np.argsort(np.abs(angle_z_z_axis))
   elif type(sort_key)==list:
     # New axis(sort_key[0]) in the world axis(sort_key[1])
     axis = ["x", "y", "z"]
-    axis_angle = grasp_pose[:,axis.index(sort_key[0]), axis.index(sort_key[1])]
+    axis_angle = grasp_pose[order, axis.index(sort_key[0]), axis.index(sort_key[1])]
     if "abs" in sort_key[2]:
       axis_angle = abs(axis_angle)
     elif "neg" in sort_key[2]:
@@ -434,35 +423,29 @@ def get_sorted_grasp_pose(obj_pose, local_grasp_pose, sort_key="vertical"):
   else:
     raise ValueError('sort_key can only be vertical first or horizontal first')
   sort_select = np.argsort(axis_angle)
-  grasp_pose = grasp_pose[sort_select]
+  grasp_pose = grasp_pose[order[sort_select]]
   return grasp_pose
 
-def get_local_grasp_pose(obj: Object, ply_file: str, grasp_pose_path = './vlm/grasp_poses/', need_rebuild=False, use_meshlab=True, crop_box:Object =None):
-  args = define_default_args()
-  args.input_file = ply_file
-  args.output_file = os.path.join(grasp_pose_path, ply_file.split('/')[-1][:-4] + '.pkl')
-  args.use_meshlab = use_meshlab
-  obj_origin_matrix = obj.get_matrix()
+def get_local_grasp_pose(obj: Object, ply_file: str, grasp_pose_path = './vlm/grasp_poses/', need_rebuild=False, use_meshlab=True, crop_box:Object =None, store: GraspPoseStore = None):
+  """Grasp poses of obj in its own frame, from the grasp pose store; Grasploc only runs for an unseen mesh/crop/scale.
+
+  The mesh is exported to ply_file if it does not exist or need_rebuild is set, the analysis spec is written
+  next to it, and the poses are written to <grasp_pose_path>/<mesh name>.pkl for the object model json.
+  Without need_rebuild an existing pkl is taken over into the store.
+  """
+  output_file = os.path.join(grasp_pose_path, ply_file.split('/')[-1][:-4] + '.pkl')
+  crop_bounds, crop_transform = None, None
   if crop_box is not None:
-    args.no_crop = False
-    crop_boundary = crop_box.get_bounding_box()
-    crop_origin_matrix = crop_box.get_matrix()
-    args.crop_box_transform = crop_origin_matrix
-    args.crop_x_min = crop_boundary[0]
-    args.crop_y_min = crop_boundary[2]
-    args.crop_z_min = crop_boundary[4]
-    args.crop_x_max = crop_boundary[1]
-    args.crop_y_max = crop_boundary[3]
-    args.crop_z_max = crop_boundary[5]
-  gl = Grasploc(args)
-  # scale_object(self.toy, 0.5)
-  
-  if not os.path.exists(args.output_file) or need_rebuild:
+    boundary = crop_box.get_bounding_box()
+    crop_bounds = [boundary[0], boundary[1], boundary[2], boundary[3], boundary[4], boundary[5]]
+    crop_transform = crop_box.get_matrix()
+  scale = lib.simGetObjectSizeFactor(ffi.cast('int', obj.get_handle()))
+  spec = make_spec(obj.get_matrix(), scale, crop_bounds, crop_transform, use_meshlab, output_file)
+  if not os.path.exists(ply_file) or need_rebuild:
     exportMesh(obj, 'binary_ply', ply_file[:-4])
-    gl.run(obj_origin_matrix)
-  else:
-    gl.load_result()
-  return gl.se3_output
+  write_spec(ply_file, spec)
+  poses, _ = grasp_poses_for_mesh(ply_file, spec, store, output_file, reuse_output=not need_rebuild)
+  return poses
 
 def add_joint(jointType, jointMode=sim.sim_jointmode_force, length=0.2, diameter=0.02): # joint axis is along Z
     jointMode = ffi.cast('int', jointMode)
@@ -27,7 +27,7 @@ from amsolver.backend.task import Task
 from amsolver.backend.const import *
 from amsolver.backend.robot import Robot
 from os.path import exists, dirname, abspath, join
-import importlib
+from tools.task_registry import get_task_registry
 from typing import Type, List
 from amsolver.observation_config import ObservationConfig
 from amsolver.task_environment import TaskEnvironment
@@ -58,7 +58,8 @@ class Environment(object):
                  frequency: int=1,
                  visual_randomization_config: VisualRandomizationConfig=None,
                  dynamics_randomization_config: DynamicsRandomizationConfig=None,
-                 attach_grasped_objects: bool = True
+                 attach_grasped_objects: bool = True,
+                 camera_workers: int = None
                  ):
 
         self._dataset_root = dataset_root
@@ -73,6 +74,8 @@ class Environment(object):
         self._visual_randomization_config = visual_randomization_config
         self._dynamics_randomization_config = dynamics_randomization_config
         self._attach_grasped_objects = attach_grasped_objects
+        # camera post-processing threads of the scene, None for the default
+        self._camera_workers = camera_workers
 
         if robot_configuration not in SUPPORTED_ROBOTS.keys():
             raise ValueError('robot_configuration must be one of %s' %
@@ -122,14 +125,11 @@ class Environment(object):
     def _string_to_task(self, task_name: str):
         task_name = task_name.replace('.py', '')
         try:
-            class_name = ''.join(
-                [w[0].upper() + w[1:] for w in task_name.split('_')])
-            mod = importlib.import_module("amsolver.tasks.%s" % task_name)
+            return get_task_registry('amsolver').get(task_name)
         except Exception as e:
             raise RuntimeError(
                 'Tried to interpret %s as a task, but failed. Only valid tasks '
                 'should belong in the tasks/ folder' % task_name) from e
-        return getattr(mod, class_name)
 
     def launch(self):
         if self._pyrep is not None:
@@ -156,17 +156,21 @@ class Environment(object):
 
         self._robot = Robot(arm, gripper)
         if self._randomize_every is None:
-            self._scene = Scene(self._pyrep, self._robot, self._obs_config)
+            self._scene = Scene(self._pyrep, self._robot, self._obs_config,
+                                camera_workers=self._camera_workers)
         else:
             self._scene = DomainRandomizationScene(
                 self._pyrep, self._robot, self._obs_config,
                 self._randomize_every, self._frequency,
                 self._visual_randomization_config,
-                self._dynamics_randomization_config)
+                self._dynamics_randomization_config,
+                camera_workers=self._camera_workers)
 
         self._set_arm_control_action()
 
     def shutdown(self):
+        if self._scene is not None:
+            self._scene.close()
         if self._pyrep is not None:
             self._pyrep.shutdown()
         self._pyrep = None
@@ -26,8 +26,10 @@ class DomainRandomizationScene(Scene):
                  randomize_every: RandomizeEvery=RandomizeEvery.EPISODE,
                  frequency: int=1,
                  visual_randomization_config=None,
-                 dynamics_randomization_config=None):
-        super().__init__(pyrep, robot, obs_config)
+                 dynamics_randomization_config=None,
+                 camera_workers=None):
+        super().__init__(pyrep, robot, obs_config,
+                         camera_workers=camera_workers)
         self._randomize_every = randomize_every
         self._frequency = frequency
         self._visual_rand_config = visual_randomization_config
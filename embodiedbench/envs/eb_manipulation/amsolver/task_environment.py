@@ -17,6 +17,7 @@ from amsolver.backend.exceptions import BoundaryError, WaypointError
 from amsolver.backend.observation import Observation
 from amsolver.backend.robot import Robot
 from amsolver.backend.scene import Scene
+from amsolver.backend.success_monitor import SuccessMonitor
 from amsolver.backend.task import Task
 from amsolver.backend.utils import execute_path
 from amsolver.demo import Demo
@@ -60,6 +61,8 @@ class TaskEnvironment(object):
         self._reset_called = False
         self._prev_ee_velocity = None
         self._enable_path_observations = False
+        self._success_check_interval = 1
+        self._success_check_tolerance = 0.0
         tasks_folder = self._task.__module__.split('.')[0]
         ttms_folder = TTMS_FOLDER + tasks_folder+'/task_ttms' # change to absolute path to vlmbench folder
         # ttms_folder = './'+tasks_folder+'/task_ttms'
@@ -162,6 +165,22 @@ class TaskEnvironment(object):
         except IKError as e:
             raise InvalidActionError('Could not find a path.') from e
 
+    def set_success_check(self, interval: int = 1, tolerance: float = 0.0) -> None:
+        """How the success conditions are checked while a path is executed.
+
+        :param interval: check every n-th substep; the last substep is always checked.
+            Above 1, a success that only holds between two checks is missed.
+        :param tolerance: a condition depending on object poses is evaluated again only
+            once one of its objects moved more than this since the last evaluation.
+        """
+        self._success_check_interval = interval
+        self._success_check_tolerance = tolerance
+
+    def _success_monitor(self) -> SuccessMonitor:
+        return SuccessMonitor(self._task._success_conditions,
+                              self._success_check_interval,
+                              self._success_check_tolerance)
+
     def _path_action(self, action, collision_checking=False, relative_to=None, recorder=None):
         self._assert_unit_quaternion(action[3:])
         # Check if the target is in the workspace; if not, then quick reject
@@ -195,6 +214,7 @@ class TaskEnvironment(object):
                     action, collision_checking, relative_to)
                 [s.set_collidable(True) for s in colliding_shapes]
                 # Only run this path until we are no longer colliding
+                monitor = self._success_monitor()
                 while not done:
                     done = path.step()
                     self._scene.step()
@@ -205,15 +225,16 @@ class TaskEnvironment(object):
                     colliding = self._robot.arm.check_arm_collision()
                     if not colliding:
                         break
-                    success, terminate = self._task.success()
+                    checked = monitor.check(final=done)
                     # If the task succeeds while traversing path, then break early
-                    if success:
+                    if checked is not None and checked[0]:
                         done = True
                         break
         if not done:
             path = self._path_action_get_path(
                 action, collision_checking, relative_to)
             small_step = 0
+            monitor = self._success_monitor()
             while not done:
                 done = path.step()
                 self._scene.step()
@@ -221,11 +242,11 @@ class TaskEnvironment(object):
                     observations.append(self._scene.get_observation())
                 if recorder is not None:
                     recorder.take_snap()
-                success, terminate = self._task.success()
+                checked = monitor.check(final=done)
                 # If the task succeeds while traversing path, then break early
                 # if success:
                 #     break
-                if success:
+                if checked is not None and checked[0]:
                     success_in_path.append(small_step)
                 small_step += 1
 
@@ -1,6 +1,4 @@
 #Modified From the rlbench: https://github.com/stepjam/RLBench
-import importlib
-import pickle
 from os import listdir
 from os.path import join, exists
 from typing import List
@@ -14,29 +12,26 @@ from amsolver.backend.const import *
 from amsolver.backend.utils import image_to_float_array, rgb_handles_to_mask
 from amsolver.demo import Demo
 from amsolver.observation_config import ObservationConfig
+from tools.task_registry import get_task_registry, task_module_name, task_class_name
+from tools.demo_store import FAIL_CASES_FOLDER, load_demo_index, indexed_episodes, load_low_dim
 
 
 class InvalidTaskName(Exception):
     pass
 
 
-def name_to_task_class(task_file: str, parent_folder = "vlm"):
-    name = task_file.replace('.py', '')
-    class_name = ''.join([w[0].upper() + w[1:] for w in name.split('_')])
+def name_to_task_class(task_file: str, parent_folder = "vlm", reload = False):
+    name = task_module_name(task_file)
     try:
-        mod = importlib.import_module(parent_folder+".tasks.%s" % name)
-        mod = importlib.reload(mod)
+        return get_task_registry(parent_folder).get(name, reload=reload)
     except ModuleNotFoundError as e:
         raise InvalidTaskName(
             "The task file '%s' does not exist or cannot be compiled."
             % name) from e
-    try:
-        task_class = getattr(mod, class_name)
     except AttributeError as e:
         raise InvalidTaskName(
             "Cannot find the class name '%s' in the file '%s'."
-            % (class_name, name)) from e
-    return task_class
+            % (task_class_name(name), name)) from e
 
 
 def get_stored_demos(amount: int, image_paths: bool, dataset_root: str,
@@ -58,8 +53,11 @@ def get_stored_demos(amount: int, image_paths: bool, dataset_root: str,
     if fail_demos:
         examples_path = join(
         task_root, VARIATIONS_FOLDER % variation_number,
-        'fail_cases')
-    examples = listdir(examples_path)
+        FAIL_CASES_FOLDER)
+    # the demo index lists the episodes and their image counts, unless the folder changed since
+    index = load_demo_index(join(task_root, VARIATIONS_FOLDER % variation_number))
+    entries = indexed_episodes(index, examples_path, FAIL_CASES_FOLDER if fail_demos else EPISODES_FOLDER)
+    examples = list(entries) if entries is not None else listdir(examples_path)
     if amount == -1:
         amount = len(examples)
     if amount > len(examples):
@@ -80,8 +78,8 @@ def get_stored_demos(amount: int, image_paths: bool, dataset_root: str,
     demos = []
     for example in selected_examples:
         example_path = join(examples_path, example)
-        with open(join(example_path, LOW_DIM_PICKLE), 'rb') as f:
-            obs = pickle.load(f)
+        entry = entries.get(example) if entries is not None else None
+        obs = load_low_dim(example_path, entry)
 
         l_sh_rgb_f = join(example_path, LEFT_SHOULDER_RGB_FOLDER)
         l_sh_depth_f = join(example_path, LEFT_SHOULDER_DEPTH_FOLDER)
@@ -101,7 +99,14 @@ def get_stored_demos(amount: int, image_paths: bool, dataset_root: str,
 
         num_steps = len(obs)
 
-        if not (num_steps == len(listdir(l_sh_rgb_f)) == len(
+        if entry is not None:
+            counts = [entry['images'].get(folder, 0) for folder in (
+                LEFT_SHOULDER_RGB_FOLDER, LEFT_SHOULDER_DEPTH_FOLDER, RIGHT_SHOULDER_RGB_FOLDER,
+                RIGHT_SHOULDER_DEPTH_FOLDER, OVERHEAD_RGB_FOLDER, OVERHEAD_DEPTH_FOLDER,
+                WRIST_RGB_FOLDER, WRIST_DEPTH_FOLDER, FRONT_RGB_FOLDER, FRONT_DEPTH_FOLDER)]
+            if any(count != num_steps for count in counts):
+                raise RuntimeError('Broken dataset assumption')
+        elif not (num_steps == len(listdir(l_sh_rgb_f)) == len(
                 listdir(l_sh_depth_f)) == len(listdir(r_sh_rgb_f)) == len(
                 listdir(r_sh_depth_f)) == len(listdir(oh_rgb_f)) == len(
                 listdir(oh_depth_f)) == len(listdir(wrist_rgb_f)) == len(
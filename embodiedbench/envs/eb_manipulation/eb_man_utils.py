@@ -1,17 +1,26 @@
 import os
 from typing import List
 import numpy as np
-from pyrep.objects import VisionSensor
-from ultralytics import YOLO
 import cv2
 from scipy.spatial.transform import Rotation
+from embodiedbench.tracing import tracer
 
 SCENE_BOUNDS = np.array([-0.3, -0.5, 0.6, 0.7, 0.5, 1.6])
 ROTATION_RESOLUTION = 3
 VOXEL_SIZE = 100
 CAMERAS = ['front', 'left_shoulder', 'right_shoulder', 'wrist']
 USE_GENERAL_OBJECT_NAMES = True
-object_detection_model = YOLO("yolo11n.pt")
+# pyrep and ultralytics are imported on first use, so that the planners can use the
+# constants above without loading the simulator or the detector
+_object_detection_model = None
+
+
+def get_object_detection_model():
+    global _object_detection_model
+    if _object_detection_model is None:
+        from ultralytics import YOLO
+        _object_detection_model = YOLO("yolo11n.pt")
+    return _object_detection_model
 
 # From https://github.com/stepjam/RLBench/blob/master/rlbench/backend/utils.py
 def point_to_voxel_index(
@@ -48,6 +57,7 @@ def get_continous_action_from_discrete(discrete_action):
     ])
     return continuous_action
 
+@tracer.trace('obs.draw_axes')
 def draw_xyz_coordinate(image_path, resolution):
     image = cv2.imread(image_path)
     # origin = (45, 172)  # Adjust based on the table's position in the image
@@ -201,6 +211,7 @@ def increase_bbox(bbox, scale_factor=1):
 
     return [new_x1, new_y1, new_x2, new_y2]
 
+@tracer.trace('obs.draw_boxes')
 def draw_bounding_boxes(image_path_list, world_points, camera_extrinsics_list, camera_intrinsics_list):
     image_save_path_list = []
     for input_image_path, camera_extrinsics, camera_intrinsics in zip(image_path_list, camera_extrinsics_list, camera_intrinsics_list):
@@ -210,7 +221,7 @@ def draw_bounding_boxes(image_path_list, world_points, camera_extrinsics_list, c
         pixel_points_2D, _ = cv2.projectPoints(np.array(world_points), rvec, tvec, camera_intrinsics, np.zeros(4))
 
         # get the bounding boxes using YOLO
-        results = object_detection_model.predict(source=input_image_path, conf=0.0001, line_width=1, verbose=False)
+        results = get_object_detection_model().predict(source=input_image_path, conf=0.0001, line_width=1, verbose=False)
         predicted_boxes = results[0].boxes.xyxy
         image_bgr = cv2.imread(input_image_path, cv2.IMREAD_COLOR)
 
@@ -267,6 +278,7 @@ def _get_mask_id_to_name_dict_for_input(object_info):
     return mask_id_to_name_dict
 
 def _get_point_cloud_dict_for_input(obs, camera_types):
+    from pyrep.objects import VisionSensor
     # This function gets the point cloud using the same operations as PerAct Colab Tutorial
     point_cloud_dict = {}
     camera_extrinsics_list, camera_intrinsics_list = [], []
@@ -334,6 +346,7 @@ def form_obs_for_input(
 
     return real_name_to_avg_coord, all_avg_point_list
 
+@tracer.trace('obs.object_coord')
 def form_object_coord_for_input(obs, task_class, camera_types):
     mask_id_to_sim_name = _get_mask_id_to_name_dict_for_input(obs['object_informations'])
     point_cloud_dict, camera_extrinsics_list, camera_intrinsics_list = _get_point_cloud_dict_for_input(obs, camera_types)
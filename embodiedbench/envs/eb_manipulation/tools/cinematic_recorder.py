@@ -14,6 +14,7 @@ from amsolver.backend.observation import Observation
 from amsolver.backend.task import TASKS_PATH
 from amsolver.backend.task import Task
 from amsolver.backend.utils import task_file_to_task_class
+from tools.task_registry import get_task_registry
 from amsolver.observation_config import ObservationConfig
 from amsolver.sim2real.domain_randomization import RandomizeEvery, \
     VisualRandomizationConfig
@@ -138,9 +139,7 @@ def main(argv):
     if len(FLAGS.tasks) > 0:
         task_names = FLAGS.tasks
     else:
-        tasks_path = './vlm/tasks'
-        task_names = [t.replace('.py', '') for t in os.listdir(tasks_path)
-                    if t != '__init__.py' and t.endswith('.py')]
+        task_names = get_task_registry('vlm').task_names()
     task_classes = [task_file_to_task_class(
         task_file,  parent_folder = 'vlm') for task_file in task_names]
 
@@ -1,4 +1,3 @@
-from multiprocessing import Process, Manager
 from time import time
 
 from pyrep.const import RenderMode
@@ -9,8 +8,11 @@ sys.path.insert(0, join(CURRENT_DIR, '..'))  # Use local amsolver rather than in
 from amsolver import ObservationConfig
 from amsolver.action_modes import ActionMode
 from amsolver.backend.utils import task_file_to_task_class
+from tools.task_registry import get_task_registry
 from amsolver.environment import Environment
 import amsolver.backend.task as task
+from generation_scheduler import UnitGenerator, UnitFailed, run_generation
+from demo_store import index_dataset
 
 import os
 import pickle
@@ -18,7 +20,6 @@ from PIL import Image
 from amsolver.backend import utils
 from amsolver.backend.const import *
 import numpy as np
-from pathlib import Path
 
 from absl import app
 from absl import flags
@@ -58,6 +59,8 @@ flags.DEFINE_integer('variations', -1,
                      'Number of variations to collect per task. -1 for all.')
 flags.DEFINE_bool('save_configs', True,
                      'whether also save the config for replay.')
+flags.DEFINE_bool('pack_demos', True,
+                     'whether to index the saved demos and pack their low-dim observations.')
 
 
 def check_and_make(dir):
@@ -193,177 +196,102 @@ def save_demo(demo, example_path):
         pickle.dump(demo, f)
 
 
-def run(i, lock, task_index, variation_count, results, file_lock, tasks):
-    """Each thread will choose one task and variation, and then gather
-    all the episodes_per_task for that variation."""
-
-    # Initialise each thread with random seed
-    np.random.seed(None)
-    num_tasks = len(tasks)
-
-    img_size = list(map(int, FLAGS.image_size))
-
-    obs_config = ObservationConfig()
-    obs_config.set_all(True)
-    obs_config.right_shoulder_camera.image_size = img_size
-    obs_config.left_shoulder_camera.image_size = img_size
-    obs_config.overhead_camera.image_size = img_size
-    obs_config.wrist_camera.image_size = img_size
-    obs_config.front_camera.image_size = img_size
-
-    # Store depth as 0 - 1
-    obs_config.right_shoulder_camera.depth_in_meters = False
-    obs_config.left_shoulder_camera.depth_in_meters = False
-    obs_config.overhead_camera.depth_in_meters = False
-    obs_config.wrist_camera.depth_in_meters = False
-    obs_config.front_camera.depth_in_meters = False
-
-    # We want to save the masks as rgb encodings.
-    obs_config.left_shoulder_camera.masks_as_one_channel = False
-    obs_config.right_shoulder_camera.masks_as_one_channel = False
-    obs_config.overhead_camera.masks_as_one_channel = False
-    obs_config.wrist_camera.masks_as_one_channel = False
-    obs_config.front_camera.masks_as_one_channel = False
-
-    if FLAGS.renderer == 'opengl':
-        obs_config.right_shoulder_camera.render_mode = RenderMode.OPENGL
-        obs_config.left_shoulder_camera.render_mode = RenderMode.OPENGL
-        obs_config.overhead_camera.render_mode = RenderMode.OPENGL
-        obs_config.wrist_camera.render_mode = RenderMode.OPENGL
-        obs_config.front_camera.render_mode = RenderMode.OPENGL
-
-    amsolver_env = Environment(
-        action_mode=ActionMode(),
-        obs_config=obs_config,
-        headless=True) # set headless=False, if user want to visualize the simulator 
-    amsolver_env.launch()
-
-    task_env = None
-
-    tasks_with_problems = results[i] = ''
-
-    while True:
-        # Figure out what task/variation this thread is going to do
-        with lock:
-
-            if task_index.value >= num_tasks:
-                print('Process', i, 'finished')
+class DemoGenerator(UnitGenerator):
+    """Records one successful demo (and its replay config) per unit."""
+
+    def __init__(self):
+        self._task = None
+        self._variation = None
+        self._task_env = None
+
+    def launch(self):
+        # Initialise each process with random seed
+        np.random.seed(None)
+
+        img_size = list(map(int, FLAGS.image_size))
+
+        obs_config = ObservationConfig()
+        obs_config.set_all(True)
+        obs_config.right_shoulder_camera.image_size = img_size
+        obs_config.left_shoulder_camera.image_size = img_size
+        obs_config.overhead_camera.image_size = img_size
+        obs_config.wrist_camera.image_size = img_size
+        obs_config.front_camera.image_size = img_size
+
+        # Store depth as 0 - 1
+        obs_config.right_shoulder_camera.depth_in_meters = False
+        obs_config.left_shoulder_camera.depth_in_meters = False
+        obs_config.overhead_camera.depth_in_meters = False
+        obs_config.wrist_camera.depth_in_meters = False
+        obs_config.front_camera.depth_in_meters = False
+
+        # We want to save the masks as rgb encodings.
+        obs_config.left_shoulder_camera.masks_as_one_channel = False
+        obs_config.right_shoulder_camera.masks_as_one_channel = False
+        obs_config.overhead_camera.masks_as_one_channel = False
+        obs_config.wrist_camera.masks_as_one_channel = False
+        obs_config.front_camera.masks_as_one_channel = False
+
+        if FLAGS.renderer == 'opengl':
+            obs_config.right_shoulder_camera.render_mode = RenderMode.OPENGL
+            obs_config.left_shoulder_camera.render_mode = RenderMode.OPENGL
+            obs_config.overhead_camera.render_mode = RenderMode.OPENGL
+            obs_config.wrist_camera.render_mode = RenderMode.OPENGL
+            obs_config.front_camera.render_mode = RenderMode.OPENGL
+
+        amsolver_env = Environment(
+            action_mode=ActionMode(),
+            obs_config=obs_config,
+            headless=True) # set headless=False, if user want to visualize the simulator 
+        amsolver_env.launch()
+        return amsolver_env
+
+    def episodes_per_variation(self, task, variation_count):
+        return FLAGS.episodes_per_task
+
+    def generate(self, env, task, unit, path):
+        if task is not self._task:
+            self._task_env = env.get_task(task)
+            self._task, self._variation = task, None
+        if unit.variation != self._variation:
+            self._task_env.set_variation(unit.variation)
+            self._variation = unit.variation
+        task_env = self._task_env
+
+        attempts = 10
+        while True:
+            success = False
+            try:
+                # TODO: for now we do the explicit looping.
+                t0 = time()
+                demo_success = task_env.get_demos(
+                    amount=1,
+                    live_demos=True)
+                demo = demo_success[0][0]
+                if len(demo_success) == 2:
+                    success = demo_success[1][0]
+                print(f"one demo for {task_env.get_name()} // Variation {unit.variation}: {time()-t0}, success: {success}")
+            except Exception as e:
+                print(e)
+                attempts -= 1
+                if attempts == 0:
+                    raise UnitFailed(str(e))
+                continue
+            if success:
                 break
+            attempts -= 1
+            if attempts == 0:
+                raise UnitFailed('no successful demo in 10 attempts')
 
-            my_variation_count = variation_count.value
-            t = tasks[task_index.value]
-            task_env = amsolver_env.get_task(t)
-            var_target = task_env.variation_count()
-            if FLAGS.variations >= 0:
-                var_target = np.minimum(FLAGS.variations, var_target)
-            if my_variation_count >= var_target:
-                # If we have reached the required number of variations for this
-                # task, then move on to the next task.
-                variation_count.value = my_variation_count = 0
-                task_index.value += 1
-
-            variation_count.value += 1
-            if task_index.value >= num_tasks:
-                print('Process', i, 'finished')
-                break
-            t = tasks[task_index.value]
-
-        task_env = amsolver_env.get_task(t)
-        task_env.set_variation(my_variation_count)
-
-        variation_path = os.path.join(
-            FLAGS.save_path, task_env.get_name(),
-            VARIATIONS_FOLDER % my_variation_count)
-
-        check_and_make(variation_path)
-
-        episodes_path = os.path.join(variation_path, EPISODES_FOLDER)
-        check_and_make(episodes_path)
-        current_episodes = list(Path(episodes_path).rglob("low_dim*"))
-
-        fails_path = os.path.join(variation_path, 'fail_cases')
-        check_and_make(fails_path)
-
-        abort_variation = False
-        ex_idx = len(current_episodes)
-        fail_idx = 0
-        need_fail_case = False
-        # for ex_idx in range(FLAGS.episodes_per_task):
-        while ex_idx<FLAGS.episodes_per_task:
-            print('Process', i, '// Task:', task_env.get_name(),
-                  '// Variation:', my_variation_count, '// Demo:', ex_idx)
-            attempts = 10
-            while attempts > 0:
-                try:
-                    # TODO: for now we do the explicit looping.
-                    t0 = time()
-                    demo_success= task_env.get_demos(
-                        amount=1,
-                        live_demos=True)
-                    if len(demo_success)==2:
-                        demo = demo_success[0][0]
-                        success = demo_success[1][0]
-                    else:
-                        demo = demo_success[0][0]
-                    print(f"one demo for {task_env.get_name()} // Variation {my_variation_count}: {time()-t0}, success: {success}")
-                except Exception as e:
-                    print(e)
-                    attempts -= 1
-                    if attempts > 0:
-                        continue
-                    problem = (
-                        'Process %d failed collecting task %s (variation: %d, '
-                        'example: %d). Skipping this task/variation.\n%s\n' % (
-                            i, task_env.get_name(), my_variation_count, ex_idx,
-                            str(e))
-                    )
-                    print(problem)
-                    tasks_with_problems += problem
-                    abort_variation = True
-                    break
-                if success:
-                    episode_path = os.path.join(episodes_path, EPISODE_FOLDER % (ex_idx))
-                    # with file_lock:
-                    save_demo(demo, episode_path)
-                    if FLAGS.save_configs:
-                        task_base, waypoint_sets, config = task_env.read_config(demo.high_level_instructions)
-                        # with file_lock:
-                        save_configs(task_base, waypoint_sets, config, episode_path)
-                    ex_idx += 1
-                    break
-                else:
-                    if need_fail_case:
-                        if fail_idx<FLAGS.episodes_per_task:
-                            fail_path = os.path.join(fails_path, EPISODE_FOLDER % fail_idx)
-                            with file_lock:
-                                save_demo(demo, fail_path)
-                            fail_idx+=1
-                        else:
-                            attempts -= 1
-                            if attempts > 0:
-                                continue
-                            problem = (
-                            'Process %d failed collecting task %s (variation: %d, '
-                            'example: %d). Skipping this task/variation.\n' % (
-                                i, task_env.get_name(), my_variation_count, ex_idx)
-                            )
-                            print(problem)
-                            tasks_with_problems += problem
-                            abort_variation = True
-                    else:
-                        attempts -= 1
-            if abort_variation:
-                break
-
-    results[i] = tasks_with_problems
-    amsolver_env.shutdown()
+        save_demo(demo, path)
+        if FLAGS.save_configs:
+            task_base, waypoint_sets, config = task_env.read_config(demo.high_level_instructions)
+            save_configs(task_base, waypoint_sets, config, path)
 
 
 def main(argv):
 
-    tasks_path = './vlm/tasks'
-    task_files = [t.replace('.py', '') for t in os.listdir(tasks_path)
-                  if t != '__init__.py' and t.endswith('.py')]
+    task_files = get_task_registry('vlm').task_names()
     
     if len(FLAGS.tasks) > 0:
         for t in FLAGS.tasks:
@@ -373,28 +301,17 @@ def main(argv):
 
     tasks = [task_file_to_task_class(t, parent_folder = 'vlm') for t in task_files]
 
-    manager = Manager()
-
-    result_dict = manager.dict()
-    file_lock = manager.Lock()
-
-    task_index = manager.Value('i', 0)
-    variation_count = manager.Value('i', 0)
-    lock = manager.Lock()
-
     check_and_make(FLAGS.save_path)
 
-    processes = [Process(
-        target=run, args=(
-            i, lock, task_index, variation_count, result_dict, file_lock,
-            tasks))
-        for i in range(FLAGS.processes)]
-    [t.start() for t in processes]
-    [t.join() for t in processes]
-
-    print('Data collection done!')
-    for i in range(FLAGS.processes):
-        print(result_dict[i])
+    generator = DemoGenerator()
+    generated, problems = run_generation(generator, tasks, FLAGS.save_path, FLAGS.processes,
+                                         variations=FLAGS.variations)
+
+    print('Data collection done! %d episodes generated' % generated)
+    if FLAGS.pack_demos:
+        print('%d episodes indexed' % index_dataset(FLAGS.save_path, pack=True,
+                                                  tasks=[generator.task_name(t) for t in tasks]))
+    print(problems)
 
 
 if __name__ == '__main__':
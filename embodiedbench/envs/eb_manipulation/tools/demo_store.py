@@ -0,0 +1,304 @@
+"""
+Index and packed low-dim storage of the recorded manipulation demos.
+
+``index_variation`` writes ``demo_index.json`` into a ``<task>/variation<n>`` folder: the
+episodes in directory order (so the random episode choice of ``get_stored_demos`` stays the
+same), their frame counts, the number of images in every camera folder, whether a packed
+container exists, and the variation descriptions. ``get_stored_demos`` reads it instead of
+listing the episode and camera folders, as long as the episodes folder was not changed
+after indexing.
+
+``pack_episode`` writes ``low_dim_obs.pack`` next to ``low_dim_obs.pkl``. The per-frame arrays
+of the observations (joint states, gripper pose, camera parameters in ``misc``, ...) are
+stacked into contiguous blocks, and the rest of the demo is pickled without them.
+``load_packed_episode`` memory-maps the file, so the arrays of a frame are views into the
+mapping that are only read from disk when used.
+
+    python tools/demo_store.py --dataset_root ./data --pack
+"""
+import os
+import sys
+import mmap
+import json
+import pickle
+import argparse
+
+import numpy as np
+
+# same layout as amsolver.backend.const
+EPISODES_FOLDER = 'episodes'
+FAIL_CASES_FOLDER = 'fail_cases'
+VARIATIONS_FOLDER = 'variation%d'
+LOW_DIM_PICKLE = 'low_dim_obs.pkl'
+VARIATION_DESCRIPTIONS = 'variation_descriptions.pkl'
+CAMERA_FOLDERS = ('left_shoulder_rgb', 'left_shoulder_depth', 'left_shoulder_mask',
+                  'right_shoulder_rgb', 'right_shoulder_depth', 'right_shoulder_mask',
+                  'overhead_rgb', 'overhead_depth', 'overhead_mask',
+                  'wrist_rgb', 'wrist_depth', 'wrist_mask',
+                  'front_rgb', 'front_depth', 'front_mask')
+
+INDEX_FILE = 'demo_index.json'
+PACK_FILE = 'low_dim_obs.pack'
+INDEX_VERSION = 1
+
+_MAGIC = b'EBPACK1\0'
+_ALIGN = 64
+_MISC_PREFIX = 'misc/'
+
+_indexes = {}
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _is_scalar(value):
+    return isinstance(value, (float, int, np.floating, np.integer)) and not isinstance(value, (bool, np.bool_))
+
+
+def _packable(values):
+    """True if every frame holds an array of the same shape and dtype, or a number."""
+    first = values[0]
+    if isinstance(first, np.ndarray):
+        return first.dtype != object and all(
+            isinstance(v, np.ndarray) and v.shape == first.shape and v.dtype == first.dtype for v in values)
+    return _is_scalar(first) and all(_is_scalar(v) for v in values)
+
+
+def _frame_values(demo, name):
+    if name.startswith(_MISC_PREFIX):
+        key = name[len(_MISC_PREFIX):]
+        return [obs.misc[key] for obs in demo]
+    return [getattr(obs, name) for obs in demo]
+
+
+def _set_frame_value(obs, name, value):
+    if name.startswith(_MISC_PREFIX):
+        obs.misc[name[len(_MISC_PREFIX):]] = value
+    else:
+        setattr(obs, name, value)
+
+
+def _packable_fields(demo):
+    observations = [obs for obs in demo]
+    if not observations:
+        return []
+    names = [name for name in vars(observations[0]) if name != 'misc'
+             and all(name in vars(obs) for obs in observations)]
+    misc = [obs.misc if isinstance(getattr(obs, 'misc', None), dict) else None for obs in observations]
+    if all(m is not None for m in misc):
+        names += [_MISC_PREFIX + key for key in misc[0] if all(key in m for m in misc)]
+    return [name for name in names if _packable(_frame_values(observations, name))]
+
+
+def pack_episode(example_path):
+    """Write the packed container of an episode from its low-dim pickle."""
+    source = os.path.join(example_path, LOW_DIM_PICKLE)
+    with open(source, 'rb') as f:
+        demo = pickle.load(f)
+    fields, blocks = {}, []
+    for name in _packable_fields(demo):
+        values = _frame_values(demo, name)
+        scalar = not isinstance(values[0], np.ndarray)
+        block = np.ascontiguousarray(np.asarray(values) if scalar else np.stack(values))
+        fields[name] = {'dtype': block.dtype.str, 'shape': list(block.shape), 'scalar': scalar,
+                        'type': type(values[0]).__name__ if scalar else None}
+        blocks.append(block)
+        for obs in demo:
+            _set_frame_value(obs, name, None)
+    rest = pickle.dumps(demo, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def layout(header_size):
+        offset = _align(len(_MAGIC) + 8 + header_size)
+        for name, block in zip(fields, blocks):
+            fields[name]['offset'] = offset
+            offset = _align(offset + block.nbytes)
+        return offset
+
+    header = {'frames': len(demo), 'fields': fields, 'source': _stat_key(source)}
+    size = 0
+    while True:
+        # the header stores the offsets, which depend on the header size
+        rest_offset = layout(size)
+        header['rest'] = [rest_offset, len(rest)]
+        encoded = json.dumps(header).encode('utf-8')
+        if len(encoded) <= size:
+            break
+        size = len(encoded) + 64
+    path = os.path.join(example_path, PACK_FILE)
+    tmp_path = path + '.tmp-%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.uint64(size).tobytes())
+        f.write(encoded.ljust(size))
+        for name, block in zip(fields, blocks):
+            f.seek(fields[name]['offset'])
+            f.write(block.tobytes())
+        f.seek(rest_offset)
+        f.write(rest)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def read_pack_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('%s is not a packed demo' % path)
+        size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(size).decode('utf-8'))
+
+
+def load_packed_episode(path):
+    """The demo of a packed container, with its arrays memory-mapped (copy on write)."""
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError('%s is not a packed demo' % path)
+    start = len(_MAGIC) + 8
+    size = int(np.frombuffer(data, dtype=np.uint64, count=1, offset=len(_MAGIC))[0])
+    header = json.loads(data[start:start + size].decode('utf-8'))
+    rest_offset, rest_size = header['rest']
+    demo = pickle.loads(data[rest_offset:rest_offset + rest_size])
+    observations = [demo[i] for i in range(header['frames'])]
+    for name, field in header['fields'].items():
+        block = np.frombuffer(data, dtype=np.dtype(field['dtype']), count=int(np.prod(field['shape'])),
+                              offset=field['offset']).reshape(field['shape'])
+        if field['scalar']:
+            values = block.tolist()
+            if field['type'] not in ('float', 'int'):
+                values = list(block)
+        else:
+            # iterating the block gives plain per-frame views without copying
+            values = list(block)
+        if name.startswith(_MISC_PREFIX):
+            key = name[len(_MISC_PREFIX):]
+            for obs, value in zip(observations, values):
+                obs.misc[key] = value
+        else:
+            for obs, value in zip(observations, values):
+                setattr(obs, name, value)
+    return demo
+
+
+def load_low_dim(example_path, entry=None):
+    """Low-dim demo of an episode, from the packed container when the index says it is current."""
+    if entry is not None and entry.get('packed'):
+        source = os.path.join(example_path, LOW_DIM_PICKLE)
+        if not os.path.exists(source) or _stat_key(source) == entry.get('source'):
+            return load_packed_episode(os.path.join(example_path, PACK_FILE))
+    with open(os.path.join(example_path, LOW_DIM_PICKLE), 'rb') as f:
+        return pickle.load(f)
+
+
+def _index_episodes(folder, pack):
+    entries = {}
+    if not os.path.isdir(folder):
+        return None
+    for name in os.listdir(folder):
+        example_path = os.path.join(folder, name)
+        if not os.path.isdir(example_path) or name.startswith('.'):
+            continue
+        source = os.path.join(example_path, LOW_DIM_PICKLE)
+        if not os.path.exists(source):
+            continue
+        images = {}
+        for camera in CAMERA_FOLDERS:
+            camera_path = os.path.join(example_path, camera)
+            if os.path.isdir(camera_path):
+                images[camera] = len(os.listdir(camera_path))
+        pack_path = os.path.join(example_path, PACK_FILE)
+        packed = os.path.exists(pack_path) and read_pack_header(pack_path).get('source') == _stat_key(source)
+        if pack and not packed:
+            pack_episode(example_path)
+            packed = True
+        if packed:
+            frames = read_pack_header(pack_path)['frames']
+        else:
+            with open(source, 'rb') as f:
+                frames = len(pickle.load(f))
+        entries[name] = {'frames': frames, 'images': images, 'packed': packed, 'source': _stat_key(source)}
+    # taken last, so an episode added while indexing makes the index stale
+    return {'mtime_ns': os.stat(folder).st_mtime_ns, 'episodes': entries}
+
+
+def index_variation(variation_path, pack=False):
+    """Write the index of one ``<task>/variation<n>`` folder, packing the episodes if asked."""
+    index = {'version': INDEX_VERSION, 'descriptions': None}
+    descriptions = os.path.join(variation_path, VARIATION_DESCRIPTIONS)
+    if os.path.exists(descriptions):
+        with open(descriptions, 'rb') as f:
+            index['descriptions'] = pickle.load(f)
+    for group in (EPISODES_FOLDER, FAIL_CASES_FOLDER):
+        entries = _index_episodes(os.path.join(variation_path, group), pack)
+        if entries is not None:
+            index[group] = entries
+    if index['descriptions'] is None and index.get(EPISODES_FOLDER, {}).get('episodes'):
+        first = next(iter(index[EPISODES_FOLDER]['episodes']))
+        demo = load_low_dim(os.path.join(variation_path, EPISODES_FOLDER, first), index[EPISODES_FOLDER]['episodes'][first])
+        descriptions = getattr(demo, 'high_level_instructions', None)
+        index['descriptions'] = list(descriptions) if isinstance(descriptions, (list, tuple)) else descriptions
+    path = os.path.join(variation_path, INDEX_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, default=str)
+    os.replace(path + '.tmp', path)
+    return index
+
+
+def index_dataset(dataset_root, pack=False, tasks=None):
+    """Index every variation of every task under ``dataset_root``; returns the number of episodes."""
+    count = 0
+    for task in sorted(os.listdir(dataset_root)):
+        task_root = os.path.join(dataset_root, task)
+        if not os.path.isdir(task_root) or (tasks and task not in tasks):
+            continue
+        for variation in sorted(os.listdir(task_root)):
+            variation_path = os.path.join(task_root, variation)
+            if variation.startswith('variation') and os.path.isdir(variation_path):
+                index = index_variation(variation_path, pack)
+                count += len(index.get(EPISODES_FOLDER, {}).get('episodes', {}))
+    return count
+
+
+def load_demo_index(variation_path):
+    """Index of a variation folder, cached per process; None if there is none."""
+    path = os.path.join(variation_path, INDEX_FILE)
+    try:
+        key = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _indexes.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'r') as f:
+        index = json.load(f)
+    if index.get('version') != INDEX_VERSION:
+        return None
+    _indexes[path] = (key, index)
+    return index
+
+
+def indexed_episodes(index, examples_path, group=EPISODES_FOLDER):
+    """Episode entries of ``group`` if the index is still current for ``examples_path``, else None."""
+    if index is None or group not in index:
+        return None
+    try:
+        if os.stat(examples_path).st_mtime_ns != index[group]['mtime_ns']:
+            return None
+    except FileNotFoundError:
+        return None
+    return index[group]['episodes']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index (and pack) the recorded demos of a dataset.')
+    parser.add_argument('--dataset_root', type=str, required=True)
+    parser.add_argument('--tasks', type=lambda s: s.split(','), default=None)
+    parser.add_argument('--pack', action='store_true', help='also write the packed low-dim containers')
+    args = parser.parse_args()
+    print('%d episodes indexed' % index_dataset(args.dataset_root, args.pack, args.tasks))
+    sys.exit(0)
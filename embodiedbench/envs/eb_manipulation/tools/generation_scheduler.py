@@ -0,0 +1,272 @@
+"""
+Work-stealing job scheduler for the manipulation data generators.
+
+All (task, variation, episode) work units are enumerated up front. Units whose output
+already exists are skipped, so an interrupted generation resumes exactly where it stopped.
+The pending units are split into contiguous blocks, one per worker process, which keeps a
+worker on the same task and variation as long as possible. A worker takes units from the
+front of its own block; once it runs out it steals from the back of the block with the
+most remaining work, so one slow task or variation does not stall the others.
+
+Every unit is written into a temporary folder next to its final location and renamed
+into place when complete, so a folder ``episode<n>`` always holds a finished unit and no
+lock is needed around disk writes. Each finished, failed, skipped or dropped unit is also
+appended to ``<save_path>/progress.jsonl``.
+
+A unit that fails ends its variation at the episode before it: later units of the variation
+are skipped, and the ones other workers had already finished (stolen from the back of a
+block) are removed once all workers are done, so the episodes of a variation stay numbered
+without holes.
+
+This module does not depend on pyrep/amsolver; the simulator work is done by a
+``UnitGenerator`` subclass in the generator scripts.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import random
+import traceback
+import multiprocessing as mp
+from collections import namedtuple
+
+# same layout as amsolver.backend.const
+EPISODES_FOLDER = 'episodes'
+EPISODE_FOLDER = 'episode%d'
+VARIATIONS_FOLDER = 'variation%d'
+PROGRESS_FILE = 'progress.jsonl'
+
+WorkUnit = namedtuple('WorkUnit', ['task', 'task_name', 'variation', 'episode'])
+
+
+class UnitFailed(Exception):
+    """Raised by ``UnitGenerator.generate`` when a unit cannot be produced; ends its variation before it."""
+
+
+class UnitGenerator:
+    """Simulator work of a generator script, run inside each worker process."""
+
+    def launch(self):
+        """Start the simulator of this process and return it."""
+        raise NotImplementedError
+
+    def shutdown(self, env):
+        env.shutdown()
+
+    def task_name(self, task):
+        """Output folder of a task class, same as ``Task.get_name``."""
+        return re.sub('(?<!^)(?=[A-Z])', '_', task.__name__).lower()
+
+    def variation_count(self, env, task):
+        return env.get_task(task).variation_count()
+
+    def episodes_per_variation(self, task, variation_count):
+        raise NotImplementedError
+
+    def generate(self, env, task, unit, path):
+        """Produce ``unit`` of ``task`` into the (empty) folder ``path``; raise ``UnitFailed`` if it cannot be done."""
+        raise NotImplementedError
+
+
+def unit_path(save_path, unit):
+    return os.path.join(save_path, unit.task_name, VARIATIONS_FOLDER % unit.variation,
+                        EPISODES_FOLDER, EPISODE_FOLDER % unit.episode)
+
+
+def enumerate_units(generator, tasks, variation_counts, variations=-1):
+    """All work units, in task, variation, episode order."""
+    units = []
+    for task_index, task in enumerate(tasks):
+        count = variation_counts[task_index]
+        if variations >= 0:
+            count = min(variations, count)
+        per_variation = generator.episodes_per_variation(task, variation_counts[task_index])
+        name = generator.task_name(task)
+        for variation in range(count):
+            for episode in range(per_variation):
+                units.append(WorkUnit(task_index, name, variation, episode))
+    return units
+
+
+def _count_variations(generator, tasks, queue):
+    env = generator.launch()
+    try:
+        queue.put([generator.variation_count(env, task) for task in tasks])
+    finally:
+        generator.shutdown(env)
+
+
+def count_variations(generator, tasks):
+    """Variation count of every task, from a short-lived simulator process."""
+    queue = mp.Queue()
+    process = mp.Process(target=_count_variations, args=(generator, tasks, queue))
+    process.start()
+    counts = queue.get()
+    process.join()
+    return counts
+
+
+class WorkStealingQueue:
+    """Per-worker blocks of unit indices in shared memory, with one lock per block."""
+
+    def __init__(self, num_units, num_workers):
+        bounds = [num_units * worker // num_workers for worker in range(num_workers + 1)]
+        self.num_workers = num_workers
+        self._head = mp.Array('l', bounds[:-1], lock=False)
+        self._tail = mp.Array('l', bounds[1:], lock=False)
+        self._locks = [mp.Lock() for _ in range(num_workers)]
+
+    def remaining(self, worker):
+        return self._tail[worker] - self._head[worker]
+
+    def pop(self, worker):
+        with self._locks[worker]:
+            if self._head[worker] < self._tail[worker]:
+                self._head[worker] += 1
+                return self._head[worker] - 1
+        return None
+
+    def steal(self, worker):
+        while True:
+            victims = sorted((self.remaining(v), v) for v in range(self.num_workers) if v != worker)
+            victims = [v for remaining, v in reversed(victims) if remaining > 0]
+            if not victims:
+                return None
+            victim = victims[0]
+            with self._locks[victim]:
+                if self._head[victim] < self._tail[victim]:
+                    self._tail[victim] -= 1
+                    return self._tail[victim]
+
+    def get(self, worker):
+        index = self.pop(worker)
+        if index is None:
+            index = self.steal(worker)
+        return index
+
+
+def append_progress(save_path, record):
+    # a single short write with O_APPEND is atomic, workers do not need a lock
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    fd = os.open(os.path.join(save_path, PROGRESS_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _temporary_path(final_path):
+    folder, name = os.path.split(final_path)
+    return os.path.join(folder, '.{}.tmp-{}'.format(name, os.getpid()))
+
+
+def drop_after_failures(save_path, units, first_failed):
+    """Remove the finished units numbered after the first failed episode of their variation.
+
+    ``first_failed`` maps (task, variation) to that episode. Returns the number of units removed.
+    """
+    dropped = 0
+    for unit in units:
+        failed = first_failed.get((unit.task, unit.variation))
+        if failed is None or unit.episode <= failed:
+            continue
+        path = unit_path(save_path, unit)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            append_progress(save_path, {'task': unit.task_name, 'variation': unit.variation,
+                                        'episode': unit.episode, 'status': 'dropped'})
+            dropped += 1
+    return dropped
+
+
+def _worker(worker, generator, tasks, units, groups, queue, aborted, abort_lock, save_path, results):
+    random.seed(None)
+    env = generator.launch()
+    problems = []
+    try:
+        while True:
+            index = queue.get(worker)
+            if index is None:
+                break
+            unit = units[index]
+            record = {'task': unit.task_name, 'variation': unit.variation, 'episode': unit.episode, 'worker': worker}
+            group = groups[index]
+            if 0 <= aborted[group] < unit.episode:
+                append_progress(save_path, dict(record, status='skipped'))
+                continue
+            final_path = unit_path(save_path, unit)
+            tmp_path = _temporary_path(final_path)
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+            os.makedirs(tmp_path)
+            start = time.time()
+            print('Process', worker, '// Task:', unit.task_name, '// Variation:', unit.variation, '// Demo:', unit.episode)
+            try:
+                generator.generate(env, tasks[unit.task], unit, tmp_path)
+            except UnitFailed as e:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                with abort_lock:
+                    # the variation ends before its first failed episode
+                    if aborted[group] < 0 or unit.episode < aborted[group]:
+                        aborted[group] = unit.episode
+                problem = ('Process %d failed collecting task %s (variation: %d, example: %d). '
+                           'Skipping the rest of this task/variation.\n%s\n' % (worker, unit.task_name, unit.variation,
+                                                                                 unit.episode, e))
+                print(problem)
+                problems.append(problem)
+                append_progress(save_path, dict(record, status='failed', error=str(e)))
+                continue
+            os.rename(tmp_path, final_path)
+            append_progress(save_path, dict(record, status='done', seconds=time.time() - start))
+    except Exception:
+        problems.append('Process %d crashed:\n%s' % (worker, traceback.format_exc()))
+        raise
+    finally:
+        results[worker] = ''.join(problems)
+        generator.shutdown(env)
+
+
+def run_generation(generator, tasks, save_path, num_workers, variations=-1, variation_counts=None):
+    """Generate every missing unit of ``tasks`` with ``num_workers`` processes.
+
+    Returns:
+        (number of units generated in this run, problems reported by the workers)
+    """
+    if variation_counts is None:
+        variation_counts = count_variations(generator, tasks)
+    all_units = enumerate_units(generator, tasks, variation_counts, variations)
+    units = [unit for unit in all_units if not os.path.isdir(unit_path(save_path, unit))]
+    print('%d of %d work units left' % (len(units), len(all_units)))
+    if not units:
+        return 0, ''
+    for folder in {os.path.dirname(unit_path(save_path, unit)) for unit in units}:
+        os.makedirs(folder, exist_ok=True)
+        # units interrupted in a previous run
+        for name in os.listdir(folder):
+            if name.startswith('.') and '.tmp-' in name:
+                shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+
+    group_ids = {}
+    groups = [group_ids.setdefault((unit.task, unit.variation), len(group_ids)) for unit in units]
+    num_workers = max(1, min(num_workers, len(units)))
+    queue = WorkStealingQueue(len(units), num_workers)
+    # first failed episode of every group, -1 while none failed
+    aborted = mp.Array('l', [-1] * len(group_ids), lock=False)
+    abort_lock = mp.Lock()
+    manager = mp.Manager()
+    results = manager.dict()
+
+    processes = [mp.Process(target=_worker, args=(worker, generator, tasks, units, groups, queue, aborted,
+                                                  abort_lock, save_path, results))
+                 for worker in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    first_failed = {key: aborted[group] for key, group in group_ids.items() if aborted[group] >= 0}
+    if first_failed:
+        # including the units of the variation finished in a previous run
+        print('%d finished units after a failed one removed' % drop_after_failures(save_path, all_units, first_failed))
+    done = sum(os.path.isdir(unit_path(save_path, unit)) for unit in units)
+    return done, ''.join(results.get(worker, '') for worker in range(num_workers))
@@ -0,0 +1,202 @@
+"""
+Content-addressed store of the grasp poses computed by Grasploc.
+
+A grasp analysis is identified by the hash of the exported mesh together with everything
+else that changes its result: the crop box, the object scale and origin, and the Grasploc
+sampling and gripper parameters. The poses are stored as ``<root>/<key[:2]>/<key>.npy``,
+so two parts sharing a mesh file name no longer collide, and an unchanged mesh exported
+again is a cache hit instead of a rebuild.
+
+Next to every exported mesh ``<name>.ply`` a ``<name>.grasp.json`` spec records the
+parameters it was analysed with; ``precompute_grasp_poses.py`` uses these specs to fill
+the store offline. The object models keep referencing the ``.pkl`` pose files, which are
+written from the store and loaded through ``load_grasp_poses`` at scene setup.
+"""
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+
+import numpy as np
+
+MANIPULATION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE = os.path.join(MANIPULATION_DIR, 'vlm', 'grasp_poses')
+SPEC_SUFFIX = '.grasp.json'
+
+# Grasploc arguments that change the computed poses
+GRASP_PARAMS = ('pcd_sample_voxel_size', 'grasp_sample_voxel_size', 'min_num_points_between_proportion',
+                'max_num_points_intefering', 'min_grasp_distance', 'finger_max_distance', 'finger_width',
+                'finger_thickness', 'rotation_sample', 'finger_length', 'meshlab_sampling_file')
+
+_loaded = {}
+
+
+def _canonical(value, digits=6):
+    """Json-able copy of ``value`` with floats rounded, so simulator noise does not change the key."""
+    if isinstance(value, dict):
+        return {key: _canonical(item, digits) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(item, digits) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), digits) + 0.0
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def make_spec(origin_matrix, scale=1.0, crop_bounds=None, crop_transform=None, use_meshlab=True, output_file=None):
+    """Parameters of one grasp analysis; ``crop_bounds`` as [x_min, x_max, y_min, y_max, z_min, z_max]."""
+    spec = {
+        'origin': _canonical(origin_matrix),
+        'scale': _canonical(scale),
+        'crop': None,
+        'use_meshlab': bool(use_meshlab),
+    }
+    if crop_bounds is not None:
+        spec['crop'] = {'bounds': _canonical(crop_bounds), 'transform': _canonical(crop_transform)}
+    if output_file is not None:
+        spec['output_file'] = os.path.basename(output_file)
+    return spec
+
+
+def spec_path(mesh_file):
+    return os.path.splitext(mesh_file)[0] + SPEC_SUFFIX
+
+
+def write_spec(mesh_file, spec):
+    with open(spec_path(mesh_file), 'w') as f:
+        json.dump(spec, f, indent=1)
+
+
+def read_spec(mesh_file):
+    with open(spec_path(mesh_file), 'r') as f:
+        return json.load(f)
+
+
+def default_args(spec=None, mesh_file=None):
+    from tools.grasploc import define_default_args
+    args = define_default_args([])
+    if mesh_file is not None:
+        args.input_file = mesh_file
+    if spec is not None:
+        args.use_meshlab = spec['use_meshlab']
+        if spec['crop'] is not None:
+            args.no_crop = False
+            args.crop_box_transform = np.asarray(spec['crop']['transform'])
+            (args.crop_x_min, args.crop_x_max, args.crop_y_min,
+             args.crop_y_max, args.crop_z_min, args.crop_z_max) = spec['crop']['bounds']
+    return args
+
+
+def grasp_pose_key(mesh_file, spec, args=None):
+    """Hash of the mesh content, the analysis spec and the Grasploc parameters."""
+    if args is None:
+        args = default_args(spec)
+    digest = hashlib.sha256()
+    with open(mesh_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    params = {name: getattr(args, name) for name in GRASP_PARAMS}
+    if params.get('meshlab_sampling_file') is not None:
+        params['meshlab_sampling_file'] = os.path.basename(params['meshlab_sampling_file'])
+    key_spec = {name: value for name, value in spec.items() if name != 'output_file'}
+    digest.update(json.dumps({'spec': key_spec, 'params': _canonical(params)}, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _atomic_write(path, write):
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class GraspPoseStore:
+    def __init__(self, root=DEFAULT_STORE):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + '.npy')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def put(self, key, poses):
+        _atomic_write(self.path(key), lambda f: np.save(f, np.asarray(poses)))
+
+
+def compute_grasp_poses(mesh_file, spec, args=None):
+    """Run Grasploc on ``mesh_file``, returns the (N, 4, 4) grasp poses in the object frame."""
+    from tools.grasploc import Grasploc
+    if args is None:
+        args = default_args(spec, mesh_file)
+    fd, args.output_file = tempfile.mkstemp(suffix='.pkl')
+    os.close(fd)
+    try:
+        gl = Grasploc(args)
+        gl.run(np.asarray(spec['origin']))
+    finally:
+        os.remove(args.output_file)
+    if gl.se3_output is None:
+        raise RuntimeError('no grasp poses found for {}'.format(mesh_file))
+    return gl.se3_output
+
+
+def write_pose_file(path, poses):
+    """Write the poses in the pickle format referenced by the object model json."""
+    _atomic_write(path, lambda f: pickle.dump(np.asarray(poses), f))
+
+
+def grasp_poses_for_mesh(mesh_file, spec, store=None, output_file=None, reuse_output=False):
+    """Poses of ``mesh_file`` from the store, computing and storing them on a miss.
+
+    With ``reuse_output`` an existing ``output_file`` from before the store is taken over
+    on a miss instead of running Grasploc again.
+
+    Returns:
+        (poses, whether they were computed)
+    """
+    store = store or GraspPoseStore()
+    args = default_args(spec, mesh_file)
+    key = grasp_pose_key(mesh_file, spec, args)
+    poses = store.get(key)
+    computed = poses is None
+    if computed and reuse_output and output_file is not None and os.path.exists(output_file):
+        with open(output_file, 'rb') as f:
+            poses = pickle.load(f)
+        computed = False
+        store.put(key, poses)
+    elif computed:
+        poses = compute_grasp_poses(mesh_file, spec, args)
+        store.put(key, poses)
+    if output_file is not None:
+        write_pose_file(output_file, poses)
+    return poses, computed
+
+
+def load_grasp_poses(path):
+    """Pose file of an object model, loaded once per process and shared by all instances."""
+    stat = os.stat(path)
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    with open(path, 'rb') as f:
+        poses = pickle.load(f)
+    if isinstance(poses, np.ndarray):
+        poses.setflags(write=False)
+    _loaded[path] = ((stat.st_mtime_ns, stat.st_size), poses)
+    return poses
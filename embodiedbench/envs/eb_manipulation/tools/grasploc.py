@@ -1,9 +1,10 @@
-import open3d as o3d
 import argparse
 import numpy as np
 from itertools import combinations
 import pickle
 import os
+from collections import namedtuple
+from scipy.spatial import cKDTree
 from distutils.util import strtobool
 
 class GraspPoint:
@@ -16,6 +17,147 @@ class GraspPoint:
         self.neighbor_idx = idx
         self.bbox3d = bbox3d # x, y, z: x is length along normal, z is length along principal
 
+FINGER_PERCENTS = (0.1, 0.2, 0.4, 0.5)
+
+GraspCandidates = namedtuple('GraspCandidates', ['centroids', 'normals', 'principals', 'n_between', 'n_around'])
+
+
+def voxel_down_sample(points, voxel_size):
+    """Mean of the points in every voxel, with the voxel grid of open3d's voxel_down_sample."""
+    min_bound = points.min(axis=0) - voxel_size * 0.5
+    voxels = np.floor((points - min_bound) / voxel_size).astype(np.int64)
+    keys = np.ravel_multi_index(voxels.T, voxels.max(axis=0) + 1)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    sums = np.stack([np.bincount(inverse, weights=points[:, axis], minlength=len(counts)) for axis in range(3)], axis=1)
+    return sums / counts[:, None]
+
+
+def estimate_normals(points, query_points=None, knn=30, tree=None, chunk=65536):
+    """Unoriented normals at query_points (default: all points) from the covariance of their knn nearest points."""
+    tree = cKDTree(points) if tree is None else tree
+    query_points = points if query_points is None else query_points
+    normals = np.empty((len(query_points), 3))
+    for start in range(0, len(query_points), chunk):
+        _, idx = tree.query(query_points[start:start + chunk], k=min(knn, len(points)), workers=-1)
+        neighbors = points[idx.reshape(len(idx), -1)]
+        neighbors = neighbors - neighbors.mean(axis=1, keepdims=True)
+        _, vectors = np.linalg.eigh(np.einsum('nki,nkj->nij', neighbors, neighbors))
+        normals[start:start + chunk] = vectors[:, :, 0]
+    return normals
+
+
+def grasp_candidates(points, tree, samples, sample_normals, finger_thickness, finger_max_distance, finger_width, finger_length,
+                     rotation_sample, finger_percents=FINGER_PERCENTS, block_elements=1 << 20):
+    """Point counts between and around the fingers for every grasp candidate.
+
+    The candidates are ordered like the loops of the original find_grasp1: sample, normal sign (+/-),
+    finger percent, rotation about the normal. The centroids of a sample all lie on its normal, so the
+    in-plane finger tests of a point are shared by both signs and all finger percents; only the test
+    along the normal and the search sphere differ. Blocks of samples are evaluated against the points
+    near them, and the two tests are combined into counts with a batched matrix product.
+    """
+    ft, fd, fw, fl = finger_thickness, finger_max_distance, finger_width, finger_length
+    percents = np.asarray(finger_percents, dtype=float)
+    num_percents = len(percents)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normals = sample_normals / np.linalg.norm(sample_normals, axis=1, keepdims=True)
+        # principal orthogonal to the normal, from the x axis; the same for both normal signs
+        principals = np.array([1.0, 0.0, 0.0]) - normals[:, :1] * normals
+        principals = principals / np.linalg.norm(principals, axis=1, keepdims=True)
+    others = np.cross(principals, normals)
+    # rotations r and r + rotation_sample/2 only swap the two fingers
+    num_rotations = rotation_sample // 2 if rotation_sample % 2 == 0 else rotation_sample
+    theta = np.pi * 2 / rotation_sample * np.arange(num_rotations)
+    cos, sin = np.cos(theta), np.sin(theta)
+    radius = np.sqrt(ft**2 + (fd + 2*fw)**2 + fl**2) / 2
+    reach = radius + fl * percents.max()
+
+    counts_between = np.zeros((len(samples), 2 * num_percents, num_rotations))
+    counts_around = np.zeros((len(samples), 2 * num_percents, num_rotations))
+    start, step = 0, 16
+    while start < len(samples):
+        end = min(start + step, len(samples))
+        block = samples[start:end]
+        center = block.mean(axis=0)
+        extent = np.sqrt(np.max(np.sum((block - center)**2, axis=1)))
+        local = points[tree.query_ball_point(center, r=reach + extent)]
+        step = int(np.clip(step * block_elements / max(len(local) * (end - start), 1), 1, 1024))
+        if len(local) < 2:
+            start = end
+            continue
+        count = end - start
+        # coordinates of the points relative to every sample: along its normal (+ sign) and in the grasp plane
+        along = normals[start:end] @ local.T - np.einsum('ij,ij->i', normals[start:end], block)[:, None]
+        on_principal = principals[start:end] @ local.T - np.einsum('ij,ij->i', principals[start:end], block)[:, None]
+        on_other = others[start:end] @ local.T - np.einsum('ij,ij->i', others[start:end], block)[:, None]
+        in_plane = on_principal**2 + on_other**2
+
+        between_fingers = np.empty((count, num_rotations, len(local)), dtype=np.float32)
+        around_fingers = np.empty((count, num_rotations, len(local)), dtype=np.float32)
+        for r in range(num_rotations):
+            # principal = cos * principal + sin * other, cross = normal x principal = sin * principal - cos * other
+            in_thickness = np.abs(cos[r] * on_principal + sin[r] * on_other) < ft / 2
+            on_cross = np.abs(sin[r] * on_principal - cos[r] * on_other)
+            between_fingers[:, r] = in_thickness & (on_cross < fd / 2)
+            around_fingers[:, r] = in_thickness & (on_cross < fd / 2 + fw)
+
+        between_normal = np.empty((count, 2 * num_percents, len(local)), dtype=np.float32)
+        around_normal = np.empty((count, 2 * num_percents, len(local)), dtype=np.float32)
+        rows = np.arange(count)
+        for i, sign in enumerate((1.0, -1.0)):
+            for k, f_p in enumerate(percents):
+                offset = sign * along - fl * f_p
+                dist = in_plane + offset**2
+                within = dist <= radius**2
+                # the nearest neighbor is left out, like idx[1:] of the distance-sorted open3d radius search
+                within[rows, np.argmin(dist, axis=1)] = False
+                between_normal[:, i * num_percents + k] = within & (np.abs(offset) < fl / 2)
+                # extend between area distance of finger width along +/-cross and -normal
+                around_normal[:, i * num_percents + k] = within & (offset < fl / 2) & (offset > -fl / 2 - fw)
+        counts_between[start:end] = np.matmul(between_normal, between_fingers.transpose(0, 2, 1))
+        counts_around[start:end] = np.matmul(around_normal, around_fingers.transpose(0, 2, 1))
+        start = end
+
+    # back to all rotations; the other normal sign mirrors the grasp plane, rotation r becomes -r
+    r = np.arange(rotation_sample)
+    index = np.stack([r % num_rotations, (-r % rotation_sample) % num_rotations])
+    shape = (len(samples), 2, num_percents, rotation_sample)
+    n_between = np.take_along_axis(counts_between.reshape(len(samples), 2, num_percents, num_rotations),
+                                   np.broadcast_to(index[None, :, None, :], shape), axis=3)
+    n_around = np.take_along_axis(counts_around.reshape(len(samples), 2, num_percents, num_rotations),
+                                  np.broadcast_to(index[None, :, None, :], shape), axis=3) - n_between
+
+    signed = np.stack([normals, -normals], axis=1)
+    centroids = samples[:, None, None, :] + fl * percents[None, None, :, None] * signed[:, :, None, :]
+    theta = np.pi * 2 / rotation_sample * r
+    signed_others = np.stack([others, -others], axis=1)
+    rotated = (np.cos(theta)[None, None, :, None] * principals[:, None, None, :]
+               + np.sin(theta)[None, None, :, None] * signed_others[:, :, None, :])
+    return GraspCandidates(np.repeat(centroids.reshape(-1, 3), rotation_sample, axis=0),
+                           np.repeat(np.repeat(signed, num_percents, axis=1).reshape(-1, 3), rotation_sample, axis=0),
+                           np.broadcast_to(rotated[:, :, None], (len(samples), 2, num_percents, rotation_sample, 3)).reshape(-1, 3),
+                           n_between.reshape(-1).astype(np.int64), n_around.reshape(-1).astype(np.int64))
+
+
+def select_grasps(candidates, min_num_points_in_grasp, max_num_points_intefering, min_grasps=10):
+    """Indices of the accepted candidates, halving the point threshold until more than min_grasps are found.
+
+    As in the original search, every pass appends its accepted candidates to those of the previous passes.
+    """
+    selected = []
+    while len(selected) <= min_grasps:
+        accepted = (candidates.n_between > min_num_points_in_grasp) & (candidates.n_around < max_num_points_intefering)
+        selected.extend(np.flatnonzero(accepted).tolist())
+        if len(selected) <= min_grasps:
+            if min_num_points_in_grasp < 1:
+                # the counts are integers, a lower threshold cannot accept more candidates
+                break
+            min_num_points_in_grasp = min_num_points_in_grasp*0.5
+            print('Release the min_num_points_in_grasp to {}'.format(min_num_points_in_grasp))
+    return selected
+
+
 class Grasploc:
     def __init__(self, args):
         self.args = args
@@ -33,6 +175,7 @@ class Grasploc:
             self.save_result(origin_offset)
     
     def preprocess(self):
+        import open3d as o3d
          # sample grasp pose on surface (self.pcd), but calculate normal, principal based on volume samples (self.densepcd)
         if self.args.use_meshlab:
             try:
@@ -76,79 +219,30 @@ class Grasploc:
             return 0
 
     def find_grasp1(self):
-        self.pcd.estimate_normals()
-        pcd_tree = o3d.geometry.KDTreeFlann(self.pcd)
+        points = np.asarray(self.pcd.points)
+        tree = cKDTree(points)
         ft, fd, fw, fl = self.args.finger_thickness, self.args.finger_max_distance, self.args.finger_width, self.args.finger_length
-        # The minimum number of points that are required to be inside of a grasp
-        self.downpcd = self.pcd.voxel_down_sample(voxel_size=self.args.grasp_sample_voxel_size)
-        while len(self.downpcd.points)>2000:
+        samples = voxel_down_sample(points, self.args.grasp_sample_voxel_size)
+        while len(samples)>2000:
             self.args.grasp_sample_voxel_size = self.args.grasp_sample_voxel_size*1.2
-            self.downpcd = self.pcd.voxel_down_sample(voxel_size=self.args.grasp_sample_voxel_size)
-        self.downpcd.paint_uniform_color([1, 0, 0])
-        # if self.args.vis_debug:
-        #     geoms = []
-        #     self.pcd.paint_uniform_color([0.8, 0.8, 0.8])
-        #     geoms.append(self.pcd)
-        #     geoms.append(self.downpcd)
-        #     o3d.visualization.draw_geometries(geoms, point_show_normal=True)
-        # for pt, nm in zip(self.pcd.points[::dr], self.pcd.normals[::dr]):
-        print('num of samples:', len(self.downpcd.points))
+            samples = voxel_down_sample(points, self.args.grasp_sample_voxel_size)
+        # normals of the grasp samples, estimated on the dense point cloud
+        sample_normals = estimate_normals(points, samples, tree=tree)
+        print('num of samples:', len(samples))
+        # The minimum number of points that are required to be inside of a grasp
         min_num_points_in_grasp = (fd*fl + fl*ft + fd*ft) / self.args.pcd_sample_voxel_size**2 * self.args.min_num_points_between_proportion
         min_num_points_in_grasp *= self.crop_factor / 2
-        while len(self.grasp_points) <= 10:
-            for i, (pt, nm) in enumerate(zip(self.downpcd.points, self.downpcd.normals)):
-                print(i, '/', len(self.downpcd.points))
-                # grasp along negative normal, aka pointing inward object orthogonal to local surface
-                # do it for positive and negative direction as calculated normal is not always pointing inwards
-                for normal in [nm, -nm]:
-                    # create a cuboid of the volume between two fingers ((finger distance + 2*finger width) * finger_thickness * finger length), 
-                    # here finger distance can be 0-max distance
-                    # rotate about normal to find axis connecting two fingers that has blank space on both sides for fingers while has points between, 
-                    # (optional) the side surface direction should be consistent with finger's direction
-                    # 1. generate principal samples on orthogonal plane of normal
-                    normal = normal / np.linalg.norm(normal)
-                    finger_percents=[0.1, 0.2,0.4,0.5]
-                    for f_p in finger_percents:
-                        centroid = pt + fl*f_p * normal
-                        tmp = np.array([1, 0, 0])
-                        principal = tmp - np.dot(tmp, normal) * normal
-                        principal = principal / np.linalg.norm(principal)
-                        theta = np.pi * 2 / self.args.rotation_sample
-                        principals = [np.cos(i*theta) * principal + np.sin(i*theta) * np.cross(principal, normal) for i in range(self.args.rotation_sample)]
-                        principals = [p / np.linalg.norm(p) for p in principals]
-                        # 2. create cuboid along normal and principal direction, normal <-> finger length; principal <-> finger thickness; cross <-> grasp aperture
-                        # check point num between two fingers and on two sides
-                        radius = np.sqrt(ft**2 + (fd + 2*fw)**2 + fl**2) / 2
-                        _, idx, _ = pcd_tree.search_radius_vector_3d(centroid, radius=radius)
-                        pt_offset = np.asarray(self.pcd.points)[idx[1:], :] - centroid
-                        for principal in principals:
-                            cross = np.cross(normal, principal)
-                            # for aperture in np.linspace(self.args.min_grasp_distance, fd, 10):
-                            between_conditions = [np.abs(pt_offset @ normal) < fl / 2, np.abs(pt_offset @ principal) < ft / 2, np.abs(pt_offset @ cross) < fd / 2]
-                            # extend between area distance of finger width along +/-cross and -normal
-                            around_conditions = [pt_offset @ normal < fl / 2, pt_offset @ normal > -fl / 2 - fw, np.abs(pt_offset @ principal) < ft / 2, np.abs(pt_offset @ cross) < fd / 2 + fw]
-                            n_between = np.sum(np.bitwise_and.reduce(between_conditions))
-                            n_around = np.sum(np.bitwise_and.reduce(around_conditions)) - n_between
-                            # print(n_between, min_num_points_in_grasp, n_around, self.args.max_num_points_intefering)
-                            if n_between > min_num_points_in_grasp and n_around < self.args.max_num_points_intefering:
-                                grasp = GraspPoint(centroid, normal, principal, fd, None, None, [ft, fd, fl])
-                                self.grasp_points.append(grasp)
-                                # grasp.normal = -grasp.normal
-                                # grasp.principal = -grasp.principal
-                                # self.grasp_points.append(grasp)
-                                # print('found a grasp')
-                                # self.visual_check(grasp, vis_bbox=True)
-            if len(self.grasp_points)<=10:
-                min_num_points_in_grasp = min_num_points_in_grasp*0.5
-                print('Release the min_num_points_in_grasp to {}'.format(min_num_points_in_grasp))
-            elif len(self.grasp_points) == 0:
-                self.args.grasp_sample_voxel_size = self.args.grasp_sample_voxel_size*0.8
-                self.downpcd = self.pcd.voxel_down_sample(voxel_size=self.args.grasp_sample_voxel_size)
-                print('Grasp poses are too litte. Resample the point cloud with {}'.format(self.args.grasp_sample_voxel_size))
+        candidates = grasp_candidates(points, tree, samples, sample_normals, ft, fd, fw, fl, self.args.rotation_sample)
+        selected = select_grasps(candidates, min_num_points_in_grasp, self.args.max_num_points_intefering)
+        self.grasp_points = [GraspPoint(candidates.centroids[i], candidates.normals[i], candidates.principals[i], fd, None, None, [ft, fd, fl])
+                             for i in selected]
         print('grasp candidates:', len(self.grasp_points))
-        
+
     def visual_check(self, grasp=None, vis_bbox=False):
+        import open3d as o3d
         # visualization, create cylinder
+        if not self.pcd.has_normals():
+            self.pcd.estimate_normals()
         geoms = []
         self.pcd.paint_uniform_color([0.8, 0.8, 0.8])
         geoms.append(self.pcd)
@@ -227,7 +321,7 @@ class Grasploc:
         print('grasp poses loaded from', self.args.output_file)
 
 
-def define_default_args():
+def define_default_args(argv=None):
     parser = argparse.ArgumentParser()
     # point cloud, grasp sample density
     parser.add_argument('--use_meshlab',type=lambda x:bool(strtobool(x)), default=True, help='whether use meshlab to sample the mesh')
@@ -261,7 +355,7 @@ def define_default_args():
     parser.add_argument('--meshlab_sampling_file', type=str, default='./tools/meshlab_stratified_sampling.mlx', help='sampling script using meshlab')
     parser.add_argument('--vis_debug', type=lambda x:bool(strtobool(x)), default=False, help='visualize temporary results for debugging')
     parser.add_argument('--frame_size', type=float, default=0.01, help='coordinate frame size in visualization')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 
@@ -0,0 +1,88 @@
+"""
+Fill the grasp pose store for every object model with a process pool.
+
+Every exported mesh under the model folder that has a ``<name>.grasp.json`` spec (written
+by ``get_local_grasp_pose``) is analysed once; meshes already in the store only get their
+``.pkl`` pose file rewritten. Run from the eb_manipulation folder, like the other tools:
+
+    python tools/precompute_grasp_poses.py --processes 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+from os.path import join, dirname, abspath
+
+CURRENT_DIR = dirname(abspath(__file__))
+sys.path.insert(0, join(CURRENT_DIR, '..'))
+from tools.grasp_pose_store import (DEFAULT_STORE, SPEC_SUFFIX, GraspPoseStore, read_spec, spec_path,
+                                    grasp_poses_for_mesh)
+
+
+def find_jobs(model_dir):
+    """Meshes with a spec, and pose files referenced by a model json whose mesh has none."""
+    jobs, missing = [], []
+    for root, _, files in os.walk(model_dir):
+        for name in sorted(files):
+            path = join(root, name)
+            if name.endswith('.ply') and not name.endswith('_meshlab.ply'):
+                if os.path.exists(spec_path(path)):
+                    jobs.append(path)
+            elif name.endswith('.json') and not name.endswith(SPEC_SUFFIX):
+                try:
+                    with open(path, 'r') as f:
+                        config = json.load(f)
+                    parts = config.get('parts', [])
+                except (ValueError, AttributeError):
+                    continue
+                for part in parts:
+                    pose_file = part.get('local_grasp_pose_path') if isinstance(part, dict) else None
+                    if pose_file and not os.path.exists(spec_path(join(root, pose_file[:-4] + '.ply'))):
+                        missing.append(join(root, pose_file))
+    return jobs, missing
+
+
+def _process(job):
+    mesh_file, store_root = job
+    start = time.time()
+    try:
+        spec = read_spec(mesh_file)
+        output_file = join(dirname(mesh_file), spec.get('output_file', os.path.basename(mesh_file)[:-4] + '.pkl'))
+        poses, computed = grasp_poses_for_mesh(mesh_file, spec, GraspPoseStore(store_root), output_file)
+        return mesh_file, 'computed' if computed else 'cached', len(poses), time.time() - start, None
+    except Exception as e:
+        return mesh_file, 'failed', 0, time.time() - start, repr(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the grasp poses of all object models.')
+    parser.add_argument('--model_dir', type=str, default=abspath(join(CURRENT_DIR, '..', 'vlm', 'object_models')))
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--list', action='store_true', help='only list the meshes that would be processed')
+    args = parser.parse_args()
+
+    jobs, missing = find_jobs(args.model_dir)
+    for pose_file in missing:
+        print('no grasp spec for {}, run save_model.py once for this model'.format(pose_file))
+    if args.list:
+        for mesh_file in jobs:
+            print(mesh_file)
+        return
+    counts = {'computed': 0, 'cached': 0, 'failed': 0}
+    start = time.time()
+    with mp.Pool(max(1, min(args.processes, len(jobs) or 1))) as pool:
+        for mesh_file, status, num_poses, seconds, error in pool.imap_unordered(
+                _process, [(mesh_file, args.store) for mesh_file in jobs]):
+            counts[status] += 1
+            print('{:<9} {:>5} poses {:>7.1f}s  {}{}'.format(status, num_poses, seconds, mesh_file,
+                                                              '  ' + error if error else ''))
+    print('{} meshes in {:.1f}s: {computed} computed, {cached} from the store, {failed} failed'.format(
+        len(jobs), time.time() - start, **counts))
+    sys.exit(1 if counts['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
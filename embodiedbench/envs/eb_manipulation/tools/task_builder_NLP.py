@@ -77,14 +77,14 @@ class LoadedTask(object):
         if len(task_file) > 3 and task_file[-3:] != '.py':
             task_file += '.py'
         try:
-            task_class = name_to_task_class(task_file, parent_folder=self.parent_folder)
+            task_class = name_to_task_class(task_file, parent_folder=self.parent_folder, reload=True)
         except:
             print('There was no task named: %s. '
                   'Would you like to create it?' % task_file)
             inp = input()
             if inp == 'y':
                 self._create_python_file(task_file)
-                task_class = name_to_task_class(task_file, parent_folder=self.parent_folder)
+                task_class = name_to_task_class(task_file, parent_folder=self.parent_folder, reload=True)
             else:
                 print('Pick a defined task in that case...')
                 task_class, task_file = self._edit_new_task()
@@ -107,7 +107,7 @@ class LoadedTask(object):
 
     def reload_python(self):
         try:
-            task_class = name_to_task_class(self.task_file, parent_folder=self.parent_folder)
+            task_class = name_to_task_class(self.task_file, parent_folder=self.parent_folder, reload=True)
         except Exception as e:
             print_fail('The python file could not be loaded!')
             traceback.print_exc()
@@ -0,0 +1,100 @@
+"""
+Process-wide registry of the task classes of a task package (``vlm.tasks``, ``amsolver.tasks``).
+
+The task files of a package are listed once, and a task module is imported the first time
+its class is asked for; later lookups are a dictionary hit. Modules are no longer reloaded
+on every lookup. Reloading is explicit: ``get(..., reload=True)``, ``TaskRegistry.reload``,
+or ``AMSOLVER_TASK_HOT_RELOAD=1`` in the environment, which re-imports a task module
+whenever its source file changed since it was loaded (for editing tasks while the
+simulator keeps running).
+"""
+import os
+import threading
+import importlib
+import importlib.util
+
+HOT_RELOAD_ENV = 'AMSOLVER_TASK_HOT_RELOAD'
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def task_module_name(task_file):
+    return task_file.replace('.py', '')
+
+
+def task_class_name(task_file):
+    return ''.join([w[0].upper() + w[1:] for w in task_module_name(task_file).split('_')])
+
+
+def _source_mtime(module):
+    path = getattr(module, '__file__', None)
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
+
+
+class TaskRegistry:
+    def __init__(self, parent_folder, hot_reload=None):
+        self.package = parent_folder + '.tasks'
+        if hot_reload is None:
+            hot_reload = os.environ.get(HOT_RELOAD_ENV, '0') not in ('', '0', 'false', 'False')
+        self.hot_reload = hot_reload
+        self._names = None
+        # task module name -> (class, module, source mtime)
+        self._classes = {}
+        # task module names whose module is re-imported on the next lookup
+        self._stale = set()
+        self._lock = threading.RLock()
+
+    def task_names(self):
+        """Module names of all task files of the package, sorted; listed once."""
+        if self._names is None:
+            spec = importlib.util.find_spec(self.package)
+            names = set()
+            for folder in (spec.submodule_search_locations or []) if spec is not None else []:
+                names.update(f[:-3] for f in os.listdir(folder) if f.endswith('.py') and f != '__init__.py')
+            self._names = sorted(names)
+        return list(self._names)
+
+    def get(self, task_file, reload=False):
+        """Task class of ``task_file`` (``pick_cube`` or ``pick_cube.py``).
+
+        Raises the ModuleNotFoundError or AttributeError of a missing module or class.
+        """
+        name = task_module_name(task_file)
+        cached = self._classes.get(name)
+        if cached is not None and not reload and not (self.hot_reload and _source_mtime(cached[1]) != cached[2]):
+            return cached[0]
+        with self._lock:
+            module = importlib.import_module('%s.%s' % (self.package, name))
+            if reload or cached is not None or name in self._stale:
+                module = importlib.reload(module)
+            task_class = getattr(module, task_class_name(name))
+            self._classes[name] = (task_class, module, _source_mtime(module))
+            self._stale.discard(name)
+            return task_class
+
+    def reload(self, task_file=None):
+        """Forget the cached classes (all, or of one task file) and the task list.
+
+        The next ``get`` of a forgotten task re-imports its module.
+        """
+        with self._lock:
+            self._names = None
+            names = list(self._classes) if task_file is None else [task_module_name(task_file)]
+            for name in names:
+                if self._classes.pop(name, None) is not None:
+                    self._stale.add(name)
+
+    def __contains__(self, task_file):
+        return task_module_name(task_file) in self.task_names()
+
+
+def get_task_registry(parent_folder='vlm'):
+    registry = _registries.get(parent_folder)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(parent_folder, TaskRegistry(parent_folder))
+    return registry
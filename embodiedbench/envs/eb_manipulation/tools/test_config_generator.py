@@ -1,4 +1,3 @@
-from multiprocessing import Process, Manager
 from time import time
 import cv2
 from pyrep.objects.dummy import Dummy
@@ -11,14 +10,15 @@ sys.path.insert(0, join(CURRENT_DIR, '..'))  # Use local amsolver rather than in
 from amsolver import ObservationConfig
 from amsolver.action_modes import ActionMode
 from amsolver.backend.utils import task_file_to_task_class
+from tools.task_registry import get_task_registry
 from amsolver.environment import Environment
 import amsolver.backend.task as task
+from generation_scheduler import UnitGenerator, UnitFailed, run_generation
 
 import os
 import pickle
 from PIL import Image
 from amsolver.backend import utils
-from amsolver.backend.const import *
 import numpy as np
 import random
 
@@ -110,118 +110,56 @@ def save_demo(task_base, waypoint_sets, config, example_path):
     task_base.save_model(os.path.join(example_path, "task_base.ttm"))
     waypoint_sets.save_model(os.path.join(example_path, "waypoint_sets.ttm"))
 
-def run(i, lock, task_index, variation_count, results, file_lock, tasks):
-    """Each thread will choose one task and variation, and then gather
-    all the episodes_per_task for that variation."""
-
-    # Initialise each thread with random seed
-    np.random.seed(None)
-    num_tasks = len(tasks)
-
-    img_size = list(map(int, FLAGS.image_size))
-
-    obs_config = ObservationConfig()
-    obs_config.set_all_high_dim(False)
-    obs_config.set_all_low_dim(True)
-
-    amsolver_env = Environment(
-        action_mode=ActionMode(),
-        obs_config=obs_config,
-        headless=True)
-    amsolver_env.launch()
-    # recorder = Recorder()
-    recorder = None
-    task_env = None
-
-    tasks_with_problems = results[i] = ''
-
-    while True:
-        # Figure out what task/variation this thread is going to do
-        with lock:
-
-            if task_index.value >= num_tasks:
-                print('Process', i, 'finished')
+class ConfigGenerator(UnitGenerator):
+    """Saves the scene configs (task_base, waypoint_sets, configs.pkl) of one episode per unit."""
+
+    def __init__(self):
+        self._task = None
+        self._variation = None
+        self._task_env = None
+
+    def launch(self):
+        # Initialise each process with random seed
+        np.random.seed(None)
+        obs_config = ObservationConfig()
+        obs_config.set_all_high_dim(False)
+        obs_config.set_all_low_dim(True)
+
+        amsolver_env = Environment(
+            action_mode=ActionMode(),
+            obs_config=obs_config,
+            headless=True)
+        amsolver_env.launch()
+        return amsolver_env
+
+    def episodes_per_variation(self, task, variation_count):
+        if FLAGS.episodes_per_task_all_variations > 0:
+            return FLAGS.episodes_per_task_all_variations // variation_count
+        return FLAGS.episodes_per_task
+
+    def generate(self, env, task, unit, path):
+        if task is not self._task:
+            self._task_env = env.get_task(task)
+            self._task, self._variation = task, None
+        if unit.variation != self._variation:
+            self._task_env.set_variation(unit.variation)
+            self._variation = unit.variation
+
+        attempts = 10
+        while True:
+            try:
+                task_base, waypoint_sets, config = self._task_env.save_config()
                 break
-
-            my_variation_count = variation_count.value
-            t = tasks[task_index.value]
-            task_env = amsolver_env.get_task(t)
-            var_target = task_env.variation_count()
-            if FLAGS.variations >= 0:
-                var_target = np.minimum(FLAGS.variations, var_target)
-            if my_variation_count >= var_target:
-                # If we have reached the required number of variations for this
-                # task, then move on to the next task.
-                variation_count.value = my_variation_count = 0
-                task_index.value += 1
-
-            variation_count.value += 1
-            if task_index.value >= num_tasks:
-                print('Process', i, 'finished')
-                break
-            t = tasks[task_index.value]
-
-        task_env = amsolver_env.get_task(t)
-        task_env.set_variation(my_variation_count)
-
-        if FLAGS.episodes_per_task_all_variations>0:
-            FLAGS.episodes_per_task = (FLAGS.episodes_per_task_all_variations // task_env.variation_count())
-        variation_path = os.path.join(
-            FLAGS.save_path, task_env.get_name(),
-            VARIATIONS_FOLDER % my_variation_count)
-
-        check_and_make(variation_path)
-
-        episodes_path = os.path.join(variation_path, EPISODES_FOLDER)
-        check_and_make(episodes_path)
-        current_episodes = os.listdir(episodes_path)
-
-        abort_variation = False
-        ex_idx = len(current_episodes)
-        # for ex_idx in range(FLAGS.episodes_per_task):
-        while ex_idx<FLAGS.episodes_per_task:
-            print('Process', i, '// Task:', task_env.get_name(),
-                  '// Variation:', my_variation_count, '// Demo:', ex_idx)
-            attempts = 10
-            while attempts > 0:
-                try:
-                    task_base, waypoint_sets, config = task_env.save_config()
-                    if recorder is not None:
-                        recorder.take_snap()
-                except Exception as e:
-                    print(e)
-                    attempts -= 1
-                    if attempts > 0:
-                        continue
-                    problem = (
-                        'Process %d failed collecting task %s (variation: %d, '
-                        'example: %d). Skipping this task/variation.\n%s\n' % (
-                            i, task_env.get_name(), my_variation_count, ex_idx,
-                            str(e))
-                    )
-                    print(problem)
-                    tasks_with_problems += problem
-                    abort_variation = True
-                    break
-                episode_path = os.path.join(episodes_path, EPISODE_FOLDER % (ex_idx))
-                with file_lock:
-                    save_demo(task_base, waypoint_sets, config, episode_path)
-                    if recorder is not None:
-                        recorder.save_image(os.path.join(episode_path, "image.png"))
-                ex_idx += 1
-                break
-            if abort_variation:
-                break
-
-    results[i] = tasks_with_problems
-    amsolver_env.shutdown()
+            except Exception as e:
+                print(e)
+                attempts -= 1
+                if attempts == 0:
+                    raise UnitFailed(str(e))
+        save_demo(task_base, waypoint_sets, config, path)
 
 
 def main(argv):
-    # tasks_path = './language_tasks/tasks'
-    tasks_path = './vlm/tasks'
-    task_files = [t.replace('.py', '') for t in os.listdir(tasks_path)
-                  if t != '__init__.py' and t.endswith('.py')]
+    task_files = get_task_registry('vlm').task_names()
     
     if len(FLAGS.tasks) > 0:
         for t in FLAGS.tasks:
@@ -231,28 +169,13 @@ def main(argv):
 
     tasks = [task_file_to_task_class(t, parent_folder = 'vlm') for t in task_files]
 
-    manager = Manager()
-
-    result_dict = manager.dict()
-    file_lock = manager.Lock()
-
-    task_index = manager.Value('i', 0)
-    variation_count = manager.Value('i', 0)
-    lock = manager.Lock()
-
     check_and_make(FLAGS.save_path)
 
-    processes = [Process(
-        target=run, args=(
-            i, lock, task_index, variation_count, result_dict, file_lock,
-            tasks))
-        for i in range(FLAGS.processes)]
-    [t.start() for t in processes]
-    [t.join() for t in processes]
+    generated, problems = run_generation(ConfigGenerator(), tasks, FLAGS.save_path, FLAGS.processes,
+                                         variations=FLAGS.variations)
 
-    print('Data collection done!')
-    for i in range(FLAGS.processes):
-        print(result_dict[i])
+    print('Data collection done! %d episodes generated' % generated)
+    print(problems)
 
 
 if __name__ == '__main__':
@@ -237,4 +237,11 @@ class NumberCondition(Condition):
             if ismet:
                 count+= 1
         met = count >= self.num_bound
-        return met, False
\ No newline at end of file
+        return met, False
+
+    def sub_conditions(self):
+        return self._conditions
+
+    def combine(self, results):
+        count = sum(1 for ismet, term in results if ismet)
+        return count >= self.num_bound, False
@@ -1,4 +1,3 @@
-import ai2thor.controller
 import gym
 import numpy as np
 import time
@@ -7,9 +6,9 @@ import json
 import os
 import sys
 import math
-from ai2thor.platform import CloudRendering
 from embodiedbench.envs.eb_navigation.utils import draw_target_box, draw_boxes
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 import copy
 
 SUCCESS_THRESHOLD = 1
@@ -46,6 +45,9 @@ class EBNavigationEnv(gym.Env):
 
         :param config: Dictionary containing initialization parameters for the controller.
         """
+        # imported here so that loading the module (e.g. for ValidEvalSets) does not import ai2thor
+        import ai2thor.controller
+        from ai2thor.platform import CloudRendering
         self.resolution = resolution
         self.config = {
             "agentMode": "default",
@@ -108,6 +110,7 @@ class EBNavigationEnv(gym.Env):
             dataset = dataset[0:len(dataset):select_every]
         return dataset
 
+    @tracer.trace('env.reset')
     def reset(self, **kwargs):
         """
         Reset the environment.
@@ -125,9 +128,10 @@ class EBNavigationEnv(gym.Env):
 
         scene_name = traj_data["scene"]
         logger.info(f"Restoring scene {scene_name}...")
-        self._last_event = self.env.reset(
-            scene=scene_name
-        )
+        with tracer.span('sim.reset'):
+            self._last_event = self.env.reset(
+                scene=scene_name
+            )
 
         if self.multiview:
             event = self.env.step(action="GetMapViewCameraProperties", raise_for_failure=True)
@@ -176,6 +180,7 @@ class EBNavigationEnv(gym.Env):
 
         return obs
     
+    @tracer.trace('sim.step')
     def discrete_action_mapper(self, action_index):
         """
         Maps a discrete action index to the corresponding iTHOR environment action.
@@ -215,6 +220,7 @@ class EBNavigationEnv(gym.Env):
         else:
             print(f"Invalid action index: {action_index}")
 
+    @tracer.trace('sim.reward')
     def measure_success(self):
         # success measurement
         agent_position = self.env.last_event.metadata["agent"]["position"]
@@ -235,6 +241,7 @@ class EBNavigationEnv(gym.Env):
 
         
 
+    @tracer.trace('env.step')
     def step(self, action: int, reasoning, i_flag):
         """
         Perform an action in the environment.
@@ -345,6 +352,7 @@ class EBNavigationEnv(gym.Env):
         self.env.random_initilize(seed)
 
 
+    @tracer.trace('env.save_image')
     def save_image(self, *args, **kwargs):
         """Save current agent view as a PNG image."""
         episode_idx = self._current_episode_num if not len(self.selected_indexes) else self.selected_indexes[self._current_episode_num - 1] + 1
@@ -395,6 +403,7 @@ class EBNavigationEnv(gym.Env):
                 # img.save(image_path)
                 return image_path
 
+    @tracer.trace('env.save_log')
     def save_episode_log_per_step(self, flag):
 
         episode_idx = self._current_episode_num if not len(self.selected_indexes) else self.selected_indexes[self._current_episode_num - 1] + 1
@@ -4,12 +4,16 @@ import random
 from tqdm import tqdm
 import time
 import json
-from embodiedbench.envs.eb_alfred.EBAlfEnv import EBAlfEnv, ValidEvalSets
 from embodiedbench.planner.vlm_planner import VLMPlanner
-from embodiedbench.evaluator.summarize_result import average_json_values
 from embodiedbench.evaluator.evaluator_utils import load_saved_data, update_config_with_args
 from embodiedbench.evaluator.config.system_prompts import alfred_system_prompt
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
+from embodiedbench.lazy_import import lazy_module
+
+# the simulator and pyarrow are imported when the evaluator first uses them
+alfred_env = lazy_module('embodiedbench.envs.eb_alfred.EBAlfEnv')
+results_warehouse = lazy_module('embodiedbench.evaluator.results_warehouse')
 
 example_path = os.path.join(os.path.dirname(__file__), 'config/alfred_examples.json')
 exploration_example_path = os.path.join(os.path.dirname(__file__), 'config/alfred_long_horizon_examples.json')
@@ -18,7 +22,7 @@ system_prompt = alfred_system_prompt
 class EB_AlfredEvaluator():
     def __init__(self, config):
         self.model_name = config['model_name']
-        self.eval_set = ValidEvalSets[0]
+        self.eval_set = alfred_env.ValidEvalSets[0]
         self.config = config
         self.env = None
         self.planner = None
@@ -48,6 +52,7 @@ class EB_AlfredEvaluator():
                 logger.warning("Language only mode should not have multistep enabled. Setting these arguments to False ...")
                 self.config['multistep'] = 0
         
+    @tracer.trace('artifacts.write')
     def save_episode_metric(self, episode_info):
         episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
         filename = 'episode_{}_final_res{}.json'.format(episode_idx, self.exp_suffix)
@@ -57,6 +62,7 @@ class EB_AlfredEvaluator():
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
             json.dump(episode_info, f, ensure_ascii=False, indent=2)
     
+    @tracer.trace('artifacts.write')
     def save_planner_outputs(self, reasoning_list):
         episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
         filename = 'planner_output_episode_{}{}.txt'.format(episode_idx, self.exp_suffix)
@@ -67,6 +73,7 @@ class EB_AlfredEvaluator():
             for s in reasoning_list:
                 f.write(s + "\n")
     
+    @tracer.trace('artifacts.write')
     def save_prompts(self, prompts_list):
         """실제 입력된 프롬프트 저장"""
         episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
@@ -80,6 +87,7 @@ class EB_AlfredEvaluator():
                 f.write(prompt)
                 f.write("\n\n")
     
+    @tracer.trace('artifacts.write')
     def save_memory_info(self):
         """사용된 메모리 정보 저장"""
         episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
@@ -112,6 +120,10 @@ class EB_AlfredEvaluator():
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
             json.dump(memory_info, f, ensure_ascii=False, indent=2)
     
+    def save_episode_timing(self):
+        episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
+        tracer.end_episode(os.path.join(self.env.log_path, 'results'), 'episode_{}_timing{}.json'.format(episode_idx, self.exp_suffix))
+
     def load_dynamic_memory(self, eval_set, task_type=None, current_episode_num=None):
         """이전 실행 결과에서 동적 메모리 로드 (base eval_set은 제외, task_type별로 카테고리화)
         
@@ -144,10 +156,11 @@ class EB_AlfredEvaluator():
             return [], []
 
     def evaluate_main(self):
-        valid_eval_sets = self.config.get('eval_sets', ValidEvalSets)
+        tracer.enable(self.config.get('trace', tracer.enabled))
+        valid_eval_sets = self.config.get('eval_sets', alfred_env.ValidEvalSets)
         valid_eval_sets = list(valid_eval_sets)
         if type(valid_eval_sets) == list and len(valid_eval_sets) == 0:
-            valid_eval_sets = ValidEvalSets
+            valid_eval_sets = alfred_env.ValidEvalSets
 
         for eval_set in valid_eval_sets:
             if self.env is not None:
@@ -169,7 +182,7 @@ class EB_AlfredEvaluator():
             if task_selection_seed is None:
                 task_selection_seed = self.seed
             
-            self.env = EBAlfEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], 
+            self.env = alfred_env.EBAlfEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], 
                                           exp_name=exp_name, selected_indexes=self.config.get('selected_indexes', []), 
                                           detection_box=self.config.get('detection_box', False),
                                           resolution=self.config.get('resolution', 500),
@@ -203,7 +216,10 @@ class EB_AlfredEvaluator():
                         logger.info(f"[EB_AlfredEvaluator] Loaded memory for eval_set={self.eval_set}, task_type={task_type}: success={len(success_memory)}, failure={len(failure_memory)}")
 
             self.evaluate()
-            average_json_values(os.path.join(self.env.log_path, 'results'), output_file='summary.json')
+            tracer.export_chrome_trace(os.path.join(self.env.log_path, 'results', 'trace{}.json'.format(self.exp_suffix)))
+            results_warehouse.summarize_results(os.path.join(self.env.log_path, 'results'), 'eb_alfred', self.model_name.split('/')[-1],
+                                                self.config['exp_name'], eval_set, output_file='summary.json',
+                                                warehouse_dir=self.config.get('warehouse_dir', results_warehouse.DEFAULT_WAREHOUSE_DIR))
             with open(os.path.join(self.env.log_path, 'config.txt'), 'w') as f:
                 f.write(str(self.config))
 
@@ -212,6 +228,7 @@ class EB_AlfredEvaluator():
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': [], 'num_invalid_actions': 0, 'empty_plan': 0}
+            tracer.begin_episode(eval_set=self.eval_set)
             obs = self.env.reset()
             img_path = self.env.save_image(obs)
             user_instruction = self.env.episode_language_instruction
@@ -324,6 +341,7 @@ class EB_AlfredEvaluator():
             self.save_planner_outputs(reasoning_list)
             self.save_prompts(prompts_list)
             self.save_memory_info()
+            self.save_episode_timing()
             progress_bar.update()
 
 
@@ -3,12 +3,16 @@ import numpy as np
 from tqdm import tqdm
 import time
 import json
-from embodiedbench.envs.eb_habitat.EBHabEnv import EBHabEnv, ValidEvalSets
 from embodiedbench.planner.vlm_planner import VLMPlanner
-from embodiedbench.evaluator.summarize_result import average_json_values
 from embodiedbench.evaluator.evaluator_utils import load_saved_data, update_config_with_args
 from embodiedbench.evaluator.config.system_prompts import habitat_system_prompt
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
+from embodiedbench.lazy_import import lazy_module
+
+# the simulator and pyarrow are imported when the evaluator first uses them
+habitat_env = lazy_module('embodiedbench.envs.eb_habitat.EBHabEnv')
+results_warehouse = lazy_module('embodiedbench.evaluator.results_warehouse')
 
 link_path = os.path.join(os.path.dirname(__file__), '../envs/eb_habitat/data')
 try:
@@ -25,7 +29,7 @@ system_prompt = habitat_system_prompt
 class EB_HabitatEvaluator():
     def __init__(self, config):
         self.model_name = config['model_name']
-        self.eval_set = ValidEvalSets[0]
+        self.eval_set = habitat_env.ValidEvalSets[0]
         self.config = config
         self.env = None
         self.planner = None
@@ -41,6 +45,7 @@ class EB_HabitatEvaluator():
                 self.config['multistep'] = 0
         
         
+    @tracer.trace('artifacts.write')
     def save_episode_metric(self, episode_info):
         filename = 'episode_{}_final_res.json'.format(self.env._current_episode_num)
         res_path = os.path.join(self.env.log_path, 'results')
@@ -49,11 +54,15 @@ class EB_HabitatEvaluator():
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
             json.dump(episode_info, f, ensure_ascii=False)
 
+    def save_episode_timing(self):
+        tracer.end_episode(os.path.join(self.env.log_path, 'results'), 'episode_{}_timing.json'.format(self.env._current_episode_num))
+
     def evaluate_main(self):
-        valid_eval_sets = self.config.get('eval_sets', ValidEvalSets)
+        tracer.enable(self.config.get('trace', tracer.enabled))
+        valid_eval_sets = self.config.get('eval_sets', habitat_env.ValidEvalSets)
         valid_eval_sets = list(valid_eval_sets)
         if type(valid_eval_sets) == list and len(valid_eval_sets) == 0:
-            valid_eval_sets = ValidEvalSets
+            valid_eval_sets = habitat_env.ValidEvalSets
             
         for eval_set in valid_eval_sets:
             if self.env is not None:
@@ -61,7 +70,7 @@ class EB_HabitatEvaluator():
             self.eval_set = eval_set
             logger.info(f'Current eval set: {eval_set}')
             exp_name = f"{self.model_name.split('/')[-1]}_{self.config['exp_name']}/{eval_set}" if len(self.config['exp_name']) else f"{self.model_name.split('/')[-1]}/{eval_set}"
-            self.env = EBHabEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], exp_name=exp_name,
+            self.env = habitat_env.EBHabEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], exp_name=exp_name,
                                              start_epi_index=self.config.get('start_epi_index', 0), resolution=self.config.get('resolution', 500))
 
             model_type = self.config.get('model_type', 'remote')
@@ -70,7 +79,10 @@ class EB_HabitatEvaluator():
                                                  use_feedback=self.config.get('env_feedback', True), multistep=self.config.get('multistep', 0), tp=self.config.get('tp', 1))
 
             self.evaluate()
-            average_json_values(os.path.join(self.env.log_path, 'results'), output_file='summary.json')
+            tracer.export_chrome_trace(os.path.join(self.env.log_path, 'results', 'trace.json'))
+            results_warehouse.summarize_results(os.path.join(self.env.log_path, 'results'), 'eb_habitat', self.model_name.split('/')[-1],
+                                                self.config['exp_name'], eval_set, output_file='summary.json',
+                                                warehouse_dir=self.config.get('warehouse_dir', results_warehouse.DEFAULT_WAREHOUSE_DIR))
             with open(os.path.join(self.env.log_path, 'config.txt'), 'w') as f:
                 f.write(str(self.config))
 
@@ -79,6 +91,7 @@ class EB_HabitatEvaluator():
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': [], 'num_invalid_actions': 0, 'empty_plan': 0}
+            tracer.begin_episode(eval_set=self.eval_set)
             obs = self.env.reset()
             img_path = self.env.save_image(obs)
             user_instruction = self.env.episode_language_instruction
@@ -173,6 +186,7 @@ class EB_HabitatEvaluator():
             
             self.env.save_episode_log()
             self.save_episode_metric(episode_info)
+            self.save_episode_timing()
             progress_bar.update()
 
 
@@ -6,16 +6,21 @@ import json
 import copy
 import argparse
 from embodiedbench.evaluator.config.system_prompts import eb_manipulation_system_prompt
-from embodiedbench.envs.eb_manipulation.EBManEnv_re import EBManEnv, EVAL_SETS, ValidEvalSets
 from embodiedbench.envs.eb_manipulation.eb_man_utils import form_object_coord_for_input, draw_bounding_boxes, draw_xyz_coordinate
 from embodiedbench.planner.manip_planner_re import ManipPlanner
 from embodiedbench.evaluator.config.eb_manipulation_example import vlm_examples_baseline, llm_examples, vlm_examples_ablation
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
+from embodiedbench.lazy_import import lazy_module
+
+# the simulator and pyarrow are imported when the evaluator first uses them
+manipulation_env = lazy_module('embodiedbench.envs.eb_manipulation.EBManEnv_re')
+results_warehouse = lazy_module('embodiedbench.evaluator.results_warehouse')
 
 class EB_ManipulationEvaluator():
     def __init__(self, config):
         self.model_name = config['model_name']
-        self.eval_set = ValidEvalSets[0]
+        self.eval_set = manipulation_env.ValidEvalSets[0]
         self.config = config
         self.env = None
         self.planner = None
@@ -33,20 +38,20 @@ class EB_ManipulationEvaluator():
         if self.config['language_only'] == 1:
             # visual icl baseline
             if self.config['visual_icl'] == 1:
-                for variation in EVAL_SETS[self.eval_set]:
+                for variation in manipulation_env.EVAL_SETS[self.eval_set]:
                     all_examples[variation] = vlm_examples_ablation[variation.split('_')[0]]
             # language only
             else:
-                for variation in EVAL_SETS[self.eval_set]:
+                for variation in manipulation_env.EVAL_SETS[self.eval_set]:
                     all_examples[variation] = llm_examples[variation.split('_')[0]]
         else:
             # main baseline
             if self.config['detection_box'] == 1 and self.config['multiview'] == 0 and self.config['visual_icl'] == 0 and self.config['multistep'] == 0:
-                for variation in EVAL_SETS[self.eval_set]:
+                for variation in manipulation_env.EVAL_SETS[self.eval_set]:
                     all_examples[variation] = vlm_examples_baseline[variation.split('_')[0]]
             # ablation study
             else:
-                for variation in EVAL_SETS[self.eval_set]:
+                for variation in manipulation_env.EVAL_SETS[self.eval_set]:
                     all_examples[variation] = vlm_examples_ablation[variation.split('_')[0]]
 
         return all_examples
@@ -85,6 +90,7 @@ class EB_ManipulationEvaluator():
         else:
             return [], []
 
+    @tracer.trace('artifacts.write')
     def save_episode_metric(self, episode_info):
         filename = 'episode_{}_res{}.json'.format(self.env._current_episode_num, self.exp_suffix)
         res_path = os.path.join(self.env.log_path, 'results')
@@ -93,6 +99,7 @@ class EB_ManipulationEvaluator():
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
             json.dump(episode_info, f, ensure_ascii=False, indent=2)
     
+    @tracer.trace('artifacts.write')
     def save_planner_outputs(self, reasoning_list):
         filename = 'planner_output_episode_{}{}.txt'.format(self.env._current_episode_num, self.exp_suffix)
         res_path = os.path.join(self.env.log_path, 'results')
@@ -102,6 +109,7 @@ class EB_ManipulationEvaluator():
             for s in reasoning_list:
                 f.write(s + "\n")
     
+    @tracer.trace('artifacts.write')
     def save_prompts(self, prompts_list):
         """실제 입력된 프롬프트 저장"""
         filename = 'prompts_episode_{}{}.txt'.format(self.env._current_episode_num, self.exp_suffix)
@@ -114,6 +122,7 @@ class EB_ManipulationEvaluator():
                 f.write(prompt)
                 f.write("\n\n")
     
+    @tracer.trace('artifacts.write')
     def save_memory_info(self, task_variation):
         """사용된 메모리 정보 저장"""
         filename = 'memory_info_episode_{}{}.json'.format(self.env._current_episode_num, self.exp_suffix)
@@ -136,27 +145,20 @@ class EB_ManipulationEvaluator():
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
             json.dump(memory_info, f, ensure_ascii=False, indent=2)
     
+    def save_episode_timing(self):
+        tracer.end_episode(os.path.join(self.env.log_path, 'results'), 'episode_{}_timing{}.json'.format(self.env._current_episode_num, self.exp_suffix))
+
     def print_task_eval_results(self, filename):
         folder_path = f"{self.log_path}/results"
-        total_number_of_task = 0
-        success_number_of_task = 0
-        planner_steps = 0
-        output_format_error = 0
+        warehouse = results_warehouse.ResultsWarehouse(self.config.get('warehouse_dir', results_warehouse.DEFAULT_WAREHOUSE_DIR))
+        partition = ('eb_manipulation', self.real_model_name, os.path.basename(os.path.dirname(self.log_path)), self.eval_set)
+        warehouse.ingest(folder_path, *partition)
+        columns = warehouse.load_partition(*partition, results_dir=folder_path).select(['task_success', 'planner_output_error', 'planner_steps']).to_pydict()
 
-        for file_name in sorted(os.listdir(folder_path)):
-            if file_name.endswith(".json") and file_name.startswith("episode"):
-                file_path = os.path.join(folder_path, file_name)
-                
-                # Open and load the JSON file
-                with open(file_path, 'r', encoding='utf-8') as json_file:
-                    data = json.load(json_file)
-                    task_success = data["task_success"]
-                    if data["planner_output_error"] > 0:    
-                        output_format_error += 1
-                    if task_success == 1:
-                        success_number_of_task += 1
-                    planner_steps += data["planner_steps"]
-                    total_number_of_task += 1
+        total_number_of_task = len(columns['task_success'])
+        success_number_of_task = sum(1 for value in columns['task_success'] if value == 1)
+        planner_steps = sum(value or 0 for value in columns['planner_steps'])
+        output_format_error = sum(1 for value in columns['planner_output_error'] if (value or 0) > 0)
 
         task_log = {}
         task_log['save_path'] = self.log_path
@@ -210,6 +212,7 @@ class EB_ManipulationEvaluator():
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': [], 'action_success': [], 'executed_actions': [], 'step_task_success': []}
             image_history = []
+            tracer.begin_episode(eval_set=self.eval_set)
 
             _, obs = self.env.reset()
             if self.config['multiview']:
@@ -307,15 +310,17 @@ class EB_ManipulationEvaluator():
             self.save_planner_outputs(reasoning_list)
             self.save_prompts(prompts_list)
             self.save_memory_info(self.env.current_task_variation)
+            self.save_episode_timing()
             progress_bar.update()
         self.print_task_eval_results(filename="summary{}.json".format(self.exp_suffix))
         self.env.close()
     
     def evaluate_main(self):
-        valid_eval_sets = self.config.get('eval_sets', ValidEvalSets)
+        tracer.enable(self.config.get('trace', tracer.enabled))
+        valid_eval_sets = self.config.get('eval_sets', manipulation_env.ValidEvalSets)
         valid_eval_sets = list(valid_eval_sets)
         if type(valid_eval_sets) == list and len(valid_eval_sets) == 0:
-            valid_eval_sets = ValidEvalSets
+            valid_eval_sets = manipulation_env.ValidEvalSets
         
         for eval_set in valid_eval_sets:
             if self.env is not None:
@@ -326,6 +331,7 @@ class EB_ManipulationEvaluator():
                 real_model_name = self.model_name.split('/')[1]
             else:
                 real_model_name = self.model_name
+            self.real_model_name = real_model_name
             if 'exp_name' not in self.config or self.config['exp_name'] is None:
                 self.log_path = 'running/eb_manipulation/{}/n_shot={}_resolution={}_detection_box={}_multiview={}_multistep={}_visual_icl={}/{}'.format(
                                                                                                     real_model_name, 
@@ -349,7 +355,7 @@ class EB_ManipulationEvaluator():
                 # exp_name이 "4_re" 형식이면 "baseline4_re" 형식으로 조합
                 folder_name = f"{memory_prefix}{exp_name}"
                 self.log_path = 'running/eb_manipulation/{}/{}/{}'.format(real_model_name, folder_name, self.eval_set)
-            self.env = EBManEnv(eval_set=self.eval_set, img_size=(self.config['resolution'], self.config['resolution']), down_sample_ratio=self.config["down_sample_ratio"], log_path=self.log_path, tasks_per_variation=self.tasks_per_variation, task_selection_seed=self.task_selection_seed)
+            self.env = manipulation_env.EBManEnv(eval_set=self.eval_set, img_size=(self.config['resolution'], self.config['resolution']), down_sample_ratio=self.config["down_sample_ratio"], log_path=self.log_path, tasks_per_variation=self.tasks_per_variation, task_selection_seed=self.task_selection_seed)
             ic_examples = self.load_demonstration()
             self.planner = ManipPlanner(model_name=self.model_name,
                                         model_type=self.config['model_type'],
@@ -366,6 +372,7 @@ class EB_ManipulationEvaluator():
             # 동적 메모리는 evaluate() 함수 내에서 각 episode마다 로드 (instruction 기반 유사도 계산을 위해)
             
             self.evaluate()
+            tracer.export_chrome_trace(os.path.join(self.log_path, 'results', 'trace{}.json'.format(self.exp_suffix)))
             with open(os.path.join(self.log_path, 'config.txt'), 'w') as f:
                 f.write(str(self.config))
                 
@@ -3,9 +3,7 @@ import os
 import numpy as np
 from tqdm import tqdm
 import json
-from embodiedbench.envs.eb_navigation.EBNavEnv import EBNavigationEnv, ValidEvalSets
 from embodiedbench.planner.nav_planner import EBNavigationPlanner
-from embodiedbench.evaluator.summarize_result import average_json_values
 import sys
 import warnings
 
@@ -14,6 +12,12 @@ from time import sleep
 from embodiedbench.evaluator.config.system_prompts import eb_navigation_system_prompt
 from embodiedbench.evaluator.config.eb_navigation_example import examples
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
+from embodiedbench.lazy_import import lazy_module
+
+# the simulator and pyarrow are imported when the evaluator first uses them
+navigation_env = lazy_module('embodiedbench.envs.eb_navigation.EBNavEnv')
+results_warehouse = lazy_module('embodiedbench.evaluator.results_warehouse')
 
 system_prompt = eb_navigation_system_prompt
 examples = examples
@@ -29,6 +33,7 @@ class EB_NavigationEvaluator():
         self.env = None
         self.planner = None
 
+    @tracer.trace('artifacts.write')
     def save_episode_metric(self, episode_info):
         episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
         filename = 'episode_{}_final_res.json'.format(episode_idx)
@@ -38,12 +43,17 @@ class EB_NavigationEvaluator():
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
             json.dump(episode_info, f, ensure_ascii=False)
 
+    def save_episode_timing(self):
+        episode_idx = self.env._current_episode_num if not len(self.env.selected_indexes) else self.env.selected_indexes[self.env._current_episode_num - 1] + 1
+        tracer.end_episode(os.path.join(self.env.log_path, 'results'), 'episode_{}_timing.json'.format(episode_idx))
+
     def evaluate_main(self):
+        tracer.enable(self.config.get('trace', tracer.enabled))
 
-        valid_eval_sets = self.config.get('eval_sets', ValidEvalSets)
+        valid_eval_sets = self.config.get('eval_sets', navigation_env.ValidEvalSets)
         self.eval_sets = list(valid_eval_sets)
         if type(self.eval_sets) == list and len(self.eval_sets) == 0:
-            self.eval_sets = ValidEvalSets
+            self.eval_sets = navigation_env.ValidEvalSets
             
         for eval_set in self.eval_sets:
             if self.env is not None:
@@ -52,7 +62,7 @@ class EB_NavigationEvaluator():
             logger.info(f'Current eval set: {eval_set}')
             exp_name = f"{self.model_name.split('/')[-1]}_{self.config['exp_name']}/{eval_set}" if len(self.config['exp_name']) else f"{self.model_name.split('/')[-1]}/{eval_set}"
 
-            self.env = EBNavigationEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], 
+            self.env = navigation_env.EBNavigationEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], 
                                    exp_name=exp_name, multiview=self.config['multiview'], boundingbox=self.config['detection_box'], 
                                    multistep = self.config['multistep'], resolution = self.config['resolution'])
 
@@ -64,7 +74,10 @@ class EB_NavigationEvaluator():
                                            visual_icl = self.config['visual_icl'], truncate=self.config.get('truncate', False))
             
             self.evaluate()
-            average_json_values(os.path.join(self.env.log_path, 'results'), selected_key = None)
+            tracer.export_chrome_trace(os.path.join(self.env.log_path, 'results', 'trace.json'))
+            results_warehouse.summarize_results(os.path.join(self.env.log_path, 'results'), 'eb_nav', self.model_name.split('/')[-1],
+                                                self.config['exp_name'], eval_set, output_file='summary_all.json',
+                                                warehouse_dir=self.config.get('warehouse_dir', results_warehouse.DEFAULT_WAREHOUSE_DIR))
             with open(os.path.join(self.env.log_path, 'config.txt'), 'w') as f:
                 f.write(str(self.config))
 
@@ -73,6 +86,7 @@ class EB_NavigationEvaluator():
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': []}
+            tracer.begin_episode(eval_set=self.eval_set)
             obs = self.env.reset()
             img_path = self.env.save_image(obs)
             user_instruction = self.env.episode_language_instruction
@@ -132,6 +146,7 @@ class EB_NavigationEvaluator():
             # episode_info["num_invalid_action_ratio"] = info["num_invalid_actions"] / info["env_step"]
             episode_info["episode_elapsed_seconds"] = info["episode_elapsed_seconds"]
             self.save_episode_metric(episode_info)
+            self.save_episode_timing()
             progress_bar.update()
 
     def check_config_valid(self):
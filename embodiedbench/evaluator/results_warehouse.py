@@ -0,0 +1,327 @@
+"""
+Columnar results warehouse for episode results.
+
+Every evaluator writes one ``episode_*_res*.json`` file per episode. Instead of
+re-parsing all of them each time a summary is needed, the files of a results
+directory are ingested once into a Parquet partition laid out as
+
+    <root>/env=<env>/model=<model>/experiment=<experiment>/eval_set=<eval_set>/data.parquet
+
+Ingestion is incremental: a small manifest next to each partition remembers the
+size and mtime of every source file per results directory, so only new or modified
+episodes are parsed again. Rows keep the results directory they come from, so two
+directories mapping to the same partition (e.g. runs without an experiment name)
+do not replace each other's episodes. Summaries and group-by aggregations across
+any number of runs are then computed with pyarrow over the numeric columns.
+
+pyarrow is imported on first use, the evaluators import this module eagerly.
+"""
+import os
+import re
+import json
+import glob
+import argparse
+from urllib.parse import quote
+
+PARTITION_KEYS = ('env', 'model', 'experiment', 'eval_set')
+DEFAULT_WAREHOUSE_DIR = 'running/warehouse'
+EPISODE_FILE_PATTERN = re.compile(r'^episode_(\d+)_(?:final_)?res(.*)\.json$')
+
+_DATA_FILE = 'data.parquet'
+_MANIFEST_FILE = '_manifest.json'
+_META_COLUMNS = ('episode_num', 'run_suffix', 'source_file', 'results_dir')
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor='hive')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, bool))
+
+
+def _scalar(value):
+    """Unwrap single element lists the same way the old JSON summary did."""
+    if isinstance(value, list) and len(value) == 1:
+        return value[0]
+    return value
+
+
+def episode_records_to_table(records):
+    """Build a table from parsed episode dicts.
+
+    Numeric scalars (bool, int, float and single element lists of them) become
+    float64 columns, strings become string columns. Nested values and longer
+    lists are not stored; they are kept in the per-episode JSON files.
+    """
+    import pyarrow as pa
+    columns = {}
+    for record in records:
+        for key, value in record.items():
+            value = _scalar(value)
+            if _is_number(value):
+                columns.setdefault(key, pa.float64())
+                if columns[key] == pa.string():
+                    columns[key] = pa.float64()
+            elif isinstance(value, str):
+                columns.setdefault(key, pa.string())
+
+    arrays = {}
+    for key, dtype in columns.items():
+        values = []
+        for record in records:
+            value = _scalar(record.get(key))
+            if dtype == pa.float64():
+                values.append(float(value) if _is_number(value) else None)
+            else:
+                values.append(value if isinstance(value, str) else None)
+        arrays[key] = pa.array(values, type=dtype)
+    if not arrays:
+        return pa.table({'episode_num': pa.array([], type=pa.float64())})
+    return pa.table(arrays)
+
+
+def read_episode_files(json_files):
+    """Parse episode result files into records with ``episode_num``, ``run_suffix`` and ``source_file``."""
+    records = []
+    for json_file in json_files:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            continue
+        # partition columns always come from the warehouse layout
+        record = {key: value for key, value in data.items() if key not in PARTITION_KEYS}
+        file_name = os.path.basename(json_file)
+        match = EPISODE_FILE_PATTERN.match(file_name)
+        if match:
+            record['episode_num'] = int(match.group(1))
+            record['run_suffix'] = match.group(2)
+        record['source_file'] = file_name
+        records.append(record)
+    return records
+
+
+def numeric_means(table, columns=None):
+    """Mean of every numeric column (ignoring nulls), like the old ``average_json_values``."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    averages = {}
+    for name in table.column_names:
+        if name in _META_COLUMNS or name in PARTITION_KEYS:
+            continue
+        if columns is not None and name not in columns:
+            continue
+        column = table.column(name)
+        if not pa.types.is_floating(column.type) or column.null_count == len(column):
+            continue
+        averages[name] = pc.mean(column).as_py()
+    return averages
+
+
+class ResultsWarehouse:
+    def __init__(self, root=DEFAULT_WAREHOUSE_DIR):
+        self.root = root
+
+    def partition_dir(self, env, model, experiment, eval_set):
+        values = (env, model, experiment, eval_set)
+        parts = ['{}={}'.format(key, quote(str(value), safe='')) for key, value in zip(PARTITION_KEYS, values)]
+        return os.path.join(self.root, *parts)
+
+    def ingest(self, results_dir, env, model, experiment, eval_set):
+        """Ingest the episode result files of ``results_dir`` into one partition.
+
+        Only the rows of ``results_dir`` are replaced; other results directories of the
+        same partition keep theirs. Returns the number of episode files that had to be
+        (re-)parsed.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        source = os.path.abspath(results_dir)
+        partition = self.partition_dir(env, model, experiment, eval_set)
+        data_path = os.path.join(partition, _DATA_FILE)
+        manifest_path = os.path.join(partition, _MANIFEST_FILE)
+
+        current = {}
+        if os.path.isdir(results_dir):
+            for entry in os.scandir(results_dir):
+                if entry.is_file() and EPISODE_FILE_PATTERN.match(entry.name):
+                    stat = entry.stat()
+                    current[entry.name] = [stat.st_size, stat.st_mtime_ns]
+
+        sources = {}
+        if os.path.exists(manifest_path) and os.path.exists(data_path):
+            with open(manifest_path, 'r') as f:
+                # manifests without results directories are rebuilt from the current one
+                sources = json.load(f).get('sources', {})
+        manifest = sources.get(source, {})
+
+        changed = sorted(name for name, stamp in current.items() if manifest.get(name) != stamp)
+        removed = [name for name in manifest if name not in current]
+        if not changed and not removed:
+            return 0
+
+        tables = []
+        if sources:
+            existing = pq.read_table(data_path)
+            stale = pa.array(changed + removed, type=pa.string())
+            replaced = pc.and_(pc.equal(existing.column('results_dir'), source),
+                               pc.is_in(existing.column('source_file'), value_set=stale))
+            tables.append(existing.filter(pc.invert(pc.fill_null(replaced, False))))
+        records = read_episode_files([os.path.join(results_dir, name) for name in changed])
+        for record in records:
+            record['results_dir'] = source
+        if records:
+            tables.append(episode_records_to_table(records))
+        table = pa.concat_tables(tables, promote_options='permissive') if tables else episode_records_to_table([])
+
+        if current:
+            sources[source] = current
+        else:
+            sources.pop(source, None)
+        os.makedirs(partition, exist_ok=True)
+        # write hidden temporary files first so readers never observe a half written partition
+        tmp_path = os.path.join(partition, '.' + _DATA_FILE + '.tmp')
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, data_path)
+        tmp_path = os.path.join(partition, '.' + _MANIFEST_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'sources': sources}, f)
+        os.replace(tmp_path, manifest_path)
+        return len(changed)
+
+    def dataset(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        partitioning = _partitioning()
+        dataset = ds.dataset(self.root, format='parquet', partitioning=partitioning, ignore_prefixes=['_', '.'])
+        # partitions may hold different metric columns; scan them with the union of their schemas
+        schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+        schema = pa.unify_schemas(schemas + [partitioning.schema], promote_options='permissive')
+        return ds.dataset(self.root, schema=schema, format='parquet', partitioning=partitioning,
+                          ignore_prefixes=['_', '.'])
+
+    def load(self, filters=None, columns=None):
+        """Load episodes as one table. ``filters`` maps column names to a value or a list of values."""
+        import pyarrow.dataset as ds
+        if not os.path.isdir(self.root):
+            return episode_records_to_table([])
+        expression = None
+        for key, value in (filters or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            condition = ds.field(key).isin(list(values))
+            expression = condition if expression is None else expression & condition
+        dataset = self.dataset()
+        if columns is not None:
+            columns = [name for name in columns if name in dataset.schema.names]
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def aggregate(self, group_by=('model', 'experiment', 'eval_set'), metrics=None, filters=None, aggregation='mean'):
+        """Group-by summary over all ingested episodes.
+
+        Args:
+            group_by: columns to group on, partition keys or string columns such as ``task_type``
+            metrics: numeric columns to aggregate (default: all numeric columns)
+            filters: see ``load``
+            aggregation: any pyarrow hash aggregation name, e.g. 'mean', 'sum', 'max'
+
+        Returns:
+            list of dicts, one per group, holding the group keys, ``num_episodes`` and
+            one entry per metric.
+        """
+        import pyarrow as pa
+        group_by = list(group_by)
+        table = self.load(filters=filters)
+        if metrics is None:
+            metrics = [name for name in table.column_names
+                       if pa.types.is_floating(table.schema.field(name).type)
+                       and name not in _META_COLUMNS and name not in group_by]
+        else:
+            metrics = [name for name in metrics if name in table.column_names]
+        if table.num_rows == 0:
+            return []
+        grouped = table.group_by(group_by).aggregate(
+            [(name, aggregation) for name in metrics] + [([], 'count_all')])
+        suffix = '_' + aggregation
+        names = []
+        for name in grouped.column_names:
+            if name == 'count_all':
+                name = 'num_episodes'
+            elif name.endswith(suffix) and name[:-len(suffix)] in metrics:
+                name = name[:-len(suffix)]
+            names.append(name)
+        grouped = grouped.rename_columns(names)
+        return grouped.sort_by([(key, 'ascending') for key in group_by]).to_pylist()
+
+    def load_partition(self, env, model, experiment, eval_set, results_dir=None):
+        """Read a single partition directly, without scanning the whole warehouse.
+
+        With ``results_dir`` only the episodes ingested from that directory are returned.
+        """
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        data_path = os.path.join(self.partition_dir(env, model, experiment, eval_set), _DATA_FILE)
+        if not os.path.exists(data_path):
+            return episode_records_to_table([])
+        table = pq.read_table(data_path)
+        if results_dir is not None:
+            if 'results_dir' not in table.column_names:
+                return episode_records_to_table([])
+            table = table.filter(pc.equal(table.column('results_dir'), os.path.abspath(results_dir)))
+        return table
+
+    def summarize(self, env, model, experiment, eval_set, columns=None, results_dir=None):
+        return numeric_means(self.load_partition(env, model, experiment, eval_set, results_dir), columns=columns)
+
+
+def summarize_results(results_dir, env, model, experiment, eval_set, output_file='summary.json',
+                      warehouse_dir=DEFAULT_WAREHOUSE_DIR):
+    """Ingest ``results_dir`` into the warehouse and write the averaged metrics to ``output_file`` inside it."""
+    warehouse = ResultsWarehouse(warehouse_dir)
+    warehouse.ingest(results_dir, env, model, experiment, eval_set)
+    averages = warehouse.summarize(env, model, experiment, eval_set, results_dir=results_dir)
+    print('final results: ')
+    print(averages)
+    if output_file is not None:
+        with open(os.path.join(results_dir, output_file), 'w') as f:
+            json.dump(averages, f, indent=4)
+    return averages
+
+
+def ingest_running_dir(running_dir, env, warehouse_dir=DEFAULT_WAREHOUSE_DIR):
+    """Ingest every ``<model>/<experiment>/<eval_set>/results`` directory found under ``running_dir``.
+
+    Result directories produced by ``EBAlfEnv``/``EBHabEnv``/``EBNavEnv`` use a single
+    ``<model>_<experiment>`` folder; in that case the experiment is left empty.
+    """
+    warehouse = ResultsWarehouse(warehouse_dir)
+    parsed = 0
+    for results_dir in sorted(glob.glob(os.path.join(running_dir, '*', '*', 'results')) +
+                              glob.glob(os.path.join(running_dir, '*', '*', '*', 'results'))):
+        parts = os.path.relpath(results_dir, running_dir).split(os.sep)[:-1]
+        if len(parts) == 2:
+            model, experiment, eval_set = parts[0], '', parts[1]
+        else:
+            model, experiment, eval_set = parts
+        parsed += warehouse.ingest(results_dir, env, model, experiment, eval_set)
+    return parsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest episode results and print group-by summaries.')
+    parser.add_argument('--warehouse_dir', default=DEFAULT_WAREHOUSE_DIR, type=str)
+    parser.add_argument('--ingest', type=str, default=None, help='running/<env> directory to ingest before aggregating')
+    parser.add_argument('--env', type=str, default=None, help='environment name used for the ingested partitions, e.g. eb_alfred')
+    parser.add_argument('--group_by', type=lambda s: s.split(','), default=['model', 'experiment', 'eval_set'])
+    parser.add_argument('--metrics', type=lambda s: s.split(','), default=None)
+    parser.add_argument('--aggregation', type=str, default='mean')
+    args = parser.parse_args()
+
+    if args.ingest is not None:
+        env = args.env or os.path.basename(os.path.normpath(args.ingest))
+        print('parsed {} episode files'.format(ingest_running_dir(args.ingest, env, args.warehouse_dir)))
+    for row in ResultsWarehouse(args.warehouse_dir).aggregate(args.group_by, args.metrics, aggregation=args.aggregation):
+        print(json.dumps(row))
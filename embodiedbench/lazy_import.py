@@ -0,0 +1,40 @@
+"""
+Modules imported on first use.
+
+The evaluators bind their simulator environment and the results warehouse with
+``lazy_module`` instead of ``from ... import ...``, so importing an evaluator (``main.py``
+imports the one of the selected environment, helper scripts import them for their
+constants) does not load ai2thor, habitat, pyrep/amsolver or pyarrow. The module is
+imported when one of its attributes is first read, e.g. when the evaluator creates its
+environment:
+
+    alfred_env = lazy_module('embodiedbench.envs.eb_alfred.EBAlfEnv')
+    ...
+    self.env = alfred_env.EBAlfEnv(eval_set=...)
+
+Attributes are looked up in ``sys.modules`` on every access, so a module replaced there
+(e.g. by the replay environments of the benchmark harness) is picked up.
+"""
+import sys
+import importlib
+
+
+class LazyModule:
+    __slots__ = ('_name',)
+
+    def __init__(self, name):
+        self._name = name
+
+    def _load(self):
+        module = sys.modules.get(self._name)
+        return module if module is not None else importlib.import_module(self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}{}>'.format(self._name, '' if self._name in sys.modules else ' (not imported)')
+
+
+def lazy_module(name):
+    return LazyModule(name)
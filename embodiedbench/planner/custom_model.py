@@ -1,8 +1,8 @@
 import requests
-import torch
 import os
 import io
 import requests
+from embodiedbench.tracing import tracer
 
 temperature = 0
 max_completion_tokens = 2048
@@ -15,6 +15,7 @@ class CustomModel():
         self.model_type = 'custom'
         
 
+    @tracer.trace('model.respond')
     def respond(self, prompt, obs=None):        
         with open(obs, "rb") as img_file:
             files = {"image": img_file}
@@ -12,7 +12,9 @@ from embodiedbench.envs.eb_manipulation.eb_man_utils import ROTATION_RESOLUTION,
 from embodiedbench.planner.remote_model import RemoteModel
 from embodiedbench.planner.custom_model import CustomModel
 from embodiedbench.planner.planner_utils import local_image_to_data_url, template_manip, template_lang_manip
+from embodiedbench.planner.plan_parser import parse_plan, plan_to_json
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 
 VISUAL_ICL_EXAMPLES_PATH = "embodiedbench/evaluator/config/visual_icl_examples/eb_manipulation"
 VISUAL_ICL_EXAMPLE_CATEGORY = {
@@ -44,6 +46,7 @@ class ManipPlanner():
         self.multi_step_image = multistep
         self.visual_icl = visual_icl
     
+    @tracer.trace('planner.prompt')
     def process_prompt(self, user_instruction, avg_obj_coord, task_variation, prev_act_feedback=[]):
         user_instruction = user_instruction.rstrip('.')
         if len(prev_act_feedback) == 0:
@@ -68,6 +71,7 @@ class ManipPlanner():
                 task_prompt += f"{action_feedback}, "
         return general_prompt, task_prompt
 
+    @tracer.trace('planner.prompt')
     def process_prompt_visual_icl(self, user_instruction, avg_obj_coord, prev_act_feedback=[]):
         user_instruction = user_instruction.rstrip('.')
         if len(prev_act_feedback) == 0:
@@ -92,6 +96,7 @@ class ManipPlanner():
                 task_prompt += f"{action_feedback}, "
         return general_prompt, task_prompt
     
+    @tracer.trace('planner.message')
     def get_message(self, images, prompt, task_prompt, messages=[]):
         if self.language_only and not self.visual_icl:
             return messages + [
@@ -216,6 +221,7 @@ class ManipPlanner():
         
             return current_message
     
+    @tracer.trace('planner.message')
     def get_message_visual_icl(self, images, first_prompt, task_prompt, task_variation, messages=[]):
         current_message = [
             {
@@ -277,9 +283,12 @@ class ManipPlanner():
             )
         return current_message
     
+    @tracer.trace('planner.parse')
     def json_to_action(self, output_text):
+        self.last_plan = None
         try:
-            json_object = json.loads(output_text)
+            json_object = parse_plan(output_text)
+            self.last_plan = json_object
             action = []
             try:
                 executable_plan = json_object['executable_plan'] if 'executable_plan' in json_object else json_object["properties"]["executable_plan"]
@@ -365,6 +374,7 @@ class ManipPlanner():
         self.planner_steps += 1
         return action, out
     
+    @tracer.trace('planner.act')
     def act(self, observation, user_instruction, avg_obj_coord, task_variation):
         if type(observation) == dict:
             obs = observation[self.obs_key]
@@ -432,7 +442,11 @@ class ManipPlanner():
         logger.debug(f"Model Output:\n{out}\n")
         self.planner_steps += 1
         action, json_output = self.json_to_action(out)
-        return action, out
+        return action, self.output_json(out)
+
+    def output_json(self, out):
+        # the response as one line of json if it was parsed, the raw text otherwise
+        return out if self.last_plan is None else plan_to_json(self.last_plan)
 
     def update_info(self, info):
         env_feedback = info['env_feedback']
@@ -6,15 +6,16 @@ import cv2
 import json
 # import lmdeploy
 # from lmdeploy import pipeline, GenerationConfig, PytorchEngineConfig
-from openai import OpenAI
 from embodiedbench.planner.planner_config.generation_guide import llm_generation_guide, vlm_generation_guide
-from embodiedbench.planner.planner_utils import local_image_to_data_url, truncate_message_prompts
+from embodiedbench.planner.planner_utils import local_image_to_data_url, truncate_message_prompts, ActionPlan, ActionPlan_lang
+from embodiedbench.planner.plan_parser import parse_plan, plan_to_json
 # from embodiedbench.planner.eb_navigation.RemoteModel_claude import RemoteModel
 from embodiedbench.planner.remote_model import RemoteModel
 from embodiedbench.planner.custom_model import CustomModel
 from embodiedbench.evaluator.config.visual_icl_examples.eb_navigation.ebnav_visual_icl import create_example_json_list
 from embodiedbench.planner.planner_utils import template, template_lang
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 
 template = template
 template_lang = template_lang
@@ -89,6 +90,7 @@ You are supposed to output in JSON.{template_lang if self.language_only else tem
         return available_action_str
 
 
+    @tracer.trace('planner.prompt')
     def process_prompt(self, user_instruction, prev_act_feedback=[]):
 
         user_instruction = user_instruction.rstrip('.')
@@ -136,6 +138,7 @@ You are supposed to output in JSON.{template_lang if self.language_only else tem
         return prompt
     
 
+    @tracer.trace('planner.message')
     def get_message(self, image, prompt, messages=[]):
 
         if self.language_only:
@@ -232,10 +235,13 @@ You are supposed to output in JSON.{template_lang if self.language_only else tem
             action = np.random.randint(len(self.actions))
         return action
     
+    @tracer.trace('planner.parse')
     def json_to_action(self, output_text, json_key='executable_plan'):
         valid = True
+        self.last_plan = None
         try:
-            json_object = json.loads(output_text)
+            json_object = parse_plan(output_text, ActionPlan_lang if self.language_only else ActionPlan)
+            self.last_plan = json_object
             action = [x[self.action_key] for x in json_object[json_key]]
             if not len(action):
                 print('empty plan, using random action instead')
@@ -258,20 +264,19 @@ You are supposed to output in JSON.{template_lang if self.language_only else tem
     def act_custom(self, prompt, obs):
         assert type(obs) == str # input image path
         out = self.model.respond(prompt, obs)
-        out = out.replace("'",'"')
-        out = out.replace('\"s ', "\'s ")
-        out = out.replace('```json', '').replace('```', '')
         logger.debug(f"Model Output:\n{out}\n")
         self.planner_steps += 1
         action, valid = self.json_to_action(out)
         if valid:
-            return action, out
+            # the evaluator loads the output as json
+            return action, plan_to_json(self.last_plan)
         else:
             out = '''{"visual_state_description":"invalid json, random action", "reasoning_and_reflection":"invalid json, random action",
                    "language_plan":"invalid json, random action"}'''
             return action, out
 
 
+    @tracer.trace('planner.act')
     def act(self, observation, user_instruction):
         if type(observation) == dict:
             obs = observation[self.obs_key]
@@ -321,7 +326,8 @@ You are supposed to output in JSON.{template_lang if self.language_only else tem
         action, valid = self.json_to_action(out)
         self.planner_steps += 1
         if valid:
-            return action, out
+            # the evaluator loads the output as json
+            return action, plan_to_json(self.last_plan)
         else:
             out = '''{"visual_state_description":"invalid json, random action", "reasoning_and_reflection":"invalid json, random action",
                    "language_plan":"invalid json, random action"}'''
@@ -0,0 +1,427 @@
+"""
+Single-pass tolerant parser for the json plans returned by the models.
+
+Well-formed responses, bare or wrapped in prose or code fences, are decoded by ``json.loads``
+directly. Only when that raises ``JSONDecodeError`` does the response go through
+``PlanStreamParser``, which reads the response once, left to right, and recovers from the
+errors the models are known to make:
+
+    - prose or markdown code fences around the json object
+    - single-quoted strings and python literals (True / False / None)
+    - unescaped double quotes inside string values, e.g. in ``reasoning_and_reflection``
+    - raw newlines and tabs inside strings, unknown escape sequences
+    - trailing commas, missing commas between members on separate lines, unquoted keys
+
+A quote inside a string value is taken as the closing quote only if the next non-blank
+character can follow a value (``,`` ``}`` ``]``, or a new member after a line break),
+otherwise it is kept as part of the text.
+
+The parser also accepts the response in chunks (``feed``) and returns the items of
+``executable_plan`` as soon as they are complete, so actions can be extracted from a
+streamed response before it ends. Given one of the ``ActionPlan*`` schemas, the plan items
+are validated and coerced (e.g. ``"action_id": "3"``) while they are parsed.
+"""
+import re
+import json
+import typing
+import functools
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING_SPECIAL = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_NUMBER_PREFIX = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d*)?(?:[eE][-+]?\d*)?')
+_WORD = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+_ESCAPES = {'"': '"', "'": "'", '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_VALUE_START = set('"\'{[-+.0123456789')
+_WAIT = object()
+
+PLAN_KEY = 'executable_plan'
+
+
+class PlanParseError(json.JSONDecodeError):
+    """Raised for responses that cannot be recovered; a ``json.JSONDecodeError`` for existing handlers."""
+
+
+@functools.lru_cache(maxsize=None)
+def plan_item_fields(schema):
+    """Field types of one ``executable_plan`` item of an ``ActionPlan*`` schema, None if the plan is free-form."""
+    if schema is None or PLAN_KEY not in schema.model_fields:
+        return None
+    annotation = schema.model_fields[PLAN_KEY].annotation
+    if typing.get_origin(annotation) is not list:
+        return None
+    item_type = typing.get_args(annotation)[0]
+    try:
+        return typing.get_type_hints(item_type)
+    except TypeError:
+        return None
+
+
+def _coerce(value, expected):
+    if expected is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and re.fullmatch(r'\s*-?\d+\s*', value):
+            return int(value)
+        raise ValueError
+    if expected is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise ValueError
+    return value
+
+
+def validate_plan_item(item, fields):
+    """Coerce the known fields of a plan item in place; raises ValueError with the offending field."""
+    if not isinstance(item, dict):
+        raise ValueError('executable_plan item is not an object: {!r}'.format(item))
+    for name, expected in fields.items():
+        if name in item:
+            try:
+                item[name] = _coerce(item[name], expected)
+            except ValueError:
+                raise ValueError('invalid {} in executable_plan item: {!r}'.format(name, item[name]))
+    return item
+
+
+class _Frame:
+    __slots__ = ('value', 'key', 'is_plan')
+
+    def __init__(self, value, is_plan=False):
+        self.value = value
+        self.key = None  # pending key of an object
+        self.is_plan = is_plan
+
+
+class PlanStreamParser:
+    """Incremental tolerant json parser, see the module docstring.
+
+    Usage:
+        parser = PlanStreamParser(ActionPlan)
+        for chunk in stream:
+            for item in parser.feed(chunk):
+                ...                        # a complete, validated executable_plan item
+        plan = parser.close()              # the whole object; raises PlanParseError
+    """
+
+    def __init__(self, schema=None):
+        self.fields = plan_item_fields(schema)
+        self.result = None
+        self._buf = ''
+        self._pos = 0
+        self._stack = []
+        self._expect = 'start'  # start, key, colon, value, comma, done
+        self._string = None      # [quote, parts, is_key, has surrogates] while inside a string
+        self._ready = []
+
+    @property
+    def done(self):
+        return self._expect == 'done'
+
+    def feed(self, chunk):
+        """Consume a chunk of the response; returns the plan items completed by it."""
+        self._buf += chunk
+        self._parse(final=False)
+        ready, self._ready = self._ready, []
+        return ready
+
+    def close(self):
+        """Finish parsing and return the plan object."""
+        self._parse(final=True)
+        if self._expect != 'done':
+            raise self._error('Unexpected end of response')
+        return self.result
+
+    def _error(self, msg, pos=None):
+        return PlanParseError(msg, self._buf, self._pos if pos is None else pos)
+
+    # values
+
+    def _add(self, value):
+        if not self._stack:
+            self.result = value
+            self._expect = 'done'
+            return
+        frame = self._stack[-1]
+        if isinstance(frame.value, dict):
+            frame.value[frame.key] = value
+            frame.key = None
+        else:
+            if frame.is_plan:
+                if self.fields is not None:
+                    try:
+                        validate_plan_item(value, self.fields)
+                    except ValueError as e:
+                        raise self._error(str(e))
+                self._ready.append(value)
+            frame.value.append(value)
+        self._expect = 'comma'
+
+    def _open(self, container):
+        is_plan = (isinstance(container, list) and len(self._stack) == 1
+                   and self._stack[0].key == PLAN_KEY)
+        self._stack.append(_Frame(container, is_plan))
+        self._expect = 'key' if isinstance(container, dict) else 'value'
+
+    def _close(self):
+        self._add(self._stack.pop().value)
+
+    # strings
+
+    def _closes_string(self, quote_pos, final):
+        """Decide whether the quote at ``quote_pos`` ends the current string value (None: need more input)."""
+        buf = self._buf
+        blank = _WHITESPACE.match(buf, quote_pos + 1)
+        j = blank.end()
+        if j == len(buf):
+            return True if final else None
+        c = buf[j]
+        in_object = isinstance(self._stack[-1].value, dict)
+        if c in '}]':
+            return True
+        if c in '"\'':
+            # a new member or element without the comma, only accepted on a new line
+            return '\n' in blank.group()
+        if c != ',':
+            return False
+        k = _WHITESPACE.match(buf, j + 1).end()
+        if k == len(buf):
+            return True if final else None
+        d = buf[k]
+        if in_object:
+            return d in '"\'}'
+        return d in _VALUE_START or d in '{[]'
+
+    def _finish_string(self):
+        quote, parts, is_key, surrogates = self._string
+        self._string = None
+        text = ''.join(parts)
+        if surrogates:
+            text = text.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+        if is_key:
+            self._stack[-1].key = text
+            self._expect = 'colon'
+        else:
+            self._add(text)
+
+    def _scan_string(self, final):
+        buf, n = self._buf, len(self._buf)
+        quote, parts, is_key, _ = self._string
+        special = _STRING_SPECIAL[quote]
+        pos = self._pos
+        while True:
+            match = special.search(buf, pos)
+            if match is None:
+                parts.append(buf[pos:])
+                self._pos = n
+                if final:
+                    raise self._error('Unterminated string', n)
+                return _WAIT
+            i = match.start()
+            if i > pos:
+                parts.append(buf[pos:i])
+            if buf[i] == '\\':
+                if i + 1 >= n:
+                    self._pos = i
+                    if final:
+                        parts.append('\\')
+                        self._pos = n
+                        raise self._error('Unterminated string', n)
+                    return _WAIT
+                escape = buf[i + 1]
+                if escape == 'u':
+                    if i + 6 > n and not final:
+                        self._pos = i
+                        return _WAIT
+                    try:
+                        code = int(buf[i + 2:i + 6], 16)
+                        parts.append(chr(code))
+                        self._string[3] |= 0xd800 <= code <= 0xdfff
+                        pos = i + 6
+                    except ValueError:
+                        parts.append('\\u')
+                        pos = i + 2
+                elif escape in _ESCAPES:
+                    parts.append(_ESCAPES[escape])
+                    pos = i + 2
+                else:
+                    parts.append('\\' + escape)
+                    pos = i + 2
+                continue
+            closes = True if is_key else self._closes_string(i, final)
+            if closes is None:
+                self._pos = i
+                return _WAIT
+            if closes:
+                self._pos = i + 1
+                self._finish_string()
+                return None
+            parts.append(buf[i])
+            pos = i + 1
+
+    # tokens
+
+    def _scan_scalar(self, final):
+        buf, pos = self._buf, self._pos
+        if not final and _NUMBER_PREFIX.match(buf, pos).end() == len(buf):
+            return _WAIT
+        match = _NUMBER.match(buf, pos)
+        if match is not None:
+            text = match.group()
+            self._pos = match.end()
+            try:
+                value = int(text)
+            except ValueError:
+                value = float(text)
+            self._add(value)
+            return None
+        match = _WORD.match(buf, pos)
+        if match is None:
+            raise self._error('Expecting value')
+        if match.end() == len(buf) and not final:
+            return _WAIT
+        if match.group() not in _LITERALS:
+            raise self._error('Expecting value')
+        self._pos = match.end()
+        self._add(_LITERALS[match.group()])
+        return None
+
+    def _parse(self, final):
+        buf = self._buf
+        n = len(buf)
+        while self._pos < n or (final and self._string is not None):
+            if self._string is not None:
+                if self._scan_string(final) is _WAIT:
+                    return
+                continue
+            expect = self._expect
+            if expect == 'done':
+                self._pos = n
+                return
+            if expect == 'start':
+                start = buf.find('{', self._pos)
+                if start < 0:
+                    self._pos = n
+                    return
+                self._pos = start + 1
+                self._open({})
+                continue
+            c = buf[self._pos]
+            if c in ' \t\n\r':
+                self._pos = _WHITESPACE.match(buf, self._pos).end()
+                continue
+            frame = self._stack[-1]
+            in_object = isinstance(frame.value, dict)
+            if expect == 'key':
+                if c == '"' or c == "'":
+                    self._string = [c, [], True, False]
+                    self._pos += 1
+                elif c == '}':
+                    self._pos += 1
+                    self._close()
+                elif c == ',':
+                    self._pos += 1
+                else:
+                    match = _WORD.match(buf, self._pos)
+                    if match is None:
+                        raise self._error('Expecting property name')
+                    if match.end() == n and not final:
+                        return
+                    frame.key = match.group()
+                    self._pos = match.end()
+                    self._expect = 'colon'
+            elif expect == 'colon':
+                if c != ':':
+                    raise self._error("Expecting ':' delimiter")
+                self._pos += 1
+                self._expect = 'value'
+            elif expect == 'value':
+                if c == '"' or c == "'":
+                    self._string = [c, [], False, False]
+                    self._pos += 1
+                elif c == '{':
+                    self._pos += 1
+                    self._open({})
+                elif c == '[':
+                    self._pos += 1
+                    self._open([])
+                elif c == ']' and not in_object:
+                    self._pos += 1
+                    self._close()
+                elif c == ',' and not in_object:
+                    self._pos += 1
+                elif self._scan_scalar(final) is _WAIT:
+                    return
+            else:  # comma
+                if c == ',':
+                    self._pos += 1
+                    self._expect = 'key' if in_object else 'value'
+                elif c == ('}' if in_object else ']'):
+                    self._pos += 1
+                    self._close()
+                elif in_object and (c in '"\'' or c.isalpha() or c == '_'):
+                    self._expect = 'key'
+                elif not in_object and (c in _VALUE_START or c in '{['):
+                    self._expect = 'value'
+                else:
+                    raise self._error("Expecting ',' delimiter")
+
+
+def _loads(text):
+    """``json.loads`` of the response, or of the outermost ``{...}`` around it; None if neither decodes."""
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+    start, end = text.find('{'), text.rfind('}')
+    if 0 <= start < end and (start > 0 or end < len(text) - 1):
+        try:
+            return json.loads(text[start:end + 1], strict=False)
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def parse_plan(text, schema=None):
+    """Decode a model response into the plan dict; raises ``PlanParseError`` if it cannot be recovered."""
+    result = _loads(text)
+    if isinstance(result, dict):
+        fields = plan_item_fields(schema)
+        plan = result.get(PLAN_KEY)
+        if fields is not None and isinstance(plan, list):
+            for item in plan:
+                try:
+                    validate_plan_item(item, fields)
+                except ValueError as e:
+                    raise PlanParseError(str(e), text, 0)
+        return result
+    parser = PlanStreamParser(schema)
+    parser.feed(text)
+    return parser.close()
+
+
+def iter_plan_items(chunks, schema=None):
+    """Yield the ``executable_plan`` items of a streamed response as soon as each one is complete."""
+    parser = PlanStreamParser(schema)
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
+
+
+def plan_to_json(plan):
+    """One line of json for a parsed plan, as the planners return and log it."""
+    return json.dumps(plan, ensure_ascii=False)
+
+
+def repair_json(text, schema=None):
+    """Return ``text`` as valid json if it can be recovered, otherwise unchanged."""
+    try:
+        return plan_to_json(parse_plan(text, schema))
+    except PlanParseError:
+        return text
@@ -1,12 +1,11 @@
 import os
-import re
 import base64
 import copy
 from mimetypes import guess_type
-import google.generativeai as genai
-from openai import OpenAI, AzureOpenAI
 import typing_extensions as typing
 from pydantic import BaseModel, Field
+from embodiedbench.planner.plan_parser import repair_json
+from embodiedbench.tracing import tracer
 
 template_lang = '''\
 The output json format should be {'reasoning_and_reflection':str, 'language_plan':str, 'executable_plan':List[{'action_id':int, 'action_name':str}...]}
@@ -48,41 +47,16 @@ The fields in above JSON follows the purpose below:
 !!! When generating content for JSON strings, avoid using any contractions or abbreviated forms (like 's, 're, 've, 'll, 'd, n't) that use apostrophes. Instead, write out full forms (is, are, have, will, would, not) to prevent parsing errors in JSON. Please do not output any other thing more than the above-mentioned JSON, do not include ```json and ```!!!.
 '''
 
+@tracer.trace('planner.fix_json')
 def fix_json(json_str):
     """
-    Locates the substring between the keys "reasoning_and_reflection" and "language_plan"
-    and escapes any inner double quotes that are not already escaped.
-    
-    The regex uses a positive lookahead to stop matching when reaching the delimiter for the next key.
+    Returns the model output as valid json, repairing the common generation errors
+    (code fences, single quotes, unescaped quotes in "reasoning_and_reflection", trailing commas, ...)
+    with the tolerant parser of plan_parser. Outputs that cannot be recovered are returned unchanged.
+    Kept for compatibility: the models and planners no longer call it, json_to_action parses the raw
+    response once with parse_plan.
     """
-    # first fix common errors
-    json_str = json_str.replace("'",'"') 
-    json_str = json_str.replace('\"s ', "\'s ")
-    json_str = json_str.replace('\"re ', "\'re ")
-    json_str = json_str.replace('\"ll ', "\'ll ")
-    json_str = json_str.replace('\"t ', "\'t ")
-    json_str = json_str.replace('\"d ', "\'d ")
-    json_str = json_str.replace('\"m ', "\'m ")
-    json_str = json_str.replace('\"ve ', "\'ve ")
-    json_str = json_str.replace('```json', '').replace('```', '')
-
-    # Then fix some situations. Pattern explanation:
-    # 1. ("reasoning_and_reflection"\s*:\s*") matches the key and the opening quote.
-    # 2. (?P<value>.*?) lazily captures everything in a group named 'value'.
-    # 3. (?=",\s*"language_plan") is a positive lookahead that stops matching before the closing quote
-    #    that comes before the "language_plan" key.
-    pattern = r'("reasoning_and_reflection"\s*:\s*")(?P<value>.*?)(?=",\s*"language_plan")'
-    
-    def replacer(match):
-        prefix = match.group(1)            # Contains the key and the opening quote.
-        value = match.group("value")         # The raw value that might contain unescaped quotes.
-        # Escape any double quote that is not already escaped.
-        fixed_value = re.sub(r'(?<!\\)"', r'\\"', value)
-        return prefix + fixed_value
-
-    # Use re.DOTALL so that newlines in the value are included.
-    fixed_json = re.sub(pattern, replacer, json_str, flags=re.DOTALL)
-    return fixed_json
+    return repair_json(json_str)
 
 
 class ExecutableAction_1(typing.TypedDict): 
@@ -211,6 +185,7 @@ class ActionPlan_lang_manip(BaseModel):
     executable_plan: str
 
 # Function to encode a local image into data URL 
+@tracer.trace('planner.encode_image')
 def local_image_to_data_url(image_path):
     # Guess the MIME type of the image based on the file extension
     mime_type, _ = guess_type(image_path)
@@ -2,17 +2,15 @@ import json
 import sys
 import os
 import base64
-import anthropic
-import google.generativeai as genai
-from openai import OpenAI
-import typing_extensions as typing
+# Provider SDKs are imported in RemoteModel.__init__, only for the provider that is used.
 # Lazy load lmdeploy only when model_type='local' to avoid Python 3.9 compatibility issues
 # import lmdeploy
 # from lmdeploy import pipeline, GenerationConfig, PytorchEngineConfig
 from embodiedbench.planner.planner_config.generation_guide import llm_generation_guide, vlm_generation_guide
 from embodiedbench.planner.planner_config.generation_guide_manip import llm_generation_guide_manip, vlm_generation_guide_manip
 from embodiedbench.planner.planner_utils import convert_format_2claude, convert_format_2gemini, ActionPlan_1, ActionPlan, ActionPlan_lang, \
-                                             ActionPlan_1_manip, ActionPlan_manip, ActionPlan_lang_manip, fix_json
+                                             ActionPlan_1_manip, ActionPlan_manip, ActionPlan_lang_manip
+from embodiedbench.tracing import tracer
 
 temperature = 0
 max_completion_tokens = 2048
@@ -38,7 +36,9 @@ class RemoteModel:
             backend_config = PytorchEngineConfig(session_len=12000, dtype='float16', tp=tp)
             self.model = pipeline(self.model_name, backend_config=backend_config)
         else:
+            from openai import OpenAI
             if "claude" in self.model_name:
+                import anthropic
                 self.model = anthropic.Anthropic(
                     api_key=os.environ.get("ANTHROPIC_API_KEY"),
                 )
@@ -77,6 +77,7 @@ class RemoteModel:
                     raise ValueError(f"Unsupported model name: {model_name}")
 
 
+    @tracer.trace('model.respond')
     def respond(self, message_history: list):
         if self.model_type == 'local':
             return self._call_local(message_history)
@@ -141,7 +142,6 @@ class RemoteModel:
             )
         )
         out = response.text
-        out = fix_json(out)
         return out
 
     def _call_claude(self, message_history: list):
@@ -304,9 +304,8 @@ class RemoteModel:
             max_tokens=max_completion_tokens
         )
 
-        # easy to meet json errors
+        # easy to meet json errors, the planners parse the raw text with the tolerant parse_plan
         out = response.choices[0].message.content
-        out = fix_json(out)
         return out
     
     def _call_intern38b(self, message_history):
@@ -334,9 +333,8 @@ class RemoteModel:
             max_tokens=max_completion_tokens,
         )
 
-        # easy to meet json errors
+        # easy to meet json errors, the planners parse the raw text with the tolerant parse_plan
         out = response.choices[0].message.content
-        out = fix_json(out)
         return out
 
 
@@ -1,4 +1,3 @@
-import torch
 import re
 import os
 import time
@@ -6,10 +5,12 @@ import numpy as np
 import cv2
 import json
 from embodiedbench.planner.planner_config.generation_guide import llm_generation_guide, vlm_generation_guide
-from embodiedbench.planner.planner_utils import local_image_to_data_url, template, template_lang, fix_json
+from embodiedbench.planner.planner_utils import local_image_to_data_url, template, template_lang, ActionPlan, ActionPlan_lang
+from embodiedbench.planner.plan_parser import parse_plan, plan_to_json
 from embodiedbench.planner.remote_model import RemoteModel
 from embodiedbench.planner.custom_model import CustomModel
 from embodiedbench.main import logger
+from embodiedbench.tracing import tracer
 
 class VLMPlanner():
     def __init__(self, model_name, model_type, actions, system_prompt, examples, n_shot=0, obs_key='head_rgb', 
@@ -73,6 +74,7 @@ class VLMPlanner():
         return base_examples + success_examples + failure_examples
 
 
+    @tracer.trace('planner.prompt')
     def process_prompt(self, user_instruction, prev_act_feedback=[], eval_set=None):
         user_instruction = user_instruction.rstrip('.')
         # 동적 메모리 포함하여 모든 예제 가져오기 (eval_set이 제공된 경우)
@@ -133,6 +135,7 @@ class VLMPlanner():
         return prompt
     
 
+    @tracer.trace('planner.message')
     def get_message(self, image, prompt, messages=[]):
         if self.language_only:
             return messages + [
@@ -188,9 +191,12 @@ class VLMPlanner():
             action = np.random.randint(len(self.actions))
         return action
     
+    @tracer.trace('planner.parse')
     def json_to_action(self, output_text, json_key='executable_plan'):
+        self.last_plan = None
         try:
-            json_object = json.loads(output_text)
+            json_object = parse_plan(output_text, ActionPlan_lang if self.language_only else ActionPlan)
+            self.last_plan = json_object
             action = [x[self.action_key] for x in json_object[json_key]]
             if not len(action):
                 print('empty plan, stop here')
@@ -221,14 +227,13 @@ class VLMPlanner():
     def act_custom(self, prompt, obs):
         assert type(obs) == str # input image path
         out = self.model.respond(prompt, obs)
-        # fix common generated json errors
-        out = fix_json(out)
         logger.debug(f"Model Output:\n{out}\n")
         action = self.json_to_action(out)
         self.planner_steps += 1
-        return action, out
+        return action, self.output_json(out)
 
 
+    @tracer.trace('planner.act')
     def act(self, observation, user_instruction, eval_set=None, task_type=None):
         if type(observation) == dict:
             obs = observation[self.obs_key]
@@ -290,7 +295,11 @@ class VLMPlanner():
             )
         action = self.json_to_action(out)
         self.planner_steps += 1
-        return action, out
+        return action, self.output_json(out)
+
+    def output_json(self, out):
+        # the response as one line of json if it was parsed, the raw text otherwise
+        return out if self.last_plan is None else plan_to_json(self.last_plan)
 
     def update_info(self, info):
         """Update episode feedback history."""
@@ -0,0 +1,157 @@
+"""
+Span based tracing of the evaluation loop.
+
+Stages of the loop (env reset/step, simulator calls, observation post-processing, image
+encoding, prompt building, model calls, json repair, artifact writing) are wrapped with
+``tracer.span(name)`` blocks or ``@tracer.trace(name)`` decorators. Tracing is disabled by
+default; a disabled span is a shared no-op object, so instrumented code pays one attribute
+check per call. Enable it with ``trace: True`` in the evaluator config or ``EB_TRACE=1``.
+
+The evaluators write, next to the episode results,
+
+    episode_<n>_timing.json    per-episode table of count / total / mean / max milliseconds per span
+    trace.json                 Chrome trace-event file of the eval set (chrome://tracing, Perfetto)
+"""
+import os
+import json
+import time
+import threading
+import functools
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns() - self.start, self.cat, self.args)
+        return False
+
+    def set(self, **args):
+        """Attach extra arguments to the span, shown in the Chrome trace."""
+        if self.args is None:
+            self.args = {}
+        self.args.update(args)
+
+
+class Tracer:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.pid = os.getpid()
+        # (name, cat, start_ns, duration_ns, thread id, args); list.append is atomic under the GIL
+        self._events = []
+        self._episode_index = 0
+        self._episode_start = None
+        self._episode_args = None
+
+    def enable(self, enabled=True):
+        self.enabled = bool(enabled)
+
+    def span(self, name, cat='eval', **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args or None)
+
+    def trace(self, name=None, cat='eval'):
+        """Decorator that records every call of the function as a span."""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(span_name, start, time.perf_counter_ns() - start, cat)
+            return wrapper
+        return decorator
+
+    def record(self, name, start_ns, duration_ns, cat='eval', args=None):
+        self._events.append((name, cat, start_ns, duration_ns, threading.get_ident(), args))
+
+    def clear(self):
+        self._events = []
+        self._episode_index = 0
+        self._episode_start = None
+
+    def begin_episode(self, **args):
+        if not self.enabled:
+            return
+        self._episode_index = len(self._events)
+        self._episode_start = time.perf_counter_ns()
+        self._episode_args = args or None
+
+    def episode_summary(self):
+        """Aggregate the spans recorded since ``begin_episode``, slowest stage first."""
+        table = {}
+        for name, _, _, duration, _, _ in self._events[self._episode_index:]:
+            row = table.get(name)
+            if row is None:
+                row = table[name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            ms = duration / 1e6
+            row['count'] += 1
+            row['total_ms'] += ms
+            if ms > row['max_ms']:
+                row['max_ms'] = ms
+        for row in table.values():
+            row['mean_ms'] = row['total_ms'] / row['count']
+        return dict(sorted(table.items(), key=lambda item: -item[1]['total_ms']))
+
+    def end_episode(self, res_path, filename):
+        """Record the episode span and write the per-episode timing table to ``res_path/filename``."""
+        if not self.enabled or self._episode_start is None:
+            return None
+        self.record('episode', self._episode_start, time.perf_counter_ns() - self._episode_start, 'episode',
+                    self._episode_args)
+        self._episode_start = None
+        summary = self.episode_summary()
+        if not os.path.exists(res_path):
+            os.makedirs(res_path)
+        with open(os.path.join(res_path, filename), 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def export_chrome_trace(self, path):
+        """Write all recorded spans as Chrome trace-event json and start a new trace."""
+        if not self.enabled:
+            return
+        events = [{'name': name, 'cat': cat, 'ph': 'X', 'ts': start / 1000, 'dur': duration / 1000,
+                   'pid': self.pid, 'tid': tid, 'args': args or {}}
+                  for name, cat, start, duration, tid, args in self._events]
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        self.clear()
+
+
+tracer = Tracer(enabled=os.environ.get('EB_TRACE', '0') not in ('', '0', 'false', 'False'))